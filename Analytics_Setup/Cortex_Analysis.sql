@@ -129,171 +129,814 @@ SELECT
 FROM parsed_transcripts
 LIMIT 10;
 
---Create a Dynamic Table of all of the Cortex LLM function fields combined with the original fields
-CREATE OR REPLACE DYNAMIC TABLE transcript_analysis_results
+-- Create a Python UDF for the keyword fast path of the device classification
+-- It matches the HOME_MEDICAL_DEVICES device names in each transcript (Aho-Corasick, see Python_Pipeline/device_fastpath.py)
+-- and returns the device name and category when all devices mentioned belong to one category
+CREATE OR REPLACE FUNCTION MED_DEVICE_TRANSCRIPTS.ANALYTICS.DEVICE_FASTPATH_CLASSIFY(
+    TRANSCRIPT VARCHAR,
+    AGENT_NAME VARCHAR,
+    CUSTOMER_NAME VARCHAR
+)
+RETURNS OBJECT
+LANGUAGE PYTHON
+RUNTIME_VERSION = '3.11'
+IMMUTABLE
+IMPORTS = (
+    '@MED_DEVICE_TRANSCRIPTS.PUBLIC.GITHUB_REPO_MED_DEVICE_TRANSCRIPTS/branches/main/Python_Pipeline/device_fastpath.py',
+    '@MED_DEVICE_TRANSCRIPTS.PUBLIC.GITHUB_REPO_MED_DEVICE_TRANSCRIPTS/branches/main/Python_Pipeline/transcript_io.py',
+    '@MED_DEVICE_TRANSCRIPTS.PUBLIC.GITHUB_REPO_MED_DEVICE_TRANSCRIPTS/branches/main/Python_Pipeline/home_medical_devices.csv'
+)
+HANDLER = 'device_fastpath.udf_classify';
+
+-- Query the fast path on a few transcripts
+SELECT
+  conversation_id,
+  DEVICE_FASTPATH_CLASSIFY(transcript, agent_name, customer_name) as device_fastpath
+FROM parsed_transcripts
+LIMIT 10;
+
+-- Token budgets: the longest transcripts dominated latency and cost, and could exceed the context window of
+-- EXTRACT_ANSWER (2,048 tokens). The budgets below match TOKEN_BUDGETS in Python_Pipeline/transcript_chunker.py:
+--   summarize       2000 tokens - longer transcripts are summarized in chunks of 1000 tokens and reduced
+--   extract_answer  1800 tokens
+--   sentiment        500 tokens - context window of 512 tokens
+--   complete        3000 tokens - resolution and service rating prompts
+-- The example queries at the top of this script send the full transcript to each function; the tables below use the budgets
+
+-- Count the tokens of each transcript per function
+SELECT
+  conversation_id,
+  SNOWFLAKE.CORTEX.COUNT_TOKENS('summarize', transcript) as summarize_tokens,
+  SNOWFLAKE.CORTEX.COUNT_TOKENS('extract_answer', transcript) as extract_answer_tokens,
+  SNOWFLAKE.CORTEX.COUNT_TOKENS('mistral-large2', transcript) as complete_tokens
+FROM parsed_transcripts
+ORDER BY summarize_tokens DESC
+LIMIT 10;
+
+-- Create a Python UDF that splits a transcript into chunks of at most MAX_TOKENS on speaker-turn boundaries
+-- It returns an ARRAY of objects (chunk_no, turn_start, turn_end, tokens, text) to be used with LATERAL FLATTEN
+CREATE OR REPLACE FUNCTION MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_CHUNKS(
+    TRANSCRIPT VARCHAR,
+    AGENT_NAME VARCHAR,
+    CUSTOMER_NAME VARCHAR,
+    MAX_TOKENS NUMBER
+)
+RETURNS ARRAY
+LANGUAGE PYTHON
+RUNTIME_VERSION = '3.11'
+IMMUTABLE
+IMPORTS = (
+    '@MED_DEVICE_TRANSCRIPTS.PUBLIC.GITHUB_REPO_MED_DEVICE_TRANSCRIPTS/branches/main/Python_Pipeline/transcript_chunker.py',
+    '@MED_DEVICE_TRANSCRIPTS.PUBLIC.GITHUB_REPO_MED_DEVICE_TRANSCRIPTS/branches/main/Python_Pipeline/turn_parser.py',
+    '@MED_DEVICE_TRANSCRIPTS.PUBLIC.GITHUB_REPO_MED_DEVICE_TRANSCRIPTS/branches/main/Python_Pipeline/transcript_io.py'
+)
+HANDLER = 'transcript_chunker.udf_chunks';
+
+-- Create a Python UDF that caps a transcript at MAX_TOKENS
+-- Transcripts within the budget are returned unchanged; longer ones keep their opening and closing turns
+CREATE OR REPLACE FUNCTION MED_DEVICE_TRANSCRIPTS.ANALYTICS.FIT_TRANSCRIPT_TO_BUDGET(
+    TRANSCRIPT VARCHAR,
+    AGENT_NAME VARCHAR,
+    CUSTOMER_NAME VARCHAR,
+    MAX_TOKENS NUMBER
+)
+RETURNS VARCHAR
+LANGUAGE PYTHON
+RUNTIME_VERSION = '3.11'
+IMMUTABLE
+IMPORTS = (
+    '@MED_DEVICE_TRANSCRIPTS.PUBLIC.GITHUB_REPO_MED_DEVICE_TRANSCRIPTS/branches/main/Python_Pipeline/transcript_chunker.py',
+    '@MED_DEVICE_TRANSCRIPTS.PUBLIC.GITHUB_REPO_MED_DEVICE_TRANSCRIPTS/branches/main/Python_Pipeline/turn_parser.py',
+    '@MED_DEVICE_TRANSCRIPTS.PUBLIC.GITHUB_REPO_MED_DEVICE_TRANSCRIPTS/branches/main/Python_Pipeline/transcript_io.py'
+)
+HANDLER = 'transcript_chunker.udf_fit';
+
+-- Query the chunks of the longest transcripts
+SELECT
+  p.conversation_id,
+  c.value:chunk_no::INT as chunk_no,
+  c.value:turn_start::INT as turn_start,
+  c.value:turn_end::INT as turn_end,
+  c.value:tokens::INT as chunk_tokens
+FROM parsed_transcripts p,
+  LATERAL FLATTEN(input => TRANSCRIPT_CHUNKS(p.transcript, p.agent_name, p.customer_name, 1000)) c
+ORDER BY LENGTH(p.transcript) DESC, p.conversation_id, chunk_no
+LIMIT 20;
+
+-- Create a Dynamic Table of transcript summaries with map-reduce summarization of long transcripts
+-- Transcripts within the summarize budget get one SUMMARIZE call. Longer ones are split into chunks, the chunks are
+-- summarized as separate rows (which the warehouse runs in parallel), and the chunk summaries are summarized again
+CREATE OR REPLACE DYNAMIC TABLE transcript_summaries
   TARGET_LAG = 'DOWNSTREAM'
   WAREHOUSE = CORTEX_DEMO_WH
   REFRESH_MODE = 'AUTO'
 AS
+  WITH unique_transcripts AS (
     SELECT
-    source,
+      conversation_id,
+      agent_name,
+      customer_name,
+      transcript,
+      -- A NULL or empty transcript counts as 0 tokens, so it still gets a (NULL) summary row and is not dropped by the
+      -- join in TRANSCRIPT_ANALYSIS_RESULTS_FINAL
+      COALESCE(SNOWFLAKE.CORTEX.COUNT_TOKENS('summarize', transcript), 0) as transcript_tokens
+    FROM parsed_transcripts
+    QUALIFY ROW_NUMBER() OVER (PARTITION BY conversation_id ORDER BY start_time DESC) = 1
+  ),
+  chunk_summaries AS (
+    -- Map: summarize each chunk of the long transcripts
+    SELECT
+      u.conversation_id,
+      u.transcript_tokens,
+      c.value:chunk_no::INT as chunk_no,
+      SNOWFLAKE.CORTEX.COUNT_TOKENS('summarize', c.value:text::VARCHAR) as chunk_tokens,
+      SNOWFLAKE.CORTEX.SUMMARIZE(c.value:text::VARCHAR) as chunk_summary
+    FROM unique_transcripts u,
+      LATERAL FLATTEN(input => TRANSCRIPT_CHUNKS(u.transcript, u.agent_name, u.customer_name, 1000)) c
+    WHERE u.transcript_tokens > 2000
+  ),
+  reduce_inputs AS (
+    SELECT
+      conversation_id,
+      transcript_tokens,
+      COUNT(*) as chunk_count,
+      SUM(chunk_tokens) as map_input_tokens,
+      SUM(SNOWFLAKE.CORTEX.COUNT_TOKENS('summarize', chunk_summary)) as map_output_tokens,
+      LISTAGG(chunk_summary, '\n') WITHIN GROUP (ORDER BY chunk_no) as reduce_input
+    FROM chunk_summaries
+    GROUP BY conversation_id, transcript_tokens
+  )
+  -- summarize_calls, summarize_input_tokens and map_output_tokens count every SUMMARIZE call of the conversation, for
+  -- the token accounting of the sync procedure
+  SELECT
     conversation_id,
-    start_time,
-    end_time,
-    agent_name,
-    customer_name,
-    transcript,
+    transcript_tokens,
+    1 as chunk_count,
     SNOWFLAKE.CORTEX.SUMMARIZE(transcript) as transcript_summary,
-    SNOWFLAKE.CORTEX.SENTIMENT(transcript) as sentiment_score,
-    CASE
-        WHEN SNOWFLAKE.CORTEX.SENTIMENT(transcript) > 0.33 THEN 'Positive'
-        WHEN SNOWFLAKE.CORTEX.SENTIMENT(transcript) < -0.33 THEN 'Negative'
-        ELSE 'Neutral'
-    END as sentiment_category,
-    SNOWFLAKE.CORTEX.CLASSIFY_TEXT(
-        transcript, 
-        ['Diabetes', 'Respiratory', 'Mobility', 'Urology', 'Pain Management', 'Monitoring', 'Orthopedic', 'Nutrition', 'Infusion', 'Wound Care','Other']
-        )['label'] as device_category,
-        SNOWFLAKE.CORTEX.EXTRACT_ANSWER(transcript, 'What is the main issue?') as main_issue_json,
-        SNOWFLAKE.CORTEX.COMPLETE(
-        'mistral-large2',
-        [
+    1 as summarize_calls,
+    transcript_tokens as summarize_input_tokens,
+    0 as map_output_tokens
+  FROM unique_transcripts
+  WHERE transcript_tokens <= 2000
+  UNION ALL
+  -- Reduce: summarize the chunk summaries in order
+  SELECT
+    conversation_id,
+    transcript_tokens,
+    chunk_count,
+    SNOWFLAKE.CORTEX.SUMMARIZE(reduce_input) as transcript_summary,
+    chunk_count + 1 as summarize_calls,
+    map_input_tokens + SNOWFLAKE.CORTEX.COUNT_TOKENS('summarize', reduce_input) as summarize_input_tokens,
+    map_output_tokens
+  FROM reduce_inputs;
+
+-- Show the transcripts that were summarized in chunks
+SELECT conversation_id, transcript_tokens, chunk_count, transcript_summary
+FROM transcript_summaries
+WHERE chunk_count > 1
+ORDER BY transcript_tokens DESC;
+
+-- Model routing for the COMPLETE prompts: every prompt used to go to mistral-large2, whatever the length of the call.
+-- ROUTE_COMPLETE_MODEL picks llama3.1-8b, llama3.1-70b or mistral-large2 per transcript from its length, the keyword
+-- fast path status and a quality tier ('economy', 'standard' or 'premium'; see QUALITY_TIERS in
+-- Python_Pipeline/model_router.py). 'premium' sends every prompt to mistral-large2
+CREATE OR REPLACE FUNCTION MED_DEVICE_TRANSCRIPTS.ANALYTICS.ROUTE_COMPLETE_MODEL(
+    TRANSCRIPT VARCHAR,
+    FASTPATH_STATUS VARCHAR,
+    QUALITY_TIER VARCHAR
+)
+RETURNS VARCHAR
+LANGUAGE PYTHON
+RUNTIME_VERSION = '3.11'
+IMMUTABLE
+IMPORTS = (
+    '@MED_DEVICE_TRANSCRIPTS.PUBLIC.GITHUB_REPO_MED_DEVICE_TRANSCRIPTS/branches/main/Python_Pipeline/model_router.py',
+    '@MED_DEVICE_TRANSCRIPTS.PUBLIC.GITHUB_REPO_MED_DEVICE_TRANSCRIPTS/branches/main/Python_Pipeline/device_fastpath.py',
+    '@MED_DEVICE_TRANSCRIPTS.PUBLIC.GITHUB_REPO_MED_DEVICE_TRANSCRIPTS/branches/main/Python_Pipeline/transcript_chunker.py',
+    '@MED_DEVICE_TRANSCRIPTS.PUBLIC.GITHUB_REPO_MED_DEVICE_TRANSCRIPTS/branches/main/Python_Pipeline/turn_parser.py',
+    '@MED_DEVICE_TRANSCRIPTS.PUBLIC.GITHUB_REPO_MED_DEVICE_TRANSCRIPTS/branches/main/Python_Pipeline/transcript_io.py'
+)
+HANDLER = 'model_router.udf_route';
+
+-- Create a Dynamic Table with one row per COMPLETE attempt (conversation, prompt type and attempt number)
+-- Each prompt is sent to its routed model first. A response that does not have the requested format ("Resolved: ...",
+-- "7: ...") is retried once on mistral-large2, so the large model is only paid for when a smaller one fails.
+-- The token counts of every attempt come from the usage returned by COMPLETE
+CREATE OR REPLACE DYNAMIC TABLE complete_responses
+  TARGET_LAG = 'DOWNSTREAM'
+  WAREHOUSE = CORTEX_DEMO_WH
+  REFRESH_MODE = 'AUTO'
+AS
+  WITH unique_transcripts AS (
+    SELECT
+      conversation_id,
+      FIT_TRANSCRIPT_TO_BUDGET(transcript, agent_name, customer_name, 3000) as complete_input,
+      DEVICE_FASTPATH_CLASSIFY(transcript, agent_name, customer_name):status::VARCHAR as fastpath_status
+    FROM parsed_transcripts
+    QUALIFY ROW_NUMBER() OVER (PARTITION BY conversation_id ORDER BY start_time DESC) = 1
+  ),
+  complete_requests AS (
+    SELECT
+      conversation_id,
+      'resolution' as prompt_type,
+      [
         {'role': 'system', 'content': 'You are a customer service quality analyst. 
             Analyze customer service transcripts and determine if the customer\'s issue was resolved. 
             Respond with exactly one word ("Resolved", "Unresolved", or "Partial") followed by a colon and 10 words or less explaining why.'},
-        {'role': 'user', 'content': transcript}
-        ],
-        {'temperature': 0, 'max_tokens': 25}
-        )['choices'][0]['messages']::STRING as resolution_with_reason,
-        SNOWFLAKE.CORTEX.COMPLETE(
-        'mistral-large2',
-        CONCAT('Rate the customer service experience from 0 to 10, with 0 being very poor support without resolution 
+        {'role': 'user', 'content': complete_input}
+      ] as messages,
+      ROUTE_COMPLETE_MODEL(complete_input, fastpath_status, 'standard') as routed_model
+    FROM unique_transcripts
+    UNION ALL
+    SELECT
+      conversation_id,
+      'service_rating' as prompt_type,
+      [
+        {'role': 'user', 'content': CONCAT('Rate the customer service experience from 0 to 10, with 0 being very poor support without resolution 
         and 10 being highly supportive and complete resolution of the issue and a completely happy customer. 
         Return the results with a single integer for the rating followed by a colon and then a reason for the rating.
-        The reason should be 25 words or less.', transcript)
-        ) as customer_service_rating
-    FROM parsed_transcripts;
-
-    --Top 10 rows of the Dynamic Table
-    SELECT * FROM transcript_analysis_results
-    LIMIT 10;
+        The reason should be 25 words or less.', complete_input)}
+      ] as messages,
+      ROUTE_COMPLETE_MODEL(complete_input, fastpath_status, 'standard') as routed_model
+    FROM unique_transcripts
+  ),
+  first_attempts AS (
+    -- One COMPLETE call site per model, so each row only calls its routed model
+    SELECT conversation_id, prompt_type, messages, routed_model, 1 as attempt_no, 'llama3.1-8b' as model,
+      SNOWFLAKE.CORTEX.COMPLETE('llama3.1-8b', messages, {'temperature': 0, 'max_tokens': 60}) as response
+    FROM complete_requests
+    WHERE routed_model = 'llama3.1-8b'
+    UNION ALL
+    SELECT conversation_id, prompt_type, messages, routed_model, 1 as attempt_no, 'llama3.1-70b' as model,
+      SNOWFLAKE.CORTEX.COMPLETE('llama3.1-70b', messages, {'temperature': 0, 'max_tokens': 60}) as response
+    FROM complete_requests
+    WHERE routed_model = 'llama3.1-70b'
+    UNION ALL
+    SELECT conversation_id, prompt_type, messages, routed_model, 1 as attempt_no, 'mistral-large2' as model,
+      SNOWFLAKE.CORTEX.COMPLETE('mistral-large2', messages, {'temperature': 0, 'max_tokens': 60}) as response
+    FROM complete_requests
+    WHERE routed_model = 'mistral-large2'
+  ),
+  escalations AS (
+    -- Retry the responses of the smaller models that fail validation on the large model
+    SELECT conversation_id, prompt_type, messages, routed_model, 2 as attempt_no, 'mistral-large2' as model,
+      SNOWFLAKE.CORTEX.COMPLETE('mistral-large2', messages, {'temperature': 0, 'max_tokens': 60}) as response
+    FROM first_attempts
+    WHERE model <> 'mistral-large2'
+      AND NOT COALESCE(REGEXP_LIKE(
+        response['choices'][0]['messages']::STRING,
+        IFF(prompt_type = 'resolution', '\\s*(Resolved|Unresolved|Partial)\\s*:.+', '\\s*(10|[0-9])\\s*:.+'),
+        's'
+      ), FALSE)
+  ),
+  all_attempts AS (
+    SELECT conversation_id, prompt_type, messages, routed_model, attempt_no, model, response FROM first_attempts
+    UNION ALL
+    SELECT conversation_id, prompt_type, messages, routed_model, attempt_no, model, response FROM escalations
+  )
+  SELECT
+    conversation_id,
+    prompt_type,
+    -- Kept so the sync procedure can hash the input of each call for the token accounting
+    messages,
+    routed_model,
+    attempt_no,
+    model,
+    response['choices'][0]['messages']::STRING as response_text,
+    COALESCE(REGEXP_LIKE(
+      response_text,
+      IFF(prompt_type = 'resolution', '\\s*(Resolved|Unresolved|Partial)\\s*:.+', '\\s*(10|[0-9])\\s*:.+'),
+      's'
+    ), FALSE) as is_valid,
+    response['usage']['prompt_tokens']::INT as prompt_tokens,
+    response['usage']['completion_tokens']::INT as completion_tokens
+  FROM all_attempts;
 
--- Query to work with MAIN_ISSUE_JSON and create new columns from the JSON
+-- Calls, valid responses, escalations and tokens per model
 SELECT
-  conversation_id,
-  main_issue_json,
-  main_issue_json[0]:answer::STRING as main_issue_answer,
-  main_issue_json[0]:score::FLOAT as main_issue_score,
-  CASE
-    WHEN main_issue_json[0]:score::FLOAT >= 0.7 THEN 'High Confidence'
-    WHEN main_issue_json[0]:score::FLOAT >= 0.3 THEN 'Medium Confidence'
-    ELSE 'Low Confidence'
-  END as main_issue_confidence_level
-FROM transcript_analysis_results
-LIMIT 10;
+  model,
+  prompt_type,
+  COUNT(*) as calls,
+  ROUND(100 * COUNT_IF(is_valid) / COUNT(*), 1) as valid_pct,
+  COUNT_IF(attempt_no = 2) as escalations_answered,
+  SUM(prompt_tokens) as prompt_tokens,
+  SUM(completion_tokens) as completion_tokens,
+  ROUND(AVG(prompt_tokens), 0) as avg_prompt_tokens
+FROM complete_responses
+GROUP BY model, prompt_type
+ORDER BY model, prompt_type;
 
--- Create a Dynamic Table for main issue analysis
-CREATE OR REPLACE DYNAMIC TABLE main_issue_analysis
-  TARGET_LAG = 'DOWNSTREAM'
+--Create a single Dynamic Table of all of the Cortex LLM function fields combined with the original fields
+--Earlier versions built this in four layers (transcript_analysis_results, main_issue_analysis, resolution_service_analysis
+--and a three-way join on conversation_id). Each new transcript refreshed all four tables, and a repeated conversation_id
+--fanned out rows in the join. The JSON and SPLIT_PART projections are now done in place on one table, which is
+--deduplicated on conversation_id before any Cortex function is called.
+--The device category comes from the keyword fast path when it is unambiguous; only unmatched transcripts and transcripts
+--that mention devices from several categories are sent to CLASSIFY_TEXT
+--The summary comes from transcript_summaries and the EXTRACT_ANSWER and SENTIMENT prompts are capped at their token budgets. The resolution
+--and service rating responses come from complete_responses, which routes each prompt to a model
+--The table is clustered on the call date: the dashboards filter on a START_TIME range, which then only scans the
+--micro-partitions of the selected days (see section 9 of Pipeline_Benchmarks.sql)
+CREATE OR REPLACE DYNAMIC TABLE TRANSCRIPT_ANALYSIS_RESULTS_FINAL
+  TARGET_LAG = '1 MINUTE'
   WAREHOUSE = CORTEX_DEMO_WH
   REFRESH_MODE = 'AUTO'
+  CLUSTER BY (TO_DATE(start_time))
 AS
+  WITH unique_transcripts AS (
+    -- Keep one row per conversation_id so each transcript is only sent to the Cortex functions once
+    SELECT *
+    FROM parsed_transcripts
+    QUALIFY ROW_NUMBER() OVER (PARTITION BY conversation_id ORDER BY start_time DESC) = 1
+  ),
+  budgeted_transcripts AS (
+    -- Cap the prompt of each function at its token budget; transcripts within the budget are unchanged
+    SELECT
+      *,
+      FIT_TRANSCRIPT_TO_BUDGET(transcript, agent_name, customer_name, 1800) as extract_answer_input,
+      FIT_TRANSCRIPT_TO_BUDGET(transcript, agent_name, customer_name, 500) as sentiment_input
+    FROM unique_transcripts
+  ),
+  complete_results AS (
+    -- The accepted response of each prompt: the escalated attempt when there is one
+    SELECT
+      conversation_id,
+      MAX(IFF(prompt_type = 'resolution', response_text, NULL)) as resolution_with_reason,
+      MAX(IFF(prompt_type = 'service_rating', response_text, NULL)) as customer_service_rating
+    FROM (
+      SELECT *
+      FROM complete_responses
+      QUALIFY ROW_NUMBER() OVER (PARTITION BY conversation_id, prompt_type ORDER BY attempt_no DESC) = 1
+    )
+    GROUP BY conversation_id
+  ),
+  fastpath_transcripts AS (
+    SELECT
+      conversation_id,
+      transcript,
+      DEVICE_FASTPATH_CLASSIFY(transcript, agent_name, customer_name) as device_fastpath
+    FROM unique_transcripts
+  ),
+  device_categories AS (
+    -- Unambiguous keyword matches: no LLM call
+    SELECT
+      conversation_id,
+      device_fastpath:device_name::VARCHAR as device_name,
+      device_fastpath:device_category::VARCHAR as device_category,
+      'KEYWORD' as device_category_source
+    FROM fastpath_transcripts
+    WHERE device_fastpath:status::VARCHAR = 'matched'
+    UNION ALL
+    -- Unmatched or multi-category transcripts: classify with the LLM
+    SELECT
+      conversation_id,
+      device_fastpath:device_name::VARCHAR as device_name,
+      SNOWFLAKE.CORTEX.CLASSIFY_TEXT(
+        transcript, 
+        ['Diabetes', 'Respiratory', 'Mobility', 'Urology', 'Pain Management', 'Monitoring', 'Orthopedic', 'Nutrition', 'Infusion', 'Wound Care','Other']
+        )['label']::VARCHAR as device_category,
+      'CLASSIFY_TEXT' as device_category_source
+    FROM fastpath_transcripts
+    WHERE device_fastpath:status::VARCHAR <> 'matched'
+  ),
+  cortex_results AS (
+    -- Call each Cortex function once per transcript
+    SELECT
+      b.source,
+      b.conversation_id,
+      b.start_time,
+      b.end_time,
+      b.agent_name,
+      b.customer_name,
+      b.transcript,
+      s.transcript_summary,
+      SNOWFLAKE.CORTEX.SENTIMENT(b.sentiment_input) as sentiment_score,
+      SNOWFLAKE.CORTEX.EXTRACT_ANSWER(b.extract_answer_input, 'What is the main issue?') as main_issue_json,
+      r.resolution_with_reason,
+      r.customer_service_rating
+    FROM budgeted_transcripts b
+    JOIN transcript_summaries s ON s.conversation_id = b.conversation_id
+    JOIN complete_results r ON r.conversation_id = b.conversation_id
+  )
   SELECT
-    conversation_id,
-    main_issue_json,
+    source,
+    c.conversation_id,
+    start_time,
+    end_time,
+    agent_name,
+    customer_name,
+    transcript,
+    transcript_summary,
+    sentiment_score,
+    CASE
+      WHEN sentiment_score > 0.33 THEN 'Positive'
+      WHEN sentiment_score < -0.33 THEN 'Negative'
+      ELSE 'Neutral'
+    END as sentiment_category,
+    d.device_category,
+    d.device_name,
+    d.device_category_source,
     main_issue_json[0]:answer::STRING as main_issue_answer,
     main_issue_json[0]:score::FLOAT as main_issue_score,
     CASE
       WHEN main_issue_json[0]:score::FLOAT >= 0.7 THEN 'High Confidence'
       WHEN main_issue_json[0]:score::FLOAT >= 0.3 THEN 'Medium Confidence'
       ELSE 'Low Confidence'
-    END as main_issue_confidence_level
-  FROM transcript_analysis_results;
-
--- Query the dynamic table
-SELECT * FROM main_issue_analysis LIMIT 10;
-
--- Create a Dynamic Table for resolution and customer service analysis
-CREATE OR REPLACE DYNAMIC TABLE resolution_service_analysis
-  TARGET_LAG = 'DOWNSTREAM'
-  WAREHOUSE = CORTEX_DEMO_WH
-  REFRESH_MODE = 'AUTO'
-AS
-  SELECT
-    conversation_id,
-    resolution_with_reason,
+    END as main_issue_confidence_level,
     SPLIT_PART(resolution_with_reason, ':', 1) as resolution,
     TRIM(SPLIT_PART(resolution_with_reason, ':', 2)) as resolution_reason,
-    customer_service_rating,
     SPLIT_PART(customer_service_rating, ':', 1) as service_rating,
     TRIM(SPLIT_PART(customer_service_rating, ':', 2)) as service_rating_reason
-  FROM transcript_analysis_results;
+  FROM cortex_results c
+  JOIN device_categories d ON d.conversation_id = c.conversation_id;
+
+-- Query the combined dynamic table
+SELECT * FROM TRANSCRIPT_ANALYSIS_RESULTS_FINAL LIMIT 10;
 
--- Query the resolution and customer service dynamic table
-SELECT * FROM resolution_service_analysis LIMIT 10;
+-- Check that there is exactly one row per conversation_id
+SELECT conversation_id, COUNT(*) as row_count
+FROM TRANSCRIPT_ANALYSIS_RESULTS_FINAL
+GROUP BY conversation_id
+HAVING COUNT(*) > 1;
 
--- Combined query that joins all three dynamic tables
+-- Share of device classifications answered by the keyword fast path (LLM calls avoided)
 SELECT
-  t.source,
-  t.conversation_id,
-  t.start_time,
-  t.end_time,
-  t.agent_name,
-  t.customer_name,
-  t.transcript,
-  t.transcript_summary,
-  t.sentiment_score,
-  t.sentiment_category,
-  t.device_category,
-  --t.main_issue_json,
-  m.main_issue_answer,
-  m.main_issue_score,
-  m.main_issue_confidence_level,
-  --r.resolution_with_reason,
-  r.resolution,
-  r.resolution_reason,
-  --r.customer_service_rating,
-  r.service_rating,
-  r.service_rating_reason
-FROM transcript_analysis_results t
-JOIN main_issue_analysis m ON t.conversation_id = m.conversation_id
-JOIN resolution_service_analysis r ON t.conversation_id = r.conversation_id
-LIMIT 10;
+  device_category_source,
+  COUNT(*) as transcripts,
+  ROUND(100 * RATIO_TO_REPORT(COUNT(*)) OVER (), 1) as pct_of_transcripts
+FROM TRANSCRIPT_ANALYSIS_RESULTS_FINAL
+GROUP BY device_category_source;
 
--- Create a Dynamic Table that combines all three analysis tables
-CREATE OR REPLACE DYNAMIC TABLE TRANSCRIPT_ANALYSIS_RESULTS_FINAL
-  TARGET_LAG = '1 MINUTE'
-  WAREHOUSE = CORTEX_DEMO_WH
-  REFRESH_MODE = 'AUTO'
+-- Drop the intermediate dynamic tables from the earlier four-layer version
+DROP DYNAMIC TABLE IF EXISTS resolution_service_analysis;
+DROP DYNAMIC TABLE IF EXISTS main_issue_analysis;
+DROP DYNAMIC TABLE IF EXISTS transcript_analysis_results;
+
+/* Cortex token accounting: one row per conversation, function, model and input with the calls and the input and output
+tokens of the enrichment. The sync procedure below records the rows of the conversations it inserts or changes in the
+search base table. INPUT_HASH identifies what the function was given (the transcript, the budgeted prompt, or the
+COMPLETE messages), so a conversation that is enriched again with a new transcript, budget, prompt or model gets new
+rows, while re-reading an unchanged enrichment does not. A refresh that recomputes a row with the same inputs and the
+same results (such as a full refresh of the dynamic table) is not recorded.
+PIPELINE tells the writers apart: EAGER for this script, LAZY for Lazy_Enrichment.sql and ROLLING_SUMMARIES for
+Rolling_Summaries.sql (whose rows have no CONVERSATION_ID). Each writer only looks at its
+own rows, so in a mixed deployment the lazy calls do not hide the eager ones (or the reverse), and both are counted.
+COMPLETE tokens come from the usage returned by COMPLETE (complete_responses); the other functions are counted with
+COUNT_TOKENS on the text each function received and returned. SENTIMENT and CLASSIFY_TEXT are billed on their input
+tokens only, so their output tokens are recorded as 0 */
+
+-- Create the token accounting table
+CREATE TABLE IF NOT EXISTS MED_DEVICE_TRANSCRIPTS.ANALYTICS.CORTEX_TOKEN_USAGE (
+    CONVERSATION_ID NUMBER,
+    FUNCTION_NAME VARCHAR,
+    MODEL VARCHAR,
+    INPUT_TOKENS NUMBER,
+    OUTPUT_TOKENS NUMBER,
+    RECORDED_AT TIMESTAMP_LTZ,
+    CALL_COUNT NUMBER,
+    INPUT_HASH NUMBER,
+    PIPELINE VARCHAR
+);
+
+-- Add the columns introduced after the table was first created
+ALTER TABLE MED_DEVICE_TRANSCRIPTS.ANALYTICS.CORTEX_TOKEN_USAGE ADD COLUMN IF NOT EXISTS call_count NUMBER;
+ALTER TABLE MED_DEVICE_TRANSCRIPTS.ANALYTICS.CORTEX_TOKEN_USAGE ADD COLUMN IF NOT EXISTS input_hash NUMBER;
+ALTER TABLE MED_DEVICE_TRANSCRIPTS.ANALYTICS.CORTEX_TOKEN_USAGE ADD COLUMN IF NOT EXISTS pipeline VARCHAR;
+
+-- Create the credit rates per million tokens (approximate rates from the Snowflake service consumption table;
+-- update them to the current rates of your account)
+CREATE TABLE IF NOT EXISTS MED_DEVICE_TRANSCRIPTS.ANALYTICS.CORTEX_TOKEN_RATES (
+    FUNCTION_NAME VARCHAR,
+    MODEL VARCHAR,
+    CREDITS_PER_MILLION_TOKENS FLOAT
+);
+
+-- Add the default rate of each function and model that has no rate yet, so running the script again keeps the rates
+-- you updated
+MERGE INTO MED_DEVICE_TRANSCRIPTS.ANALYTICS.CORTEX_TOKEN_RATES r
+USING (
+    SELECT column1 as function_name, column2 as model, column3 as credits_per_million_tokens
+    FROM VALUES
+        ('SUMMARIZE', NULL, 0.10),
+        ('SENTIMENT', NULL, 0.08),
+        ('CLASSIFY_TEXT', NULL, 1.39),
+        ('EXTRACT_ANSWER', NULL, 0.08),
+        ('AI_AGG', NULL, 1.60),
+        ('EMBED_TEXT_768', 'snowflake-arctic-embed-m-v1.5', 0.03),
+        ('COMPLETE', 'llama3.1-8b', 0.19),
+        ('COMPLETE', 'llama3.1-70b', 1.21),
+        ('COMPLETE', 'mistral-large2', 1.95)
+) d
+ON r.function_name = d.function_name AND EQUAL_NULL(r.model, d.model)
+WHEN NOT MATCHED THEN INSERT (function_name, model, credits_per_million_tokens)
+    VALUES (d.function_name, d.model, d.credits_per_million_tokens);
+
+-- Create a view with the estimated credits of each accounting row and the conversation details used for reporting
+CREATE OR REPLACE VIEW MED_DEVICE_TRANSCRIPTS.ANALYTICS.CORTEX_TOKEN_COSTS AS
+SELECT
+  u.conversation_id,
+  r.agent_name,
+  r.start_time,
+  u.function_name,
+  u.model,
+  u.pipeline,
+  u.call_count,
+  u.input_tokens,
+  u.output_tokens,
+  u.input_tokens + u.output_tokens as total_tokens,
+  (u.input_tokens + u.output_tokens) * rt.credits_per_million_tokens / 1000000 as estimated_credits,
+  u.recorded_at
+FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.CORTEX_TOKEN_USAGE u
+LEFT JOIN MED_DEVICE_TRANSCRIPTS.ANALYTICS.CORTEX_TOKEN_RATES rt
+  ON rt.function_name = u.function_name
+  AND EQUAL_NULL(rt.model, u.model)
+LEFT JOIN MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL r
+  ON r.conversation_id = u.conversation_id;
+
+/* Keep a regular table in sync with the Dynamic Table for Cortex Search, which can not be used ontop of a Dynamic Table.
+Earlier versions rebuilt this table with CREATE OR REPLACE TABLE ... AS SELECT * each time new records were generated,
+which had to be run manually and forced any search service on the table to re-index every row.
+A stream on the Dynamic Table now captures the new and changed rows, and a task MERGEs only those rows into the table */
+
+-- Create the search base table once with the same columns as the Dynamic Table (the rows are loaded by the first sync)
+-- Change tracking lets a Cortex Search service on this table refresh incrementally
+CREATE TABLE IF NOT EXISTS MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL
+  CHANGE_TRACKING = TRUE
 AS
-  SELECT
-    t.source,
-    t.conversation_id,
-    t.start_time,
-    t.end_time,
-    t.agent_name,
-    t.customer_name,
-    t.transcript,
-    t.transcript_summary,
-    t.sentiment_score,
-    t.sentiment_category,
-    t.device_category::VARCHAR as device_category,
-    m.main_issue_answer,
-    m.main_issue_score,
-    m.main_issue_confidence_level,
-    r.resolution,
-    r.resolution_reason,
-    r.service_rating,
-    r.service_rating_reason
-  FROM transcript_analysis_results t
-  JOIN main_issue_analysis m ON t.conversation_id = m.conversation_id
-  JOIN resolution_service_analysis r ON t.conversation_id = r.conversation_id;
+SELECT * FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL
+WHERE FALSE;
 
--- Query the combined dynamic table
-SELECT * FROM TRANSCRIPT_ANALYSIS_RESULTS_FINAL LIMIT 10;
+-- Add the columns introduced after the table was first created
+ALTER TABLE MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL ADD COLUMN IF NOT EXISTS device_name VARCHAR;
+ALTER TABLE MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL ADD COLUMN IF NOT EXISTS device_category_source VARCHAR;
+-- When the sync last inserted or changed the row; the token accounting reads the rows of the current sync
+ALTER TABLE MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL ADD COLUMN IF NOT EXISTS synced_at TIMESTAMP_LTZ;
+
+-- Cluster the search base table on the call date like the Dynamic Table, so date-range queries prune micro-partitions
+ALTER TABLE MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL CLUSTER BY (TO_DATE(start_time));
+
+/* Transcript embeddings for the "similar calls" panel of the Record Viewer. Each transcript is embedded once, by the
+sync procedure below, when its enrichment first reaches the search base table; it is embedded again only when its text
+changes (TRANSCRIPT_HASH). EMBED_TEXT_768 reads at most 512 tokens, so the transcript is first capped with
+FIT_TRANSCRIPT_TO_BUDGET, which keeps its opening and closing turns. EMBEDDED_AT lets a reader load only the
+embeddings added since its last read (see VectorIndex in Python_Pipeline/vector_index.py) */
+
+-- Create the embeddings table
+CREATE TABLE IF NOT EXISTS MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_EMBEDDINGS (
+    CONVERSATION_ID NUMBER,
+    MODEL VARCHAR,
+    TRANSCRIPT_HASH NUMBER,
+    EMBEDDING VECTOR(FLOAT, 768),
+    EMBEDDED_AT TIMESTAMP_LTZ
+);
 
-/* Create or replace the existing table with all transcripts and then copy over all records from the Dynamic Table.  
-This has to be done bacause Cortex Search can not be used ontop of a Dynamic Table
-***NOTE*** This query must be run manually to refreshed each time new records are generated (I haven't built an update pipline yet!)*/
-CREATE OR REPLACE TABLE MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL AS 
-SELECT * FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL;
+-- Create a stream on the Dynamic Table; SHOW_INITIAL_ROWS makes the first sync load all existing rows
+CREATE OR REPLACE STREAM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL_STREAM
+  ON DYNAMIC TABLE MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL
+  SHOW_INITIAL_ROWS = TRUE;
+
+-- Create a procedure that merges the rows captured by the stream into the search base table
+-- Reading the stream in a DML statement advances its offset, so each change is applied exactly once
+CREATE OR REPLACE PROCEDURE MED_DEVICE_TRANSCRIPTS.ANALYTICS.SYNC_TRANSCRIPT_ANALYSIS_RESULTS_TBL()
+RETURNS VARCHAR
+LANGUAGE SQL
+AS
+$$
+DECLARE
+    rows_inserted INT DEFAULT 0;
+    rows_updated INT DEFAULT 0;
+    rows_deleted INT DEFAULT 0;
+    usage_rows INT DEFAULT 0;
+    embedded_rows INT DEFAULT 0;
+    sync_time TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP();
+BEGIN
+    MERGE INTO MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL t
+    USING (
+        -- An updated row appears in the stream as a DELETE and an INSERT; keep the INSERT for each conversation_id
+        SELECT *
+        FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL_STREAM
+        QUALIFY ROW_NUMBER() OVER (
+            PARTITION BY conversation_id
+            ORDER BY IFF(METADATA$ACTION = 'INSERT', 0, 1)
+        ) = 1
+    ) s
+    ON t.conversation_id = s.conversation_id
+    WHEN MATCHED AND s.METADATA$ACTION = 'DELETE' THEN DELETE
+    -- Only touch rows whose values changed, so re-reading rows that are already in sync does not re-index them
+    WHEN MATCHED AND s.METADATA$ACTION = 'INSERT' AND HASH(
+        t.source, t.start_time, t.end_time, t.agent_name, t.customer_name, t.transcript,
+        t.transcript_summary, t.sentiment_score, t.sentiment_category, t.device_category, t.device_name, t.device_category_source,
+        t.main_issue_answer, t.main_issue_score, t.main_issue_confidence_level,
+        t.resolution, t.resolution_reason, t.service_rating, t.service_rating_reason
+    ) <> HASH(
+        s.source, s.start_time, s.end_time, s.agent_name, s.customer_name, s.transcript,
+        s.transcript_summary, s.sentiment_score, s.sentiment_category, s.device_category, s.device_name, s.device_category_source,
+        s.main_issue_answer, s.main_issue_score, s.main_issue_confidence_level,
+        s.resolution, s.resolution_reason, s.service_rating, s.service_rating_reason
+    ) THEN UPDATE SET
+        source = s.source,
+        start_time = s.start_time,
+        end_time = s.end_time,
+        agent_name = s.agent_name,
+        customer_name = s.customer_name,
+        transcript = s.transcript,
+        transcript_summary = s.transcript_summary,
+        sentiment_score = s.sentiment_score,
+        sentiment_category = s.sentiment_category,
+        device_category = s.device_category,
+        device_name = s.device_name,
+        device_category_source = s.device_category_source,
+        main_issue_answer = s.main_issue_answer,
+        main_issue_score = s.main_issue_score,
+        main_issue_confidence_level = s.main_issue_confidence_level,
+        resolution = s.resolution,
+        resolution_reason = s.resolution_reason,
+        service_rating = s.service_rating,
+        service_rating_reason = s.service_rating_reason,
+        synced_at = :sync_time
+    WHEN NOT MATCHED AND s.METADATA$ACTION = 'INSERT' THEN INSERT (
+        source, conversation_id, start_time, end_time, agent_name, customer_name, transcript,
+        transcript_summary, sentiment_score, sentiment_category, device_category, device_name, device_category_source,
+        main_issue_answer, main_issue_score, main_issue_confidence_level,
+        resolution, resolution_reason, service_rating, service_rating_reason, synced_at
+    ) VALUES (
+        s.source, s.conversation_id, s.start_time, s.end_time, s.agent_name, s.customer_name, s.transcript,
+        s.transcript_summary, s.sentiment_score, s.sentiment_category, s.device_category, s.device_name, s.device_category_source,
+        s.main_issue_answer, s.main_issue_score, s.main_issue_confidence_level,
+        s.resolution, s.resolution_reason, s.service_rating, s.service_rating_reason, :sync_time
+    );
+    
+    -- Read the per-action counts of the MERGE
+    SELECT "number of rows inserted", "number of rows updated", "number of rows deleted"
+    INTO :rows_inserted, :rows_updated, :rows_deleted
+    FROM TABLE(RESULT_SCAN(LAST_QUERY_ID()));
+    
+    -- Record the Cortex tokens of the conversations this sync inserted or changed, one row per function, model and
+    -- input; all rows of one sync share sync_time. An input that is already recorded for the conversation by this
+    -- pipeline is skipped
+    INSERT INTO MED_DEVICE_TRANSCRIPTS.ANALYTICS.CORTEX_TOKEN_USAGE
+        (conversation_id, function_name, model, call_count, input_hash, input_tokens, output_tokens, recorded_at, pipeline)
+    WITH synced AS (
+        SELECT
+            t.*,
+            MED_DEVICE_TRANSCRIPTS.ANALYTICS.FIT_TRANSCRIPT_TO_BUDGET(t.transcript, t.agent_name, t.customer_name, 500) as sentiment_input,
+            MED_DEVICE_TRANSCRIPTS.ANALYTICS.FIT_TRANSCRIPT_TO_BUDGET(t.transcript, t.agent_name, t.customer_name, 1800) as extract_answer_input
+        FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL t
+        WHERE t.synced_at = :sync_time
+    ),
+    usage AS (
+        -- The map calls of a chunked summary and the reduce call are counted in summarize_calls and the token columns
+        SELECT n.conversation_id, 'SUMMARIZE' as function_name, NULL as model, s.summarize_calls as call_count,
+            HASH(n.transcript) as input_hash, s.summarize_input_tokens as input_tokens,
+            s.map_output_tokens + SNOWFLAKE.CORTEX.COUNT_TOKENS('summarize', n.transcript_summary) as output_tokens
+        FROM synced n
+        JOIN MED_DEVICE_TRANSCRIPTS.ANALYTICS.transcript_summaries s ON s.conversation_id = n.conversation_id
+        UNION ALL
+        SELECT conversation_id, 'SENTIMENT', NULL, 1, HASH(sentiment_input),
+            SNOWFLAKE.CORTEX.COUNT_TOKENS('sentiment', sentiment_input), 0
+        FROM synced
+        UNION ALL
+        SELECT conversation_id, 'CLASSIFY_TEXT', NULL, 1, HASH(transcript),
+            SNOWFLAKE.CORTEX.COUNT_TOKENS('classify_text', transcript), 0
+        FROM synced
+        WHERE device_category_source = 'CLASSIFY_TEXT'
+        UNION ALL
+        SELECT conversation_id, 'EXTRACT_ANSWER', NULL, 1, HASH(extract_answer_input),
+            SNOWFLAKE.CORTEX.COUNT_TOKENS('extract_answer', extract_answer_input),
+            SNOWFLAKE.CORTEX.COUNT_TOKENS('extract_answer', COALESCE(main_issue_answer, ''))
+        FROM synced
+        UNION ALL
+        SELECT n.conversation_id, 'COMPLETE', c.model, COUNT(*), HASH_AGG(c.prompt_type, c.attempt_no, c.messages),
+            SUM(c.prompt_tokens), SUM(c.completion_tokens)
+        FROM synced n
+        JOIN MED_DEVICE_TRANSCRIPTS.ANALYTICS.complete_responses c ON c.conversation_id = n.conversation_id
+        GROUP BY n.conversation_id, c.model
+    )
+    SELECT u.conversation_id, u.function_name, u.model, u.call_count, u.input_hash, u.input_tokens, u.output_tokens, :sync_time, 'EAGER'
+    FROM usage u
+    WHERE NOT EXISTS (
+        SELECT 1
+        FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.CORTEX_TOKEN_USAGE x
+        WHERE x.pipeline = 'EAGER'
+        AND x.conversation_id = u.conversation_id
+        AND x.function_name = u.function_name
+        AND EQUAL_NULL(x.model, u.model)
+        AND x.input_hash = u.input_hash
+    );
+    
+    usage_rows := SQLROWCOUNT;
+    
+    -- Embed the transcripts that are new or whose text changed since they were embedded. Only the rows this sync
+    -- inserted or changed are read (a changed transcript re-stamps synced_at), so the cost follows the new rows
+    MERGE INTO MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_EMBEDDINGS e
+    USING (
+        SELECT t.conversation_id, t.agent_name, t.customer_name, t.transcript, HASH(t.transcript) as transcript_hash
+        FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL t
+        WHERE t.synced_at = :sync_time
+        AND NOT EXISTS (
+            SELECT 1
+            FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_EMBEDDINGS x
+            WHERE x.conversation_id = t.conversation_id
+            AND x.transcript_hash = HASH(t.transcript)
+        )
+    ) s
+    ON e.conversation_id = s.conversation_id
+    WHEN MATCHED THEN UPDATE SET
+        model = 'snowflake-arctic-embed-m-v1.5',
+        transcript_hash = s.transcript_hash,
+        embedding = SNOWFLAKE.CORTEX.EMBED_TEXT_768('snowflake-arctic-embed-m-v1.5',
+            MED_DEVICE_TRANSCRIPTS.ANALYTICS.FIT_TRANSCRIPT_TO_BUDGET(s.transcript, s.agent_name, s.customer_name, 512)),
+        embedded_at = :sync_time
+    WHEN NOT MATCHED THEN INSERT (conversation_id, model, transcript_hash, embedding, embedded_at)
+    VALUES (
+        s.conversation_id,
+        'snowflake-arctic-embed-m-v1.5',
+        s.transcript_hash,
+        SNOWFLAKE.CORTEX.EMBED_TEXT_768('snowflake-arctic-embed-m-v1.5',
+            MED_DEVICE_TRANSCRIPTS.ANALYTICS.FIT_TRANSCRIPT_TO_BUDGET(s.transcript, s.agent_name, s.customer_name, 512)),
+        :sync_time
+    );
+    
+    embedded_rows := SQLROWCOUNT;
+    
+    -- Record the tokens of the embeddings this sync computed; EMBED_TEXT_768 only reads tokens
+    INSERT INTO MED_DEVICE_TRANSCRIPTS.ANALYTICS.CORTEX_TOKEN_USAGE
+        (conversation_id, function_name, model, call_count, input_hash, input_tokens, output_tokens, recorded_at, pipeline)
+    SELECT
+        e.conversation_id, 'EMBED_TEXT_768', e.model, 1, e.transcript_hash,
+        SNOWFLAKE.CORTEX.COUNT_TOKENS(e.model,
+            MED_DEVICE_TRANSCRIPTS.ANALYTICS.FIT_TRANSCRIPT_TO_BUDGET(t.transcript, t.agent_name, t.customer_name, 512)),
+        0, :sync_time, 'EAGER'
+    FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_EMBEDDINGS e
+    JOIN MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL t ON t.conversation_id = e.conversation_id
+    WHERE e.embedded_at = :sync_time
+    AND NOT EXISTS (
+        SELECT 1
+        FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.CORTEX_TOKEN_USAGE x
+        WHERE x.pipeline = 'EAGER'
+        AND x.conversation_id = e.conversation_id
+        AND x.function_name = 'EMBED_TEXT_768'
+        AND x.input_hash = e.transcript_hash
+    );
+    
+    usage_rows := usage_rows + SQLROWCOUNT;
+    
+    RETURN 'Synced TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL: ' || rows_inserted || ' inserted, ' || rows_updated || ' updated, ' || rows_deleted || ' deleted, '
+        || usage_rows || ' token usage rows recorded, ' || embedded_rows || ' transcripts embedded';
+END;
+$$;
+
+-- Create a task that runs the sync every minute, but only when the stream has new rows
+-- The WHEN condition is evaluated without starting the warehouse, so an idle pipeline costs nothing
+CREATE OR REPLACE TASK MED_DEVICE_TRANSCRIPTS.ANALYTICS.SYNC_TRANSCRIPT_ANALYSIS_RESULTS_TBL_TASK
+    WAREHOUSE = CORTEX_DEMO_WH
+    SCHEDULE = '1 MINUTE'
+    WHEN SYSTEM$STREAM_HAS_DATA('MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL_STREAM')
+AS
+    CALL MED_DEVICE_TRANSCRIPTS.ANALYTICS.SYNC_TRANSCRIPT_ANALYSIS_RESULTS_TBL();
+
+-- Run the first sync now to load the existing rows, then resume the task to keep the table up to date
+CALL MED_DEVICE_TRANSCRIPTS.ANALYTICS.SYNC_TRANSCRIPT_ANALYSIS_RESULTS_TBL();
+
+ALTER TASK MED_DEVICE_TRANSCRIPTS.ANALYTICS.SYNC_TRANSCRIPT_ANALYSIS_RESULTS_TBL_TASK RESUME;
+
+-- Suspend the task
+-- ALTER TASK MED_DEVICE_TRANSCRIPTS.ANALYTICS.SYNC_TRANSCRIPT_ANALYSIS_RESULTS_TBL_TASK SUSPEND;
+
+-- Find the calls most similar to one call in SQL (an exact scan of every embedding; the Record Viewer searches an
+-- in-memory index instead)
+SELECT
+  e.conversation_id,
+  VECTOR_COSINE_SIMILARITY(e.embedding, q.embedding) as similarity,
+  r.main_issue_answer,
+  r.transcript_summary
+FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_EMBEDDINGS e
+JOIN MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_EMBEDDINGS q
+  ON q.conversation_id = (SELECT MIN(conversation_id) FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_EMBEDDINGS)
+JOIN MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL r
+  ON r.conversation_id = e.conversation_id
+WHERE e.conversation_id <> q.conversation_id
+ORDER BY similarity DESC
+LIMIT 5;
+
+-- Estimated Cortex credits per function and model
+SELECT
+  function_name,
+  model,
+  COUNT(DISTINCT conversation_id) as conversations,
+  SUM(input_tokens) as input_tokens,
+  SUM(output_tokens) as output_tokens,
+  ROUND(SUM(estimated_credits), 4) as estimated_credits,
+  ROUND(SUM(estimated_credits) / COUNT(DISTINCT conversation_id), 6) as credits_per_conversation
+FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.CORTEX_TOKEN_COSTS
+GROUP BY function_name, model
+ORDER BY estimated_credits DESC;
+
+-- Estimated Cortex credits per day
+SELECT
+  DATE_TRUNC('day', recorded_at) as day,
+  COUNT(DISTINCT conversation_id) as conversations,
+  ROUND(SUM(estimated_credits), 4) as estimated_credits
+FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.CORTEX_TOKEN_COSTS
+GROUP BY day
+ORDER BY day;
@@ -8,67 +8,37 @@ USE ROLE ACCOUNTADMIN;
 USE DATABASE MED_DEVICE_TRANSCRIPTS;
 USE SCHEMA ANALYTICS;
 
--- Show top 10 records from RAW_JSON_DATA_INITIAL
+-- Show top 10 records loaded from the initial JSON file
 SELECT TOP 10 *
-FROM RAW_JSON_DATA_INITIAL
-ORDER BY 2;
+FROM RAW_TRANSCRIPTS
+WHERE source = 'INITIAL'
+ORDER BY conversation_id;
 
--- Show top 10 records from RAW_JSON_DATA_NEW
+-- Show top 10 records loaded from the new JSON files
 SELECT TOP 10 *
-FROM RAW_JSON_DATA_NEW
-ORDER BY 2;
+FROM RAW_TRANSCRIPTS
+WHERE source = 'NEW'
+ORDER BY file_load_time DESC;
 
--- Create dynamic table that combines RAW_JSON_DATA_INITIAL and RAW_JSON_DATA_NEW
-CREATE OR REPLACE DYNAMIC TABLE combined_raw_json_data
-  TARGET_LAG = 'DOWNSTREAM'
-  WAREHOUSE = CORTEX_DEMO_WH
-  REFRESH_MODE = 'AUTO'
-AS
-    SELECT 
-        'INITIAL' as source,
-        *
-        FROM RAW_JSON_DATA_INITIAL
-        UNION ALL
-        SELECT 
-        'NEW' as source,
-        *
-    FROM RAW_JSON_DATA_NEW;
-
--- Show records from the new dynamic table
-SELECT * 
-FROM combined_raw_json_data
-LIMIT 20;
+-- The combined_raw_json_data and parsed_transcripts dynamic tables used to union the VARIANT tables and parse the
+-- JSON on every refresh. RAW_TRANSCRIPTS is already typed and deduplicated on conversation_id at load time,
+-- so both layers are replaced by a view
+DROP DYNAMIC TABLE IF EXISTS combined_raw_json_data;
+DROP DYNAMIC TABLE IF EXISTS parsed_transcripts;
 
--- Parse transcript JSON data using dot notation
-SELECT
-  source,
-  JSON_DATA:agent_name::STRING as agent_name,
-  JSON_DATA:customer_name::STRING as customer_name,
-  JSON_DATA:conversation_id::NUMBER as conversation_id,
-  JSON_DATA:start_time::TIMESTAMP_NTZ as start_time,
-  JSON_DATA:end_time::TIMESTAMP_NTZ as end_time,
-  --DATEDIFF('minute', JSON_DATA:start_time::TIMESTAMP_NTZ, JSON_DATA:end_time::TIMESTAMP_NTZ) as conversation_duration_minutes,
-  JSON_DATA:transcript::STRING as transcript
-FROM combined_raw_json_data
-LIMIT 50;
-
--- Create a parsed transcript dynamic table
-CREATE OR REPLACE DYNAMIC TABLE parsed_transcripts
-  TARGET_LAG = 'DOWNSTREAM'
-  WAREHOUSE = CORTEX_DEMO_WH
-  REFRESH_MODE = 'AUTO'
-AS
+-- Create a parsed transcript view over the typed table
+CREATE OR REPLACE VIEW parsed_transcripts AS
 SELECT
   source,
-  JSON_DATA:conversation_id::NUMBER as conversation_id,
-  JSON_DATA:start_time::TIMESTAMP_NTZ as start_time,
-  JSON_DATA:end_time::TIMESTAMP_NTZ as end_time,
-  JSON_DATA:agent_name::STRING as agent_name,
-  JSON_DATA:customer_name::STRING as customer_name,
-  JSON_DATA:transcript::STRING as transcript
-FROM combined_raw_json_data;
+  conversation_id,
+  start_time,
+  end_time,
+  agent_name,
+  customer_name,
+  transcript
+FROM RAW_TRANSCRIPTS;
 
--- Show 10 records from the parsed_transcripts dynamic table
+-- Show 10 records from the parsed_transcripts view
 SELECT
   source,
   conversation_id,
@@ -80,3 +50,96 @@ SELECT
 FROM parsed_transcripts
 LIMIT 10;
 
+-- Create a function that splits a transcript into an array of speaker turns
+-- The parser is a single regular expression pass in Python (Python_Pipeline/turn_parser.py), so no LLM is involved.
+-- It returns an ARRAY rather than rows so the dynamic table below can use LATERAL FLATTEN and refresh incrementally
+CREATE OR REPLACE FUNCTION MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_TURNS(
+    TRANSCRIPT VARCHAR,
+    AGENT_NAME VARCHAR,
+    CUSTOMER_NAME VARCHAR
+)
+RETURNS ARRAY
+LANGUAGE PYTHON
+RUNTIME_VERSION = '3.11'
+IMMUTABLE
+IMPORTS = (
+    '@MED_DEVICE_TRANSCRIPTS.PUBLIC.GITHUB_REPO_MED_DEVICE_TRANSCRIPTS/branches/main/Python_Pipeline/turn_parser.py',
+    '@MED_DEVICE_TRANSCRIPTS.PUBLIC.GITHUB_REPO_MED_DEVICE_TRANSCRIPTS/branches/main/Python_Pipeline/transcript_io.py'
+)
+HANDLER = 'turn_parser.udf_turns';
+
+-- Create a Dynamic Table with one row per speaker turn
+-- Transcripts are parsed once when they arrive; offset_seconds is relative to the first timestamp of the transcript
+-- and is NULL for transcripts without timestamps
+CREATE OR REPLACE DYNAMIC TABLE transcript_turns
+  TARGET_LAG = 'DOWNSTREAM'
+  WAREHOUSE = CORTEX_DEMO_WH
+  REFRESH_MODE = 'AUTO'
+AS
+SELECT
+  p.conversation_id,
+  t.value:turn_no::INT as turn_no,
+  t.value:speaker::VARCHAR as speaker,
+  t.value:speaker_label::VARCHAR as speaker_label,
+  t.value:char_offset::INT as char_offset,
+  t.value:offset_seconds::INT as offset_seconds,
+  t.value:turn_text::VARCHAR as turn_text
+FROM parsed_transcripts p,
+  LATERAL FLATTEN(input => TRANSCRIPT_TURNS(p.transcript, p.agent_name, p.customer_name)) t;
+
+-- Create a Dynamic Table of conversation features computed from the turns without any inference
+-- response_gap_seconds is the time between a customer turn and the agent turn that answers it
+CREATE OR REPLACE DYNAMIC TABLE conversation_features
+  TARGET_LAG = '1 MINUTE'
+  WAREHOUSE = CORTEX_DEMO_WH
+  REFRESH_MODE = 'AUTO'
+AS
+WITH turns AS (
+  SELECT
+    conversation_id,
+    turn_no,
+    speaker,
+    offset_seconds,
+    REGEXP_COUNT(turn_text, '\\S+') as word_count,
+    LEAD(speaker) OVER (PARTITION BY conversation_id ORDER BY turn_no) as next_speaker,
+    LEAD(offset_seconds) OVER (PARTITION BY conversation_id ORDER BY turn_no) as next_offset_seconds,
+    ROW_NUMBER() OVER (PARTITION BY conversation_id ORDER BY turn_no DESC) as turns_from_end
+  FROM transcript_turns
+)
+SELECT
+  conversation_id,
+  COUNT(*) as turn_count,
+  COUNT_IF(speaker = 'AGENT') as agent_turns,
+  COUNT_IF(speaker = 'CUSTOMER') as customer_turns,
+  SUM(IFF(speaker = 'AGENT', word_count, 0)) as agent_words,
+  SUM(IFF(speaker = 'CUSTOMER', word_count, 0)) as customer_words,
+  ROUND(
+    SUM(IFF(speaker = 'AGENT', word_count, 0)) / NULLIF(SUM(IFF(speaker IN ('AGENT', 'CUSTOMER'), word_count, 0)), 0), 3
+  ) as agent_talk_ratio,
+  BOOLOR_AGG(turns_from_end = 1 AND speaker = 'CUSTOMER') as customer_last_word,
+  COUNT(offset_seconds) > 0 as has_timestamps,
+  ROUND(AVG(IFF(speaker = 'CUSTOMER' AND next_speaker = 'AGENT', next_offset_seconds - offset_seconds, NULL)), 1) as avg_response_gap_seconds,
+  MAX(IFF(speaker = 'CUSTOMER' AND next_speaker = 'AGENT', next_offset_seconds - offset_seconds, NULL)) as max_response_gap_seconds
+FROM turns
+GROUP BY conversation_id;
+
+-- Show the turns of a few conversations
+SELECT *
+FROM transcript_turns
+ORDER BY conversation_id, turn_no
+LIMIT 20;
+
+-- Show the conversation features
+SELECT *
+FROM conversation_features
+ORDER BY conversation_id
+LIMIT 10;
+
+-- Rebuild a shorter LLM input with only the customer turns, e.g. to ask what the customer's issue is
+SELECT
+  conversation_id,
+  LISTAGG(turn_text, '\n') WITHIN GROUP (ORDER BY turn_no) as customer_text
+FROM transcript_turns
+WHERE speaker = 'CUSTOMER'
+GROUP BY conversation_id
+LIMIT 10;
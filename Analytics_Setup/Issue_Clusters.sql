@@ -0,0 +1,177 @@
+-- Issue_Clusters.sql
+-- SQL script for the main issue clusters: precomputed topic clusters of main_issue_answer for "top issues" charts
+
+-- Set Context to ACCOUNTADMIN
+USE ROLE ACCOUNTADMIN;
+
+-- Setting Context
+USE DATABASE MED_DEVICE_TRANSCRIPTS;
+USE SCHEMA ANALYTICS;
+
+/* main_issue_answer (EXTRACT_ANSWER) is free text, so the same problem is worded differently in every call and can not
+be charted with a group by. Categorizing each issue with COMPLETE would cost one LLM call per transcript. Instead:
+- the batch job Python_Pipeline/issue_clusters.py embeds the main issues (EMBED_TEXT_768), clusters them with
+  mini-batch k-means, labels all clusters with a single COMPLETE call and writes ISSUE_CLUSTERS and
+  TRANSCRIPT_ISSUE_CLUSTERS
+- ASSIGN_ISSUE_CLUSTERS assigns the main issues of new calls, and of calls whose main issue changed, to the nearest
+  centroid after every sync, without reclustering or LLM calls
+- TRANSCRIPT_ISSUES has one row per call with its issue label, so a "top issues" chart is a plain group by
+Run the batch job again to recluster when new kinds of issues appear (the assigned similarity drops).
+This script uses TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL and its sync task, created in Cortex_Analysis.sql */
+
+-- Create the cluster table: one row per cluster with its label, example issues and centroid
+CREATE TABLE IF NOT EXISTS MED_DEVICE_TRANSCRIPTS.ANALYTICS.ISSUE_CLUSTERS (
+    ISSUE_CLUSTER NUMBER,
+    LABEL VARCHAR,
+    EXAMPLES ARRAY,
+    CENTROID VECTOR(FLOAT, 768),
+    MODEL VARCHAR,
+    CLUSTERED_AT TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP()
+);
+
+-- Create the assignment table: the cluster of each call and the cosine similarity of its main issue to the centroid
+CREATE TABLE IF NOT EXISTS MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ISSUE_CLUSTERS (
+    CONVERSATION_ID NUMBER,
+    ISSUE_CLUSTER NUMBER,
+    SIMILARITY FLOAT,
+    ASSIGNED_AT TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP(),
+    ISSUE_HASH NUMBER
+);
+
+-- Add the columns introduced after the table was first created
+-- HASH(main_issue_answer) of the assigned issue, so a call whose main issue changed is assigned again
+ALTER TABLE MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ISSUE_CLUSTERS ADD COLUMN IF NOT EXISTS issue_hash NUMBER;
+
+-- Create a view with the issue label of each call
+CREATE OR REPLACE VIEW MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ISSUES AS
+SELECT
+  a.conversation_id,
+  a.issue_cluster,
+  c.label as issue_label,
+  a.similarity as issue_similarity,
+  a.assigned_at
+FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ISSUE_CLUSTERS a
+JOIN MED_DEVICE_TRANSCRIPTS.ANALYTICS.ISSUE_CLUSTERS c ON c.issue_cluster = a.issue_cluster;
+
+-- Create a procedure that assigns the main issues without a cluster, or whose text changed, to the nearest centroid
+-- Each new main issue is embedded once and its tokens are recorded in CORTEX_TOKEN_USAGE (created in
+-- Cortex_Analysis.sql) like the transcript embeddings of the sync; nothing is assigned until the batch job has written
+-- the clusters
+CREATE OR REPLACE PROCEDURE MED_DEVICE_TRANSCRIPTS.ANALYTICS.ASSIGN_ISSUE_CLUSTERS()
+RETURNS VARCHAR
+LANGUAGE SQL
+AS
+$$
+DECLARE
+    rows_assigned INT DEFAULT 0;
+    usage_rows INT DEFAULT 0;
+    assign_time TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP();
+BEGIN
+    CREATE OR REPLACE TEMPORARY TABLE new_issue_embeddings AS
+    SELECT
+        r.conversation_id,
+        r.main_issue_answer,
+        HASH(r.main_issue_answer) as issue_hash,
+        SNOWFLAKE.CORTEX.EMBED_TEXT_768('snowflake-arctic-embed-m-v1.5', r.main_issue_answer) as embedding
+    FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL r
+    WHERE r.main_issue_answer IS NOT NULL
+    AND r.main_issue_answer <> ''
+    AND NOT EXISTS (
+        SELECT 1
+        FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ISSUE_CLUSTERS a
+        WHERE a.conversation_id = r.conversation_id
+        AND a.issue_hash = HASH(r.main_issue_answer)
+    )
+    -- Only embed when there are clusters to assign to
+    AND EXISTS (SELECT 1 FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.ISSUE_CLUSTERS);
+
+    MERGE INTO MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ISSUE_CLUSTERS a
+    USING (
+        SELECT
+            n.conversation_id,
+            n.issue_hash,
+            c.issue_cluster,
+            VECTOR_COSINE_SIMILARITY(n.embedding, c.centroid) as similarity
+        FROM new_issue_embeddings n
+        CROSS JOIN MED_DEVICE_TRANSCRIPTS.ANALYTICS.ISSUE_CLUSTERS c
+        QUALIFY ROW_NUMBER() OVER (
+            PARTITION BY n.conversation_id
+            ORDER BY VECTOR_COSINE_SIMILARITY(n.embedding, c.centroid) DESC
+        ) = 1
+    ) n
+    ON a.conversation_id = n.conversation_id
+    WHEN MATCHED THEN UPDATE SET
+        issue_cluster = n.issue_cluster,
+        similarity = n.similarity,
+        issue_hash = n.issue_hash,
+        assigned_at = :assign_time
+    WHEN NOT MATCHED THEN INSERT (conversation_id, issue_cluster, similarity, assigned_at, issue_hash)
+        VALUES (n.conversation_id, n.issue_cluster, n.similarity, :assign_time, n.issue_hash);
+
+    rows_assigned := SQLROWCOUNT;
+
+    -- Record the tokens of the embeddings; EMBED_TEXT_768 only reads tokens. An issue already recorded for the
+    -- conversation is skipped
+    INSERT INTO MED_DEVICE_TRANSCRIPTS.ANALYTICS.CORTEX_TOKEN_USAGE
+        (conversation_id, function_name, model, call_count, input_hash, input_tokens, output_tokens, recorded_at, pipeline)
+    SELECT
+        n.conversation_id, 'EMBED_TEXT_768', 'snowflake-arctic-embed-m-v1.5', 1, n.issue_hash,
+        SNOWFLAKE.CORTEX.COUNT_TOKENS('snowflake-arctic-embed-m-v1.5', n.main_issue_answer),
+        0, :assign_time, 'EAGER'
+    FROM new_issue_embeddings n
+    WHERE NOT EXISTS (
+        SELECT 1
+        FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.CORTEX_TOKEN_USAGE x
+        WHERE x.pipeline = 'EAGER'
+        AND x.conversation_id = n.conversation_id
+        AND x.function_name = 'EMBED_TEXT_768'
+        AND x.input_hash = n.issue_hash
+    );
+
+    usage_rows := SQLROWCOUNT;
+
+    DROP TABLE IF EXISTS new_issue_embeddings;
+
+    RETURN 'Assigned ' || rows_assigned || ' main issues to issue clusters, ' || usage_rows || ' token usage rows recorded';
+END;
+$$;
+
+-- Create a task that assigns the new calls after each sync of the search base table
+-- A task can only be added to a running task graph while its root task is suspended
+ALTER TASK MED_DEVICE_TRANSCRIPTS.ANALYTICS.SYNC_TRANSCRIPT_ANALYSIS_RESULTS_TBL_TASK SUSPEND;
+
+CREATE OR REPLACE TASK MED_DEVICE_TRANSCRIPTS.ANALYTICS.ASSIGN_ISSUE_CLUSTERS_TASK
+    WAREHOUSE = CORTEX_DEMO_WH
+    AFTER MED_DEVICE_TRANSCRIPTS.ANALYTICS.SYNC_TRANSCRIPT_ANALYSIS_RESULTS_TBL_TASK
+AS
+    CALL MED_DEVICE_TRANSCRIPTS.ANALYTICS.ASSIGN_ISSUE_CLUSTERS();
+
+ALTER TASK MED_DEVICE_TRANSCRIPTS.ANALYTICS.ASSIGN_ISSUE_CLUSTERS_TASK RESUME;
+ALTER TASK MED_DEVICE_TRANSCRIPTS.ANALYTICS.SYNC_TRANSCRIPT_ANALYSIS_RESULTS_TBL_TASK RESUME;
+
+-- Suspend the task
+-- ALTER TASK MED_DEVICE_TRANSCRIPTS.ANALYTICS.ASSIGN_ISSUE_CLUSTERS_TASK SUSPEND;
+
+-- After running the batch job (python issue_clusters.py --snowflake --clusters 20), assign any calls synced since
+CALL MED_DEVICE_TRANSCRIPTS.ANALYTICS.ASSIGN_ISSUE_CLUSTERS();
+
+-- Top issues: calls, share and average similarity per cluster
+SELECT
+  issue_label,
+  COUNT(*) as calls,
+  ROUND(100 * RATIO_TO_REPORT(COUNT(*)) OVER (), 1) as pct_calls,
+  ROUND(AVG(issue_similarity), 3) as avg_similarity
+FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ISSUES
+GROUP BY issue_label
+ORDER BY calls DESC;
+
+-- Calls assigned after the clustering with a low similarity to their centroid; many of them mean it is time to recluster
+SELECT
+  i.issue_label,
+  i.issue_similarity,
+  r.main_issue_answer
+FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ISSUES i
+JOIN MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL r ON r.conversation_id = i.conversation_id
+WHERE i.assigned_at > (SELECT MAX(clustered_at) FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.ISSUE_CLUSTERS)
+ORDER BY i.issue_similarity
+LIMIT 20;
@@ -20,46 +20,162 @@ CREATE OR REPLACE WAREHOUSE CORTEX_DEMO_WH
     AUTO_SUSPEND = 600
     AUTO_RESUME = TRUE;
 
---Create a table to store the JSON files created the initial data creation
-CREATE OR REPLACE TABLE MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_JSON_DATA_INITIAL (
+-- Create a typed table that holds one row per conversation from both the initial and the new JSON files
+-- The columns are projected from the JSON records while the files are loaded, so downstream tables do not have to
+-- store the whole record as a VARIANT and parse it again on every refresh
+CREATE OR REPLACE TABLE MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_TRANSCRIPTS (
+    SOURCE VARCHAR(10),
+    CONVERSATION_ID NUMBER,
+    START_TIME TIMESTAMP_NTZ,
+    END_TIME TIMESTAMP_NTZ,
+    AGENT_NAME VARCHAR(100),
+    CUSTOMER_NAME VARCHAR(100),
+    TRANSCRIPT VARCHAR(20000),
     FILE_NAME VARCHAR,
-    FILE_LOAD_TIME TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
-    JSON_DATA VARIANT
+    FILE_LOAD_TIME TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
 );
 
--- Copy the initial JSON file into the a table
-COPY INTO "MED_DEVICE_TRANSCRIPTS"."ANALYTICS"."RAW_JSON_DATA_INITIAL" 
+-- Create a transient staging table with the same columns that COPY INTO writes to before the rows are merged
+CREATE OR REPLACE TRANSIENT TABLE MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_TRANSCRIPTS_STAGING
+    LIKE MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_TRANSCRIPTS;
+
+-- Create a procedure that merges the staged rows into RAW_TRANSCRIPTS, keeping one row per conversation_id
+-- A conversation that is loaded again only updates the existing row when its content changed, so reloading a file
+-- does not trigger new Cortex calls downstream
+-- The staging table is shared by the task and the pipeline procedure, so the procedure only merges and deletes the
+-- files it saw when it started; rows that another COPY commits in the meantime are left for the next call
+CREATE OR REPLACE PROCEDURE MED_DEVICE_TRANSCRIPTS.ANALYTICS.MERGE_STAGED_TRANSCRIPTS()
+RETURNS VARCHAR
+LANGUAGE SQL
+AS
+$$
+DECLARE
+    files_staged INT;
+    rows_staged INT;
+    rows_merged INT;
+BEGIN
+    -- Each file is loaded by exactly one COPY, so its file name identifies a complete set of committed rows
+    CREATE OR REPLACE TEMPORARY TABLE MERGE_STAGED_FILES AS
+    SELECT FILE_NAME, COUNT(*) AS ROWS_STAGED
+    FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_TRANSCRIPTS_STAGING
+    GROUP BY FILE_NAME;
+    
+    SELECT COUNT(*), COALESCE(SUM(ROWS_STAGED), 0) INTO :files_staged, :rows_staged
+    FROM MERGE_STAGED_FILES;
+    
+    BEGIN TRANSACTION;
+    
+    MERGE INTO MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_TRANSCRIPTS t
+    USING (
+        -- Keep the most recently loaded record for each conversation_id in the staged files
+        SELECT *
+        FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_TRANSCRIPTS_STAGING
+        WHERE CONVERSATION_ID IS NOT NULL
+        AND FILE_NAME IN (SELECT FILE_NAME FROM MERGE_STAGED_FILES)
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY CONVERSATION_ID ORDER BY FILE_LOAD_TIME DESC, FILE_NAME DESC) = 1
+    ) s
+    ON t.CONVERSATION_ID = s.CONVERSATION_ID
+    WHEN MATCHED AND (
+        t.TRANSCRIPT IS DISTINCT FROM s.TRANSCRIPT
+        OR t.START_TIME IS DISTINCT FROM s.START_TIME
+        OR t.END_TIME IS DISTINCT FROM s.END_TIME
+        OR t.AGENT_NAME IS DISTINCT FROM s.AGENT_NAME
+        OR t.CUSTOMER_NAME IS DISTINCT FROM s.CUSTOMER_NAME
+    ) THEN UPDATE SET
+        SOURCE = s.SOURCE,
+        START_TIME = s.START_TIME,
+        END_TIME = s.END_TIME,
+        AGENT_NAME = s.AGENT_NAME,
+        CUSTOMER_NAME = s.CUSTOMER_NAME,
+        TRANSCRIPT = s.TRANSCRIPT,
+        FILE_NAME = s.FILE_NAME,
+        FILE_LOAD_TIME = s.FILE_LOAD_TIME
+    WHEN NOT MATCHED THEN INSERT (
+        SOURCE, CONVERSATION_ID, START_TIME, END_TIME, AGENT_NAME, CUSTOMER_NAME, TRANSCRIPT, FILE_NAME, FILE_LOAD_TIME
+    ) VALUES (
+        s.SOURCE, s.CONVERSATION_ID, s.START_TIME, s.END_TIME, s.AGENT_NAME, s.CUSTOMER_NAME, s.TRANSCRIPT, s.FILE_NAME, s.FILE_LOAD_TIME
+    );
+    rows_merged := SQLROWCOUNT;
+    
+    -- Delete only the merged files in the same transaction (TRUNCATE would commit it and also drop rows that another
+    -- COPY staged after the merge started), so a failed merge leaves the rows in place for the next load
+    DELETE FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_TRANSCRIPTS_STAGING
+    WHERE FILE_NAME IN (SELECT FILE_NAME FROM MERGE_STAGED_FILES);
+    
+    COMMIT;
+    
+    DROP TABLE IF EXISTS MERGE_STAGED_FILES;
+    
+    RETURN 'Loaded ' || rows_staged || ' rows from ' || files_staged || ' new file(s), ' || rows_merged || ' inserted or updated';
+EXCEPTION
+    WHEN OTHER THEN
+        ROLLBACK;
+        RAISE;
+END;
+$$;
+
+-- Copy the initial JSON file into the staging table, projecting the typed columns during the load
+COPY INTO "MED_DEVICE_TRANSCRIPTS"."ANALYTICS"."RAW_TRANSCRIPTS_STAGING" 
 FROM (SELECT 
+    'INITIAL',
+    $1:conversation_id::NUMBER,
+    $1:start_time::TIMESTAMP_NTZ,
+    $1:end_time::TIMESTAMP_NTZ,
+    $1:agent_name::STRING,
+    $1:customer_name::STRING,
+    $1:transcript::STRING,
     METADATA$FILENAME,
-    CURRENT_TIMESTAMP(),
-    $1::VARIANT
+    CURRENT_TIMESTAMP()
     FROM '@"MED_DEVICE_TRANSCRIPTS"."DATA_PREP"."CALL_DATA_INITIAL"') 
 FILE_FORMAT = '"MED_DEVICE_TRANSCRIPTS"."ANALYTICS"."JSON_GZ_FORMAT"' 
 ON_ERROR=ABORT_STATEMENT 
  ;
 
+-- Merge the initial records into the typed table
+CALL MED_DEVICE_TRANSCRIPTS.ANALYTICS.MERGE_STAGED_TRANSCRIPTS();
 
---Create a table to store the new JSON files that are being created in the LIVE data flow
-CREATE OR REPLACE TABLE MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_JSON_DATA_NEW (
-    FILE_NAME VARCHAR,
-    FILE_LOAD_TIME TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
-    JSON_DATA VARIANT
-);
+-- The VARIANT tables used by earlier versions of this script are replaced by RAW_TRANSCRIPTS
+DROP TABLE IF EXISTS MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_JSON_DATA_INITIAL;
+DROP TABLE IF EXISTS MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_JSON_DATA_NEW;
 
--- Create a task to load new JSON files every 15 seconds
-CREATE OR REPLACE TASK MED_DEVICE_TRANSCRIPTS.ANALYTICS.LOAD_JSON_FILES_NEW
-    WAREHOUSE = CORTEX_DEMO_WH
-    SCHEDULE = '15 seconds'
+-- Create a procedure that loads any new JSON files from the CALL_DATA_NEW stage
+-- COPY INTO skips files that have already been loaded, so the procedure can be called as often as needed
+-- and is shared by the scheduled task and the pipeline procedure below
+CREATE OR REPLACE PROCEDURE MED_DEVICE_TRANSCRIPTS.ANALYTICS.LOAD_NEW_JSON_FILES()
+RETURNS VARCHAR
+LANGUAGE SQL
 AS
-    COPY INTO "MED_DEVICE_TRANSCRIPTS"."ANALYTICS"."RAW_JSON_DATA_NEW" 
+$$
+BEGIN
+    COPY INTO "MED_DEVICE_TRANSCRIPTS"."ANALYTICS"."RAW_TRANSCRIPTS_STAGING" 
     FROM (SELECT 
+        'NEW',
+        $1:conversation_id::NUMBER,
+        $1:start_time::TIMESTAMP_NTZ,
+        $1:end_time::TIMESTAMP_NTZ,
+        $1:agent_name::STRING,
+        $1:customer_name::STRING,
+        $1:transcript::STRING,
         METADATA$FILENAME,
-        CURRENT_TIMESTAMP(),
-        $1::VARIANT
+        CURRENT_TIMESTAMP()
         FROM '@"MED_DEVICE_TRANSCRIPTS"."DATA_PREP"."CALL_DATA_NEW"') 
     FILE_FORMAT = '"MED_DEVICE_TRANSCRIPTS"."ANALYTICS"."JSON_GZ_FORMAT"' 
-    ON_ERROR=ABORT_STATEMENT 
- ;
+    ON_ERROR=ABORT_STATEMENT;
+    
+    -- Merge the new records into the typed table and report what was loaded
+    RETURN (CALL MED_DEVICE_TRANSCRIPTS.ANALYTICS.MERGE_STAGED_TRANSCRIPTS());
+END;
+$$;
+
+-- Create a task to load new JSON files every 15 seconds
+-- The pipeline procedure below loads its own files synchronously, so the task is only needed for files that arrive
+-- from other sources. Python_Pipeline/ingestion_service.py replaces it with an event-driven loader that only uses the
+-- warehouse when files arrive; keep the task suspended while the service runs
+CREATE OR REPLACE TASK MED_DEVICE_TRANSCRIPTS.ANALYTICS.LOAD_JSON_FILES_NEW
+    WAREHOUSE = CORTEX_DEMO_WH
+    SCHEDULE = '15 seconds'
+AS
+    CALL MED_DEVICE_TRANSCRIPTS.ANALYTICS.LOAD_NEW_JSON_FILES();
 
 
 -- Resume the task to start processing
@@ -74,7 +190,9 @@ ALTER TASK MED_DEVICE_TRANSCRIPTS.ANALYTICS.LOAD_JSON_FILES_NEW SUSPEND;
 -- Example with explicit execution count
 -- CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.PROCESS_CONVERSATIONS_BATCH(5);
 
--- Create a stored procedure to manage the task and batch processing
+-- Create a stored procedure to generate new transcripts and load them
+-- Instead of resuming the task and waiting a fixed 16 seconds for it to pick up the last file, the procedure loads the
+-- files it just exported synchronously and refreshes the analysis table, so it returns as soon as the data is queryable
 CREATE OR REPLACE PROCEDURE MED_DEVICE_TRANSCRIPTS.ANALYTICS.RUN_NEW_TRANSCRIPT_PIPELINE()
     RETURNS STRING
     LANGUAGE JAVASCRIPT
@@ -82,31 +200,34 @@ CREATE OR REPLACE PROCEDURE MED_DEVICE_TRANSCRIPTS.ANALYTICS.RUN_NEW_TRANSCRIPT_
 AS
 $$
     try {
-        // Resume the task
-        var resume_stmt = snowflake.createStatement({
-            sqlText: "ALTER TASK MED_DEVICE_TRANSCRIPTS.ANALYTICS.LOAD_JSON_FILES_NEW RESUME;"
-        });
-        resume_stmt.execute();
-        
         // Call the batch processing with 3 iterations
         var batch_stmt = snowflake.createStatement({
             sqlText: "CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.PROCESS_CONVERSATIONS_BATCH(3);"
         });
         batch_stmt.execute();
         
-        // Add a 16 second delay using Snowflake's system$wait function so that the last file created is loaded into the table
-        var wait_stmt = snowflake.createStatement({
-            sqlText: "CALL system$wait(16);"
+        // Load the exported files right away (COPY INTO skips any file the task already loaded)
+        var load_stmt = snowflake.createStatement({
+            sqlText: "CALL MED_DEVICE_TRANSCRIPTS.ANALYTICS.LOAD_NEW_JSON_FILES();"
         });
-        wait_stmt.execute();
+        var load_rs = load_stmt.execute();
+        load_rs.next();
+        var load_result = load_rs.getColumnValue(1);
         
-        // Suspend the task after processing completes and delay
-        var suspend_stmt = snowflake.createStatement({
-            sqlText: "ALTER TASK MED_DEVICE_TRANSCRIPTS.ANALYTICS.LOAD_JSON_FILES_NEW SUSPEND;"
-        });
-        suspend_stmt.execute();
+        // Refresh the analysis dynamic table so the new transcripts do not wait for its target lag
+        // (the table is created later by Cortex_Analysis.sql, so a missing table is reported instead of failing the run)
+        var refresh_result;
+        try {
+            var refresh_stmt = snowflake.createStatement({
+                sqlText: "ALTER DYNAMIC TABLE MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL REFRESH;"
+            });
+            refresh_stmt.execute();
+            refresh_result = "analysis table refreshed";
+        } catch (refresh_err) {
+            refresh_result = "analysis table not refreshed: " + refresh_err;
+        }
         
-        return "Batch processing completed successfully: Task resumed, 3 batches processed, waited 16 seconds, then task suspended.";
+        return "Batch processing completed successfully: 3 batches processed, " + load_result + ", " + refresh_result + ".";
     } catch (err) {
         return "Error during batch processing: " + err;
     }
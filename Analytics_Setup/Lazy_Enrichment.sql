@@ -0,0 +1,467 @@
+-- Lazy_Enrichment.sql
+-- SQL script for the lazy enrichment mode: cheap Cortex fields at ingest, SUMMARIZE and the COMPLETE prompts on first view
+
+-- Set Context to ACCOUNTADMIN
+USE ROLE ACCOUNTADMIN;
+
+-- Setting Context
+USE DATABASE MED_DEVICE_TRANSCRIPTS;
+USE SCHEMA ANALYTICS;
+
+/* TRANSCRIPT_ANALYSIS_RESULTS_FINAL pays for SUMMARIZE and two COMPLETE calls on every transcript, although the
+summary and the resolution and rating reasons are only read when someone opens the record in the Record Viewer.
+In the lazy mode:
+- TRANSCRIPT_ANALYSIS_CHEAP computes the cheap fields at ingest (sentiment, device category, main issue)
+- ENRICH_ON_READ computes the summary, resolution and service rating of the requested conversations the first time
+  they are viewed, and stores them in the TRANSCRIPT_LAZY_ENRICHMENT cache, so each transcript is enriched once
+- a task prefetches the fields for the most recent and the most negative calls of the last days, so the records most
+  likely to be opened are ready
+- TRANSCRIPT_ANALYSIS_RESULTS_LAZY has the columns of TRANSCRIPT_ANALYSIS_RESULTS_FINAL, with NULL expensive fields
+  until a record is enriched
+- the tokens of both the cheap and the expensive fields are recorded in CORTEX_TOKEN_USAGE with PIPELINE 'LAZY', so
+  they are counted next to (not instead of) the rows of the eager pipeline when both modes run
+This script uses the UDFs created in Cortex_Analysis.sql (DEVICE_FASTPATH_CLASSIFY, FIT_TRANSCRIPT_TO_BUDGET and
+ROUTE_COMPLETE_MODEL) and the CORTEX_TOKEN_USAGE table */
+
+-- Create a Dynamic Table with the cheap fields of each transcript, clustered on the call date like
+-- TRANSCRIPT_ANALYSIS_RESULTS_FINAL so the date filter of the dashboard prunes micro-partitions
+CREATE OR REPLACE DYNAMIC TABLE TRANSCRIPT_ANALYSIS_CHEAP
+  TARGET_LAG = '1 MINUTE'
+  WAREHOUSE = CORTEX_DEMO_WH
+  REFRESH_MODE = 'AUTO'
+  CLUSTER BY (TO_DATE(start_time))
+AS
+  WITH unique_transcripts AS (
+    SELECT *
+    FROM parsed_transcripts
+    QUALIFY ROW_NUMBER() OVER (PARTITION BY conversation_id ORDER BY start_time DESC) = 1
+  ),
+  fastpath_transcripts AS (
+    SELECT
+      conversation_id,
+      transcript,
+      DEVICE_FASTPATH_CLASSIFY(transcript, agent_name, customer_name) as device_fastpath
+    FROM unique_transcripts
+  ),
+  device_categories AS (
+    SELECT
+      conversation_id,
+      device_fastpath:device_name::VARCHAR as device_name,
+      device_fastpath:device_category::VARCHAR as device_category,
+      'KEYWORD' as device_category_source
+    FROM fastpath_transcripts
+    WHERE device_fastpath:status::VARCHAR = 'matched'
+    UNION ALL
+    SELECT
+      conversation_id,
+      device_fastpath:device_name::VARCHAR as device_name,
+      SNOWFLAKE.CORTEX.CLASSIFY_TEXT(
+        transcript,
+        ['Diabetes', 'Respiratory', 'Mobility', 'Urology', 'Pain Management', 'Monitoring', 'Orthopedic', 'Nutrition', 'Infusion', 'Wound Care','Other']
+        )['label']::VARCHAR as device_category,
+      'CLASSIFY_TEXT' as device_category_source
+    FROM fastpath_transcripts
+    WHERE device_fastpath:status::VARCHAR <> 'matched'
+  ),
+  cortex_results AS (
+    SELECT
+      *,
+      SNOWFLAKE.CORTEX.SENTIMENT(FIT_TRANSCRIPT_TO_BUDGET(transcript, agent_name, customer_name, 500)) as sentiment_score,
+      SNOWFLAKE.CORTEX.EXTRACT_ANSWER(
+        FIT_TRANSCRIPT_TO_BUDGET(transcript, agent_name, customer_name, 1800), 'What is the main issue?'
+      ) as main_issue_json
+    FROM unique_transcripts
+  )
+  SELECT
+    source,
+    c.conversation_id,
+    start_time,
+    end_time,
+    agent_name,
+    customer_name,
+    transcript,
+    sentiment_score,
+    CASE
+      WHEN sentiment_score > 0.33 THEN 'Positive'
+      WHEN sentiment_score < -0.33 THEN 'Negative'
+      ELSE 'Neutral'
+    END as sentiment_category,
+    d.device_category,
+    d.device_name,
+    d.device_category_source,
+    main_issue_json[0]:answer::STRING as main_issue_answer,
+    main_issue_json[0]:score::FLOAT as main_issue_score,
+    CASE
+      WHEN main_issue_json[0]:score::FLOAT >= 0.7 THEN 'High Confidence'
+      WHEN main_issue_json[0]:score::FLOAT >= 0.3 THEN 'Medium Confidence'
+      ELSE 'Low Confidence'
+    END as main_issue_confidence_level
+  FROM cortex_results c
+  JOIN device_categories d ON d.conversation_id = c.conversation_id;
+
+-- Create the cache of the expensive fields, one row per enriched conversation
+CREATE TABLE IF NOT EXISTS MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_LAZY_ENRICHMENT (
+    CONVERSATION_ID NUMBER,
+    TRANSCRIPT_SUMMARY VARCHAR,
+    RESOLUTION_WITH_REASON VARCHAR,
+    CUSTOMER_SERVICE_RATING VARCHAR,
+    ENRICHED_BY VARCHAR,        -- VIEW or PREFETCH
+    ENRICHED_AT TIMESTAMP_LTZ,
+    VIEW_COUNT NUMBER DEFAULT 0,
+    LAST_VIEWED_AT TIMESTAMP_LTZ
+);
+
+-- Create a view with the columns of TRANSCRIPT_ANALYSIS_RESULTS_FINAL; the expensive fields are NULL until enriched
+CREATE OR REPLACE VIEW MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_LAZY AS
+SELECT
+  c.source,
+  c.conversation_id,
+  c.start_time,
+  c.end_time,
+  c.agent_name,
+  c.customer_name,
+  c.transcript,
+  l.transcript_summary,
+  c.sentiment_score,
+  c.sentiment_category,
+  c.device_category,
+  c.device_name,
+  c.device_category_source,
+  c.main_issue_answer,
+  c.main_issue_score,
+  c.main_issue_confidence_level,
+  SPLIT_PART(l.resolution_with_reason, ':', 1) as resolution,
+  TRIM(SPLIT_PART(l.resolution_with_reason, ':', 2)) as resolution_reason,
+  SPLIT_PART(l.customer_service_rating, ':', 1) as service_rating,
+  TRIM(SPLIT_PART(l.customer_service_rating, ':', 2)) as service_rating_reason
+FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_CHEAP c
+LEFT JOIN MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_LAZY_ENRICHMENT l ON l.conversation_id = c.conversation_id;
+
+-- Create a procedure that enriches the requested conversations that are not cached yet
+-- The summary is computed on the transcript capped at the SUMMARIZE budget; the COMPLETE prompts are routed and
+-- escalated as in the complete_responses dynamic table. Views of cached conversations are counted, and the tokens of
+-- the new enrichment are recorded in CORTEX_TOKEN_USAGE
+CREATE OR REPLACE PROCEDURE MED_DEVICE_TRANSCRIPTS.ANALYTICS.ENRICH_ON_READ(CONVERSATION_IDS ARRAY, ENRICHED_BY VARCHAR)
+RETURNS VARCHAR
+LANGUAGE SQL
+AS
+$$
+DECLARE
+    rows_enriched INT DEFAULT 0;
+    enrich_time TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP();
+BEGIN
+    IF (ENRICHED_BY = 'VIEW') THEN
+        UPDATE MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_LAZY_ENRICHMENT
+        SET view_count = view_count + 1, last_viewed_at = :enrich_time
+        WHERE ARRAY_CONTAINS(conversation_id::VARIANT, :conversation_ids);
+    END IF;
+
+    -- One row per COMPLETE attempt of the uncached conversations
+    CREATE OR REPLACE TEMPORARY TABLE lazy_complete_attempts AS
+    WITH requests AS (
+        SELECT
+            conversation_id,
+            FIT_TRANSCRIPT_TO_BUDGET(transcript, agent_name, customer_name, 3000) as complete_input,
+            IFF(device_category_source = 'KEYWORD', 'matched', 'unmatched') as fastpath_status
+        FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_CHEAP c
+        WHERE ARRAY_CONTAINS(c.conversation_id::VARIANT, :conversation_ids)
+            AND NOT EXISTS (
+                SELECT 1
+                FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_LAZY_ENRICHMENT l
+                WHERE l.conversation_id = c.conversation_id
+            )
+    ),
+    complete_requests AS (
+        SELECT
+            conversation_id,
+            'resolution' as prompt_type,
+            [
+                {'role': 'system', 'content': 'You are a customer service quality analyst.
+                    Analyze customer service transcripts and determine if the customer\'s issue was resolved.
+                    Respond with exactly one word ("Resolved", "Unresolved", or "Partial") followed by a colon and 10 words or less explaining why.'},
+                {'role': 'user', 'content': complete_input}
+            ] as messages,
+            ROUTE_COMPLETE_MODEL(complete_input, fastpath_status, 'standard') as routed_model
+        FROM requests
+        UNION ALL
+        SELECT
+            conversation_id,
+            'service_rating' as prompt_type,
+            [
+                {'role': 'user', 'content': CONCAT('Rate the customer service experience from 0 to 10, with 0 being very poor support without resolution
+                and 10 being highly supportive and complete resolution of the issue and a completely happy customer.
+                Return the results with a single integer for the rating followed by a colon and then a reason for the rating.
+                The reason should be 25 words or less.', complete_input)}
+            ] as messages,
+            ROUTE_COMPLETE_MODEL(complete_input, fastpath_status, 'standard') as routed_model
+        FROM requests
+    ),
+    first_attempts AS (
+        SELECT conversation_id, prompt_type, messages, 1 as attempt_no, 'llama3.1-8b' as model,
+            SNOWFLAKE.CORTEX.COMPLETE('llama3.1-8b', messages, {'temperature': 0, 'max_tokens': 60}) as response
+        FROM complete_requests
+        WHERE routed_model = 'llama3.1-8b'
+        UNION ALL
+        SELECT conversation_id, prompt_type, messages, 1 as attempt_no, 'llama3.1-70b' as model,
+            SNOWFLAKE.CORTEX.COMPLETE('llama3.1-70b', messages, {'temperature': 0, 'max_tokens': 60}) as response
+        FROM complete_requests
+        WHERE routed_model = 'llama3.1-70b'
+        UNION ALL
+        SELECT conversation_id, prompt_type, messages, 1 as attempt_no, 'mistral-large2' as model,
+            SNOWFLAKE.CORTEX.COMPLETE('mistral-large2', messages, {'temperature': 0, 'max_tokens': 60}) as response
+        FROM complete_requests
+        WHERE routed_model = 'mistral-large2'
+    ),
+    escalations AS (
+        SELECT conversation_id, prompt_type, messages, 2 as attempt_no, 'mistral-large2' as model,
+            SNOWFLAKE.CORTEX.COMPLETE('mistral-large2', messages, {'temperature': 0, 'max_tokens': 60}) as response
+        FROM first_attempts
+        WHERE model <> 'mistral-large2'
+            AND NOT COALESCE(REGEXP_LIKE(
+                response['choices'][0]['messages']::STRING,
+                IFF(prompt_type = 'resolution', '\\s*(Resolved|Unresolved|Partial)\\s*:.+', '\\s*(10|[0-9])\\s*:.+'),
+                's'
+            ), FALSE)
+    )
+    SELECT
+        conversation_id,
+        prompt_type,
+        attempt_no,
+        model,
+        messages,
+        response['choices'][0]['messages']::STRING as response_text,
+        response['usage']['prompt_tokens']::INT as prompt_tokens,
+        response['usage']['completion_tokens']::INT as completion_tokens
+    FROM (
+        SELECT conversation_id, prompt_type, attempt_no, model, messages, response FROM first_attempts
+        UNION ALL
+        SELECT conversation_id, prompt_type, attempt_no, model, messages, response FROM escalations
+    );
+
+    CREATE OR REPLACE TEMPORARY TABLE lazy_new_enrichment AS
+    WITH accepted AS (
+        -- The escalated attempt when there is one
+        SELECT
+            conversation_id,
+            MAX(IFF(prompt_type = 'resolution', response_text, NULL)) as resolution_with_reason,
+            MAX(IFF(prompt_type = 'service_rating', response_text, NULL)) as customer_service_rating
+        FROM (
+            SELECT *
+            FROM lazy_complete_attempts
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY conversation_id, prompt_type ORDER BY attempt_no DESC) = 1
+        )
+        GROUP BY conversation_id
+    ),
+    summarize_requests AS (
+        SELECT
+            c.conversation_id,
+            FIT_TRANSCRIPT_TO_BUDGET(c.transcript, c.agent_name, c.customer_name, 2000) as summarize_input,
+            a.resolution_with_reason,
+            a.customer_service_rating
+        FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_CHEAP c
+        JOIN accepted a ON a.conversation_id = c.conversation_id
+    )
+    SELECT *, SNOWFLAKE.CORTEX.SUMMARIZE(summarize_input) as transcript_summary
+    FROM summarize_requests;
+
+    -- A viewer and the prefetch task can enrich the same conversation at the same time; the MERGE keeps the cache at
+    -- one row per conversation, and the run whose row was not inserted leaves it as it is
+    MERGE INTO MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_LAZY_ENRICHMENT l
+    USING lazy_new_enrichment n
+    ON l.conversation_id = n.conversation_id
+    WHEN NOT MATCHED THEN INSERT
+        (conversation_id, transcript_summary, resolution_with_reason, customer_service_rating, enriched_by, enriched_at, view_count, last_viewed_at)
+    VALUES
+        (n.conversation_id, n.transcript_summary, n.resolution_with_reason, n.customer_service_rating, :enriched_by, :enrich_time,
+         IFF(:enriched_by = 'VIEW', 1, 0), IFF(:enriched_by = 'VIEW', :enrich_time, NULL));
+
+    rows_enriched := SQLROWCOUNT;
+
+    -- Record the tokens of the rows this run inserted into the cache, so a conversation is recorded once
+    INSERT INTO MED_DEVICE_TRANSCRIPTS.ANALYTICS.CORTEX_TOKEN_USAGE
+        (conversation_id, function_name, model, call_count, input_hash, input_tokens, output_tokens, recorded_at, pipeline)
+    WITH enriched AS (
+        SELECT n.conversation_id, n.transcript_summary, n.summarize_input
+        FROM lazy_new_enrichment n
+        JOIN MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_LAZY_ENRICHMENT l ON l.conversation_id = n.conversation_id
+        WHERE l.enriched_at = :enrich_time AND l.enriched_by = :enriched_by
+    )
+    SELECT conversation_id, 'SUMMARIZE', NULL, 1, HASH(summarize_input),
+        SNOWFLAKE.CORTEX.COUNT_TOKENS('summarize', summarize_input),
+        SNOWFLAKE.CORTEX.COUNT_TOKENS('summarize', transcript_summary), :enrich_time, 'LAZY'
+    FROM enriched
+    UNION ALL
+    SELECT conversation_id, 'COMPLETE', model, COUNT(*), HASH_AGG(prompt_type, attempt_no, messages),
+        SUM(prompt_tokens), SUM(completion_tokens), :enrich_time, 'LAZY'
+    FROM lazy_complete_attempts
+    WHERE conversation_id IN (SELECT conversation_id FROM enriched)
+    GROUP BY conversation_id, model;
+
+    DROP TABLE lazy_complete_attempts;
+    DROP TABLE lazy_new_enrichment;
+
+    RETURN 'Enriched ' || rows_enriched || ' of ' || ARRAY_SIZE(:conversation_ids) || ' requested conversations';
+END;
+$$;
+
+-- Create a stream on the cheap fields; SHOW_INITIAL_ROWS makes the first run record the rows that already exist
+CREATE OR REPLACE STREAM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_CHEAP_STREAM
+  ON DYNAMIC TABLE MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_CHEAP
+  SHOW_INITIAL_ROWS = TRUE;
+
+-- Create a procedure that records the tokens of the cheap fields of the new and changed rows
+-- Reading the stream in the INSERT advances its offset. As in the sync procedure of Cortex_Analysis.sql, the rows are
+-- keyed on the conversation, function and a hash of the input, so a refresh with unchanged inputs is not recorded again
+CREATE OR REPLACE PROCEDURE MED_DEVICE_TRANSCRIPTS.ANALYTICS.RECORD_CHEAP_TOKEN_USAGE()
+RETURNS VARCHAR
+LANGUAGE SQL
+AS
+$$
+DECLARE
+    usage_rows INT DEFAULT 0;
+    record_time TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP();
+BEGIN
+    INSERT INTO MED_DEVICE_TRANSCRIPTS.ANALYTICS.CORTEX_TOKEN_USAGE
+        (conversation_id, function_name, model, call_count, input_hash, input_tokens, output_tokens, recorded_at, pipeline)
+    WITH changed AS (
+        SELECT
+            s.*,
+            FIT_TRANSCRIPT_TO_BUDGET(s.transcript, s.agent_name, s.customer_name, 500) as sentiment_input,
+            FIT_TRANSCRIPT_TO_BUDGET(s.transcript, s.agent_name, s.customer_name, 1800) as extract_answer_input
+        FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_CHEAP_STREAM s
+        WHERE s.METADATA$ACTION = 'INSERT'
+    ),
+    usage AS (
+        -- SENTIMENT and CLASSIFY_TEXT are billed on their input tokens only
+        SELECT conversation_id, 'SENTIMENT' as function_name, NULL as model, 1 as call_count, HASH(sentiment_input) as input_hash,
+            SNOWFLAKE.CORTEX.COUNT_TOKENS('sentiment', sentiment_input) as input_tokens, 0 as output_tokens
+        FROM changed
+        UNION ALL
+        SELECT conversation_id, 'CLASSIFY_TEXT', NULL, 1, HASH(transcript),
+            SNOWFLAKE.CORTEX.COUNT_TOKENS('classify_text', transcript), 0
+        FROM changed
+        WHERE device_category_source = 'CLASSIFY_TEXT'
+        UNION ALL
+        SELECT conversation_id, 'EXTRACT_ANSWER', NULL, 1, HASH(extract_answer_input),
+            SNOWFLAKE.CORTEX.COUNT_TOKENS('extract_answer', extract_answer_input),
+            SNOWFLAKE.CORTEX.COUNT_TOKENS('extract_answer', COALESCE(main_issue_answer, ''))
+        FROM changed
+    )
+    SELECT u.conversation_id, u.function_name, u.model, u.call_count, u.input_hash, u.input_tokens, u.output_tokens, :record_time, 'LAZY'
+    FROM usage u
+    WHERE NOT EXISTS (
+        SELECT 1
+        FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.CORTEX_TOKEN_USAGE x
+        WHERE x.pipeline = 'LAZY'
+        AND x.conversation_id = u.conversation_id
+        AND x.function_name = u.function_name
+        AND x.input_hash = u.input_hash
+    );
+
+    usage_rows := SQLROWCOUNT;
+
+    RETURN 'Recorded ' || usage_rows || ' token usage rows of the cheap fields';
+END;
+$$;
+
+-- Create a task that records the tokens every minute, but only when the stream has new rows
+CREATE OR REPLACE TASK MED_DEVICE_TRANSCRIPTS.ANALYTICS.RECORD_CHEAP_TOKEN_USAGE_TASK
+    WAREHOUSE = CORTEX_DEMO_WH
+    SCHEDULE = '1 MINUTE'
+    WHEN SYSTEM$STREAM_HAS_DATA('MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_CHEAP_STREAM')
+AS
+    CALL MED_DEVICE_TRANSCRIPTS.ANALYTICS.RECORD_CHEAP_TOKEN_USAGE();
+
+-- Record the tokens of the existing rows now, then resume the task
+CALL MED_DEVICE_TRANSCRIPTS.ANALYTICS.RECORD_CHEAP_TOKEN_USAGE();
+
+ALTER TASK MED_DEVICE_TRANSCRIPTS.ANALYTICS.RECORD_CHEAP_TOKEN_USAGE_TASK RESUME;
+
+-- Suspend the task
+-- ALTER TASK MED_DEVICE_TRANSCRIPTS.ANALYTICS.RECORD_CHEAP_TOKEN_USAGE_TASK SUSPEND;
+
+-- Create a procedure that prefetches the most recent and the most negative uncached conversations of the last
+-- WINDOW_DAYS days. Older calls are only enriched when they are viewed, so the prefetch stops once the window is warm
+-- instead of working through the whole history
+DROP PROCEDURE IF EXISTS MED_DEVICE_TRANSCRIPTS.ANALYTICS.PREFETCH_LAZY_ENRICHMENT(INT, INT);
+CREATE OR REPLACE PROCEDURE MED_DEVICE_TRANSCRIPTS.ANALYTICS.PREFETCH_LAZY_ENRICHMENT(
+    RECENT_LIMIT INT,
+    NEGATIVE_LIMIT INT,
+    WINDOW_DAYS INT
+)
+RETURNS VARCHAR
+LANGUAGE SQL
+AS
+$$
+DECLARE
+    window_start TIMESTAMP_NTZ;
+    conversation_ids ARRAY;
+BEGIN
+    -- The window ends at the latest call rather than today, as in Rolling_Summaries.sql, so the demo data is prefetched
+    SELECT DATEADD(day, -:WINDOW_DAYS, MAX(start_time))
+    INTO :window_start
+    FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_CHEAP;
+
+    IF (window_start IS NULL) THEN
+        RETURN 'Nothing to prefetch';
+    END IF;
+
+    WITH uncached AS (
+        SELECT conversation_id, start_time, sentiment_score
+        FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_CHEAP c
+        WHERE c.start_time >= :window_start
+        AND NOT EXISTS (
+            SELECT 1
+            FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_LAZY_ENRICHMENT l
+            WHERE l.conversation_id = c.conversation_id
+        )
+    )
+    SELECT ARRAY_UNION_AGG(ids) INTO :conversation_ids
+    FROM (
+        SELECT ARRAY_AGG(conversation_id) as ids
+        FROM (SELECT * FROM uncached QUALIFY ROW_NUMBER() OVER (ORDER BY start_time DESC) <= :recent_limit)
+        UNION ALL
+        SELECT ARRAY_AGG(conversation_id) as ids
+        FROM (SELECT * FROM uncached QUALIFY ROW_NUMBER() OVER (ORDER BY sentiment_score ASC) <= :negative_limit)
+    );
+
+    IF (conversation_ids IS NULL OR ARRAY_SIZE(conversation_ids) = 0) THEN
+        RETURN 'Nothing to prefetch';
+    END IF;
+
+    CALL MED_DEVICE_TRANSCRIPTS.ANALYTICS.ENRICH_ON_READ(:conversation_ids, 'PREFETCH');
+    RETURN 'Prefetched ' || ARRAY_SIZE(conversation_ids) || ' conversations';
+END;
+$$;
+
+-- Create a task that warms the cache for the calls of the last 7 days every 15 minutes
+CREATE OR REPLACE TASK MED_DEVICE_TRANSCRIPTS.ANALYTICS.PREFETCH_LAZY_ENRICHMENT_TASK
+    WAREHOUSE = CORTEX_DEMO_WH
+    SCHEDULE = '15 MINUTE'
+AS
+    CALL MED_DEVICE_TRANSCRIPTS.ANALYTICS.PREFETCH_LAZY_ENRICHMENT(50, 50, 7);
+
+ALTER TASK MED_DEVICE_TRANSCRIPTS.ANALYTICS.PREFETCH_LAZY_ENRICHMENT_TASK RESUME;
+
+-- Suspend the task
+-- ALTER TASK MED_DEVICE_TRANSCRIPTS.ANALYTICS.PREFETCH_LAZY_ENRICHMENT_TASK SUSPEND;
+
+-- Enrich one conversation on view (this is what the Record Viewer calls) and read it back
+CALL MED_DEVICE_TRANSCRIPTS.ANALYTICS.ENRICH_ON_READ(ARRAY_CONSTRUCT(1), 'VIEW');
+
+SELECT transcript_summary, resolution, resolution_reason, service_rating, service_rating_reason
+FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_LAZY
+WHERE conversation_id = 1;
+
+-- Share of transcripts enriched, by how they were enriched, and the expensive calls avoided so far
+-- (SUMMARIZE and at least two COMPLETE calls per transcript that is never enriched)
+SELECT
+  COUNT(*) as transcripts,
+  COUNT(l.conversation_id) as enriched,
+  COUNT_IF(l.enriched_by = 'VIEW') as enriched_on_view,
+  COUNT_IF(l.enriched_by = 'PREFETCH') as prefetched,
+  COUNT_IF(l.enriched_by = 'PREFETCH' AND l.view_count > 0) as prefetched_and_viewed,
+  ROUND(100 * COUNT(l.conversation_id) / NULLIF(COUNT(*), 0), 1) as pct_enriched,
+  3 * (COUNT(*) - COUNT(l.conversation_id)) as expensive_calls_avoided
+FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_CHEAP c
+LEFT JOIN MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_LAZY_ENRICHMENT l ON l.conversation_id = c.conversation_id;
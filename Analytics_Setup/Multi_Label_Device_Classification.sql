@@ -86,16 +86,47 @@ SELECT
 FROM parsed_transcripts
 LIMIT 10;
 
--- Create a view for easy access to multi-label device categories
-CREATE OR REPLACE VIEW parsed_transcripts_multi_category AS
+-- Create a Dynamic Table for easy access to multi-label device categories
+-- Earlier versions used a plain view, which re-ran AI_CLASSIFY over every transcript each time it was queried.
+-- The Dynamic Table stores the result and refreshes incrementally, so each transcript is classified once
+DROP VIEW IF EXISTS parsed_transcripts_multi_category;
+
+CREATE OR REPLACE DYNAMIC TABLE parsed_transcripts_multi_category
+  TARGET_LAG = 'DOWNSTREAM'
+  WAREHOUSE = CORTEX_DEMO_WH
+  REFRESH_MODE = 'AUTO'
+AS
+WITH fastpath_transcripts AS (
+  -- Keyword fast path (see Cortex_Analysis.sql): transcripts that only name devices of one category skip AI_CLASSIFY
+  SELECT
+    conversation_id,
+    transcript,
+    DEVICE_FASTPATH_CLASSIFY(transcript, agent_name, customer_name) as device_fastpath
+  FROM parsed_transcripts
+),
+classified_transcripts AS (
+  SELECT
+    conversation_id,
+    transcript,
+    OBJECT_CONSTRUCT('labels', ARRAY_CONSTRUCT(device_fastpath:device_category::STRING)) as device_category_raw
+  FROM fastpath_transcripts
+  WHERE device_fastpath:status::STRING = 'matched'
+  UNION ALL
+  SELECT
+    conversation_id,
+    transcript,
+    AI_CLASSIFY(
+      transcript, 
+      ['Diabetes', 'Respiratory', 'Mobility', 'Urology', 'Pain Management', 'Monitoring', 'Orthopedic', 'Nutrition', 'Infusion', 'Wound Care'], 
+      {'output_mode': 'multi'}
+    )::VARIANT as device_category_raw
+  FROM fastpath_transcripts
+  WHERE device_fastpath:status::STRING <> 'matched'
+)
 SELECT
   conversation_id,
   transcript,
-  AI_CLASSIFY(
-    transcript, 
-    ['Diabetes', 'Respiratory', 'Mobility', 'Urology', 'Pain Management', 'Monitoring', 'Orthopedic', 'Nutrition', 'Infusion', 'Wound Care'], 
-    {'output_mode': 'multi'}
-  ) as device_category_raw,
+  device_category_raw,
   device_category_raw::VARIANT:labels[0]::STRING AS primary_category,
   CASE 
     WHEN ARRAY_SIZE(device_category_raw::VARIANT:labels) > 1 
@@ -103,20 +134,43 @@ SELECT
     ELSE device_category_raw::VARIANT:labels[0]::STRING
   END AS all_categories,
   ARRAY_SIZE(device_category_raw::VARIANT:labels) AS category_count
-FROM parsed_transcripts;
+FROM classified_transcripts;
+
+-- Create a bridge Dynamic Table with one row per conversation and device category
+-- The labels are exploded once when new transcripts arrive instead of in every analytics query
+-- (category_score is NULL for keyword fast path matches and when AI_CLASSIFY does not return scores)
+CREATE OR REPLACE DYNAMIC TABLE conversation_device_categories
+  TARGET_LAG = '1 MINUTE'
+  WAREHOUSE = CORTEX_DEMO_WH
+  REFRESH_MODE = 'AUTO'
+AS
+SELECT
+  conversation_id,
+  label.value::STRING AS device_category,
+  label.index AS category_rank,
+  device_category_raw::VARIANT:scores[label.index]::FLOAT AS category_score
+FROM parsed_transcripts_multi_category,
+LATERAL FLATTEN(input => device_category_raw::VARIANT:labels) AS label;
 
--- Query the view
+-- Query the multi-label table
 SELECT * FROM parsed_transcripts_multi_category
 WHERE category_count > 1  -- Only show records with multiple categories
 LIMIT 10;
 
 -- Analytics query: Count conversations by device category (accounting for multi-labels)
+-- This is a plain aggregate over the bridge table and does not call AI_CLASSIFY
 SELECT 
-  category.value::STRING AS device_category,
-  COUNT(*) AS conversation_count
-FROM parsed_transcripts_multi_category,
-LATERAL FLATTEN(input => device_category_raw::VARIANT:labels) AS category
+  device_category,
+  COUNT(DISTINCT conversation_id) AS conversation_count
+FROM conversation_device_categories
 GROUP BY device_category
 ORDER BY conversation_count DESC;
 
-
+-- Analytics query: Count conversations by primary device category
+SELECT 
+  device_category,
+  COUNT(*) AS conversation_count
+FROM conversation_device_categories
+WHERE category_rank = 0
+GROUP BY device_category
+ORDER BY conversation_count DESC;
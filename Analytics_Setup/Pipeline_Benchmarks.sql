@@ -0,0 +1,574 @@
+-- Pipeline_Benchmarks.sql
+-- SQL script for measuring the throughput of the transcript pipeline before and after each optimization
+
+-- Set Context to ACCOUNTADMIN
+USE ROLE ACCOUNTADMIN;
+
+-- Set worksheet Context
+USE DATABASE MED_DEVICE_TRANSCRIPTS;
+USE SCHEMA DATA_PREP;
+USE WAREHOUSE CORTEX_DEMO_WH;
+
+------------------------------------------------------------------------------------------------------------------------
+-- 1. Transcript generation: row-by-row cursor vs set-based batch
+------------------------------------------------------------------------------------------------------------------------
+
+-- Start from an empty table so both procedures generate the same number of transcripts
+TRUNCATE TABLE MED_DEVICE_TRANSCRIPTS.DATA_PREP.SUPPORT_CONVERSATIONS_NEW;
+
+-- Insert 50 conversations without transcripts (change the ROWCOUNT to benchmark a larger load)
+INSERT INTO MED_DEVICE_TRANSCRIPTS.DATA_PREP.SUPPORT_CONVERSATIONS_NEW (
+    START_TIME,
+    END_TIME,
+    AGENT_ID,
+    CUSTOMER_ID,
+    SENTIMENT,
+    ISSUE_RESOLVED,
+    DEVICE_NAME,
+    COMMON_ISSUE
+)
+WITH random_data AS (
+    SELECT
+        DATEADD(minute, -1 * MOD(ABS(RANDOM()), 43200), CURRENT_TIMESTAMP()) AS START_TIME,
+        DATEADD(minute, 2 + MOD(ABS(RANDOM()), 18), START_TIME) AS END_TIME,
+        1 + MOD(ABS(RANDOM()), 8) AS AGENT_ID,
+        1 + MOD(ABS(RANDOM()), 100) AS CUSTOMER_ID,
+        CASE MOD(ABS(RANDOM()), 3)
+            WHEN 0 THEN 'positive'
+            WHEN 1 THEN 'negative'
+            ELSE 'neutral'
+        END AS SENTIMENT,
+        CASE WHEN RANDOM() < 0.7 THEN TRUE ELSE FALSE END AS ISSUE_RESOLVED,
+        1 + MOD(ABS(RANDOM()), 50) AS RANDOM_DEVICE_ID
+    FROM
+        TABLE(GENERATOR(ROWCOUNT => 50))
+)
+SELECT
+    rd.START_TIME,
+    rd.END_TIME,
+    rd.AGENT_ID,
+    rd.CUSTOMER_ID,
+    rd.SENTIMENT,
+    rd.ISSUE_RESOLVED,
+    hmd.DEVICE_NAME,
+    hmd.COMMON_ISSUES AS COMMON_ISSUE
+FROM
+    random_data rd
+JOIN
+    MED_DEVICE_TRANSCRIPTS.CREATE_TRANSCRIPTS.HOME_MEDICAL_DEVICES hmd ON hmd.DEVICE_ID = rd.RANDOM_DEVICE_ID;
+
+-- Run the cursor procedure (one COMPLETE call and one UPDATE per row)
+CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.GENERATE_TRANSCRIPTS_NEW_RECORDS();
+
+-- Clear the transcripts so the same rows can be generated again
+UPDATE MED_DEVICE_TRANSCRIPTS.DATA_PREP.SUPPORT_CONVERSATIONS_NEW SET TRANSCRIPT = NULL;
+
+-- Run the set-based procedure (one prompt query, one COMPLETE query, one UPDATE ... FROM)
+CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.GENERATE_TRANSCRIPTS_NEW_RECORDS_BATCH();
+
+-- Compare rows/minute for both runs. Both procedures also report rows/minute in their return value
+SELECT
+    CASE WHEN QUERY_TEXT ILIKE '%_BATCH()%' THEN 'Set-based' ELSE 'Cursor' END AS generation_method,
+    TOTAL_ELAPSED_TIME / 1000 AS elapsed_seconds,
+    ROUND(50 / NULLIF(TOTAL_ELAPSED_TIME / 60000, 0), 1) AS rows_per_minute,
+    START_TIME
+FROM TABLE(INFORMATION_SCHEMA.QUERY_HISTORY_BY_SESSION())
+WHERE QUERY_TEXT ILIKE 'CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.GENERATE_TRANSCRIPTS_NEW_RECORDS%'
+    AND EXECUTION_STATUS = 'SUCCESS'
+ORDER BY START_TIME DESC
+LIMIT 2;
+
+-- Clean up the benchmark rows
+TRUNCATE TABLE MED_DEVICE_TRANSCRIPTS.DATA_PREP.SUPPORT_CONVERSATIONS_NEW;
+
+------------------------------------------------------------------------------------------------------------------------
+-- 2. Conversation batches: one file per conversation vs batch mode
+------------------------------------------------------------------------------------------------------------------------
+
+-- Count the files on the stage before the run
+LIST @MED_DEVICE_TRANSCRIPTS.DATA_PREP.CALL_DATA_NEW;
+SET files_before = (SELECT COUNT(*) FROM TABLE(RESULT_SCAN(LAST_QUERY_ID())));
+
+-- Original mode: 1,000 executions of one conversation each (one full round of procedure calls and one file per conversation)
+-- NOTE: this run takes a long time; reduce the execution count to sample the per-conversation cost instead
+CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.PROCESS_CONVERSATIONS_BATCH(1000);
+
+LIST @MED_DEVICE_TRANSCRIPTS.DATA_PREP.CALL_DATA_NEW;
+SET files_after_single = (SELECT COUNT(*) FROM TABLE(RESULT_SCAN(LAST_QUERY_ID())));
+
+-- Batch mode: the same 1,000 conversations as 10 batches of 100, each exported to one file
+CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.PROCESS_CONVERSATIONS_BATCH(10, 100, 1);
+
+LIST @MED_DEVICE_TRANSCRIPTS.DATA_PREP.CALL_DATA_NEW;
+SET files_after_batch = (SELECT COUNT(*) FROM TABLE(RESULT_SCAN(LAST_QUERY_ID())));
+
+-- Stage files written by each mode
+SELECT
+    $files_after_single - $files_before AS files_one_per_conversation,
+    $files_after_batch - $files_after_single AS files_batch_mode;
+
+-- End-to-end time for each mode
+SELECT
+    QUERY_TEXT,
+    TOTAL_ELAPSED_TIME / 1000 AS elapsed_seconds,
+    ROUND(1000 / NULLIF(TOTAL_ELAPSED_TIME / 60000, 0), 1) AS conversations_per_minute
+FROM TABLE(INFORMATION_SCHEMA.QUERY_HISTORY_BY_SESSION())
+WHERE QUERY_TEXT ILIKE 'CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.PROCESS_CONVERSATIONS_BATCH(%'
+    AND EXECUTION_STATUS = 'SUCCESS'
+ORDER BY START_TIME DESC
+LIMIT 2;
+
+------------------------------------------------------------------------------------------------------------------------
+-- 3. Raw layers: VARIANT tables parsed by two dynamic tables vs typed columns at COPY time
+------------------------------------------------------------------------------------------------------------------------
+
+-- Run the storage and refresh queries below once before re-running JSON_to_Table.sql and Create_Dynamic_Tables.sql
+-- (old layout) and once after (typed layout). ACCOUNT_USAGE keeps the history of dropped tables, so the old layers can
+-- still be measured after the migration. ACCOUNT_USAGE views can lag behind by up to a few hours
+USE SCHEMA ANALYTICS;
+
+-- Record when the migration to typed columns happened
+SET typed_layout_since = (SELECT MIN(CREATED) FROM MED_DEVICE_TRANSCRIPTS.INFORMATION_SCHEMA.TABLES
+                          WHERE TABLE_SCHEMA = 'ANALYTICS' AND TABLE_NAME = 'RAW_TRANSCRIPTS');
+
+-- Storage of the raw layers: old VARIANT tables and parsing dynamic tables vs the typed table
+SELECT
+    CASE
+        WHEN TABLE_NAME IN ('RAW_TRANSCRIPTS', 'RAW_TRANSCRIPTS_STAGING') THEN 'Typed at COPY time'
+        ELSE 'VARIANT + dynamic tables'
+    END AS raw_layout,
+    TABLE_NAME,
+    TABLE_DROPPED,
+    ROUND(ACTIVE_BYTES / 1024 / 1024, 2) AS active_mb,
+    ROUND(TIME_TRAVEL_BYTES / 1024 / 1024, 2) AS time_travel_mb
+FROM SNOWFLAKE.ACCOUNT_USAGE.TABLE_STORAGE_METRICS
+WHERE TABLE_CATALOG = 'MED_DEVICE_TRANSCRIPTS'
+    AND TABLE_SCHEMA = 'ANALYTICS'
+    AND TABLE_NAME IN ('RAW_JSON_DATA_INITIAL', 'RAW_JSON_DATA_NEW', 'COMBINED_RAW_JSON_DATA', 'PARSED_TRANSCRIPTS',
+                       'RAW_TRANSCRIPTS', 'RAW_TRANSCRIPTS_STAGING')
+ORDER BY raw_layout, TABLE_NAME, TABLE_CREATED DESC;
+
+-- Refresh time of the dynamic tables before and after the migration
+-- Before: the two parsing layers plus the analysis tables; after: only the analysis tables
+SELECT
+    CASE WHEN REFRESH_START_TIME < $typed_layout_since THEN 'VARIANT + dynamic tables' ELSE 'Typed at COPY time' END AS raw_layout,
+    NAME AS dynamic_table,
+    COUNT(*) AS refreshes,
+    ROUND(AVG(DATEDIFF('millisecond', REFRESH_START_TIME, REFRESH_END_TIME)) / 1000, 2) AS avg_refresh_seconds,
+    ROUND(SUM(DATEDIFF('millisecond', REFRESH_START_TIME, REFRESH_END_TIME)) / 1000, 2) AS total_refresh_seconds
+FROM SNOWFLAKE.ACCOUNT_USAGE.DYNAMIC_TABLE_REFRESH_HISTORY
+WHERE DATABASE_NAME = 'MED_DEVICE_TRANSCRIPTS'
+    AND SCHEMA_NAME = 'ANALYTICS'
+    AND STATE = 'SUCCEEDED'
+GROUP BY 1, 2
+ORDER BY 1, 2;
+
+-- Time spent loading new files into the raw layer (the load procedure now also runs the MERGE)
+SELECT
+    CASE WHEN START_TIME < $typed_layout_since THEN 'VARIANT + dynamic tables' ELSE 'Typed at COPY time' END AS raw_layout,
+    COUNT(*) AS loads,
+    ROUND(AVG(TOTAL_ELAPSED_TIME) / 1000, 2) AS avg_load_seconds
+FROM SNOWFLAKE.ACCOUNT_USAGE.QUERY_HISTORY
+WHERE QUERY_TEXT ILIKE 'CALL MED_DEVICE_TRANSCRIPTS.ANALYTICS.LOAD_NEW_JSON_FILES()%'
+    AND EXECUTION_STATUS = 'SUCCESS'
+GROUP BY 1
+ORDER BY 1;
+
+------------------------------------------------------------------------------------------------------------------------
+-- 4. Cortex analysis: four-layer dynamic table DAG vs a single enrichment table
+------------------------------------------------------------------------------------------------------------------------
+
+-- Run these queries after Cortex_Analysis.sql has replaced the four-layer DAG with the single table.
+-- ACCOUNT_USAGE keeps the refresh and metering history of the dropped dynamic tables and can lag behind by a few hours
+USE SCHEMA ANALYTICS;
+
+-- Record when the single enrichment table was created
+SET single_dt_since = (SELECT MAX(CREATED) FROM MED_DEVICE_TRANSCRIPTS.INFORMATION_SCHEMA.TABLES
+                       WHERE TABLE_SCHEMA = 'ANALYTICS' AND TABLE_NAME = 'TRANSCRIPT_ANALYSIS_RESULTS_FINAL');
+
+-- Refresh latency per DAG: the time from the first refresh start to the last refresh end for each refresh cycle of the
+-- final table (all tables in the DAG share a data timestamp for the same cycle)
+SELECT
+    CASE WHEN MIN(REFRESH_START_TIME) < $single_dt_since THEN 'Four-layer DAG' ELSE 'Single table' END AS dag_layout,
+    DATA_TIMESTAMP,
+    COUNT(*) AS tables_refreshed,
+    ROUND(DATEDIFF('millisecond', MIN(REFRESH_START_TIME), MAX(REFRESH_END_TIME)) / 1000, 2) AS cycle_seconds
+FROM SNOWFLAKE.ACCOUNT_USAGE.DYNAMIC_TABLE_REFRESH_HISTORY
+WHERE DATABASE_NAME = 'MED_DEVICE_TRANSCRIPTS'
+    AND SCHEMA_NAME = 'ANALYTICS'
+    AND NAME IN ('TRANSCRIPT_ANALYSIS_RESULTS', 'MAIN_ISSUE_ANALYSIS', 'RESOLUTION_SERVICE_ANALYSIS',
+                 'TRANSCRIPT_ANALYSIS_RESULTS_FINAL')
+    AND STATE = 'SUCCEEDED'
+GROUP BY DATA_TIMESTAMP
+ORDER BY DATA_TIMESTAMP DESC;
+
+-- Average refresh cycle for each layout
+SELECT
+    dag_layout,
+    COUNT(*) AS refresh_cycles,
+    ROUND(AVG(cycle_seconds), 2) AS avg_cycle_seconds
+FROM (
+    SELECT
+        CASE WHEN MIN(REFRESH_START_TIME) < $single_dt_since THEN 'Four-layer DAG' ELSE 'Single table' END AS dag_layout,
+        DATEDIFF('millisecond', MIN(REFRESH_START_TIME), MAX(REFRESH_END_TIME)) / 1000 AS cycle_seconds
+    FROM SNOWFLAKE.ACCOUNT_USAGE.DYNAMIC_TABLE_REFRESH_HISTORY
+    WHERE DATABASE_NAME = 'MED_DEVICE_TRANSCRIPTS'
+        AND SCHEMA_NAME = 'ANALYTICS'
+        AND NAME IN ('TRANSCRIPT_ANALYSIS_RESULTS', 'MAIN_ISSUE_ANALYSIS', 'RESOLUTION_SERVICE_ANALYSIS',
+                     'TRANSCRIPT_ANALYSIS_RESULTS_FINAL')
+        AND STATE = 'SUCCEEDED'
+    GROUP BY DATA_TIMESTAMP
+)
+GROUP BY dag_layout
+ORDER BY dag_layout;
+
+-- Cortex credits per layout (the Cortex calls are billed to the refresh queries of the dynamic tables)
+SELECT
+    CASE WHEN q.START_TIME < $single_dt_since THEN 'Four-layer DAG' ELSE 'Single table' END AS dag_layout,
+    c.FUNCTION_NAME,
+    c.MODEL_NAME,
+    SUM(c.TOKENS) AS tokens,
+    ROUND(SUM(c.TOKEN_CREDITS), 4) AS token_credits
+FROM SNOWFLAKE.ACCOUNT_USAGE.CORTEX_FUNCTIONS_QUERY_USAGE_HISTORY c
+JOIN SNOWFLAKE.ACCOUNT_USAGE.QUERY_HISTORY q ON q.QUERY_ID = c.QUERY_ID
+WHERE q.DATABASE_NAME = 'MED_DEVICE_TRANSCRIPTS'
+    AND q.QUERY_TYPE = 'REFRESH_DYNAMIC_TABLE'
+GROUP BY 1, 2, 3
+ORDER BY 1, 2, 3;
+
+-- Execution time and cloud services credits of the refresh queries per layout
+SELECT
+    CASE WHEN START_TIME < $single_dt_since THEN 'Four-layer DAG' ELSE 'Single table' END AS dag_layout,
+    COUNT(*) AS refresh_queries,
+    ROUND(SUM(CREDITS_USED_CLOUD_SERVICES), 4) AS cloud_services_credits,
+    ROUND(SUM(EXECUTION_TIME) / 1000, 2) AS execution_seconds
+FROM SNOWFLAKE.ACCOUNT_USAGE.QUERY_HISTORY
+WHERE DATABASE_NAME = 'MED_DEVICE_TRANSCRIPTS'
+    AND QUERY_TYPE = 'REFRESH_DYNAMIC_TABLE'
+GROUP BY 1
+ORDER BY 1;
+
+------------------------------------------------------------------------------------------------------------------------
+-- 5. Search base table: full CTAS rebuild vs incremental MERGE sync
+------------------------------------------------------------------------------------------------------------------------
+
+USE SCHEMA ANALYTICS;
+
+-- Cost of the original full rebuild: rewrites every row of the dynamic table
+-- (run it against a scratch copy so the synced search base table is not replaced)
+CREATE OR REPLACE TABLE MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL_CTAS AS
+SELECT * FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL;
+SET ctas_query_id = LAST_QUERY_ID();
+
+-- Generate a few new conversations, load them and refresh the dynamic table, then run one incremental sync
+CALL MED_DEVICE_TRANSCRIPTS.ANALYTICS.RUN_NEW_TRANSCRIPT_PIPELINE();
+CALL MED_DEVICE_TRANSCRIPTS.ANALYTICS.SYNC_TRANSCRIPT_ANALYSIS_RESULTS_TBL();
+SET sync_query_id = LAST_QUERY_ID();
+
+-- Rows written and elapsed time of both approaches
+SELECT
+    CASE WHEN QUERY_ID = $ctas_query_id THEN 'Full CTAS rebuild' ELSE 'Incremental MERGE sync' END AS sync_method,
+    TOTAL_ELAPSED_TIME / 1000 AS elapsed_seconds,
+    ROWS_PRODUCED
+FROM TABLE(INFORMATION_SCHEMA.QUERY_HISTORY_BY_SESSION())
+WHERE QUERY_ID IN ($ctas_query_id, $sync_query_id);
+
+-- Rows inserted, updated and deleted by the MERGE inside the sync procedure
+SELECT
+    START_TIME,
+    ROWS_INSERTED,
+    ROWS_UPDATED,
+    ROWS_DELETED,
+    TOTAL_ELAPSED_TIME / 1000 AS elapsed_seconds
+FROM TABLE(INFORMATION_SCHEMA.QUERY_HISTORY_BY_SESSION())
+WHERE QUERY_TYPE = 'MERGE'
+    AND QUERY_TEXT ILIKE '%TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL%'
+ORDER BY START_TIME DESC
+LIMIT 1;
+
+-- Scheduled sync runs: skipped runs (stream empty) do not start the warehouse
+SELECT
+    STATE,
+    COUNT(*) AS runs,
+    ROUND(AVG(DATEDIFF('millisecond', QUERY_START_TIME, COMPLETED_TIME)) / 1000, 2) AS avg_run_seconds
+FROM TABLE(INFORMATION_SCHEMA.TASK_HISTORY(
+    TASK_NAME => 'SYNC_TRANSCRIPT_ANALYSIS_RESULTS_TBL_TASK',
+    SCHEDULED_TIME_RANGE_START => DATEADD('day', -1, CURRENT_TIMESTAMP())))
+GROUP BY STATE;
+
+-- Clean up the scratch copy
+DROP TABLE IF EXISTS MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL_CTAS;
+
+------------------------------------------------------------------------------------------------------------------------
+-- 6. Multi-label categories: AI_CLASSIFY view vs persisted tables
+------------------------------------------------------------------------------------------------------------------------
+
+USE SCHEMA ANALYTICS;
+
+-- Original approach: the category counts query classified every transcript again through the view
+SELECT 
+  category.value::STRING AS device_category,
+  COUNT(*) AS conversation_count
+FROM (
+    SELECT AI_CLASSIFY(
+        transcript, 
+        ['Diabetes', 'Respiratory', 'Mobility', 'Urology', 'Pain Management', 'Monitoring', 'Orthopedic', 'Nutrition', 'Infusion', 'Wound Care'], 
+        {'output_mode': 'multi'}
+      ) as device_category_raw
+    FROM parsed_transcripts
+),
+LATERAL FLATTEN(input => device_category_raw::VARIANT:labels) AS category
+GROUP BY device_category;
+SET view_query_id = LAST_QUERY_ID();
+
+-- Persisted approach: aggregate over the bridge table
+SELECT device_category, COUNT(DISTINCT conversation_id) AS conversation_count
+FROM conversation_device_categories
+GROUP BY device_category;
+SET bridge_query_id = LAST_QUERY_ID();
+
+-- Elapsed time of both queries
+SELECT
+    CASE WHEN QUERY_ID = $view_query_id THEN 'AI_CLASSIFY per query' ELSE 'Bridge table aggregate' END AS category_counts,
+    TOTAL_ELAPSED_TIME / 1000 AS elapsed_seconds
+FROM TABLE(INFORMATION_SCHEMA.QUERY_HISTORY_BY_SESSION())
+WHERE QUERY_ID IN ($view_query_id, $bridge_query_id);
+
+-- AI_CLASSIFY tokens: the view query pays for every transcript, the dynamic table refreshes only for new ones
+SELECT
+    CASE WHEN q.QUERY_ID = $view_query_id THEN 'AI_CLASSIFY per query' ELSE 'Dynamic table refreshes' END AS category_counts,
+    SUM(c.TOKENS) AS tokens,
+    ROUND(SUM(c.TOKEN_CREDITS), 4) AS token_credits
+FROM SNOWFLAKE.ACCOUNT_USAGE.CORTEX_FUNCTIONS_QUERY_USAGE_HISTORY c
+JOIN SNOWFLAKE.ACCOUNT_USAGE.QUERY_HISTORY q ON q.QUERY_ID = c.QUERY_ID
+WHERE c.FUNCTION_NAME ILIKE '%CLASSIFY%'
+    AND (q.QUERY_ID = $view_query_id
+         OR (q.QUERY_TYPE = 'REFRESH_DYNAMIC_TABLE' AND q.QUERY_TEXT ILIKE '%PARSED_TRANSCRIPTS_MULTI_CATEGORY%'))
+GROUP BY 1;
+
+------------------------------------------------------------------------------------------------------------------------
+-- 7. Device classification: CLASSIFY_TEXT for every transcript vs keyword fast path
+------------------------------------------------------------------------------------------------------------------------
+
+USE SCHEMA ANALYTICS;
+
+-- Share of transcripts classified by the keyword fast path, i.e. CLASSIFY_TEXT calls avoided
+SELECT
+    COUNT(*) AS transcripts,
+    COUNT_IF(device_category_source = 'KEYWORD') AS keyword_matches,
+    COUNT_IF(device_category_source = 'CLASSIFY_TEXT') AS llm_classifications,
+    ROUND(100 * COUNT_IF(device_category_source = 'KEYWORD') / NULLIF(COUNT(*), 0), 1) AS llm_calls_avoided_pct
+FROM TRANSCRIPT_ANALYSIS_RESULTS_FINAL;
+
+-- Fast path status breakdown (ambiguous = devices from more than one category were mentioned)
+SELECT
+    DEVICE_FASTPATH_CLASSIFY(transcript, agent_name, customer_name):status::STRING AS fastpath_status,
+    COUNT(*) AS transcripts
+FROM parsed_transcripts
+GROUP BY fastpath_status
+ORDER BY transcripts DESC;
+
+-- Agreement between the fast path and CLASSIFY_TEXT on a sample of matched transcripts
+-- (validates that the keyword category is a safe replacement for the LLM label)
+SELECT
+    COUNT(*) AS sampled,
+    COUNT_IF(keyword_category = llm_category) AS agreeing,
+    ROUND(100 * COUNT_IF(keyword_category = llm_category) / NULLIF(COUNT(*), 0), 1) AS agreement_pct
+FROM (
+    SELECT
+        DEVICE_FASTPATH_CLASSIFY(transcript, agent_name, customer_name):device_category::STRING AS keyword_category,
+        SNOWFLAKE.CORTEX.CLASSIFY_TEXT(
+            transcript, 
+            ['Diabetes', 'Respiratory', 'Mobility', 'Urology', 'Pain Management', 'Monitoring', 'Orthopedic', 'Nutrition', 'Infusion', 'Wound Care','Other']
+        )['label']::STRING AS llm_category
+    FROM parsed_transcripts
+    WHERE DEVICE_FASTPATH_CLASSIFY(transcript, agent_name, customer_name):status::STRING = 'matched'
+    LIMIT 50
+);
+
+------------------------------------------------------------------------------------------------------------------------
+-- 8. Export format: JSON arrays vs gzip-compressed, size-rolled NDJSON at 100,000 conversations
+------------------------------------------------------------------------------------------------------------------------
+
+USE SCHEMA DATA_PREP;
+
+-- A separate stage, so the benchmark files are not picked up by LOAD_NEW_JSON_FILES
+CREATE OR REPLACE STAGE MED_DEVICE_TRANSCRIPTS.DATA_PREP.EXPORT_FORMAT_BENCH;
+
+-- 100,000 conversations with transcripts copied from the loaded ones, so no COMPLETE calls are needed
+TRUNCATE TABLE MED_DEVICE_TRANSCRIPTS.DATA_PREP.SUPPORT_CONVERSATIONS_NEW;
+INSERT INTO MED_DEVICE_TRANSCRIPTS.DATA_PREP.SUPPORT_CONVERSATIONS_NEW (START_TIME, END_TIME, AGENT_ID, CUSTOMER_ID, TRANSCRIPT)
+WITH sample_transcripts AS (
+    SELECT transcript, ROW_NUMBER() OVER (ORDER BY conversation_id) - 1 AS sample_number, COUNT(*) OVER () AS samples
+    FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_TRANSCRIPTS
+    WHERE transcript IS NOT NULL
+),
+generated AS (
+    SELECT
+        SEQ4() AS row_number,
+        DATEADD(minute, -1 * MOD(ABS(RANDOM()), 43200), CURRENT_TIMESTAMP()) AS START_TIME,
+        1 + MOD(ABS(RANDOM()), 8) AS AGENT_ID,
+        1 + MOD(ABS(RANDOM()), 100) AS CUSTOMER_ID
+    FROM TABLE(GENERATOR(ROWCOUNT => 100000))
+)
+SELECT g.START_TIME, DATEADD(minute, 10, g.START_TIME), g.AGENT_ID, g.CUSTOMER_ID, s.transcript
+FROM generated g
+JOIN sample_transcripts s ON s.sample_number = MOD(g.row_number, s.samples);
+
+-- JSON arrays: each ARRAY_AGG is one VARIANT, so the batch has to be split into enough files to keep every array
+-- under the VARIANT size limit; 32 files keep them around 10 MB
+CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.EXPORT_CONVERSATIONS_TO_JSON(32, 'ARRAY', 16, 0, '@MED_DEVICE_TRANSCRIPTS.DATA_PREP.EXPORT_FORMAT_BENCH/array');
+
+-- NDJSON: gzip-compressed files rolled every 16 MB of JSON
+CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.EXPORT_CONVERSATIONS_TO_JSON(1, 'NDJSON', 16, 0, '@MED_DEVICE_TRANSCRIPTS.DATA_PREP.EXPORT_FORMAT_BENCH/ndjson');
+
+-- Files and stage bytes per format
+LIST @MED_DEVICE_TRANSCRIPTS.DATA_PREP.EXPORT_FORMAT_BENCH;
+SELECT
+    SPLIT_PART(SPLIT_PART("name", 'export_format_bench/', 2), '/', 1) AS export_format,
+    COUNT(*) AS files,
+    ROUND(SUM("size") / 1024 / 1024, 1) AS stage_mb,
+    ROUND(MAX("size") / 1024 / 1024, 1) AS largest_file_mb
+FROM TABLE(RESULT_SCAN(LAST_QUERY_ID()))
+GROUP BY export_format;
+
+-- Load both exports into scratch copies of the staging table with the same projection as LOAD_NEW_JSON_FILES
+-- JSON_GZ_FORMAT reads both: STRIP_OUTER_ARRAY has no effect on NDJSON lines and the compression is detected
+CREATE OR REPLACE TRANSIENT TABLE MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_TRANSCRIPTS_ARRAY_BENCH LIKE MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_TRANSCRIPTS_STAGING;
+CREATE OR REPLACE TRANSIENT TABLE MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_TRANSCRIPTS_NDJSON_BENCH LIKE MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_TRANSCRIPTS_STAGING;
+
+-- Disable the result cache and run both loads on the same warehouse
+ALTER SESSION SET USE_CACHED_RESULT = FALSE;
+
+COPY INTO MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_TRANSCRIPTS_ARRAY_BENCH
+FROM (SELECT
+    'NEW',
+    $1:conversation_id::NUMBER,
+    $1:start_time::TIMESTAMP_NTZ,
+    $1:end_time::TIMESTAMP_NTZ,
+    $1:agent_name::STRING,
+    $1:customer_name::STRING,
+    $1:transcript::STRING,
+    METADATA$FILENAME,
+    CURRENT_TIMESTAMP()
+    FROM '@MED_DEVICE_TRANSCRIPTS.DATA_PREP.EXPORT_FORMAT_BENCH/array/')
+FILE_FORMAT = '"MED_DEVICE_TRANSCRIPTS"."ANALYTICS"."JSON_GZ_FORMAT"'
+ON_ERROR = ABORT_STATEMENT;
+SET array_load_query_id = LAST_QUERY_ID();
+
+COPY INTO MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_TRANSCRIPTS_NDJSON_BENCH
+FROM (SELECT
+    'NEW',
+    $1:conversation_id::NUMBER,
+    $1:start_time::TIMESTAMP_NTZ,
+    $1:end_time::TIMESTAMP_NTZ,
+    $1:agent_name::STRING,
+    $1:customer_name::STRING,
+    $1:transcript::STRING,
+    METADATA$FILENAME,
+    CURRENT_TIMESTAMP()
+    FROM '@MED_DEVICE_TRANSCRIPTS.DATA_PREP.EXPORT_FORMAT_BENCH/ndjson/')
+FILE_FORMAT = '"MED_DEVICE_TRANSCRIPTS"."ANALYTICS"."JSON_GZ_FORMAT"'
+ON_ERROR = ABORT_STATEMENT;
+SET ndjson_load_query_id = LAST_QUERY_ID();
+
+ALTER SESSION UNSET USE_CACHED_RESULT;
+
+-- Load time, rows and throughput per format
+SELECT
+    CASE WHEN QUERY_ID = $array_load_query_id THEN 'JSON arrays' ELSE 'Gzip NDJSON' END AS export_format,
+    ROWS_PRODUCED AS rows_loaded,
+    TOTAL_ELAPSED_TIME / 1000 AS elapsed_seconds,
+    EXECUTION_TIME / 1000 AS execution_seconds,
+    ROUND(ROWS_PRODUCED / NULLIF(TOTAL_ELAPSED_TIME / 1000, 0)) AS rows_per_second
+FROM TABLE(INFORMATION_SCHEMA.QUERY_HISTORY_BY_SESSION())
+WHERE QUERY_ID IN ($array_load_query_id, $ndjson_load_query_id);
+
+-- Both loads must contain the same conversations
+SELECT
+    (SELECT COUNT(*) FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_TRANSCRIPTS_ARRAY_BENCH) AS array_rows,
+    (SELECT COUNT(*) FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_TRANSCRIPTS_NDJSON_BENCH) AS ndjson_rows,
+    (SELECT COUNT(*) FROM (
+        SELECT CONVERSATION_ID, TRANSCRIPT FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_TRANSCRIPTS_ARRAY_BENCH
+        MINUS
+        SELECT CONVERSATION_ID, TRANSCRIPT FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_TRANSCRIPTS_NDJSON_BENCH
+    )) AS mismatched_rows;
+
+-- Clean up the benchmark rows, files and tables
+TRUNCATE TABLE MED_DEVICE_TRANSCRIPTS.DATA_PREP.SUPPORT_CONVERSATIONS_NEW;
+DROP STAGE IF EXISTS MED_DEVICE_TRANSCRIPTS.DATA_PREP.EXPORT_FORMAT_BENCH;
+DROP TABLE IF EXISTS MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_TRANSCRIPTS_ARRAY_BENCH;
+DROP TABLE IF EXISTS MED_DEVICE_TRANSCRIPTS.ANALYTICS.RAW_TRANSCRIPTS_NDJSON_BENCH;
+
+------------------------------------------------------------------------------------------------------------------------
+-- 9. Date-range pruning: whole-table dashboard loads vs START_TIME range on tables clustered by date
+------------------------------------------------------------------------------------------------------------------------
+
+-- The analysis tables are clustered on TO_DATE(start_time) (Cortex_Analysis.sql and Lazy_Enrichment.sql). Pruning only
+-- shows once a table spans many micro-partitions, so run this after loading a larger volume of conversations
+
+USE SCHEMA ANALYTICS;
+ALTER SESSION SET USE_CACHED_RESULT = FALSE;
+
+-- How well the rows are clustered by date (average depth close to 1 means each day lives in few micro-partitions)
+SELECT SYSTEM$CLUSTERING_INFORMATION('MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL') AS dynamic_table_clustering;
+SELECT SYSTEM$CLUSTERING_INFORMATION('MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL') AS search_table_clustering;
+
+-- Original dashboard load: the whole table, with the date filter applied afterwards in pandas
+SELECT *
+FROM TRANSCRIPT_ANALYSIS_RESULTS_FINAL
+ORDER BY START_TIME DESC;
+SET full_load_query_id = LAST_QUERY_ID();
+
+-- Dashboard load with the date picker pushed down: the last 7 days of data
+SET range_end = (SELECT MAX(START_TIME)::DATE FROM TRANSCRIPT_ANALYSIS_RESULTS_FINAL);
+SELECT *
+FROM TRANSCRIPT_ANALYSIS_RESULTS_FINAL
+WHERE START_TIME BETWEEN DATEADD('day', -6, $range_end)::TIMESTAMP_NTZ AND DATEADD('microsecond', -1, DATEADD('day', 1, $range_end)::TIMESTAMP_NTZ)
+ORDER BY START_TIME DESC;
+SET range_load_query_id = LAST_QUERY_ID();
+
+ALTER SESSION UNSET USE_CACHED_RESULT;
+
+-- Partitions scanned vs total for both loads, from the table scan operators of the query profiles
+SELECT
+    'Whole table' AS dashboard_load,
+    OPERATOR_ATTRIBUTES:table_name::STRING AS table_name,
+    OPERATOR_STATISTICS:pruning:partitions_scanned::NUMBER AS partitions_scanned,
+    OPERATOR_STATISTICS:pruning:partitions_total::NUMBER AS partitions_total,
+    ROUND(100 * OPERATOR_STATISTICS:pruning:partitions_scanned::NUMBER / NULLIF(OPERATOR_STATISTICS:pruning:partitions_total::NUMBER, 0), 1) AS scanned_pct,
+    OPERATOR_STATISTICS:io:bytes_scanned::NUMBER AS bytes_scanned
+FROM TABLE(GET_QUERY_OPERATOR_STATS($full_load_query_id))
+WHERE OPERATOR_TYPE = 'TableScan'
+UNION ALL
+SELECT
+    'Last 7 days',
+    OPERATOR_ATTRIBUTES:table_name::STRING,
+    OPERATOR_STATISTICS:pruning:partitions_scanned::NUMBER,
+    OPERATOR_STATISTICS:pruning:partitions_total::NUMBER,
+    ROUND(100 * OPERATOR_STATISTICS:pruning:partitions_scanned::NUMBER / NULLIF(OPERATOR_STATISTICS:pruning:partitions_total::NUMBER, 0), 1),
+    OPERATOR_STATISTICS:io:bytes_scanned::NUMBER
+FROM TABLE(GET_QUERY_OPERATOR_STATS($range_load_query_id))
+WHERE OPERATOR_TYPE = 'TableScan';
+
+-- Elapsed time of both loads
+SELECT
+    CASE WHEN QUERY_ID = $full_load_query_id THEN 'Whole table' ELSE 'Last 7 days' END AS dashboard_load,
+    ROWS_PRODUCED,
+    TOTAL_ELAPSED_TIME / 1000 AS elapsed_seconds
+FROM TABLE(INFORMATION_SCHEMA.QUERY_HISTORY_BY_SESSION())
+WHERE QUERY_ID IN ($full_load_query_id, $range_load_query_id);
+
+-- Pruning of the dashboard queries over the last 7 days (ACCOUNT_USAGE can lag behind by up to 45 minutes)
+SELECT
+    IFF(QUERY_TEXT ILIKE '%START_TIME BETWEEN%', 'Date range pushed down', 'Whole table') AS dashboard_load,
+    COUNT(*) AS queries,
+    SUM(PARTITIONS_SCANNED) AS partitions_scanned,
+    SUM(PARTITIONS_TOTAL) AS partitions_total,
+    ROUND(100 * SUM(PARTITIONS_SCANNED) / NULLIF(SUM(PARTITIONS_TOTAL), 0), 1) AS scanned_pct,
+    ROUND(AVG(TOTAL_ELAPSED_TIME) / 1000, 2) AS avg_elapsed_seconds
+FROM SNOWFLAKE.ACCOUNT_USAGE.QUERY_HISTORY
+WHERE START_TIME >= DATEADD('day', -7, CURRENT_TIMESTAMP())
+    AND QUERY_TYPE = 'SELECT'
+    AND (QUERY_TEXT ILIKE '%FROM TRANSCRIPT_ANALYSIS_RESULTS_FINAL%' OR QUERY_TEXT ILIKE '%FROM TRANSCRIPT_ANALYSIS_RESULTS_LAZY%')
+GROUP BY dashboard_load;
@@ -0,0 +1,240 @@
+-- Rolling_Summaries.sql
+-- SQL script for the rolling agent and device category summaries: updated with the new calls only, read instantly by the dashboards
+
+-- Set Context to ACCOUNTADMIN
+USE ROLE ACCOUNTADMIN;
+
+-- Setting Context
+USE DATABASE MED_DEVICE_TRANSCRIPTS;
+USE SCHEMA ANALYTICS;
+
+/* The AISQL notebook summarizes each agent with AI_SUMMARIZE_AGG over every transcript of the agent, so each run reads
+(and pays for) the whole history again, and the dashboards can not show the summaries without waiting for it. Instead:
+- ROLLING_SUMMARIES keeps one summary per agent and per device category, with the calls it covers
+- UPDATE_ROLLING_SUMMARIES folds in only the calls that are not in a summary yet: it summarizes their per-call
+  transcript_summary with AI_AGG and combines the result with the previous summary in one COMPLETE call per summary
+- the summaries cover a configurable window of days, ending at the latest call. A summary whose first call is more
+  than REBUILD_SLACK_DAYS older than the window is rebuilt from the calls in the window, so the cost of an update is
+  bounded by the new calls and the window, not by the history
+The dashboards read the table (Med_Device_Transcripts_Overview.py, Agent Metrics tab).
+The AI_AGG and COMPLETE tokens of each update are recorded in CORTEX_TOKEN_USAGE with PIPELINE 'ROLLING_SUMMARIES'.
+This script uses TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL and CORTEX_TOKEN_USAGE, created in Cortex_Analysis.sql */
+
+-- Create the summary table: one row per agent (SUMMARY_TYPE 'AGENT') and per device category ('DEVICE')
+CREATE TABLE IF NOT EXISTS MED_DEVICE_TRANSCRIPTS.ANALYTICS.ROLLING_SUMMARIES (
+    SUMMARY_TYPE VARCHAR,
+    SUMMARY_KEY VARCHAR,
+    WINDOW_DAYS NUMBER,
+    SUMMARY VARCHAR,
+    CALLS_SUMMARIZED NUMBER,
+    FIRST_CALL_TIME TIMESTAMP_NTZ,
+    LAST_CALL_TIME TIMESTAMP_NTZ,
+    UPDATED_AT TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP()
+);
+
+-- Create the table of the calls folded into each summary, so an update only reads the calls that are not in it yet
+CREATE TABLE IF NOT EXISTS MED_DEVICE_TRANSCRIPTS.ANALYTICS.ROLLING_SUMMARY_CALLS (
+    SUMMARY_TYPE VARCHAR,
+    SUMMARY_KEY VARCHAR,
+    CONVERSATION_ID NUMBER,
+    FOLDED_AT TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP()
+);
+
+-- Create a procedure that folds the new calls of the window into the summaries
+-- The Cortex calls are made into temporary tables before the transaction: creating a table is DDL, which would commit
+-- an open transaction. The transaction then only applies the results, and any error rolls it back and is raised
+CREATE OR REPLACE PROCEDURE MED_DEVICE_TRANSCRIPTS.ANALYTICS.UPDATE_ROLLING_SUMMARIES(
+    WINDOW_DAYS NUMBER,
+    REBUILD_SLACK_DAYS NUMBER
+)
+RETURNS VARCHAR
+LANGUAGE SQL
+AS
+$$
+DECLARE
+    window_start TIMESTAMP_NTZ;
+    rebuild_before TIMESTAMP_NTZ;
+    summaries_rebuilt INT DEFAULT 0;
+    calls_folded INT DEFAULT 0;
+    summaries_updated INT DEFAULT 0;
+    summaries_created INT DEFAULT 0;
+    update_time TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP();
+BEGIN
+    -- The window ends at the latest call rather than today, so a table of older calls (like the demo data) still has summaries
+    SELECT DATEADD(day, -:WINDOW_DAYS, MAX(start_time))
+    INTO :window_start
+    FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL;
+
+    IF (window_start IS NULL) THEN
+        RETURN 'No calls to summarize';
+    END IF;
+
+    -- Summaries that cover too much history (or another window) are dropped and built again from the calls in the window
+    rebuild_before := DATEADD(day, -:REBUILD_SLACK_DAYS, :window_start);
+
+    -- The calls of the window that are not in a summary that is kept
+    CREATE OR REPLACE TEMPORARY TABLE ROLLING_SUMMARY_NEW_CALLS AS
+    WITH window_calls AS (
+        SELECT 'AGENT' as summary_type, agent_name as summary_key, conversation_id, start_time, transcript_summary
+        FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL
+        WHERE start_time >= :window_start AND agent_name IS NOT NULL
+        UNION ALL
+        SELECT 'DEVICE', device_category, conversation_id, start_time, transcript_summary
+        FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL
+        WHERE start_time >= :window_start AND device_category IS NOT NULL
+    )
+    SELECT w.*
+    FROM window_calls w
+    WHERE w.transcript_summary IS NOT NULL
+    AND NOT EXISTS (
+        SELECT 1
+        FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.ROLLING_SUMMARY_CALLS c
+        JOIN MED_DEVICE_TRANSCRIPTS.ANALYTICS.ROLLING_SUMMARIES s
+            ON s.summary_type = c.summary_type AND s.summary_key = c.summary_key
+        WHERE c.summary_type = w.summary_type
+        AND c.summary_key = w.summary_key
+        AND c.conversation_id = w.conversation_id
+        AND s.first_call_time >= :rebuild_before
+        AND s.window_days = :WINDOW_DAYS
+    );
+
+    -- Summarize the new calls of each summary, then combine that with the kept summary in one COMPLETE call.
+    -- AI_AGG does not report its usage, so its tokens are counted with COUNT_TOKENS on the per-call summaries it read
+    -- and on its result; COMPLETE is called with options so it returns the usage
+    CREATE OR REPLACE TEMPORARY TABLE ROLLING_SUMMARY_UPDATES AS
+    WITH new_summaries AS (
+        SELECT summary_type, summary_key, COUNT(*) as new_calls, MIN(start_time) as first_call_time, MAX(start_time) as last_call_time,
+            SUM(SNOWFLAKE.CORTEX.COUNT_TOKENS('summarize', transcript_summary)) as aggregated_tokens,
+            AI_AGG(transcript_summary, 'How well has this agent done providing customer service? Answer in 25 words or less.') as new_summary
+        FROM ROLLING_SUMMARY_NEW_CALLS
+        WHERE summary_type = 'AGENT'
+        GROUP BY summary_type, summary_key
+        UNION ALL
+        SELECT summary_type, summary_key, COUNT(*), MIN(start_time), MAX(start_time),
+            SUM(SNOWFLAKE.CORTEX.COUNT_TOKENS('summarize', transcript_summary)),
+            AI_AGG(transcript_summary, 'What problems do customers have with this kind of device, and how well are they resolved? Answer in 25 words or less.')
+        FROM ROLLING_SUMMARY_NEW_CALLS
+        WHERE summary_type = 'DEVICE'
+        GROUP BY summary_type, summary_key
+    ),
+    kept_summaries AS (
+        SELECT *
+        FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.ROLLING_SUMMARIES
+        WHERE first_call_time >= :rebuild_before AND window_days = :WINDOW_DAYS
+    ),
+    combined AS (
+        SELECT n.*, SNOWFLAKE.CORTEX.COMPLETE(
+            'mistral-large2',
+            [{'role': 'user', 'content':
+                'Combine these two summaries of customer service calls into one summary of 25 words or less. ' ||
+                'Weigh each summary by its number of calls. Answer with the summary only.\n\n' ||
+                'Earlier summary (' || k.calls_summarized || ' calls): ' || k.summary || '\n\n' ||
+                'New summary (' || n.new_calls || ' calls): ' || n.new_summary}],
+            {'temperature': 0}
+        ) as combine_response
+        FROM new_summaries n
+        JOIN kept_summaries k ON k.summary_type = n.summary_type AND k.summary_key = n.summary_key
+    )
+    -- A new agent or device category gets the AI_AGG summary as is
+    SELECT n.*, NULL::VARIANT as combine_response, n.new_summary as summary
+    FROM new_summaries n
+    WHERE NOT EXISTS (
+        SELECT 1 FROM kept_summaries k WHERE k.summary_type = n.summary_type AND k.summary_key = n.summary_key
+    )
+    UNION ALL
+    SELECT c.*, c.combine_response['choices'][0]['messages']::STRING as summary
+    FROM combined c;
+
+    BEGIN TRANSACTION;
+
+    DELETE FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.ROLLING_SUMMARY_CALLS c
+    USING MED_DEVICE_TRANSCRIPTS.ANALYTICS.ROLLING_SUMMARIES s
+    WHERE c.summary_type = s.summary_type
+    AND c.summary_key = s.summary_key
+    AND (s.first_call_time < :rebuild_before OR s.window_days <> :WINDOW_DAYS);
+
+    DELETE FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.ROLLING_SUMMARIES
+    WHERE first_call_time < :rebuild_before OR window_days <> :WINDOW_DAYS;
+
+    summaries_rebuilt := SQLROWCOUNT;
+
+    MERGE INTO MED_DEVICE_TRANSCRIPTS.ANALYTICS.ROLLING_SUMMARIES s
+    USING ROLLING_SUMMARY_UPDATES n
+    ON s.summary_type = n.summary_type AND s.summary_key = n.summary_key
+    WHEN MATCHED THEN UPDATE SET
+        summary = n.summary,
+        calls_summarized = s.calls_summarized + n.new_calls,
+        first_call_time = LEAST(s.first_call_time, n.first_call_time),
+        last_call_time = GREATEST(s.last_call_time, n.last_call_time),
+        updated_at = :update_time
+    WHEN NOT MATCHED THEN INSERT
+        (summary_type, summary_key, window_days, summary, calls_summarized, first_call_time, last_call_time, updated_at)
+    VALUES
+        (n.summary_type, n.summary_key, :WINDOW_DAYS, n.summary, n.new_calls, n.first_call_time, n.last_call_time, :update_time);
+
+    SELECT "number of rows inserted", "number of rows updated"
+    INTO :summaries_created, :summaries_updated
+    FROM TABLE(RESULT_SCAN(LAST_QUERY_ID()));
+
+    INSERT INTO MED_DEVICE_TRANSCRIPTS.ANALYTICS.ROLLING_SUMMARY_CALLS (summary_type, summary_key, conversation_id, folded_at)
+    SELECT summary_type, summary_key, conversation_id, :update_time
+    FROM ROLLING_SUMMARY_NEW_CALLS;
+
+    calls_folded := SQLROWCOUNT;
+
+    -- Record the tokens of the update in CORTEX_TOKEN_USAGE (created in Cortex_Analysis.sql), one AI_AGG row and at
+    -- most one COMPLETE row per summary. The rows belong to no single conversation, so CONVERSATION_ID is NULL
+    INSERT INTO MED_DEVICE_TRANSCRIPTS.ANALYTICS.CORTEX_TOKEN_USAGE
+        (conversation_id, function_name, model, call_count, input_hash, input_tokens, output_tokens, recorded_at, pipeline)
+    SELECT NULL, 'AI_AGG', NULL, 1, HASH(summary_type, summary_key, new_summary),
+        aggregated_tokens, SNOWFLAKE.CORTEX.COUNT_TOKENS('summarize', new_summary), :update_time, 'ROLLING_SUMMARIES'
+    FROM ROLLING_SUMMARY_UPDATES
+    UNION ALL
+    SELECT NULL, 'COMPLETE', 'mistral-large2', 1, HASH(summary_type, summary_key, summary),
+        combine_response['usage']['prompt_tokens']::INT, combine_response['usage']['completion_tokens']::INT,
+        :update_time, 'ROLLING_SUMMARIES'
+    FROM ROLLING_SUMMARY_UPDATES
+    WHERE combine_response IS NOT NULL;
+
+    COMMIT;
+
+    DROP TABLE IF EXISTS ROLLING_SUMMARY_NEW_CALLS;
+    DROP TABLE IF EXISTS ROLLING_SUMMARY_UPDATES;
+
+    RETURN 'Folded ' || calls_folded || ' calls: ' || summaries_created || ' summaries created, ' ||
+        summaries_updated || ' updated, ' || summaries_rebuilt || ' rebuilt';
+EXCEPTION
+    WHEN OTHER THEN
+        -- Roll back and raise, so the task run is recorded as failed
+        ROLLBACK;
+        RAISE;
+END;
+$$;
+
+-- Create a task that updates the summaries every hour with the last 30 days of calls
+-- Folding hourly rather than after every sync keeps the number of COMPLETE calls (one per changed summary) small
+CREATE OR REPLACE TASK MED_DEVICE_TRANSCRIPTS.ANALYTICS.UPDATE_ROLLING_SUMMARIES_TASK
+    WAREHOUSE = CORTEX_DEMO_WH
+    SCHEDULE = '60 MINUTE'
+AS
+    CALL MED_DEVICE_TRANSCRIPTS.ANALYTICS.UPDATE_ROLLING_SUMMARIES(30, 7);
+
+ALTER TASK MED_DEVICE_TRANSCRIPTS.ANALYTICS.UPDATE_ROLLING_SUMMARIES_TASK RESUME;
+
+-- Suspend the task
+-- ALTER TASK MED_DEVICE_TRANSCRIPTS.ANALYTICS.UPDATE_ROLLING_SUMMARIES_TASK SUSPEND;
+
+-- Build the summaries now rather than waiting for the first task run
+CALL MED_DEVICE_TRANSCRIPTS.ANALYTICS.UPDATE_ROLLING_SUMMARIES(30, 7);
+
+-- The agent summaries
+SELECT summary_key as agent_name, summary, calls_summarized, first_call_time, last_call_time, updated_at
+FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.ROLLING_SUMMARIES
+WHERE summary_type = 'AGENT'
+ORDER BY agent_name;
+
+-- The device category summaries
+SELECT summary_key as device_category, summary, calls_summarized, first_call_time, last_call_time, updated_at
+FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.ROLLING_SUMMARIES
+WHERE summary_type = 'DEVICE'
+ORDER BY calls_summarized DESC;
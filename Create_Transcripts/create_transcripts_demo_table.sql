@@ -248,6 +248,8 @@ DECLARE
     prompt VARCHAR;
     transcript VARCHAR;
     row_count INTEGER DEFAULT 0;
+    run_started_at TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP();
+    elapsed_seconds FLOAT;
 BEGIN
     FOR record IN conv_cursor DO
         curr_conversation_id := record.CONVERSATION_ID;
@@ -284,12 +286,72 @@ BEGIN
         row_count := row_count + 1;
     END FOR;
     
-    RETURN 'Successfully generated ' || row_count || ' transcripts';
+    -- Report throughput so the cursor can be compared with the set-based procedure below
+    elapsed_seconds := DATEDIFF('millisecond', :run_started_at, CURRENT_TIMESTAMP()) / 1000;
+    RETURN 'Successfully generated ' || row_count || ' transcripts in ' || ROUND(elapsed_seconds, 1) || ' seconds ('
+        || COALESCE(TO_VARCHAR(ROUND(row_count / NULLIF(elapsed_seconds, 0) * 60, 1)), 'n/a') || ' rows/minute)';
 END;
 $$;
 
--- Call the procedure to generate transcripts
-CALL MED_DEVICE_TRANSCRIPTS.CREATE_TRANSCRIPTS.GENERATE_TRANSCRIPTS();
+-- Set-based alternative to the cursor above. The cursor makes one synchronous COMPLETE call and one single-row UPDATE per conversation.
+-- This procedure builds every prompt in one statement, runs all of the COMPLETE calls as one query (which Snowflake parallelizes
+-- across the warehouse) and applies the results with a single UPDATE ... FROM
+CREATE OR REPLACE PROCEDURE MED_DEVICE_TRANSCRIPTS.CREATE_TRANSCRIPTS.GENERATE_TRANSCRIPTS_BATCH()
+RETURNS VARCHAR
+LANGUAGE SQL
+AS
+$$
+DECLARE
+    row_count INTEGER DEFAULT 0;
+    run_started_at TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP();
+    elapsed_seconds FLOAT;
+BEGIN
+    -- Step 1: Build the prompt for every conversation that does not have a transcript yet
+    CREATE OR REPLACE TEMPORARY TABLE transcript_prompts AS
+    SELECT
+        SC.CONVERSATION_ID,
+        CONCAT(
+            'Generate a realistic transcript of a conversation between a customer support agent and a customer for a medical device company. ',
+            'The conversation should be at least 2 minutes long, showing timestamps. ',
+            'The customer is calling about their ', SC.DEVICE_NAME, ' with one of the following issues: ', SC.COMMON_ISSUE, '. ',
+            'The sentiment should be ', SC.SENTIMENT, '. ',
+            'The issue should be ', CASE WHEN SC.ISSUE_RESOLVED THEN 'resolved' ELSE 'unresolved' END, '. ',
+            'Format it as a back-and-forth dialogue with timestamps, customer name, and agent name. ',
+            'The customer name is ', C.CUSTOMER_NAME, ' ',
+            'and the agent name is ', A.AGENT_NAME, '. ',
+            'Make the conversation detailed and realistic with complete sentences. ',
+            'Only output the transcript itself, no additional text.'
+        ) AS PROMPT
+    FROM MED_DEVICE_TRANSCRIPTS.CREATE_TRANSCRIPTS.SUPPORT_CONVERSATIONS SC
+    JOIN MED_DEVICE_TRANSCRIPTS.CREATE_TRANSCRIPTS.CUSTOMERS C ON SC.CUSTOMER_ID = C.CUSTOMER_ID
+    JOIN MED_DEVICE_TRANSCRIPTS.CREATE_TRANSCRIPTS.SUPPORT_AGENTS A ON SC.AGENT_ID = A.AGENT_ID
+    WHERE SC.TRANSCRIPT IS NULL;
+    
+    -- Step 2: Generate all of the transcripts in a single query
+    CREATE OR REPLACE TEMPORARY TABLE generated_transcripts AS
+    SELECT
+        CONVERSATION_ID,
+        SNOWFLAKE.CORTEX.COMPLETE('CLAUDE-3-5-SONNET', PROMPT) AS TRANSCRIPT
+    FROM transcript_prompts;
+    
+    -- Step 3: Apply every generated transcript with one UPDATE
+    UPDATE MED_DEVICE_TRANSCRIPTS.CREATE_TRANSCRIPTS.SUPPORT_CONVERSATIONS SC
+    SET TRANSCRIPT = GT.TRANSCRIPT
+    FROM generated_transcripts GT
+    WHERE SC.CONVERSATION_ID = GT.CONVERSATION_ID;
+    row_count := SQLROWCOUNT;
+    
+    elapsed_seconds := DATEDIFF('millisecond', :run_started_at, CURRENT_TIMESTAMP()) / 1000;
+    RETURN 'Successfully generated ' || row_count || ' transcripts in ' || ROUND(elapsed_seconds, 1) || ' seconds ('
+        || COALESCE(TO_VARCHAR(ROUND(row_count / NULLIF(elapsed_seconds, 0) * 60, 1)), 'n/a') || ' rows/minute)';
+END;
+$$;
+
+-- Call the set-based procedure to generate transcripts
+CALL MED_DEVICE_TRANSCRIPTS.CREATE_TRANSCRIPTS.GENERATE_TRANSCRIPTS_BATCH();
+
+-- The original cursor procedure can still be called for comparison (see Analytics_Setup/Pipeline_Benchmarks.sql)
+-- CALL MED_DEVICE_TRANSCRIPTS.CREATE_TRANSCRIPTS.GENERATE_TRANSCRIPTS();
 
 -- Query to check results
 SELECT 
@@ -57,6 +57,12 @@ CREATE OR REPLACE TABLE MED_DEVICE_TRANSCRIPTS.DATA_PREP.SUPPORT_CONVERSATIONS_N
     FOREIGN KEY (CUSTOMER_ID) REFERENCES MED_DEVICE_TRANSCRIPTS.CREATE_TRANSCRIPTS.CUSTOMERS(CUSTOMER_ID)
 );
 
+-- Create a sequence for the conversation IDs of the new records
+-- SUPPORT_CONVERSATIONS_NEW is truncated after every batch, so its AUTOINCREMENT column and MAX(CONVERSATION_ID) do not
+-- see the conversations that were already exported. The sequence is kept when the script is run again and starts
+-- above the 1000..999999999 range of the random IDs of earlier versions, so new IDs never collide with loaded ones
+CREATE SEQUENCE IF NOT EXISTS MED_DEVICE_TRANSCRIPTS.DATA_PREP.CONVERSATION_ID_SEQ START = 1000000000;
+
 -- Create a new procedure to generate transcripts for the SUPPORT_CONVERSATIONS_NEW table
 CREATE OR REPLACE PROCEDURE MED_DEVICE_TRANSCRIPTS.DATA_PREP.GENERATE_TRANSCRIPTS_NEW_RECORDS()
 RETURNS VARCHAR
@@ -88,6 +94,8 @@ DECLARE
     prompt VARCHAR;
     transcript VARCHAR;
     row_count INTEGER DEFAULT 0;
+    run_started_at TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP();
+    elapsed_seconds FLOAT;
 BEGIN
     FOR record IN conv_cursor DO
         curr_conversation_id := record.CONVERSATION_ID;
@@ -124,15 +132,90 @@ BEGIN
         row_count := row_count + 1;
     END FOR;
     
-    RETURN 'Successfully generated ' || row_count || ' transcripts';
+    -- Report throughput so the cursor can be compared with the set-based procedure below
+    elapsed_seconds := DATEDIFF('millisecond', :run_started_at, CURRENT_TIMESTAMP()) / 1000;
+    RETURN 'Successfully generated ' || row_count || ' transcripts in ' || ROUND(elapsed_seconds, 1) || ' seconds ('
+        || COALESCE(TO_VARCHAR(ROUND(row_count / NULLIF(elapsed_seconds, 0) * 60, 1)), 'n/a') || ' rows/minute)';
 END;
 $$;
 
--- Call the procedure to generate transcripts
-CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.GENERATE_TRANSCRIPTS_NEW_RECORDS();
+-- Set-based alternative to the cursor above. The cursor makes one synchronous COMPLETE call and one single-row UPDATE per conversation.
+-- This procedure builds every prompt in one statement, runs all of the COMPLETE calls as one query (which Snowflake parallelizes
+-- across the warehouse) and applies the results with a single UPDATE ... FROM
+CREATE OR REPLACE PROCEDURE MED_DEVICE_TRANSCRIPTS.DATA_PREP.GENERATE_TRANSCRIPTS_NEW_RECORDS_BATCH()
+RETURNS VARCHAR
+LANGUAGE SQL
+AS
+$$
+DECLARE
+    row_count INTEGER DEFAULT 0;
+    run_started_at TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP();
+    elapsed_seconds FLOAT;
+BEGIN
+    -- Step 1: Build the prompt for every conversation that does not have a transcript yet
+    CREATE OR REPLACE TEMPORARY TABLE transcript_prompts AS
+    SELECT
+        SC.CONVERSATION_ID,
+        CONCAT(
+            'Generate a realistic transcript of a conversation between a customer support agent and a customer for a medical device company. ',
+            'The conversation should be at least 2 minutes long, showing timestamps. ',
+            'The customer is calling about their ', SC.DEVICE_NAME, ' with one of the following issues: ', SC.COMMON_ISSUE, '. ',
+            'The sentiment should be ', SC.SENTIMENT, '. ',
+            'The issue should be ', CASE WHEN SC.ISSUE_RESOLVED THEN 'resolved' ELSE 'unresolved' END, '. ',
+            'Format it as a back-and-forth dialogue with timestamps, customer name, and agent name. ',
+            'The customer name is ', C.CUSTOMER_NAME, ' ',
+            'and the agent name is ', A.AGENT_NAME, '. ',
+            'Make the conversation detailed and realistic with complete sentences. ',
+            'Only output the transcript itself, no additional text.'
+        ) AS PROMPT
+    FROM MED_DEVICE_TRANSCRIPTS.DATA_PREP.SUPPORT_CONVERSATIONS_NEW SC
+    JOIN MED_DEVICE_TRANSCRIPTS.CREATE_TRANSCRIPTS.CUSTOMERS C ON SC.CUSTOMER_ID = C.CUSTOMER_ID
+    JOIN MED_DEVICE_TRANSCRIPTS.CREATE_TRANSCRIPTS.SUPPORT_AGENTS A ON SC.AGENT_ID = A.AGENT_ID
+    WHERE SC.TRANSCRIPT IS NULL;
+    
+    -- Step 2: Generate all of the transcripts in a single query
+    CREATE OR REPLACE TEMPORARY TABLE generated_transcripts AS
+    SELECT
+        CONVERSATION_ID,
+        SNOWFLAKE.CORTEX.COMPLETE('CLAUDE-3-5-SONNET', PROMPT) AS TRANSCRIPT
+    FROM transcript_prompts;
+    
+    -- Step 3: Apply every generated transcript with one UPDATE
+    UPDATE MED_DEVICE_TRANSCRIPTS.DATA_PREP.SUPPORT_CONVERSATIONS_NEW SC
+    SET TRANSCRIPT = GT.TRANSCRIPT
+    FROM generated_transcripts GT
+    WHERE SC.CONVERSATION_ID = GT.CONVERSATION_ID;
+    row_count := SQLROWCOUNT;
+    
+    elapsed_seconds := DATEDIFF('millisecond', :run_started_at, CURRENT_TIMESTAMP()) / 1000;
+    RETURN 'Successfully generated ' || row_count || ' transcripts in ' || ROUND(elapsed_seconds, 1) || ' seconds ('
+        || COALESCE(TO_VARCHAR(ROUND(row_count / NULLIF(elapsed_seconds, 0) * 60, 1)), 'n/a') || ' rows/minute)';
+END;
+$$;
+
+-- Call the set-based procedure to generate transcripts
+CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.GENERATE_TRANSCRIPTS_NEW_RECORDS_BATCH();
+
+-- The original cursor procedure can still be called for comparison (see Analytics_Setup/Pipeline_Benchmarks.sql)
+-- CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.GENERATE_TRANSCRIPTS_NEW_RECORDS();
 
--- Create a procedure to export conversation data to a JSON file with a timestamp in the filename
-CREATE OR REPLACE PROCEDURE MED_DEVICE_TRANSCRIPTS.DATA_PREP.EXPORT_CONVERSATIONS_TO_JSON()
+-- Create a procedure to export conversation data to JSON files with a timestamp in the filename
+-- EXPORT_FORMAT 'ARRAY' (default) writes each file as one JSON array; FILES_PER_BATCH splits the conversations
+-- round-robin across that many files so large batches can be loaded in parallel
+-- EXPORT_FORMAT 'NDJSON' writes gzip-compressed newline-delimited JSON (one conversation per line) instead, rolled to a
+-- new file every MAX_FILE_MB megabytes of uncompressed JSON or, when MAX_ROWS_PER_FILE is set, every MAX_ROWS_PER_FILE
+-- conversations. The rows are numbered in conversation_id order, so the same batch always produces the same files
+-- (conversations_<timestamp>_00000.json.gz, _00001, ...). COPY INTO loads the files and the lines within them in
+-- parallel, without one large VARIANT parse per file
+DROP PROCEDURE IF EXISTS MED_DEVICE_TRANSCRIPTS.DATA_PREP.EXPORT_CONVERSATIONS_TO_JSON();
+DROP PROCEDURE IF EXISTS MED_DEVICE_TRANSCRIPTS.DATA_PREP.EXPORT_CONVERSATIONS_TO_JSON(INT);
+CREATE OR REPLACE PROCEDURE MED_DEVICE_TRANSCRIPTS.DATA_PREP.EXPORT_CONVERSATIONS_TO_JSON(
+    FILES_PER_BATCH INT DEFAULT 1,
+    EXPORT_FORMAT VARCHAR DEFAULT 'ARRAY',
+    MAX_FILE_MB INT DEFAULT 16,
+    MAX_ROWS_PER_FILE INT DEFAULT 0,
+    TARGET_STAGE VARCHAR DEFAULT '@MED_DEVICE_TRANSCRIPTS.DATA_PREP.call_data_new'
+)
 RETURNS VARCHAR
 LANGUAGE SQL
 AS
@@ -142,36 +225,107 @@ DECLARE
     filename VARCHAR;
     query_text VARCHAR;
     result VARCHAR;
+    export_mode VARCHAR;
+    file_count INT;
+    row_count INT;
+    max_file_bytes INT;
+    filenames ARRAY DEFAULT ARRAY_CONSTRUCT();
 BEGIN
-    -- Generate a timestamp string for the filename (format: YYYYMMDD_HHMMSS)
-    timestamp_str := TO_VARCHAR(CURRENT_TIMESTAMP(), 'YYYYMMDD_HHMMSS');
-    filename := 'conversations_' || timestamp_str || '.json';
+    -- Generate a timestamp string for the filename (format: YYYYMMDD_HHMMSSmmm)
+    -- Milliseconds are included so that batches exported within the same second do not overwrite each other
+    timestamp_str := TO_VARCHAR(CURRENT_TIMESTAMP(), 'YYYYMMDD_HH24MISSFF3');
+    export_mode := UPPER(COALESCE(EXPORT_FORMAT, 'ARRAY'));
+    IF (export_mode NOT IN ('ARRAY', 'NDJSON')) THEN
+        RETURN 'Unknown EXPORT_FORMAT ' || EXPORT_FORMAT || ', expected ARRAY or NDJSON';
+    END IF;
+    file_count := GREATEST(COALESCE(FILES_PER_BATCH, 1), 1);
+    max_file_bytes := GREATEST(COALESCE(MAX_FILE_MB, 16), 1) * 1024 * 1024;
     
-    -- Create a temporary table with the data in JSON format
+    -- Create a temporary table with the data in JSON format and the file each row is written to
     CREATE OR REPLACE TEMPORARY TABLE temp_json_data AS
-    SELECT OBJECT_CONSTRUCT(
-        'conversation_id', SC.CONVERSATION_ID,
-        'start_time', SC.START_TIME,
-        'end_time', SC.END_TIME,
-        'agent_name', SA.AGENT_NAME,
-        'customer_name', C.CUSTOMER_NAME,
-        'transcript', SC.TRANSCRIPT
-    ) AS json_data
-    FROM MED_DEVICE_TRANSCRIPTS.DATA_PREP.support_conversations_new SC
-    LEFT JOIN MED_DEVICE_TRANSCRIPTS.CREATE_TRANSCRIPTS.SUPPORT_AGENTS SA ON SA.AGENT_ID = SC.AGENT_ID
-    LEFT JOIN MED_DEVICE_TRANSCRIPTS.CREATE_TRANSCRIPTS.CUSTOMERS C ON C.CUSTOMER_ID = SC.CUSTOMER_ID;
+    WITH json_rows AS (
+        SELECT
+            SC.CONVERSATION_ID,
+            OBJECT_CONSTRUCT(
+                'conversation_id', SC.CONVERSATION_ID,
+                'start_time', SC.START_TIME,
+                'end_time', SC.END_TIME,
+                'agent_name', SA.AGENT_NAME,
+                'customer_name', C.CUSTOMER_NAME,
+                'transcript', SC.TRANSCRIPT
+            ) AS json_data,
+            ROW_NUMBER() OVER (ORDER BY SC.CONVERSATION_ID) AS row_number
+        FROM MED_DEVICE_TRANSCRIPTS.DATA_PREP.support_conversations_new SC
+        LEFT JOIN MED_DEVICE_TRANSCRIPTS.CREATE_TRANSCRIPTS.SUPPORT_AGENTS SA ON SA.AGENT_ID = SC.AGENT_ID
+        LEFT JOIN MED_DEVICE_TRANSCRIPTS.CREATE_TRANSCRIPTS.CUSTOMERS C ON C.CUSTOMER_ID = SC.CUSTOMER_ID
+    ),
+    file_buckets AS (
+        SELECT
+            json_data,
+            CASE
+                WHEN :export_mode = 'ARRAY' THEN MOD(row_number - 1, :file_count)
+                WHEN COALESCE(:MAX_ROWS_PER_FILE, 0) > 0 THEN FLOOR((row_number - 1) / :MAX_ROWS_PER_FILE)
+                -- Bytes of JSON (plus the newline) written before this row, in conversation_id order
+                ELSE FLOOR(COALESCE(SUM(LENGTH(TO_JSON(json_data)) + 1) OVER (
+                    ORDER BY row_number ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                ), 0) / :max_file_bytes)
+            END AS bucket
+        FROM json_rows
+    )
+    -- Number the files without gaps: a conversation larger than MAX_FILE_MB skips byte buckets, and a file number
+    -- without rows would be listed in the result but never written
+    SELECT
+        json_data,
+        DENSE_RANK() OVER (ORDER BY bucket) - 1 AS file_number
+    FROM file_buckets;
     
-    -- Convert the rows to a JSON array
-    query_text := 'COPY INTO @MED_DEVICE_TRANSCRIPTS.DATA_PREP.call_data_new/' || filename || ' 
-    FROM (SELECT ARRAY_AGG(json_data) FROM temp_json_data)
-    FILE_FORMAT = (FORMAT_NAME = ''MED_DEVICE_TRANSCRIPTS.DATA_PREP.json_format'')
-    OVERWRITE = TRUE;';
+    -- SQLROWCOUNT is only set by DML, not by CREATE TABLE ... AS SELECT
+    SELECT COUNT(*) INTO :row_count FROM temp_json_data;
     
-    -- Execute the copy command
-    EXECUTE IMMEDIATE :query_text;
+    IF (export_mode = 'NDJSON') THEN
+        -- COPY INTO writes no file for an empty result, so there is nothing to export
+        IF (row_count = 0) THEN
+            RETURN 'No conversations to export';
+        END IF;
+        SELECT MAX(file_number) + 1 INTO :file_count FROM temp_json_data;
+    ELSE
+        -- Never write more files than there are conversations; without conversations one empty array is written
+        file_count := LEAST(file_count, GREATEST(row_count, 1));
+    END IF;
     
-    -- Return success message with the filename
-    result := 'Successfully exported conversation data to ' || filename;
+    FOR i IN 0 TO file_count - 1 DO
+        IF (export_mode = 'NDJSON') THEN
+            filename := 'conversations_' || timestamp_str || '_' || LPAD(i, 5, '0') || '.json.gz';
+            -- One JSON object per line; SINGLE keeps the deterministic file name and MAX_FILE_SIZE lifts the
+            -- 16 MB default of single-file unloads (the file size is already bounded by file_number)
+            query_text := 'COPY INTO ' || TARGET_STAGE || '/' || filename || ' 
+            FROM (SELECT json_data FROM temp_json_data WHERE file_number = ' || i || ' ORDER BY json_data:conversation_id)
+            FILE_FORMAT = (TYPE = JSON COMPRESSION = GZIP)
+            SINGLE = TRUE
+            MAX_FILE_SIZE = 5368709120
+            OVERWRITE = TRUE;';
+        ELSE
+            -- A single file keeps the original name, multiple files get a file number suffix
+            IF (file_count = 1) THEN
+                filename := 'conversations_' || timestamp_str || '.json';
+            ELSE
+                filename := 'conversations_' || timestamp_str || '_' || LPAD(i, 3, '0') || '.json';
+            END IF;
+            
+            -- Convert the rows for this file to a JSON array
+            query_text := 'COPY INTO ' || TARGET_STAGE || '/' || filename || ' 
+            FROM (SELECT ARRAY_AGG(json_data) FROM temp_json_data WHERE file_number = ' || i || ')
+            FILE_FORMAT = (FORMAT_NAME = ''MED_DEVICE_TRANSCRIPTS.DATA_PREP.json_format'')
+            OVERWRITE = TRUE;';
+        END IF;
+        
+        -- Execute the copy command
+        EXECUTE IMMEDIATE :query_text;
+        filenames := ARRAY_APPEND(:filenames, filename);
+    END FOR;
+    
+    -- Return success message with the filenames
+    result := 'Successfully exported ' || row_count || ' conversations as ' || export_mode || ' to ' || file_count || ' file(s): ' || ARRAY_TO_STRING(filenames, ', ');
     RETURN result;
 END;
 $$;
@@ -179,8 +333,29 @@ $$;
 -- Call the procedure to export conversation data to a JSON file
 CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.EXPORT_CONVERSATIONS_TO_JSON();
 
+-- Example of the NDJSON format: gzip-compressed files rolled every 16 MB of JSON
+-- CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.EXPORT_CONVERSATIONS_TO_JSON(1, 'NDJSON');
+
+-- Example of the NDJSON format rolled every 10,000 conversations
+-- CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.EXPORT_CONVERSATIONS_TO_JSON(1, 'NDJSON', 16, 10000);
+
 -- Create a new procedure that performs the complete conversation processing pipeline
-CREATE OR REPLACE PROCEDURE MED_DEVICE_TRANSCRIPTS.DATA_PREP.PROCESS_CONVERSATIONS_BATCH(NUM_EXECUTIONS INT DEFAULT 3)
+-- Each execution generates a batch of ROWS_PER_BATCH conversations with one set-based transcript generation
+-- and one export of FILES_PER_BATCH files, so the number of procedure calls and stage files no longer grows
+-- with every conversation. The defaults (1 row, 1 file) keep the original one-conversation-per-file behavior
+-- EXPORT_FORMAT, MAX_FILE_MB and MAX_ROWS_PER_FILE are passed to EXPORT_CONVERSATIONS_TO_JSON ('ARRAY' or 'NDJSON';
+-- NDJSON rolls files every MAX_FILE_MB megabytes or MAX_ROWS_PER_FILE conversations instead of using FILES_PER_BATCH)
+DROP PROCEDURE IF EXISTS MED_DEVICE_TRANSCRIPTS.DATA_PREP.PROCESS_CONVERSATIONS_BATCH(INT);
+DROP PROCEDURE IF EXISTS MED_DEVICE_TRANSCRIPTS.DATA_PREP.PROCESS_CONVERSATIONS_BATCH(INT, INT, INT);
+DROP PROCEDURE IF EXISTS MED_DEVICE_TRANSCRIPTS.DATA_PREP.PROCESS_CONVERSATIONS_BATCH(INT, INT, INT, VARCHAR);
+CREATE OR REPLACE PROCEDURE MED_DEVICE_TRANSCRIPTS.DATA_PREP.PROCESS_CONVERSATIONS_BATCH(
+    NUM_EXECUTIONS INT DEFAULT 3,
+    ROWS_PER_BATCH INT DEFAULT 1,
+    FILES_PER_BATCH INT DEFAULT 1,
+    EXPORT_FORMAT VARCHAR DEFAULT 'ARRAY',
+    MAX_FILE_MB INT DEFAULT 16,
+    MAX_ROWS_PER_FILE INT DEFAULT 0
+)
 RETURNS VARCHAR
 LANGUAGE SQL
 AS
@@ -189,17 +364,20 @@ DECLARE
     generate_transcript_result VARCHAR;
     export_json_result VARCHAR;
     results_array ARRAY DEFAULT ARRAY_CONSTRUCT();
-    conversation_id INT;
-    random_id INT;
+    batch_size INT;
+    batch_row_count INT;
+    total_row_count INT DEFAULT 0;
     current_execution INT DEFAULT 1;
+    run_started_at TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP();
+    elapsed_seconds FLOAT;
     final_result VARCHAR;
 BEGIN
+    -- At most 100,000 rows per batch, the size of the row number array below
+    batch_size := LEAST(GREATEST(COALESCE(ROWS_PER_BATCH, 1), 1), 100000);
+    
     -- Recursive execution loop
     REPEAT
-        -- Generate a random 4+ digit ID (between 1000 and 999999999)
-        random_id := 1000 + MOD(ABS(RANDOM()), 999999000);
-        
-        -- Step 1: Insert a new record in SUPPORT_CONVERSATIONS_NEW with the custom ID
+        -- Step 1: Insert a batch of new records in SUPPORT_CONVERSATIONS_NEW
         INSERT INTO MED_DEVICE_TRANSCRIPTS.DATA_PREP.SUPPORT_CONVERSATIONS_NEW (
             CONVERSATION_ID,
             START_TIME,
@@ -213,8 +391,8 @@ BEGIN
         )
         WITH random_data AS (
             SELECT
-                -- Use our generated random ID
-                :random_id AS CONVERSATION_ID,
+                -- Unique across batches and runs, so the MERGE on conversation_id downstream keeps every conversation
+                MED_DEVICE_TRANSCRIPTS.DATA_PREP.CONVERSATION_ID_SEQ.NEXTVAL AS CONVERSATION_ID,
                 -- Random timestamp within the last 30 days for start time
                 DATEADD(minute, -1 * MOD(ABS(RANDOM()), 43200), CURRENT_TIMESTAMP()) AS START_TIME,
                 -- End time between 2 and 20 minutes after start time
@@ -234,7 +412,8 @@ BEGIN
                 -- Random device ID between 1 and 50
                 1 + MOD(ABS(RANDOM()), 50) AS RANDOM_DEVICE_ID
             FROM 
-                TABLE(GENERATOR(ROWCOUNT => 1))
+                -- GENERATOR needs a constant row count, so exactly batch_size rows are produced from an array instead
+                TABLE(FLATTEN(INPUT => ARRAY_GENERATE_RANGE(0, :batch_size)))
         )
         SELECT
             rd.CONVERSATION_ID,
@@ -250,21 +429,21 @@ BEGIN
             random_data rd
         JOIN 
             MED_DEVICE_TRANSCRIPTS.CREATE_TRANSCRIPTS.HOME_MEDICAL_DEVICES hmd ON hmd.DEVICE_ID = rd.RANDOM_DEVICE_ID;
+        batch_row_count := SQLROWCOUNT;
         
-        -- Store the conversation ID
-        conversation_id := random_id;
-        
-        -- Step 2: Call the GENERATE_TRANSCRIPTS_ADD_RECORDS procedure
-        generate_transcript_result := (CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.GENERATE_TRANSCRIPTS_NEW_RECORDS());
+        -- Step 2: Generate the transcripts for the whole batch with one set-based query
+        generate_transcript_result := (CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.GENERATE_TRANSCRIPTS_NEW_RECORDS_BATCH());
                
-        -- Step 3: Call the EXPORT_CONVERSATIONS_TO_JSON procedure
-        export_json_result := (CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.EXPORT_CONVERSATIONS_TO_JSON());
+        -- Step 3: Export the whole batch to FILES_PER_BATCH JSON files (or size-rolled NDJSON files)
+        export_json_result := (CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.EXPORT_CONVERSATIONS_TO_JSON(
+            :FILES_PER_BATCH, :EXPORT_FORMAT, :MAX_FILE_MB, :MAX_ROWS_PER_FILE));
         
-        -- Step 4: Truncate both tables
+        -- Step 4: Truncate the table for the next batch
         TRUNCATE TABLE MED_DEVICE_TRANSCRIPTS.DATA_PREP.SUPPORT_CONVERSATIONS_NEW;
         
         -- Add result to the array
-        results_array := ARRAY_APPEND(:results_array, 'Execution ' || current_execution || ': Processed conversation ' || conversation_id);
+        total_row_count := total_row_count + batch_row_count;
+        results_array := ARRAY_APPEND(:results_array, 'Execution ' || current_execution || ': ' || export_json_result);
         
         -- Increment execution counter
         current_execution := current_execution + 1;
@@ -273,7 +452,10 @@ BEGIN
     END REPEAT;
     
     -- Build final result string from array
-    final_result := 'Successfully processed ' || NUM_EXECUTIONS || ' conversations.' || 
+    elapsed_seconds := DATEDIFF('millisecond', :run_started_at, CURRENT_TIMESTAMP()) / 1000;
+    final_result := 'Successfully processed ' || total_row_count || ' conversations in ' || NUM_EXECUTIONS || ' batches in '
+                    || ROUND(elapsed_seconds, 1) || ' seconds ('
+                    || COALESCE(TO_VARCHAR(ROUND(total_row_count / NULLIF(elapsed_seconds, 0) * 60, 1)), 'n/a') || ' conversations/minute).' ||
                     CHR(10) || ARRAY_TO_STRING(results_array, CHR(10));
     
     RETURN final_result;
@@ -286,3 +468,11 @@ CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.PROCESS_CONVERSATIONS_BATCH();
 -- Example with explicit execution count
 -- CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.PROCESS_CONVERSATIONS_BATCH(5);
 
+-- Example of batch mode: 10 batches of 100 conversations, each batch exported to 4 files (1,000 conversations in 40 files)
+-- CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.PROCESS_CONVERSATIONS_BATCH(10, 100, 4);
+
+-- Example of batch mode with gzip-compressed NDJSON exports
+-- CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.PROCESS_CONVERSATIONS_BATCH(10, 100, 1, 'NDJSON');
+
+-- Example of batch mode with NDJSON exports rolled every 25 conversations (4 files per batch of 100)
+-- CALL MED_DEVICE_TRANSCRIPTS.DATA_PREP.PROCESS_CONVERSATIONS_BATCH(10, 100, 1, 'NDJSON', 16, 25);
@@ -0,0 +1,105 @@
+"""
+Local HTTP stand-in for the Cortex REST API complete endpoint.
+
+Serves POST /api/v2/cortex/inference:complete with the responses of model_router.StubComplete, after a simulated
+latency, and rejects requests with HTTP 429 when more than max_concurrent requests are in flight or at random with
+rate_429. GET /stats returns the request counters. It lets enrichment_worker.py be tested and benchmarked offline.
+Requires the aiohttp package.
+
+Usage:
+    python cortex_http_stub.py [port] [median latency ms] [429 rate] [max concurrent requests]
+"""
+
+import asyncio
+import json
+import math
+import random
+import sys
+
+from aiohttp import web
+
+from model_router import StubComplete
+
+COMPLETE_PATH = "/api/v2/cortex/inference:complete"
+
+
+class CortexHttpStub:
+    """aiohttp application with simulated latency and rate limiting."""
+
+    def __init__(self, latency_ms=300, latency_sigma=0.5, rate_429=0.02, max_concurrent=32, seed=0):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.rate_429 = rate_429
+        self.max_concurrent = max_concurrent
+        self.random = random.Random(seed)
+        self.complete = StubComplete(seed)
+        self.in_flight = 0
+        self.stats = {"requests": 0, "completed": 0, "rejected_429": 0, "max_in_flight": 0}
+
+        self.app = web.Application()
+        self.app.router.add_post(COMPLETE_PATH, self.handle_complete)
+        self.app.router.add_get("/stats", self.handle_stats)
+        self.runner = None
+
+    async def handle_complete(self, request):
+        self.stats["requests"] += 1
+        if self.in_flight >= self.max_concurrent or self.random.random() < self.rate_429:
+            self.stats["rejected_429"] += 1
+            return web.json_response({"message": "Too many requests"}, status=429)
+
+        self.in_flight += 1
+        self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.in_flight)
+        try:
+            body = await request.json()
+            response = self.complete(body["model"], body["messages"])
+            # Log-normal latency around the median, like real inference latency
+            latency = self.latency_ms * math.exp(self.random.gauss(0, self.latency_sigma))
+            await asyncio.sleep(latency / 1000)
+        finally:
+            self.in_flight -= 1
+
+        self.stats["completed"] += 1
+        return web.json_response({
+            "model": body["model"],
+            "choices": [{"message": {"content": response["text"]}}],
+            "usage": {
+                "prompt_tokens": response["prompt_tokens"],
+                "completion_tokens": response["completion_tokens"],
+                "total_tokens": response["prompt_tokens"] + response["completion_tokens"],
+            },
+        })
+
+    async def handle_stats(self, request):
+        return web.json_response(self.stats)
+
+    async def start(self, host="127.0.0.1", port=8765):
+        """Start serving in the running event loop; returns the base URL."""
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+
+def main(args):
+    port = int(args[0]) if len(args) > 0 else 8765
+    latency_ms = float(args[1]) if len(args) > 1 else 300
+    rate_429 = float(args[2]) if len(args) > 2 else 0.02
+    max_concurrent = int(args[3]) if len(args) > 3 else 32
+
+    stub = CortexHttpStub(latency_ms=latency_ms, rate_429=rate_429, max_concurrent=max_concurrent)
+    print(f"Serving {COMPLETE_PATH} on port {port} (median latency {latency_ms} ms, "
+          f"429 rate {rate_429}, max {max_concurrent} concurrent requests)")
+    web.run_app(stub.app, host="127.0.0.1", port=port, print=None)
+    print(json.dumps(stub.stats))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] in ("-h", "--help"):
+        print(__doc__)
+        sys.exit(0)
+    main(sys.argv[1:])
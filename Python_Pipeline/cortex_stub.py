@@ -0,0 +1,342 @@
+"""
+Deterministic local stand-in for the Cortex functions used by the pipeline.
+
+CortexStub implements SUMMARIZE, SENTIMENT, CLASSIFY_TEXT, EXTRACT_ANSWER, COMPLETE and AI_CLASSIFY with plausible
+outputs in the shapes the SQL expects:
+
+- summarize(text)                    -> 'The customer reported: ... The agent responded: ...'
+- sentiment(text)                    -> a score between -1 and 1
+- classify_text(text, categories)    -> {"label": "Respiratory"}
+- extract_answer(text, question)     -> [{"answer": "...", "score": 0.82}]
+- complete(model, prompt, options)   -> 'Resolved: reason' / '7: reason' for the pipeline prompts (see
+                                        model_router.StubComplete); with options, the {"choices", "usage"} object
+- ai_classify(text, categories, config) -> {"labels": ["Respiratory", ...]}
+- embed_text_768(model, text)        -> a list of 768 floats of unit length
+
+The outputs depend only on the inputs, so repeated runs give the same results. Each call is delayed by a log-normal
+latency (per function, and per model for COMPLETE) and fails with a configurable rate; latency and failures are drawn
+from a seeded generator, so a sequential run is fully reproducible. With realtime=False the latency is only recorded,
+which measures the simulated cost of a run without waiting for it.
+
+register() adds the functions to a DuckDB connection as cortex_summarize, cortex_sentiment, cortex_classify_text,
+cortex_extract_answer, cortex_complete, ai_classify and cortex_embed_text_768, so the offline database (offline_db.py) can run the
+enrichment queries. In SQL a simulated failure returns NULL, like the TRY_ variants of the functions.
+
+Usage:
+    python cortex_stub.py <json file or directory> [...]
+"""
+
+import hashlib
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from statistics import median
+
+from device_fastpath import get_matcher
+from model_router import RESOLUTION_SYSTEM_PROMPT, SERVICE_RATING_PROMPT, StubComplete
+from transcript_chunker import estimate_tokens
+from transcript_io import read_transcripts
+from turn_parser import AGENT, CUSTOMER, parse_turns
+
+DEVICE_CATEGORIES = [
+    "Diabetes", "Respiratory", "Mobility", "Urology", "Pain Management",
+    "Monitoring", "Orthopedic", "Nutrition", "Infusion", "Wound Care",
+]
+
+# Words that point to a device category when the transcript names no catalog device
+CATEGORY_HINTS = {
+    "Diabetes": ["glucose", "insulin", "blood sugar", "diabetic", "lancet", "test strip"],
+    "Respiratory": ["cpap", "bipap", "oxygen", "nebulizer", "breathing", "inhaler", "mask"],
+    "Mobility": ["wheelchair", "walker", "scooter", "cane", "crutch", "lift"],
+    "Urology": ["catheter", "urinary", "incontinence", "ostomy"],
+    "Pain Management": ["tens", "pain", "heating pad", "cold therapy"],
+    "Monitoring": ["monitor", "blood pressure", "pulse", "oximeter", "thermometer", "scale"],
+    "Orthopedic": ["brace", "splint", "knee", "back support", "orthotic"],
+    "Nutrition": ["feeding", "formula", "enteral", "nutrition"],
+    "Infusion": ["infusion", "iv pole", "iv line", "pump tubing"],
+    "Wound Care": ["wound", "dressing", "bandage", "gauze", "ulcer"],
+}
+
+POSITIVE_WORDS = {
+    "thank", "thanks", "great", "appreciate", "perfect", "helpful", "resolved", "fixed", "working", "glad",
+    "wonderful", "excellent", "happy", "pleased",
+}
+NEGATIVE_WORDS = {
+    "frustrated", "frustrating", "broken", "leak", "leaking", "error", "fail", "failed", "problem", "issue",
+    "disappointed", "annoyed", "upset", "unacceptable", "pain", "worse", "stopped", "won't", "can't", "doesn't",
+}
+WORD = re.compile(r"[a-z']+")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# Median latency per call, latency per input token and log-normal spread; COMPLETE uses the per-model profiles of
+# model_router.StubComplete
+LATENCY_PROFILES = {
+    "summarize": {"median_ms": 450, "ms_per_token": 0.4, "sigma": 0.35},
+    "sentiment": {"median_ms": 60, "ms_per_token": 0.02, "sigma": 0.25},
+    "classify_text": {"median_ms": 180, "ms_per_token": 0.1, "sigma": 0.3},
+    "extract_answer": {"median_ms": 220, "ms_per_token": 0.15, "sigma": 0.3},
+    "ai_classify": {"median_ms": 300, "ms_per_token": 0.15, "sigma": 0.35},
+    "embed_text": {"median_ms": 40, "ms_per_token": 0.02, "sigma": 0.25},
+}
+for _model, _profile in StubComplete.PROFILES.items():
+    LATENCY_PROFILES["complete:" + _model] = {"median_ms": _profile["base_ms"], "ms_per_token": _profile["ms_per_token"], "sigma": 0.3}
+
+
+EMBEDDING_DIM = 768
+
+
+class CortexStubError(Exception):
+    """A simulated Cortex function failure."""
+
+
+def first_sentence(text, max_words=25):
+    """Return the first sentence of a text, cut to max_words words."""
+    sentence = SENTENCE_END.split((text or "").strip(), 1)[0]
+    words = sentence.split()
+    return " ".join(words[:max_words]).rstrip(",;") + ("..." if len(words) > max_words else "")
+
+
+def hashed_embedding(text, dim=EMBEDDING_DIM):
+    """Unit-length bag of words and word pairs, hashed into dim signed buckets with log-scaled counts.
+
+    Texts that share words get a positive cosine similarity, which is enough to exercise the similarity search; it
+    does not capture paraphrases like a real embedding model."""
+    words = WORD.findall((text or "").lower())
+    counts = defaultdict(int)
+    for token in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        counts[token] += 1
+    vector = [0.0] * dim
+    for token, count in counts.items():
+        digest = int.from_bytes(hashlib.md5(token.encode("utf-8")).digest()[:8], "big")
+        vector[digest % dim] += (1 + math.log(count)) * (1 if digest >> 63 else -1)
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm for value in vector] if norm else vector
+
+
+class CortexStub:
+    """Deterministic Cortex functions with simulated latency and failures."""
+
+    def __init__(self, seed=0, latency=None, failure_rates=None, realtime=True):
+        self.seed = seed
+        self.latency = {name: dict(profile) for name, profile in LATENCY_PROFILES.items()}
+        for name, profile in (latency or {}).items():
+            self.latency.setdefault(name, {"median_ms": 0, "ms_per_token": 0, "sigma": 0}).update(profile)
+        self.failure_rates = failure_rates or {}
+        self.realtime = realtime
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.matcher = get_matcher()
+        self.complete_stub = StubComplete(seed)
+        self.stats = defaultdict(lambda: {"calls": 0, "failures": 0, "latency_ms": []})
+
+    def _fraction(self, *parts):
+        """A stable pseudo-random number in [0, 1) for the given inputs."""
+        digest = hashlib.sha256("|".join([str(self.seed)] + [str(part) for part in parts]).encode("utf-8")).hexdigest()
+        return int(digest[:8], 16) / 0x100000000
+
+    def _call(self, function, text, profile_name=None):
+        """Apply the simulated latency and failure rate of one call."""
+        profile = self.latency[profile_name or function]
+        with self.lock:
+            noise = self.random.gauss(0, profile["sigma"])
+            failed = self.random.random() < self.failure_rates.get(function, 0.0)
+            latency_ms = (profile["median_ms"] + profile["ms_per_token"] * estimate_tokens(text)) * math.exp(noise)
+            stats = self.stats[function]
+            stats["calls"] += 1
+            stats["failures"] += int(failed)
+            stats["latency_ms"].append(latency_ms)
+        if self.realtime:
+            time.sleep(latency_ms / 1000)
+        if failed:
+            raise CortexStubError(f"{function.upper()}: simulated failure")
+
+    def _turns(self, text):
+        turns = parse_turns(text)
+        customer = [turn["turn_text"] for turn in turns if turn["speaker"] == CUSTOMER]
+        agent = [turn["turn_text"] for turn in turns if turn["speaker"] == AGENT]
+        return customer, agent
+
+    def _categories(self, text, categories):
+        """Return the categories the transcript points to, best first."""
+        result = self.matcher.classify(text)
+        found = []
+        if result["device_category"] in categories:
+            found.append(result["device_category"])
+        lower = (text or "").lower()
+        hits = []
+        for category in categories:
+            count = sum(lower.count(hint) for hint in CATEGORY_HINTS.get(category, []))
+            if count and category not in found:
+                hits.append((-count, categories.index(category), category))
+        found.extend(category for _, _, category in sorted(hits))
+        return found
+
+    def _issue(self, text, customer):
+        """The first customer sentence that mentions a problem, else the customer's first sentence."""
+        for turn in customer:
+            if any(word in NEGATIVE_WORDS for word in WORD.findall(turn.lower())):
+                return first_sentence(turn)
+        return first_sentence(customer[0] if customer else text)
+
+    def summarize(self, text):
+        self._call("summarize", text)
+        customer, agent = self._turns(text)
+        summary = f"The customer reported: {self._issue(text, customer)}"
+        # The longest agent turn after the greeting is usually the fix or next step
+        if len(agent) > 1:
+            summary += f" The agent responded: {first_sentence(max(agent[1:], key=len))}"
+        return summary
+
+    def sentiment(self, text):
+        self._call("sentiment", text)
+        words = WORD.findall((text or "").lower())
+        positive = sum(word.rstrip("s") in POSITIVE_WORDS or word in POSITIVE_WORDS for word in words)
+        negative = sum(word in NEGATIVE_WORDS for word in words)
+        score = (positive - negative) / (positive + negative + 2)
+        # A little stable noise so scores are not all the same few values
+        score += (self._fraction("sentiment", text) - 0.5) * 0.1
+        return round(max(-1.0, min(1.0, score)), 4)
+
+    def classify_text(self, text, categories):
+        self._call("classify_text", text)
+        found = self._categories(text, list(categories))
+        if found:
+            return {"label": found[0]}
+        if "Other" in categories:
+            return {"label": "Other"}
+        return {"label": categories[int(self._fraction("classify", text) * len(categories))]}
+
+    def ai_classify(self, text, categories, config=None):
+        self._call("ai_classify", text)
+        found = self._categories(text, list(categories))
+        if (config or {}).get("output_mode") == "multi":
+            return {"labels": found[:3] or [categories[int(self._fraction("ai_classify", text) * len(categories))]]}
+        return {"labels": found[:1] or [categories[int(self._fraction("ai_classify", text) * len(categories))]]}
+
+    def extract_answer(self, text, question):
+        self._call("extract_answer", text)
+        customer, _ = self._turns(text)
+        answer = self._issue(text, customer)
+        score = round(0.45 + 0.5 * self._fraction("extract_answer", question, text), 4)
+        return [{"answer": answer, "score": score}]
+
+    def complete(self, model, prompt, options=None):
+        """COMPLETE with a prompt string or a list of messages; with options returns the response object."""
+        messages = prompt if isinstance(prompt, list) else [{"role": "user", "content": prompt}]
+        text_in = "\n".join(message["content"] for message in messages)
+        self._call("complete", text_in, "complete:" + model)
+
+        if messages[0]["content"] == RESOLUTION_SYSTEM_PROMPT or messages[-1]["content"].startswith(SERVICE_RATING_PROMPT):
+            response = self.complete_stub(model, messages)
+            text = response["text"]
+        else:
+            text = f"Response from {model}: {first_sentence(messages[-1]['content'], 40)}"
+
+        if options is None:
+            return text
+        prompt_tokens = estimate_tokens(text_in)
+        completion_tokens = estimate_tokens(text)
+        return {
+            "choices": [{"messages": text}],
+            "created": 0,
+            "model": model,
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def embed_text_768(self, model, text):
+        """EMBED_TEXT_768 over the spoken text of the turns, so speaker labels and names do not count."""
+        self._call("embed_text", text)
+        customer, agent = self._turns(text)
+        return hashed_embedding(" ".join(customer + agent) or text)
+
+    def register(self, connection):
+        """Add the functions to a DuckDB connection; a simulated failure returns NULL."""
+        import duckdb
+
+        varchar = duckdb.sqltype("VARCHAR")
+        varchar_list = duckdb.list_type(varchar)
+        functions = [
+            ("cortex_summarize", self.summarize, [varchar], varchar),
+            ("cortex_sentiment", self.sentiment, [varchar], duckdb.sqltype("DOUBLE")),
+            ("cortex_classify_text", lambda text, categories: json.dumps(self.classify_text(text, categories)), [varchar, varchar_list], varchar),
+            ("cortex_extract_answer", lambda text, question: json.dumps(self.extract_answer(text, question)), [varchar, varchar], varchar),
+            ("cortex_complete", lambda model, prompt: self.complete(model, prompt), [varchar, varchar], varchar),
+            ("ai_classify", lambda text, categories, config: json.dumps(self.ai_classify(text, categories, json.loads(config or "{}"))), [varchar, varchar_list, varchar], varchar),
+            ("cortex_embed_text_768", self.embed_text_768, [varchar, varchar], duckdb.list_type(duckdb.sqltype("FLOAT"))),
+        ]
+        for name, function, parameters, return_type in functions:
+            connection.create_function(
+                name, function, parameters, return_type,
+                exception_handling="return_null", side_effects=True,
+            )
+
+    def report(self):
+        """Return one row per function with calls, failures and simulated latency."""
+        rows = []
+        for function, stats in sorted(self.stats.items()):
+            latencies = sorted(stats["latency_ms"])
+            rows.append({
+                "function": function,
+                "calls": stats["calls"],
+                "failures": stats["failures"],
+                "latency_ms_p50": round(median(latencies)),
+                "latency_ms_p95": round(latencies[int(0.95 * (len(latencies) - 1))]),
+                "latency_ms_total": round(sum(latencies)),
+            })
+        return rows
+
+
+# DuckDB version of the per-transcript Cortex calls of TRANSCRIPT_ANALYSIS_RESULTS_FINAL
+ENRICHMENT_QUERY = f"""
+    SELECT
+        conversation_id,
+        cortex_summarize(transcript) AS transcript_summary,
+        cortex_sentiment(transcript) AS sentiment_score,
+        cortex_classify_text(transcript, {DEVICE_CATEGORIES + ['Other']}) ->> 'label' AS device_category,
+        cortex_extract_answer(transcript, 'What is the main issue?') -> 0 ->> 'answer' AS main_issue,
+        cortex_complete('mistral-large2', '{SERVICE_RATING_PROMPT.replace("'", "''")}' || transcript) AS customer_service_rating
+    FROM parsed_transcripts
+    ORDER BY conversation_id
+"""
+
+
+def main(paths):
+    from offline_db import OfflineDatabase
+
+    db = OfflineDatabase()
+    print(f"Loaded {db.load_transcripts(read_transcripts(paths))} records")
+    stub = CortexStub(realtime=False, failure_rates={"summarize": 0.01, "extract_answer": 0.01})
+    db.register_cortex(stub)
+
+    start = time.perf_counter()
+    rows = db.execute(ENRICHMENT_QUERY)
+    elapsed = time.perf_counter() - start
+    print(f"Enriched {len(rows)} transcripts in {elapsed:.2f} s (latency simulated, not waited for)")
+    for row in rows[:3]:
+        print()
+        for name, value in zip(["conversation_id", "summary", "sentiment", "category", "main_issue", "rating"], row):
+            print(f"  {name:16s} {value}")
+
+    print()
+    for row in stub.report():
+        print(
+            f"  {row['function']:15s} calls {row['calls']:5d}  failures {row['failures']:3d}  "
+            f"p50 {row['latency_ms_p50']:5d} ms  p95 {row['latency_ms_p95']:5d} ms  "
+            f"sequential {row['latency_ms_total'] / 1000:8.1f} s"
+        )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    main(sys.argv[1:])
@@ -0,0 +1,229 @@
+"""
+Keyword fast path for device classification.
+
+Most transcripts name the device outright ("Blood Glucose Meter", "CPAP Machine", "Insulin Pump"), and the
+HOME_MEDICAL_DEVICES catalog already maps every device name to its CATEGORY. This module builds an Aho-Corasick
+automaton over the device names and their aliases and scans each transcript once:
+
+- matched:   every device mentioned belongs to one category -> device_name and device_category are assigned here
+- ambiguous: devices from more than one category are mentioned -> the transcript is sent to CLASSIFY_TEXT / AI_CLASSIFY
+- unmatched: no catalog device is mentioned -> the transcript is sent to CLASSIFY_TEXT / AI_CLASSIFY
+
+The same code runs as a batch script over exported JSON files and as the DEVICE_FASTPATH_CLASSIFY Python UDF used by
+the TRANSCRIPT_ANALYSIS_RESULTS_FINAL dynamic table (see Analytics_Setup/Cortex_Analysis.sql).
+
+Usage:
+    python device_fastpath.py <json file or directory> [...]
+"""
+
+import os
+import re
+import sys
+from collections import Counter, deque
+
+from transcript_io import DEFAULT_CATALOG_PATH, read_device_catalog, read_transcripts
+
+MATCHED = "matched"
+AMBIGUOUS = "ambiguous"
+UNMATCHED = "unmatched"
+
+PARENTHETICAL = re.compile(r"\s*\(([^)]*)\)\s*")
+
+
+def device_aliases(device_name):
+    """Return the lower-case phrases that identify a device in a transcript."""
+    aliases = set()
+    base_name = PARENTHETICAL.sub(" ", device_name).strip()
+
+    for name in (device_name, base_name):
+        aliases.add(name.lower())
+
+    # Acronyms in parentheses, e.g. "Continuous Glucose Monitor (CGM)" -> "cgm"
+    for acronym in PARENTHETICAL.findall(device_name):
+        aliases.add(acronym.strip().lower())
+
+    # Singular and plural forms of the last word ("CPAP Masks" -> "cpap mask", "Insulin Pump" -> "insulin pumps")
+    words = base_name.lower().split()
+    last = words[-1]
+    if last.endswith("ies"):
+        variants = [last[:-3] + "y"]
+    elif last.endswith("s"):
+        variants = [last[:-1]]
+    else:
+        variants = [last + "s"]
+    for variant in variants:
+        aliases.add(" ".join(words[:-1] + [variant]))
+
+    return aliases
+
+
+class AhoCorasick:
+    """Multi-pattern string matcher: finds every occurrence of every pattern in one pass over the text."""
+
+    def __init__(self, patterns):
+        # Each node is a dict of transitions; fail links and outputs are kept in parallel lists
+        self.transitions = [{}]
+        self.fail = [0]
+        self.outputs = [[]]
+
+        for pattern, value in patterns:
+            node = 0
+            for char in pattern:
+                if char not in self.transitions[node]:
+                    self.transitions.append({})
+                    self.fail.append(0)
+                    self.outputs.append([])
+                    self.transitions[node][char] = len(self.transitions) - 1
+                node = self.transitions[node][char]
+            self.outputs[node].append((len(pattern), value))
+
+        # Breadth-first pass to build the failure links
+        queue = deque(self.transitions[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.transitions[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.transitions[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.transitions[fallback].get(char, 0)
+                self.outputs[child] = self.outputs[child] + self.outputs[self.fail[child]]
+
+    def find_all(self, text):
+        """Yield (start, end, value) for every pattern occurrence in text."""
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in self.transitions[node]:
+                node = self.fail[node]
+            node = self.transitions[node].get(char, 0)
+            for length, value in self.outputs[node]:
+                yield index - length + 1, index + 1, value
+
+
+class DeviceMatcher:
+    """Assigns a device and category to transcripts that name catalog devices of a single category."""
+
+    def __init__(self, catalog):
+        self.categories = {}
+        patterns = []
+        seen = set()
+        for row in catalog:
+            device_name = row["DEVICE_NAME"]
+            self.categories[device_name] = row["CATEGORY"]
+            for alias in device_aliases(device_name):
+                if alias not in seen:
+                    seen.add(alias)
+                    patterns.append((alias, device_name))
+        self.automaton = AhoCorasick(patterns)
+
+    def find_devices(self, transcript, exclude_names=()):
+        """Return the device names mentioned in the transcript in order of appearance (whole words, longest match)."""
+        text = (transcript or "").lower()
+
+        # Blank out agent and customer names so e.g. customer "Richard Walker" is not read as the "Walker" device
+        for name in exclude_names:
+            for part in (name or "").lower().split():
+                text = re.sub(r"\b%s\b" % re.escape(part), " " * len(part), text)
+
+        matches = []
+        for start, end, device_name in self.automaton.find_all(text):
+            if start > 0 and text[start - 1].isalnum():
+                continue
+            if end < len(text) and text[end].isalnum():
+                continue
+            matches.append((start, end, device_name))
+
+        # Keep the leftmost-longest matches so "CPAP Masks" is not also counted as a shorter overlapping alias
+        matches.sort(key=lambda match: (match[0], -(match[1] - match[0])))
+        devices = []
+        covered_until = -1
+        for start, end, device_name in matches:
+            if start >= covered_until:
+                devices.append(device_name)
+                covered_until = end
+        return devices
+
+    def classify(self, transcript, exclude_names=()):
+        """Return a dict with status, device_name, device_category and the devices found."""
+        devices = self.find_devices(transcript, exclude_names)
+        if not devices:
+            return {"status": UNMATCHED, "device_name": None, "device_category": None, "devices": []}
+
+        counts = Counter(devices)
+        categories = {self.categories[device] for device in counts}
+        # The most mentioned device wins, ties go to the device mentioned first
+        device_name = max(counts, key=lambda device: (counts[device], -devices.index(device)))
+
+        if len(categories) > 1:
+            return {"status": AMBIGUOUS, "device_name": device_name, "device_category": None, "devices": sorted(counts)}
+
+        return {
+            "status": MATCHED,
+            "device_name": device_name,
+            "device_category": self.categories[device_name],
+            "devices": sorted(counts),
+        }
+
+
+_matcher = None
+
+
+def _catalog_path():
+    """Locate the catalog next to this module, or in the UDF import directory inside Snowflake."""
+    import_dir = getattr(sys, "_xoptions", {}).get("snowflake_import_directory")
+    if import_dir:
+        return os.path.join(import_dir, "home_medical_devices.csv")
+    return DEFAULT_CATALOG_PATH
+
+
+def get_matcher():
+    """Build the matcher once per process and reuse it."""
+    global _matcher
+    if _matcher is None:
+        _matcher = DeviceMatcher(read_device_catalog(_catalog_path()))
+    return _matcher
+
+
+def udf_classify(transcript, agent_name=None, customer_name=None):
+    """Handler of the DEVICE_FASTPATH_CLASSIFY UDF; returns an OBJECT with status, device_name and device_category."""
+    return get_matcher().classify(transcript, (agent_name, customer_name))
+
+
+def summarize(results):
+    """Return the status counts and the share of classification LLM calls avoided."""
+    counts = Counter(result["status"] for result in results)
+    total = len(results)
+    return {
+        "transcripts": total,
+        MATCHED: counts[MATCHED],
+        AMBIGUOUS: counts[AMBIGUOUS],
+        UNMATCHED: counts[UNMATCHED],
+        "llm_calls_avoided_pct": round(100.0 * counts[MATCHED] / total, 1) if total else 0.0,
+    }
+
+
+def main(paths):
+    matcher = get_matcher()
+    records = read_transcripts(paths)
+    results = [
+        matcher.classify(record.get("transcript"), (record.get("agent_name"), record.get("customer_name")))
+        for record in records
+    ]
+
+    summary = summarize(results)
+    print(f"Transcripts:         {summary['transcripts']}")
+    print(f"Matched (keyword):   {summary[MATCHED]}")
+    print(f"Ambiguous (LLM):     {summary[AMBIGUOUS]}")
+    print(f"Unmatched (LLM):     {summary[UNMATCHED]}")
+    print(f"LLM calls avoided:   {summary['llm_calls_avoided_pct']}%")
+
+    category_counts = Counter(result["device_category"] for result in results if result["status"] == MATCHED)
+    for category, count in category_counts.most_common():
+        print(f"  {category}: {count}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    main(sys.argv[1:])
@@ -0,0 +1,419 @@
+"""
+Priority-aware, budgeted scheduler for the enrichment of the COMPLETE prompts.
+
+A dynamic table refresh processes every pending row in no particular order, so after a prompt or model change, or
+when a backlog builds up, fresh calls wait behind historical ones. This scheduler keeps the pending work in two
+priority queues (lanes):
+
+- fresh:    calls that started within --fresh-hours of now, served by --fresh-concurrency consumers
+- backfill: older calls, and with --reprocess every call already enriched; served by --backfill-concurrency consumers
+            and throttled by a budget of tokens or credits per hour (--backfill-budget, --budget-unit)
+
+Within a lane, calls are ordered by recency (a score that halves every --half-life-hours) plus urgency from cheap
+local signals: words that point to an unresolved or unhappy call ("still not working", "refund", "supervisor", ...).
+The scheduler polls for new pending transcripts every --poll-seconds, so calls that land during a long backfill go
+straight to the fresh lane. After the first poll, it only reads the transcripts loaded since the previous poll (less
+a margin for loads that commit late), and skips the query when the latest load time and the row count of
+RAW_TRANSCRIPTS have not changed, so an idle scheduler does not scan the table. A transcript whose enrichment fails is
+queued again after --requeue-seconds, doubled on every further failure, and dead-lettered after --max-requeues
+requeues: it is counted in the lane report and left pending until it is loaded again. The enrichment itself (routing, escalation, retries and batched writes) is the one of
+enrichment_worker.py. It reports the queue depth and the time to enrichment, from being queued to being enriched,
+per lane.
+
+Usage:
+    python enrichment_scheduler.py [options] <json file or directory> [...]
+    python enrichment_scheduler.py --snowflake [options]
+"""
+
+import asyncio
+import heapq
+import itertools
+import re
+import sys
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from statistics import mean, median
+
+from enrichment_worker import EnrichmentWorker, build_parser, run_enrichment
+from model_router import CREDITS_PER_MILLION_TOKENS, LARGE_MODEL
+from transcript_chunker import TOKEN_BUDGETS, estimate_tokens
+
+FRESH = "fresh"
+BACKFILL = "backfill"
+
+# Phrases that point to a call that ended unresolved or unhappy; each match raises the urgency
+URGENT_PHRASES = [
+    "still not working", "not working", "doesn't work", "does not work", "stopped working", "broken", "defective",
+    "refund", "cancel", "supervisor", "manager", "escalate", "complaint", "unacceptable", "frustrated",
+    "disappointed", "again", "third time", "still waiting", "hasn't arrived", "never arrived",
+]
+URGENT_PATTERN = re.compile(r"\b(?:" + "|".join(re.escape(phrase) for phrase in URGENT_PHRASES) + r")\b", re.IGNORECASE)
+
+# Tokens of the prompt instructions and of the response on top of the transcript, per COMPLETE prompt
+PROMPT_OVERHEAD_TOKENS = 120
+
+# Margin of the incremental polls: rows whose load committed up to this long after their load time are still read
+LOAD_COMMIT_MARGIN = timedelta(seconds=60)
+
+
+def urgency(transcript):
+    """Urgency in [0, 1] from the urgent phrases in a transcript; three or more matches count as fully urgent."""
+    return min(1.0, len(URGENT_PATTERN.findall(transcript or "")) / 3)
+
+
+def tokens(results):
+    return sum(result["prompt_tokens"] + result["completion_tokens"] for result in results)
+
+
+def credits(results):
+    return sum(
+        (result["prompt_tokens"] + result["completion_tokens"]) * CREDITS_PER_MILLION_TOKENS[result["model"]] / 1_000_000
+        for result in results
+    )
+
+
+def as_utc(value):
+    """Return a naive UTC datetime for a datetime or an ISO 8601 string (None stays None)."""
+    if value is None or isinstance(value, datetime) and value.tzinfo is None:
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+
+class HourlyBudget:
+    """A budget of tokens or credits per sliding window (an hour by default)."""
+
+    def __init__(self, limit, window_seconds=3600):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.entries = deque()
+        self.lock = asyncio.Lock()
+        self.waited_seconds = 0.0
+
+    def used(self):
+        cutoff = time.monotonic() - self.window_seconds
+        while self.entries and self.entries[0][0] < cutoff:
+            self.entries.popleft()
+        return sum(entry[1] for entry in self.entries)
+
+    async def reserve(self, amount):
+        """Wait until amount fits in the budget and reserve it; returns the entry to settle with the actual cost."""
+        async with self.lock:
+            while True:
+                # A single item larger than the whole budget still runs when nothing else is in the window
+                if self.used() + amount <= self.limit or not self.entries:
+                    entry = [time.monotonic(), amount]
+                    self.entries.append(entry)
+                    return entry
+                wait = self.entries[0][0] + self.window_seconds - time.monotonic()
+                self.waited_seconds += max(wait, 0.0)
+                await asyncio.sleep(max(wait, 0.01))
+
+    def settle(self, entry, amount):
+        entry[1] = amount
+
+
+class Lane:
+    """A priority queue of pending transcripts with its own consumers and statistics."""
+
+    def __init__(self, name, concurrency, budget=None):
+        self.name = name
+        self.concurrency = concurrency
+        self.budget = budget
+        self.heap = []
+        self.condition = asyncio.Condition()
+        self.closed = False
+        self.stats = {"queued": 0, "enriched": 0, "failed": 0, "requeued": 0, "dead_lettered": 0, "tokens": 0, "credits": 0.0}
+        self.waits = []
+        self.depths = []
+
+    async def put(self, priority, sequence, record):
+        async with self.condition:
+            heapq.heappush(self.heap, (-priority, sequence, time.monotonic(), record))
+            self.stats["queued"] += 1
+            self.condition.notify()
+
+    async def get(self):
+        """Return (queued_at, record) of the highest priority, or None once the lane is closed and empty."""
+        async with self.condition:
+            while not self.heap and not self.closed:
+                await self.condition.wait()
+            if not self.heap:
+                return None
+            _, _, queued_at, record = heapq.heappop(self.heap)
+            return queued_at, record
+
+    async def close(self):
+        async with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def report(self):
+        waits = sorted(self.waits)
+        return {
+            "lane": self.name,
+            **self.stats,
+            "credits": round(self.stats["credits"], 6),
+            "depth_max": max(self.depths, default=0),
+            "depth_mean": round(mean(self.depths), 1) if self.depths else 0,
+            "wait_seconds_p50": round(median(waits), 2) if waits else None,
+            "wait_seconds_p95": round(waits[int(0.95 * (len(waits) - 1))], 2) if waits else None,
+        }
+
+
+class EnrichmentScheduler(EnrichmentWorker):
+    """Fresh and backfill lanes over the enrichment of enrichment_worker.EnrichmentWorker."""
+
+    def __init__(self, db, client, fresh_concurrency=12, backfill_concurrency=2, backfill_budget=200_000,
+                 budget_unit="tokens", budget_window_seconds=3600, fresh_hours=24, half_life_hours=6,
+                 urgency_weight=1.0, now=None, poll_seconds=5.0, drain=True, reprocess=False, report_seconds=5.0,
+                 requeue_seconds=30.0, max_requeues=3, **options):
+        super().__init__(db, client, concurrency=fresh_concurrency + backfill_concurrency, **options)
+        self.lanes = {
+            FRESH: Lane(FRESH, fresh_concurrency),
+            BACKFILL: Lane(BACKFILL, backfill_concurrency, HourlyBudget(backfill_budget, budget_window_seconds)),
+        }
+        self.budget_unit = budget_unit
+        self.fresh_hours = fresh_hours
+        self.half_life_hours = half_life_hours
+        self.urgency_weight = urgency_weight
+        # Reference time of the lane and recency decisions; the scheduler's clock advances from it
+        self.now = as_utc(now) or datetime.now(timezone.utc).replace(tzinfo=None)
+        self.started = time.monotonic()
+        self.poll_seconds = poll_seconds
+        self.drain = drain
+        self.reprocess = reprocess
+        self.report_seconds = report_seconds
+        self.requeue_seconds = requeue_seconds
+        self.max_requeues = max_requeues
+        self.scheduled = set()
+        # Failed enrichments by conversation_id, and the records waiting to be queued again
+        self.failures = {}
+        self.requeues = set()
+        # Load watermark of the previous poll: (latest load time, row count) of the transcripts
+        self.watermark = None
+        self.in_flight = 0
+        self.sequence = itertools.count()
+
+    def current_time(self):
+        return self.now + timedelta(seconds=time.monotonic() - self.started)
+
+    def classify(self, record):
+        """Return the lane and the priority of a pending transcript."""
+        start_time = as_utc(record.get("start_time"))
+        age_hours = (self.current_time() - start_time).total_seconds() / 3600 if start_time else float("inf")
+        lane = FRESH if age_hours <= self.fresh_hours else BACKFILL
+        recency = 0.5 ** (max(age_hours, 0.0) / self.half_life_hours) if age_hours != float("inf") else 0.0
+        return lane, recency + self.urgency_weight * urgency(record.get("transcript"))
+
+    def cost(self, results):
+        """Tokens or credits of the results of one transcript, in the unit of the backfill budget."""
+        return credits(results) if self.budget_unit == "credits" else tokens(results)
+
+    def estimate_cost(self, record):
+        """Upper estimate of the cost of a transcript before it is enriched: both prompts on the large model."""
+        transcript_tokens = min(estimate_tokens(record.get("transcript") or ""), TOKEN_BUDGETS["complete"])
+        estimate = 2 * (transcript_tokens + PROMPT_OVERHEAD_TOKENS)
+        if self.budget_unit == "credits":
+            return estimate * CREDITS_PER_MILLION_TOKENS[LARGE_MODEL] / 1_000_000
+        return estimate
+
+    async def poll(self, include_enriched=False):
+        """Queue the pending transcripts that are not scheduled yet; returns the number queued.
+
+        The first poll reads all the pending transcripts; the next ones only those loaded since the previous poll."""
+        watermark = await asyncio.to_thread(self.db.load_watermark)
+        if self.watermark is not None and tuple(watermark) == tuple(self.watermark):
+            return 0
+        loaded_since = None
+        if self.watermark is not None and self.watermark[0] is not None:
+            loaded_since = self.watermark[0] - LOAD_COMMIT_MARGIN
+        self.watermark = watermark
+        added = 0
+        after_id = None
+        while True:
+            page = await asyncio.to_thread(self.db.fetch_pending, self.page_size, after_id, include_enriched, loaded_since)
+            if not page:
+                break
+            for record in page:
+                if record["conversation_id"] in self.scheduled:
+                    continue
+                self.scheduled.add(record["conversation_id"])
+                lane, priority = self.classify(record)
+                await self.lanes[lane].put(priority, next(self.sequence), record)
+                added += 1
+            after_id = page[-1]["conversation_id"]
+        return added
+
+    async def produce(self):
+        await self.poll(include_enriched=self.reprocess)
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            added = await self.poll()
+            idle = not added and self.in_flight == 0 and not self.requeues and not any(lane.heap for lane in self.lanes.values())
+            if self.drain and idle:
+                break
+        for task in self.requeues:
+            task.cancel()
+        for lane in self.lanes.values():
+            await lane.close()
+
+    def requeue(self, lane, record):
+        """Queue a record whose enrichment failed again after a backoff, or dead-letter it after max_requeues."""
+        conversation_id = record["conversation_id"]
+        failures = self.failures[conversation_id] = self.failures.get(conversation_id, 0) + 1
+        if failures > self.max_requeues:
+            # Left pending: a later poll queues it again once it is loaded again
+            lane.stats["dead_lettered"] += 1
+            del self.failures[conversation_id]
+            self.scheduled.discard(conversation_id)
+            print(f"Conversation {conversation_id} dead-lettered after {failures} failed enrichments", file=sys.stderr)
+            return
+        lane.stats["requeued"] += 1
+        task = asyncio.create_task(self.put_later(record, self.requeue_seconds * 2 ** (failures - 1)))
+        self.requeues.add(task)
+        task.add_done_callback(self.requeues.discard)
+
+    async def put_later(self, record, delay):
+        await asyncio.sleep(delay)
+        # Classified again: the record may have aged out of the fresh lane while it waited
+        lane, priority = self.classify(record)
+        await self.lanes[lane].put(priority, next(self.sequence), record)
+
+    async def serve(self, lane):
+        while True:
+            item = await lane.get()
+            if item is None:
+                break
+            queued_at, record = item
+            self.in_flight += 1
+            try:
+                entry = await lane.budget.reserve(self.estimate_cost(record)) if lane.budget else None
+                results = await self.enrich_record(record)
+                if results is None:
+                    lane.stats["failed"] += 1
+                    if entry:
+                        lane.budget.settle(entry, 0)
+                    self.requeue(lane, record)
+                    continue
+                self.failures.pop(record["conversation_id"], None)
+                if entry:
+                    lane.budget.settle(entry, self.cost(results))
+                lane.stats["enriched"] += 1
+                lane.stats["tokens"] += tokens(results)
+                lane.stats["credits"] += credits(results)
+                lane.waits.append(time.monotonic() - queued_at)
+            finally:
+                self.in_flight -= 1
+
+    async def monitor(self):
+        """Sample the queue depths every second and print them every report_seconds."""
+        last_report = time.monotonic()
+        while True:
+            await asyncio.sleep(1)
+            for lane in self.lanes.values():
+                lane.depths.append(len(lane.heap))
+            if time.monotonic() - last_report >= self.report_seconds:
+                last_report = time.monotonic()
+                budget = self.lanes[BACKFILL].budget
+                print(
+                    f"[{time.monotonic() - self.started:6.1f}s] "
+                    + "  ".join(f"{lane.name}: depth {len(lane.heap)}, enriched {lane.stats['enriched']}" for lane in self.lanes.values())
+                    + f"  backfill budget {budget.used():.6g}/{budget.limit:g} {self.budget_unit}"
+                )
+
+    async def run(self):
+        self.started = time.monotonic()
+        # As in EnrichmentWorker.run, a failing task cancels the others instead of leaving them blocked
+        async with asyncio.TaskGroup() as tasks:
+            writer = tasks.create_task(self.write())
+            monitor = tasks.create_task(self.monitor())
+            consumers = [
+                tasks.create_task(self.serve(lane)) for lane in self.lanes.values() for _ in range(lane.concurrency)
+            ]
+            await self.produce()
+            await asyncio.gather(*consumers)
+            monitor.cancel()
+            await self.result_queue.put(None)
+            await writer
+
+        self.stats.pop("max_work_queue")
+        self.stats["elapsed_seconds"] = round(time.monotonic() - self.started, 2)
+        self.stats["backfill_budget_wait_seconds"] = round(self.lanes[BACKFILL].budget.waited_seconds, 2)
+        print()
+        for lane in self.lanes.values():
+            row = lane.report()
+            print(
+                f"{row['lane']:9s} queued {row['queued']:5d}  enriched {row['enriched']:5d}  failed {row['failed']:3d}  "
+                f"requeued {row['requeued']:3d}  dead-lettered {row['dead_lettered']:3d}  "
+                f"depth max {row['depth_max']:5d} mean {row['depth_mean']:7.1f}  "
+                f"wait p50 {row['wait_seconds_p50']} s p95 {row['wait_seconds_p95']} s  "
+                f"tokens {row['tokens']:7d}  credits {row['credits']:.5f}"
+            )
+        print()
+        return self.stats
+
+
+def latest_start_time(db):
+    """The latest call in the offline database, used as now when replaying exported files."""
+    return db.execute("SELECT MAX(start_time) FROM parsed_transcripts")[0][0]
+
+
+async def run_scheduler(args):
+    def make_scheduler(db, client):
+        now = args.now
+        if now is None and not args.snowflake:
+            now = latest_start_time(db)
+        return EnrichmentScheduler(
+            db, client,
+            fresh_concurrency=args.fresh_concurrency,
+            backfill_concurrency=args.backfill_concurrency,
+            backfill_budget=args.backfill_budget,
+            budget_unit=args.budget_unit,
+            budget_window_seconds=args.budget_window_seconds,
+            fresh_hours=args.fresh_hours,
+            half_life_hours=args.half_life_hours,
+            urgency_weight=args.urgency_weight,
+            now=now,
+            poll_seconds=args.poll_seconds,
+            drain=not args.follow,
+            reprocess=args.reprocess,
+            report_seconds=args.report_seconds,
+            requeue_seconds=args.requeue_seconds,
+            max_requeues=args.max_requeues,
+            queue_size=args.queue_size,
+            batch_size=args.batch_size,
+            flush_seconds=args.flush_seconds,
+            quality_tier=args.quality_tier,
+        )
+
+    return await run_enrichment(args, make_scheduler)
+
+
+def parse_args(argv):
+    parser = build_parser("Priority-aware, budgeted enrichment of the COMPLETE prompts")
+    parser.add_argument("--fresh-concurrency", type=int, default=12, help="consumers of the fresh lane")
+    parser.add_argument("--backfill-concurrency", type=int, default=2, help="consumers of the backfill lane")
+    parser.add_argument("--backfill-budget", type=float, default=200_000, help="backfill tokens or credits per budget window")
+    parser.add_argument("--budget-unit", choices=["tokens", "credits"], default="tokens")
+    parser.add_argument("--budget-window-seconds", type=float, default=3600, help="length of the budget window")
+    parser.add_argument("--fresh-hours", type=float, default=24, help="calls younger than this go to the fresh lane")
+    parser.add_argument("--half-life-hours", type=float, default=6, help="age at which the recency score halves")
+    parser.add_argument("--urgency-weight", type=float, default=1.0, help="weight of the urgency score against recency")
+    parser.add_argument("--now", help="reference time (ISO 8601); offline default: the latest call in the database")
+    parser.add_argument("--poll-seconds", type=float, default=5.0, help="interval between polls for new transcripts")
+    parser.add_argument("--follow", action="store_true", help="keep polling instead of stopping once the lanes are empty")
+    parser.add_argument("--report-seconds", type=float, default=5.0, help="interval between progress lines")
+    parser.add_argument("--requeue-seconds", type=float, default=30.0, help="wait before queuing a failed transcript again, doubled per failure")
+    parser.add_argument("--max-requeues", type=int, default=3, help="dead-letter a transcript after this many requeues")
+    parser.add_argument("--reprocess", action="store_true", help="also queue the enriched transcripts, e.g. after a prompt or model change")
+    args = parser.parse_args(argv)
+    # The HTTP connection pool is sized from --concurrency
+    args.concurrency = args.fresh_concurrency + args.backfill_concurrency
+    return args
+
+
+if __name__ == "__main__":
+    asyncio.run(run_scheduler(parse_args(sys.argv[1:])))
@@ -0,0 +1,530 @@
+"""
+Async, rate-limited enrichment worker for the COMPLETE prompts.
+
+Inside the dynamic tables there is no control over concurrency, retries or batching of the Cortex calls. This worker
+takes the transcripts of parsed_transcripts that have no results yet and sends the resolution and service rating
+prompts to the Cortex REST API:
+
+- a producer pages through the pending transcripts into a bounded work queue, so it waits when the consumers fall
+  behind (backpressure) instead of holding the whole table in memory
+- a configurable number of consumers send the requests concurrently with asyncio; a token bucket limits the request
+  rate, and 429 and 5xx responses are retried with exponential backoff and jitter (honoring Retry-After)
+- each prompt is routed to a model and escalated on invalid output as in model_router.py
+- a writer collects the results from a bounded result queue and writes them with one bulk MERGE per batch
+- with a near-duplicate index (near_duplicates.py), a transcript close enough to its cluster representative copies the
+  representative's results instead of calling Cortex
+
+Transcripts whose requests fail after all retries, or whose enrichment fails with any other error, are counted as
+failed and left pending for the next run. A failure of the producer or the writer cancels the other tasks and is
+raised from run(), rather than leaving them waiting on the queues. Offline, the worker reads from
+and writes to a DuckDB database (offline_db.py) and calls the local stub in cortex_http_stub.py; with --snowflake it
+uses MED_DEVICE_TRANSCRIPTS.ANALYTICS and the Cortex REST API of the account (requires snowflake-connector-python and
+the SNOWFLAKE_ACCOUNT, SNOWFLAKE_USER, SNOWFLAKE_PASSWORD and SNOWFLAKE_PAT environment variables).
+
+Usage:
+    python enrichment_worker.py [options] <json file or directory> [...]
+    python enrichment_worker.py --snowflake [options]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+import aiohttp
+
+from device_fastpath import get_matcher
+from model_router import (
+    DEFAULT_QUALITY_TIER,
+    LARGE_MODEL,
+    RESOLUTION,
+    SERVICE_RATING,
+    build_messages,
+    is_valid_response,
+    route,
+)
+from near_duplicates import REUSE, REVIEW, NearDuplicateIndex
+from offline_db import RESULT_COLUMNS, OfflineDatabase
+from transcript_chunker import TOKEN_BUDGETS, estimate_tokens, fit_to_budget
+from transcript_io import read_transcripts
+
+COMPLETE_PATH = "/api/v2/cortex/inference:complete"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CortexRequestError(Exception):
+    """A Cortex request that still failed after all retries."""
+
+
+class TokenBucket:
+    """Allows rate requests per second on average, with bursts of up to capacity requests."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CortexRestClient:
+    """Sends COMPLETE requests to the Cortex REST API (or the local stub) with rate limiting and retries."""
+
+    def __init__(self, session, base_url, limiter, headers=None, max_retries=5, backoff_base=0.25, backoff_max=10.0):
+        self.session = session
+        self.url = base_url.rstrip("/") + COMPLETE_PATH
+        self.limiter = limiter
+        self.headers = headers or {}
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = {"requests": 0, "retries": 0, "responses_429": 0}
+
+    async def complete(self, model, messages, max_tokens=60):
+        """Return a dict with text, prompt_tokens, completion_tokens and latency_ms."""
+        body = {"model": model, "messages": messages, "temperature": 0, "max_tokens": max_tokens, "stream": False}
+
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            self.stats["requests"] += 1
+            start = time.perf_counter()
+            retry_after = None
+            try:
+                async with self.session.post(self.url, json=body, headers=self.headers) as response:
+                    if response.status == 200:
+                        result = await self.read_response(response)
+                        result["latency_ms"] = (time.perf_counter() - start) * 1000
+                        return result
+                    if response.status not in RETRY_STATUSES:
+                        raise CortexRequestError(f"HTTP {response.status}: {await response.text()}")
+                    if response.status == 429:
+                        self.stats["responses_429"] += 1
+                    retry_after = response.headers.get("Retry-After")
+                    error = f"HTTP {response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = str(e) or type(e).__name__
+
+            if attempt == self.max_retries:
+                raise CortexRequestError(f"{model} failed after {attempt + 1} attempts: {error}")
+
+            # Exponential backoff with full jitter; a Retry-After header sets the minimum wait
+            self.stats["retries"] += 1
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+            if retry_after:
+                try:
+                    delay = max(delay, float(retry_after))
+                except ValueError:
+                    pass
+            await asyncio.sleep(delay)
+
+    async def read_response(self, response):
+        """Parse a JSON response, or the server-sent events the Cortex REST API streams by default."""
+        if response.content_type == "text/event-stream":
+            text, usage = [], {}
+            async for line in response.content:
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[5:])
+                for choice in event.get("choices", []):
+                    text.append(choice.get("delta", {}).get("content", ""))
+                usage = event.get("usage") or usage
+            return {
+                "text": "".join(text),
+                "prompt_tokens": usage.get("prompt_tokens", 0),
+                "completion_tokens": usage.get("completion_tokens", 0),
+            }
+
+        payload = await response.json()
+        choice = payload["choices"][0]
+        usage = payload.get("usage", {})
+        return {
+            "text": choice.get("message", {}).get("content") or choice.get("messages", ""),
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+        }
+
+
+async def enrich_prompt(client, conversation_id, prompt_type, transcript, fastpath_status, quality_tier):
+    """Send one prompt to its routed model, escalating an invalid response to the large model."""
+    messages = build_messages(prompt_type, transcript)
+    routed_model = route(estimate_tokens(transcript), fastpath_status, quality_tier)
+
+    response = await client.complete(routed_model, messages)
+    model = routed_model
+    valid = is_valid_response(prompt_type, response["text"])
+    escalated = False
+    if not valid and routed_model != LARGE_MODEL:
+        escalated = True
+        escalation = await client.complete(LARGE_MODEL, messages)
+        escalation["prompt_tokens"] += response["prompt_tokens"]
+        escalation["completion_tokens"] += response["completion_tokens"]
+        escalation["latency_ms"] += response["latency_ms"]
+        response = escalation
+        model = LARGE_MODEL
+        valid = is_valid_response(prompt_type, response["text"])
+
+    return {
+        "conversation_id": conversation_id,
+        "prompt_type": prompt_type,
+        "routed_model": routed_model,
+        "model": model,
+        "escalated": escalated,
+        "response_text": response["text"],
+        "is_valid": valid,
+        "prompt_tokens": response["prompt_tokens"],
+        "completion_tokens": response["completion_tokens"],
+        "latency_ms": round(response["latency_ms"], 1),
+    }
+
+
+class EnrichmentWorker:
+    """Producer, concurrent consumers and a batching writer connected by bounded queues."""
+
+    def __init__(self, db, client, concurrency=16, queue_size=64, batch_size=100, flush_seconds=2.0,
+                 page_size=500, quality_tier=DEFAULT_QUALITY_TIER, near_duplicates=None):
+        self.db = db
+        self.client = client
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.page_size = page_size
+        self.quality_tier = quality_tier
+        self.matcher = get_matcher()
+        self.near_duplicates = near_duplicates
+        # Results of the cluster representatives enriched in this run, for their near-duplicates
+        self.representative_results = {}
+        self.work_queue = asyncio.Queue(maxsize=queue_size)
+        self.result_queue = asyncio.Queue(maxsize=queue_size * 2)
+        self.stats = {"enriched": 0, "reused": 0, "flagged_for_review": 0, "failed": 0, "batches": 0, "rows_written": 0, "max_work_queue": 0}
+        self.completion_times = []
+
+    async def produce(self):
+        after_id = None
+        while True:
+            page = await asyncio.to_thread(self.db.fetch_pending, self.page_size, after_id)
+            if not page:
+                break
+            for record in page:
+                # Blocks while the queue is full, so reading the table keeps pace with the consumers
+                await self.work_queue.put(record)
+                self.stats["max_work_queue"] = max(self.stats["max_work_queue"], self.work_queue.qsize())
+            after_id = page[-1]["conversation_id"]
+        for _ in range(self.concurrency):
+            await self.work_queue.put(None)
+
+    async def reuse(self, record):
+        """Copy the results of the record's cluster representative; returns False when it has to be enriched."""
+        match = self.near_duplicates.add(
+            record["conversation_id"], record.get("transcript"), record.get("agent_name"), record.get("customer_name")
+        )
+        if match["action"] == REVIEW:
+            self.stats["flagged_for_review"] += 1
+        if match["action"] != REUSE:
+            return False
+
+        representative = match["representative"]
+        results = self.representative_results.get(representative)
+        if results is None:
+            results = await asyncio.to_thread(self.db.fetch_results, representative)
+        if not results:
+            # The representative is still in flight or failed
+            return False
+
+        for result in results:
+            await self.result_queue.put(dict(
+                result,
+                conversation_id=record["conversation_id"],
+                prompt_tokens=0,
+                completion_tokens=0,
+                latency_ms=0.0,
+                reused_from=representative,
+            ))
+        self.stats["reused"] += 1
+        self.completion_times.append(time.monotonic())
+        return True
+
+    def record_failure(self, record, error):
+        self.stats["failed"] += 1
+        detail = error if isinstance(error, CortexRequestError) else f"{type(error).__name__}: {error}"
+        print(f"Conversation {record.get('conversation_id')} left pending: {detail}", file=sys.stderr)
+
+    async def enrich_record(self, record):
+        """Run both prompts for one transcript and queue the results; returns them, or None on failure."""
+        try:
+            names = (record.get("agent_name"), record.get("customer_name"))
+            status = self.matcher.classify(record.get("transcript"), names)["status"]
+            transcript = fit_to_budget(record.get("transcript"), names[0], names[1], TOKEN_BUDGETS["complete"])
+            results = await asyncio.gather(*[
+                enrich_prompt(self.client, record["conversation_id"], prompt_type, transcript, status, self.quality_tier)
+                for prompt_type in (RESOLUTION, SERVICE_RATING)
+            ])
+        except Exception as e:
+            # Any error of one transcript leaves it pending; raising it would end the consumer
+            self.record_failure(record, e)
+            return None
+        if self.near_duplicates is not None:
+            self.representative_results[record["conversation_id"]] = results
+        for result in results:
+            await self.result_queue.put(result)
+        self.stats["enriched"] += 1
+        self.completion_times.append(time.monotonic())
+        return results
+
+    async def consume(self):
+        while True:
+            record = await self.work_queue.get()
+            if record is None:
+                break
+            try:
+                if self.near_duplicates is not None and await self.reuse(record):
+                    continue
+            except Exception as e:
+                self.record_failure(record, e)
+                continue
+            await self.enrich_record(record)
+
+    async def write(self):
+        batch = []
+        done = False
+        while not done:
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    result = await asyncio.wait_for(self.result_queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if result is None:
+                    done = True
+                    break
+                batch.append(result)
+            if batch:
+                self.stats["rows_written"] += await asyncio.to_thread(self.db.merge_results, batch)
+                self.stats["batches"] += 1
+                batch = []
+
+    async def run(self):
+        start = time.monotonic()
+        # A failing task cancels the others, so a dead writer or producer does not leave the rest blocked on a queue
+        async with asyncio.TaskGroup() as tasks:
+            writer = tasks.create_task(self.write())
+            consumers = [tasks.create_task(self.consume()) for _ in range(self.concurrency)]
+            await self.produce()
+            await asyncio.gather(*consumers)
+            await self.result_queue.put(None)
+            await writer
+
+        self.stats["elapsed_seconds"] = round(time.monotonic() - start, 2)
+        self.stats["transcripts_per_second"] = round((self.stats["enriched"] + self.stats["reused"]) / self.stats["elapsed_seconds"], 2) if self.stats["elapsed_seconds"] else 0.0
+        self.stats["sustained_transcripts_per_second"] = self.sustained_rate()
+        return self.stats
+
+    def sustained_rate(self):
+        """Throughput between the 10th and 90th percentile completions, leaving out ramp-up and the tail."""
+        times = self.completion_times
+        if len(times) < 10:
+            return None
+        low, high = int(0.1 * len(times)), int(0.9 * len(times))
+        span = times[high] - times[low]
+        return round((high - low) / span, 2) if span > 0 else None
+
+
+class SnowflakeDatabase:
+    """Reads pending transcripts from and merges results into MED_DEVICE_TRANSCRIPTS.ANALYTICS."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.connection.cursor().execute("""
+            CREATE TABLE IF NOT EXISTS TRANSCRIPT_COMPLETE_RESULTS (
+                CONVERSATION_ID NUMBER,
+                PROMPT_TYPE VARCHAR,
+                ROUTED_MODEL VARCHAR,
+                MODEL VARCHAR,
+                ESCALATED BOOLEAN,
+                RESPONSE_TEXT VARCHAR,
+                IS_VALID BOOLEAN,
+                PROMPT_TOKENS NUMBER,
+                COMPLETION_TOKENS NUMBER,
+                LATENCY_MS FLOAT,
+                REUSED_FROM NUMBER,
+                ENRICHED_AT TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP()
+            )
+        """)
+
+    def fetch_pending(self, limit=1000, after_id=None, include_enriched=False, loaded_since=None):
+        cursor = self.connection.cursor()
+        # RAW_TRANSCRIPTS is loaded in FILE_LOAD_TIME order, so the loaded_since filter prunes to the newest
+        # micro-partitions instead of scanning the table
+        cursor.execute("""
+            SELECT conversation_id, start_time, end_time, agent_name, customer_name, transcript
+            FROM parsed_transcripts p
+            WHERE (%s OR NOT EXISTS (
+                SELECT 1 FROM TRANSCRIPT_COMPLETE_RESULTS r WHERE r.conversation_id = p.conversation_id
+            ))
+            AND (%s IS NULL OR p.conversation_id IN (
+                SELECT conversation_id FROM RAW_TRANSCRIPTS WHERE FILE_LOAD_TIME >= %s
+            ))
+            AND p.conversation_id > %s
+            ORDER BY p.conversation_id
+            LIMIT %s
+        """, (include_enriched, loaded_since, loaded_since, after_id if after_id is not None else -1, limit))
+        columns = [column[0].lower() for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def load_watermark(self):
+        # Answered from the micro-partition metadata: no table scan
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT MAX(FILE_LOAD_TIME), COUNT(*) FROM RAW_TRANSCRIPTS")
+        return cursor.fetchone()
+
+    def fetch_results(self, conversation_id):
+        cursor = self.connection.cursor()
+        cursor.execute(
+            f"SELECT {', '.join(RESULT_COLUMNS)} FROM TRANSCRIPT_COMPLETE_RESULTS WHERE conversation_id = %s",
+            (conversation_id,),
+        )
+        return [dict(zip(RESULT_COLUMNS, row)) for row in cursor.fetchall()]
+
+    def merge_results(self, results):
+        """One MERGE statement per batch, with the rows bound as a VALUES list."""
+        if not results:
+            return 0
+        placeholders = ", ".join("(" + ", ".join("%s" for _ in RESULT_COLUMNS) + ")" for _ in results)
+        parameters = [result.get(column) for result in results for column in RESULT_COLUMNS]
+        source_columns = ", ".join(f"column{index + 1} AS {column}" for index, column in enumerate(RESULT_COLUMNS))
+        self.connection.cursor().execute(f"""
+            MERGE INTO TRANSCRIPT_COMPLETE_RESULTS t
+            USING (SELECT {source_columns} FROM VALUES {placeholders}) s
+            ON t.conversation_id = s.conversation_id AND t.prompt_type = s.prompt_type
+            WHEN MATCHED THEN UPDATE SET
+                {", ".join(f"{column} = s.{column}" for column in RESULT_COLUMNS[2:])},
+                enriched_at = CURRENT_TIMESTAMP()
+            WHEN NOT MATCHED THEN INSERT ({", ".join(RESULT_COLUMNS)})
+                VALUES ({", ".join("s." + column for column in RESULT_COLUMNS)})
+        """, parameters)
+        return len(results)
+
+
+def snowflake_connection():
+    """Connect with the SNOWFLAKE_* environment variables."""
+    import snowflake.connector
+
+    return snowflake.connector.connect(
+        account=os.environ["SNOWFLAKE_ACCOUNT"],
+        user=os.environ["SNOWFLAKE_USER"],
+        password=os.environ["SNOWFLAKE_PASSWORD"],
+        warehouse="CORTEX_DEMO_WH",
+        database="MED_DEVICE_TRANSCRIPTS",
+        schema="ANALYTICS",
+    )
+
+
+async def run_enrichment(args, make_worker):
+    """Open the database and the Cortex client from the command line options, then run make_worker(db, client)."""
+    stub = None
+    if args.snowflake:
+        db = SnowflakeDatabase(snowflake_connection())
+        base_url = args.base_url or f"https://{os.environ['SNOWFLAKE_ACCOUNT']}.snowflakecomputing.com"
+        headers = {
+            "Authorization": f"Bearer {os.environ['SNOWFLAKE_PAT']}",
+            "X-Snowflake-Authorization-Token-Type": "PROGRAMMATIC_ACCESS_TOKEN",
+        }
+    else:
+        db = OfflineDatabase(args.database)
+        if args.paths:
+            print(f"Loaded {db.load_transcripts(read_transcripts(args.paths))} records into {args.database}")
+        base_url, headers = args.base_url, {}
+        if not base_url:
+            from cortex_http_stub import CortexHttpStub
+
+            stub = CortexHttpStub(latency_ms=args.stub_latency_ms, rate_429=args.stub_rate_429, max_concurrent=args.stub_max_concurrent)
+            base_url = await stub.start(port=args.stub_port)
+
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.concurrency * 2)
+    try:
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            client = CortexRestClient(session, base_url, TokenBucket(args.rate, args.burst), headers, args.max_retries)
+            stats = await make_worker(db, client).run()
+    finally:
+        if stub:
+            await stub.stop()
+
+    stats.update(client.stats)
+    for key, value in stats.items():
+        print(f"{key + ':':36s} {value}")
+    if stub:
+        print(f"{'stub_max_in_flight:':36s} {stub.stats['max_in_flight']}")
+    return stats
+
+
+async def run_worker(args):
+    near_duplicates = None
+    if args.near_duplicates:
+        near_duplicates = NearDuplicateIndex.load(args.near_duplicates) if os.path.exists(args.near_duplicates) else NearDuplicateIndex()
+
+    def make_worker(db, client):
+        return EnrichmentWorker(
+            db, client,
+            concurrency=args.concurrency,
+            queue_size=args.queue_size,
+            batch_size=args.batch_size,
+            flush_seconds=args.flush_seconds,
+            quality_tier=args.quality_tier,
+            near_duplicates=near_duplicates,
+        )
+
+    try:
+        return await run_enrichment(args, make_worker)
+    finally:
+        if near_duplicates is not None:
+            near_duplicates.save(args.near_duplicates)
+
+
+def build_parser(description="Async, rate-limited enrichment of the COMPLETE prompts"):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("paths", nargs="*", help="JSON files or directories to load into the offline database first")
+    parser.add_argument("--snowflake", action="store_true", help="use Snowflake and the Cortex REST API instead of the offline mode")
+    parser.add_argument("--database", default=":memory:", help="DuckDB file of the offline mode")
+    parser.add_argument("--base-url", help="Cortex REST API base URL (offline default: start the local stub)")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent transcripts")
+    parser.add_argument("--rate", type=float, default=50.0, help="requests per second")
+    parser.add_argument("--burst", type=int, default=None, help="token bucket capacity (default: one second of requests)")
+    parser.add_argument("--queue-size", type=int, default=64, help="bound of the work queue")
+    parser.add_argument("--batch-size", type=int, default=100, help="result rows per MERGE")
+    parser.add_argument("--flush-seconds", type=float, default=2.0, help="maximum wait before writing a partial batch")
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120.0, help="request timeout in seconds")
+    parser.add_argument("--quality-tier", default=DEFAULT_QUALITY_TIER)
+    parser.add_argument("--stub-port", type=int, default=8765)
+    parser.add_argument("--stub-latency-ms", type=float, default=300.0)
+    parser.add_argument("--stub-rate-429", type=float, default=0.02)
+    parser.add_argument("--stub-max-concurrent", type=int, default=32)
+    return parser
+
+
+def parse_args(argv):
+    parser = build_parser()
+    parser.add_argument("--near-duplicates", help="near-duplicate index file; reuse the results of near-identical transcripts")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(run_worker(parse_args(sys.argv[1:])))
@@ -0,0 +1,431 @@
+"""
+Event-driven ingestion of new transcript files, replacing the LOAD_JSON_FILES_NEW polling task.
+
+The task wakes every 15 seconds and runs COPY INTO whether or not a file arrived, and has to be resumed and suspended
+around each pipeline run. This service watches the stage instead (a local directory in offline mode) and only loads
+when there is something to load:
+
+- the stage is listed every --poll-seconds; LIST is a metadata operation that does not resume the warehouse, so an
+  idle service costs nothing (locally, the directory is scanned and each new file is hashed once)
+- every file is identified by its name and MD5 checksum; files that are not in the manifest of loaded files
+  (INGEST_MANIFEST) are pending, so a file that is overwritten with new content is loaded again
+- pending files are loaded in micro-batches, as soon as --batch-files files are pending or the oldest one has waited
+  --batch-seconds
+- each batch is copied, merged into RAW_TRANSCRIPTS on conversation_id and recorded in the manifest in one
+  transaction. A batch interrupted by a crash leaves no manifest entries and is loaded again after a restart, and a
+  committed batch is never loaded twice, so every file is applied exactly once
+- when a batch is rejected, its files are loaded one by one; a file that is rejected on its own (it does not parse,
+  or COPY rejects it) is quarantined: it is recorded in the manifest with rows_loaded 0 and the error, and the service
+  moves on. It is not retried until its content changes; delete its manifest row to retry it as is
+- any other error (a dropped connection, a warehouse that is not available, a lock timeout) says nothing about the
+  files: they stay pending and are retried after --retry-seconds, doubled on every further failure up to 5 minutes.
+  With --once, a file is given up after --retry-limit failures and left pending for the next run
+
+The manifest, not the COPY load metadata, decides which files are new: the load metadata expires after 64 days and
+does not notice a file that was uploaded again with different content. Keep the LOAD_JSON_FILES_NEW task suspended
+while the service runs.
+Offline, the service loads into a DuckDB database (offline_db.py); with --snowflake it watches CALL_DATA_NEW and loads
+into MED_DEVICE_TRANSCRIPTS.ANALYTICS (requires snowflake-connector-python and the SNOWFLAKE_ACCOUNT, SNOWFLAKE_USER
+and SNOWFLAKE_PASSWORD environment variables).
+
+Usage:
+    python ingestion_service.py [options] <directory>
+    python ingestion_service.py --snowflake [options]
+"""
+
+import argparse
+import gzip
+import hashlib
+import os
+import sys
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from statistics import median
+
+import duckdb
+
+from offline_db import OfflineDatabase
+from transcript_io import iter_transcript_file, list_transcript_files
+
+DEFAULT_STAGE = "@MED_DEVICE_TRANSCRIPTS.DATA_PREP.CALL_DATA_NEW"
+MAX_RETRY_SECONDS = 300.0
+
+
+def file_md5(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class LocalStage:
+    """A local directory of JSON files loaded into the offline database."""
+
+    def __init__(self, directory, db, source="NEW", settle_seconds=1.0):
+        self.directory = directory
+        self.db = db
+        self.source = source
+        self.settle_seconds = settle_seconds
+        # Checksums by (path, size, mtime), so an unchanged file is hashed once
+        self.checksums = {}
+
+    def list_files(self):
+        """Return the files of the directory as dicts with name, size, md5 and modified (a UTC timestamp)."""
+        files = []
+        now = time.time()
+        for path in list_transcript_files(self.directory):
+            stat = os.stat(path)
+            # A file that was modified just now may still be being written
+            if now - stat.st_mtime < self.settle_seconds:
+                continue
+            key = (path, stat.st_size, stat.st_mtime)
+            if key not in self.checksums:
+                self.checksums[key] = file_md5(path)
+            files.append({"name": os.path.basename(path), "size": stat.st_size, "md5": self.checksums[key], "modified": stat.st_mtime})
+        return files
+
+    def manifest(self):
+        return self.db.fetch_manifest()
+
+    def load(self, files, batch_id):
+        """Merge the records of the files and record them in the manifest in one transaction; returns the rows."""
+        records, manifest = [], []
+        for file in files:
+            file_records = list(iter_transcript_file(os.path.join(self.directory, file["name"])))
+            records.extend(file_records)
+            manifest.append({
+                "file_name": file["name"],
+                "md5": file["md5"],
+                "size": file["size"],
+                "rows_loaded": len(file_records),
+                "batch_id": batch_id,
+            })
+        return self.db.load_transcripts(records, self.source, manifest)
+
+    def quarantine(self, file, batch_id, error):
+        """Record a file that could not be loaded in the manifest, with no rows and the error."""
+        entry = {"file_name": file["name"], "md5": file["md5"], "size": file["size"], "rows_loaded": 0, "batch_id": batch_id, "error": error}
+        self.db.load_transcripts([], self.source, [entry])
+
+    def rejected(self, error):
+        """Whether the error comes from the content of the files, so loading them again would fail the same way."""
+        # ValueError covers invalid JSON and UTF-8, AttributeError a record that is not an object, EOFError a truncated
+        # gzip file, and duckdb.DataError a value that does not convert to its column
+        return isinstance(error, (ValueError, AttributeError, EOFError, gzip.BadGzipFile, zlib.error, duckdb.DataError))
+
+
+class SnowflakeStage:
+    """The CALL_DATA_NEW stage, loaded into RAW_TRANSCRIPTS with COPY INTO and MERGE."""
+
+    def __init__(self, connection, stage=DEFAULT_STAGE, source="NEW"):
+        self.connection = connection
+        self.stage = stage
+        self.source = source
+        cursor = self.connection.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS INGEST_MANIFEST (
+                FILE_NAME VARCHAR,
+                MD5 VARCHAR,
+                SIZE NUMBER,
+                ROWS_LOADED NUMBER,
+                BATCH_ID VARCHAR,
+                LOADED_AT TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP(),
+                ERROR VARCHAR
+            )
+        """)
+        # Files that could not be loaded are recorded with the error; added after the table was first created
+        cursor.execute("ALTER TABLE INGEST_MANIFEST ADD COLUMN IF NOT EXISTS ERROR VARCHAR")
+        # A session-private staging table, so the service never shares RAW_TRANSCRIPTS_STAGING with the task
+        cursor.execute("CREATE TEMPORARY TABLE IF NOT EXISTS INGEST_STAGING LIKE RAW_TRANSCRIPTS_STAGING")
+
+    def list_files(self):
+        cursor = self.connection.cursor()
+        cursor.execute(f"LIST {self.stage}")
+        files = []
+        for name, size, md5, last_modified in cursor.fetchall():
+            # LIST returns the path with the stage name first; COPY INTO ... FILES expects it relative to the stage
+            relative_name = name.split("/", 1)[1] if "/" in name else name
+            if not relative_name.endswith((".json", ".json.gz", ".ndjson", ".ndjson.gz")):
+                continue
+            files.append({
+                "name": relative_name,
+                "size": size,
+                "md5": md5,
+                "modified": parsedate_to_datetime(last_modified).timestamp(),
+            })
+        return files
+
+    def manifest(self):
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT FILE_NAME, MD5 FROM INGEST_MANIFEST")
+        return {(row[0], row[1]) for row in cursor.fetchall()}
+
+    def load(self, files, batch_id):
+        cursor = self.connection.cursor()
+        file_list = ", ".join("'" + file["name"].replace("'", "''") + "'" for file in files)
+        cursor.execute("BEGIN")
+        try:
+            # FORCE: the manifest decides what is new, the COPY load metadata may have expired
+            cursor.execute(f"""
+                COPY INTO INGEST_STAGING
+                FROM (SELECT
+                    %s,
+                    $1:conversation_id::NUMBER,
+                    $1:start_time::TIMESTAMP_NTZ,
+                    $1:end_time::TIMESTAMP_NTZ,
+                    $1:agent_name::STRING,
+                    $1:customer_name::STRING,
+                    $1:transcript::STRING,
+                    METADATA$FILENAME,
+                    CURRENT_TIMESTAMP()
+                    FROM {self.stage})
+                FILES = ({file_list})
+                FILE_FORMAT = '"MED_DEVICE_TRANSCRIPTS"."ANALYTICS"."JSON_GZ_FORMAT"'
+                ON_ERROR = ABORT_STATEMENT
+                FORCE = TRUE
+            """, (self.source,))
+            # COPY returns one row per file: file, status, rows_parsed, rows_loaded, ...
+            rows_by_file = {row[0].split("/", 1)[-1]: row[3] for row in cursor.fetchall()}
+
+            # Same rules as MERGE_STAGED_TRANSCRIPTS: the latest record per conversation, and only changed rows update
+            cursor.execute("""
+                MERGE INTO RAW_TRANSCRIPTS t
+                USING (
+                    SELECT *
+                    FROM INGEST_STAGING
+                    WHERE CONVERSATION_ID IS NOT NULL
+                    QUALIFY ROW_NUMBER() OVER (PARTITION BY CONVERSATION_ID ORDER BY FILE_LOAD_TIME DESC, FILE_NAME DESC) = 1
+                ) s
+                ON t.CONVERSATION_ID = s.CONVERSATION_ID
+                WHEN MATCHED AND (
+                    t.TRANSCRIPT IS DISTINCT FROM s.TRANSCRIPT
+                    OR t.START_TIME IS DISTINCT FROM s.START_TIME
+                    OR t.END_TIME IS DISTINCT FROM s.END_TIME
+                    OR t.AGENT_NAME IS DISTINCT FROM s.AGENT_NAME
+                    OR t.CUSTOMER_NAME IS DISTINCT FROM s.CUSTOMER_NAME
+                ) THEN UPDATE SET
+                    SOURCE = s.SOURCE,
+                    START_TIME = s.START_TIME,
+                    END_TIME = s.END_TIME,
+                    AGENT_NAME = s.AGENT_NAME,
+                    CUSTOMER_NAME = s.CUSTOMER_NAME,
+                    TRANSCRIPT = s.TRANSCRIPT,
+                    FILE_NAME = s.FILE_NAME,
+                    FILE_LOAD_TIME = s.FILE_LOAD_TIME
+                WHEN NOT MATCHED THEN INSERT (
+                    SOURCE, CONVERSATION_ID, START_TIME, END_TIME, AGENT_NAME, CUSTOMER_NAME, TRANSCRIPT, FILE_NAME, FILE_LOAD_TIME
+                ) VALUES (
+                    s.SOURCE, s.CONVERSATION_ID, s.START_TIME, s.END_TIME, s.AGENT_NAME, s.CUSTOMER_NAME, s.TRANSCRIPT, s.FILE_NAME, s.FILE_LOAD_TIME
+                )
+            """)
+            cursor.execute("DELETE FROM INGEST_STAGING")
+            cursor.executemany(
+                "INSERT INTO INGEST_MANIFEST (FILE_NAME, MD5, SIZE, ROWS_LOADED, BATCH_ID) VALUES (%s, %s, %s, %s, %s)",
+                [(file["name"], file["md5"], file["size"], rows_by_file.get(file["name"], 0), batch_id) for file in files],
+            )
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        return sum(rows_by_file.values())
+
+    def quarantine(self, file, batch_id, error):
+        self.connection.cursor().execute(
+            "INSERT INTO INGEST_MANIFEST (FILE_NAME, MD5, SIZE, ROWS_LOADED, BATCH_ID, ERROR) VALUES (%s, %s, %s, 0, %s, %s)",
+            (file["name"], file["md5"], file["size"], batch_id, error),
+        )
+
+    def rejected(self, error):
+        """Whether COPY rejected the files: a data exception (SQLSTATE class 22) such as a parse or conversion error."""
+        from snowflake.connector.errors import ProgrammingError
+
+        return isinstance(error, ProgrammingError) and str(error.sqlstate or "").startswith("22")
+
+
+class IngestionService:
+    """Watches a stage and loads new files in micro-batches, recording each batch in the manifest."""
+
+    def __init__(self, stage, batch_files=50, batch_seconds=5.0, poll_seconds=1.0, retry_seconds=5.0, retry_limit=5):
+        self.stage = stage
+        self.batch_files = batch_files
+        self.batch_seconds = batch_seconds
+        self.poll_seconds = poll_seconds
+        self.retry_seconds = retry_seconds
+        self.retry_limit = retry_limit
+        # Read once: afterwards the service adds its own batches, so idle polls only list the stage
+        self.loaded = stage.manifest()
+        # Pending files by (name, md5), with the time the service first saw them, the number of failed attempts and
+        # the time before which they are not retried
+        self.pending = {}
+        self.stats = {"polls": 0, "batches": 0, "files": 0, "rows": 0, "failed_files": 0, "retries": 0}
+        self.latencies = []
+
+    def poll(self):
+        """List the stage and add the files that are not loaded or pending yet; returns the number added."""
+        self.stats["polls"] += 1
+        added = 0
+        for file in self.stage.list_files():
+            key = (file["name"], file["md5"])
+            if key in self.loaded or key in self.pending:
+                continue
+            self.pending[key] = dict(file, seen=time.time(), attempts=0, retry_at=0.0)
+            added += 1
+        return added
+
+    def ready(self, retry_limit=None):
+        """The pending files that are not waiting for a retry, oldest first; with retry_limit, only those that have
+        failed fewer times."""
+        now = time.time()
+        files = [
+            file for file in self.pending.values()
+            if file["retry_at"] <= now and (retry_limit is None or file["attempts"] < retry_limit)
+        ]
+        return sorted(files, key=lambda file: (file["modified"], file["name"]))
+
+    def due(self):
+        files = self.ready()
+        if not files:
+            return False
+        oldest = min(file["seen"] for file in files)
+        return len(files) >= self.batch_files or time.time() - oldest >= self.batch_seconds
+
+    def load_batch(self, files=None):
+        """Load up to batch_files ready files, oldest first, in one transaction.
+
+        If the stage rejects the batch, its files are loaded one at a time and the ones it still rejects are
+        quarantined, so one bad file neither blocks the others nor stops the service. Files that fail for any other
+        reason are left pending and retried with backoff."""
+        files = (self.ready() if files is None else files)[:self.batch_files]
+        try:
+            self.load_files(files)
+        except Exception as e:
+            if not self.stage.rejected(e):
+                self.retry(files, e)
+                return
+            if len(files) == 1:
+                self.quarantine(files[0], e)
+                return
+            print(f"Batch of {len(files)} files rejected ({type(e).__name__}: {e}); loading the files one by one", file=sys.stderr)
+            for file in files:
+                try:
+                    self.load_files([file])
+                except Exception as file_error:
+                    if self.stage.rejected(file_error):
+                        self.quarantine(file, file_error)
+                    else:
+                        self.retry([file], file_error)
+
+    def load_files(self, files):
+        batch_id = uuid.uuid4().hex
+        started = time.monotonic()
+        rows = self.stage.load(files, batch_id)
+        loaded_at = time.time()
+        for file in files:
+            key = (file["name"], file["md5"])
+            del self.pending[key]
+            self.loaded.add(key)
+            # Ingest latency: from the file landing on the stage to its rows being merged
+            self.latencies.append(loaded_at - file["modified"])
+        self.stats["batches"] += 1
+        self.stats["files"] += len(files)
+        self.stats["rows"] += rows
+        print(f"{datetime.now(timezone.utc):%Y-%m-%d %H:%M:%S} batch {batch_id[:8]}: {len(files)} file(s), {rows} rows in {time.monotonic() - started:.2f} s")
+
+    def quarantine(self, file, error):
+        """Record a file that failed on its own in the manifest, so it is skipped until its content changes."""
+        key = (file["name"], file["md5"])
+        detail = f"{type(error).__name__}: {error}"
+        self.stage.quarantine(file, uuid.uuid4().hex, detail)
+        del self.pending[key]
+        self.loaded.add(key)
+        self.stats["failed_files"] += 1
+        print(f"{datetime.now(timezone.utc):%Y-%m-%d %H:%M:%S} quarantined {file['name']}: {detail}", file=sys.stderr)
+
+    def retry(self, files, error):
+        """Leave files that failed for a reason other than their content pending, and back off before the next try."""
+        now = time.time()
+        for file in files:
+            file["attempts"] += 1
+            file["retry_at"] = now + min(self.retry_seconds * 2 ** (file["attempts"] - 1), MAX_RETRY_SECONDS)
+        self.stats["retries"] += len(files)
+        delay = min(file["retry_at"] for file in files) - now
+        print(
+            f"{datetime.now(timezone.utc):%Y-%m-%d %H:%M:%S} {len(files)} file(s) failed ({type(error).__name__}: {error}); "
+            f"retrying in {delay:.0f} s",
+            file=sys.stderr,
+        )
+
+    def run(self, once=False):
+        """Poll and load until interrupted; with once, load the files present at start and return."""
+        self.poll()
+        if once:
+            while True:
+                files = self.ready(self.retry_limit)
+                if files:
+                    self.load_batch(files)
+                    continue
+                waiting = [file["retry_at"] for file in self.pending.values() if file["attempts"] < self.retry_limit]
+                if not waiting:
+                    break
+                time.sleep(max(0.0, min(waiting) - time.time()))
+            return self.report()
+        try:
+            while True:
+                while self.due():
+                    self.load_batch()
+                time.sleep(self.poll_seconds)
+                self.poll()
+        except KeyboardInterrupt:
+            pass
+        return self.report()
+
+    def report(self):
+        latencies = sorted(self.latencies)
+        report = dict(self.stats)
+        report["pending"] = len(self.pending)
+        report["latency_seconds_p50"] = round(median(latencies), 2) if latencies else None
+        report["latency_seconds_p95"] = round(latencies[int(0.95 * (len(latencies) - 1))], 2) if latencies else None
+        for key, value in report.items():
+            print(f"{key + ':':24s} {value}")
+        return report
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Event-driven ingestion of new transcript files")
+    parser.add_argument("directory", nargs="?", help="directory to watch in offline mode")
+    parser.add_argument("--snowflake", action="store_true", help="watch the Snowflake stage instead of a local directory")
+    parser.add_argument("--stage", default=DEFAULT_STAGE, help="stage to watch with --snowflake")
+    parser.add_argument("--database", default="transcripts.duckdb", help="DuckDB file of the offline mode")
+    parser.add_argument("--source", default="NEW", help="value of the source column of the loaded rows")
+    parser.add_argument("--batch-files", type=int, default=50, help="load as soon as this many files are pending")
+    parser.add_argument("--batch-seconds", type=float, default=5.0, help="maximum wait of a pending file before its batch is loaded")
+    parser.add_argument("--poll-seconds", type=float, default=1.0, help="interval between listings of the stage")
+    parser.add_argument("--retry-seconds", type=float, default=5.0, help="wait before the first retry of files that failed to load")
+    parser.add_argument("--retry-limit", type=int, default=5, help="with --once: give up on a file after this many failures")
+    parser.add_argument("--settle-seconds", type=float, default=1.0, help="offline: skip files modified more recently than this")
+    parser.add_argument("--once", action="store_true", help="load the files present at start and exit")
+    args = parser.parse_args(argv)
+    if not args.snowflake and not args.directory:
+        parser.error("a directory is required without --snowflake")
+    return args
+
+
+def main(args):
+    if args.snowflake:
+        from enrichment_worker import snowflake_connection
+
+        stage = SnowflakeStage(snowflake_connection(), args.stage, args.source)
+    else:
+        stage = LocalStage(args.directory, OfflineDatabase(args.database), args.source, args.settle_seconds)
+
+    service = IngestionService(stage, args.batch_files, args.batch_seconds, args.poll_seconds, args.retry_seconds, args.retry_limit)
+    print(f"Watching {args.stage if args.snowflake else args.directory}: {len(service.loaded)} file(s) in the manifest")
+    service.run(once=args.once)
+
+
+if __name__ == "__main__":
+    main(parse_args(sys.argv[1:]))
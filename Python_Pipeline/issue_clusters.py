@@ -0,0 +1,348 @@
+"""
+Topic clusters of the main issues, so the dashboards can chart the top issues with a plain group by.
+
+main_issue_answer (EXTRACT_ANSWER) is free text: the same problem is worded differently in every call, and asking an
+LLM to categorize each issue would cost one call per transcript. This batch job instead:
+
+- embeds the main issue of every enriched call with EMBED_TEXT_768
+- clusters the distinct embeddings with mini-batch k-means (vector_index.minibatch_kmeans) into --clusters clusters,
+  and assigns every call to the nearest centroid
+- labels all clusters with one COMPLETE call, whose prompt lists the issues nearest each centroid; a cluster the
+  response gives no label is named after the most common words of its issues
+- replaces ISSUE_CLUSTERS (issue_cluster, label, examples, centroid) and TRANSCRIPT_ISSUE_CLUSTERS (conversation_id,
+  issue_cluster, similarity) in one transaction
+
+With --assign, only the calls without a cluster are embedded and assigned to the nearest existing centroid, without
+reclustering or an LLM call. In Snowflake the ASSIGN_ISSUE_CLUSTERS procedure of Analytics_Setup/Issue_Clusters.sql
+does the same in SQL after every sync, so the batch job only needs to run again when the issues drift.
+
+Offline, the main issues and embeddings come from cortex_stub.CortexStub and the clusters are written to a DuckDB
+database (offline_db.py); the stub's COMPLETE does not answer the label prompt, so the clusters get the word labels.
+With --snowflake it reads MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL (requires
+snowflake-connector-python and the SNOWFLAKE_ACCOUNT, SNOWFLAKE_USER and SNOWFLAKE_PASSWORD environment variables).
+Requires numpy.
+
+Usage:
+    python issue_clusters.py [options] <json file or directory> [...]
+    python issue_clusters.py --snowflake [options]
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+
+from cortex_stub import WORD
+from vector_index import minibatch_kmeans, nearest_centroids, normalize
+
+EMBED_MODEL = "snowflake-arctic-embed-m-v1.5"
+LABEL_MODEL = "mistral-large2"
+MAIN_ISSUE_QUESTION = "What is the main issue?"
+N_CLUSTERS = 20
+EXAMPLES_PER_CLUSTER = 5
+
+LABEL_PROMPT = (
+    "Below are numbered groups of the main issues customers raised in calls to a home medical device supplier. "
+    "Give each group a short label of 2 to 5 words that names the problem, for example \"Glucose meter readings\" or "
+    "\"Late order delivery\". Answer with one line per group in the form \"<group number>: <label>\" and nothing else."
+)
+LABEL_LINE = re.compile(r"^\W*(?:group\s*)?(\d+)\s*[:.)\-]\s*(.+?)\s*$", re.IGNORECASE)
+
+STOPWORDS = {
+    "a", "an", "the", "my", "i", "i'm", "is", "it", "it's", "to", "of", "and", "or", "in", "on", "for", "with", "that",
+    "this", "be", "been", "was", "are", "not", "but", "have", "has", "having", "had", "me", "am", "at", "from", "about",
+    "still", "just", "can't", "won't", "doesn't", "isn't", "hasn't", "any", "some", "very", "so", "do", "does", "get",
+}
+
+
+def label_prompt(groups):
+    """The label prompt for a list of example issue lists, numbered from 1."""
+    lines = [LABEL_PROMPT, ""]
+    for number, examples in enumerate(groups, 1):
+        lines.append(f"Group {number}:")
+        lines.extend(f"- {example}" for example in examples)
+        lines.append("")
+    return "\n".join(lines)
+
+
+def parse_labels(response, groups):
+    """Return {group index: label} from the '<group number>: <label>' lines of a response."""
+    labels = {}
+    for line in (response or "").splitlines():
+        match = LABEL_LINE.match(line)
+        if match and 1 <= int(match.group(1)) <= groups:
+            label = match.group(2).strip(" \"'*.")
+            if label:
+                labels.setdefault(int(match.group(1)) - 1, label[:60])
+    return labels
+
+
+def word_label(issues, words=3):
+    """A label from the most common non-stopword words of the issues."""
+    counts = Counter(
+        word for issue in issues for word in set(WORD.findall(issue.lower().replace("\u2019", "'"))) if word not in STOPWORDS and len(word) > 2
+    )
+    return " ".join(word for word, _ in counts.most_common(words)).capitalize() or "Other"
+
+
+def build_clusters(ids, issues, vectors, k=N_CLUSTERS, complete=None, seed=0):
+    """Cluster the issue embeddings and label the clusters with one complete(prompt) call.
+
+    Returns the clusters (dicts with issue_cluster, label, examples and centroid), largest first, and the
+    (conversation_id, issue_cluster, similarity) assignment of every call."""
+    vectors = normalize(vectors)
+    # Templated calls repeat the same issue; clustering the distinct vectors keeps them from taking several centroids
+    distinct = np.unique(vectors, axis=0)
+    centroids = minibatch_kmeans(distinct, min(k, len(distinct)), seed=seed)
+    nearest, scores = nearest_centroids(vectors, centroids)
+
+    # Drop empty clusters and number the rest by size
+    sizes = np.bincount(nearest, minlength=len(centroids))
+    order = [int(cluster) for cluster in np.argsort(-sizes, kind="stable") if sizes[cluster]]
+    number = {cluster: n for n, cluster in enumerate(order)}
+
+    clusters = []
+    for cluster in order:
+        members = np.flatnonzero(nearest == cluster)
+        examples = []
+        for member in members[np.argsort(-scores[members])]:
+            if issues[member] not in examples:
+                examples.append(issues[member])
+            if len(examples) == EXAMPLES_PER_CLUSTER:
+                break
+        clusters.append({
+            "issue_cluster": number[cluster],
+            "examples": examples,
+            "centroid": centroids[cluster].tolist(),
+            "issues": [issues[member] for member in members],
+        })
+
+    labels = {}
+    if complete is not None and clusters:
+        try:
+            labels = parse_labels(complete(label_prompt([cluster["examples"] for cluster in clusters])), len(clusters))
+        except Exception as e:
+            print(f"Labeling failed, using word labels: {e}")
+    used = Counter()
+    for cluster in clusters:
+        issues_of_cluster = cluster.pop("issues")
+        label = labels.get(cluster["issue_cluster"]) or word_label(issues_of_cluster)
+        used[label] += 1
+        # Two clusters with the same label would be merged by a group by on the label
+        cluster["label"] = label if used[label] == 1 else f"{label} ({used[label]})"
+
+    assignments = [(int(i), number[int(c)], round(float(s), 4)) for i, c, s in zip(ids, nearest, scores)]
+    return clusters, assignments
+
+
+class OfflineIssueStore:
+    """Main issues, embeddings and COMPLETE from cortex_stub.CortexStub over the offline DuckDB database."""
+
+    def __init__(self, db, stub):
+        self.db = db
+        self.stub = stub
+
+    def fetch_issues(self, unassigned_only=False):
+        rows = self.db.execute("""
+            SELECT p.conversation_id, p.transcript
+            FROM parsed_transcripts p
+            WHERE NOT (? AND EXISTS (
+                SELECT 1 FROM transcript_issue_clusters a WHERE a.conversation_id = p.conversation_id
+            ))
+            ORDER BY p.conversation_id
+        """, [unassigned_only])
+        ids, issues = [], []
+        for conversation_id, transcript in rows:
+            issue = self.stub.extract_answer(transcript, MAIN_ISSUE_QUESTION)[0]["answer"]
+            if issue:
+                ids.append(conversation_id)
+                issues.append(issue)
+        vectors = np.array([self.stub.embed_text_768(EMBED_MODEL, issue) for issue in issues], dtype=np.float32)
+        return ids, issues, vectors
+
+    def complete(self, prompt):
+        return self.stub.complete(LABEL_MODEL, prompt)
+
+    def fetch_clusters(self):
+        return self.db.fetch_issue_clusters()
+
+    def write_clusters(self, clusters, assignments):
+        self.db.replace_issue_clusters(clusters, assignments)
+
+    def add_assignments(self, assignments):
+        self.db.add_issue_assignments(assignments)
+
+
+class SnowflakeIssueStore:
+    """Main issues of TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL, embedded and labeled with the Cortex functions."""
+
+    def __init__(self, connection, label_model=LABEL_MODEL):
+        self.connection = connection
+        self.label_model = label_model
+        cursor = self.connection.cursor()
+        # The same tables as Analytics_Setup/Issue_Clusters.sql, so the job can run before the script
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ISSUE_CLUSTERS (
+                ISSUE_CLUSTER NUMBER,
+                LABEL VARCHAR,
+                EXAMPLES ARRAY,
+                CENTROID VECTOR(FLOAT, 768),
+                MODEL VARCHAR,
+                CLUSTERED_AT TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP()
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS TRANSCRIPT_ISSUE_CLUSTERS (
+                CONVERSATION_ID NUMBER,
+                ISSUE_CLUSTER NUMBER,
+                SIMILARITY FLOAT,
+                ASSIGNED_AT TIMESTAMP_LTZ DEFAULT CURRENT_TIMESTAMP(),
+                ISSUE_HASH NUMBER
+            )
+        """)
+        cursor.execute("ALTER TABLE TRANSCRIPT_ISSUE_CLUSTERS ADD COLUMN IF NOT EXISTS ISSUE_HASH NUMBER")
+
+    def fetch_issues(self, unassigned_only=False):
+        cursor = self.connection.cursor()
+        cursor.execute(f"""
+            SELECT
+                r.conversation_id,
+                r.main_issue_answer,
+                SNOWFLAKE.CORTEX.EMBED_TEXT_768('{EMBED_MODEL}', r.main_issue_answer)::ARRAY
+            FROM TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL r
+            WHERE r.main_issue_answer IS NOT NULL
+            AND r.main_issue_answer <> ''
+            AND NOT (%s AND EXISTS (
+                SELECT 1 FROM TRANSCRIPT_ISSUE_CLUSTERS a WHERE a.conversation_id = r.conversation_id
+            ))
+            ORDER BY r.conversation_id
+        """, (unassigned_only,))
+        rows = cursor.fetchall()
+        ids = [row[0] for row in rows]
+        issues = [row[1] for row in rows]
+        vectors = np.array([json.loads(row[2]) for row in rows], dtype=np.float32).reshape(-1, 768)
+        return ids, issues, vectors
+
+    def complete(self, prompt):
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT SNOWFLAKE.CORTEX.COMPLETE(%s, %s)", (self.label_model, prompt))
+        return cursor.fetchone()[0]
+
+    def fetch_clusters(self):
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT ISSUE_CLUSTER, LABEL, EXAMPLES, CENTROID::ARRAY FROM ISSUE_CLUSTERS ORDER BY ISSUE_CLUSTER")
+        return [
+            {"issue_cluster": row[0], "label": row[1], "examples": json.loads(row[2]), "centroid": json.loads(row[3])}
+            for row in cursor.fetchall()
+        ]
+
+    def write_clusters(self, clusters, assignments):
+        cursor = self.connection.cursor()
+        cursor.execute("BEGIN")
+        try:
+            cursor.execute("DELETE FROM ISSUE_CLUSTERS")
+            for cluster in clusters:
+                cursor.execute(
+                    "INSERT INTO ISSUE_CLUSTERS (ISSUE_CLUSTER, LABEL, EXAMPLES, CENTROID, MODEL) "
+                    "SELECT %s, %s, PARSE_JSON(%s), PARSE_JSON(%s)::ARRAY::VECTOR(FLOAT, 768), %s",
+                    (cluster["issue_cluster"], cluster["label"], json.dumps(cluster["examples"]), json.dumps(cluster["centroid"]), EMBED_MODEL),
+                )
+            cursor.execute("DELETE FROM TRANSCRIPT_ISSUE_CLUSTERS")
+            self.add_assignments(assignments, cursor)
+            # Stamp the clustered calls with the clustering time, so later assignments can be told apart
+            cursor.execute("UPDATE TRANSCRIPT_ISSUE_CLUSTERS SET ASSIGNED_AT = (SELECT MAX(CLUSTERED_AT) FROM ISSUE_CLUSTERS)")
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+
+    def add_assignments(self, assignments, cursor=None):
+        if assignments:
+            cursor = cursor or self.connection.cursor()
+            cursor.executemany(
+                "INSERT INTO TRANSCRIPT_ISSUE_CLUSTERS (CONVERSATION_ID, ISSUE_CLUSTER, SIMILARITY) VALUES (%s, %s, %s)",
+                assignments,
+            )
+            # Stamp the issue each call was assigned with, so ASSIGN_ISSUE_CLUSTERS only assigns it again when it changes
+            cursor.execute("""
+                UPDATE TRANSCRIPT_ISSUE_CLUSTERS a
+                SET ISSUE_HASH = HASH(r.main_issue_answer)
+                FROM TRANSCRIPT_ANALYSIS_RESULTS_FINAL_TBL r
+                WHERE r.conversation_id = a.conversation_id
+                AND a.ISSUE_HASH IS NULL
+            """)
+
+
+def recluster(store, k=N_CLUSTERS, seed=0):
+    ids, issues, vectors = store.fetch_issues()
+    if not ids:
+        print("No main issues to cluster")
+        return []
+    start = time.perf_counter()
+    clusters, assignments = build_clusters(ids, issues, vectors, k, store.complete, seed)
+    store.write_clusters(clusters, assignments)
+    print(f"Clustered {len(ids)} main issues into {len(clusters)} clusters in {time.perf_counter() - start:.2f} s (1 label call)")
+
+    sizes = Counter(cluster for _, cluster, _ in assignments)
+    for cluster in clusters:
+        print(f"  {cluster['issue_cluster']:3d}  {sizes[cluster['issue_cluster']]:6d}  {cluster['label']:40s}  e.g. {cluster['examples'][0]}")
+    return clusters
+
+
+def assign(store):
+    clusters = store.fetch_clusters()
+    if not clusters:
+        print("No issue clusters yet; run without --assign first")
+        return []
+    ids, _, vectors = store.fetch_issues(unassigned_only=True)
+    if not ids:
+        print("Every main issue has a cluster")
+        return []
+    centroids = normalize([cluster["centroid"] for cluster in clusters])
+    numbers = [cluster["issue_cluster"] for cluster in clusters]
+    nearest, scores = nearest_centroids(normalize(vectors), centroids)
+    assignments = [(int(i), numbers[c], round(float(s), 4)) for i, c, s in zip(ids, nearest, scores)]
+    store.add_assignments(assignments)
+    print(f"Assigned {len(assignments)} new main issues to the nearest of {len(clusters)} clusters")
+    return assignments
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Topic clusters of the main issues")
+    parser.add_argument("paths", nargs="*", help="offline: transcript JSON files or directories to load first")
+    parser.add_argument("--snowflake", action="store_true", help="read and write MED_DEVICE_TRANSCRIPTS.ANALYTICS")
+    parser.add_argument("--database", default="transcripts.duckdb", help="DuckDB file of the offline mode")
+    parser.add_argument("--clusters", type=int, default=N_CLUSTERS, help="number of clusters")
+    parser.add_argument("--label-model", default=LABEL_MODEL, help="COMPLETE model of the label call")
+    parser.add_argument("--assign", action="store_true", help="only assign the calls without a cluster to the nearest centroid")
+    parser.add_argument("--seed", type=int, default=0, help="k-means seed")
+    return parser.parse_args(argv)
+
+
+def main(args):
+    if args.snowflake:
+        from enrichment_worker import snowflake_connection
+
+        store = SnowflakeIssueStore(snowflake_connection(), args.label_model)
+    else:
+        from cortex_stub import CortexStub
+        from offline_db import OfflineDatabase
+        from transcript_io import read_transcripts
+
+        db = OfflineDatabase(args.database)
+        if args.paths:
+            print(f"Loaded {db.load_transcripts(read_transcripts(args.paths))} records into {args.database}")
+        store = OfflineIssueStore(db, CortexStub(realtime=False))
+
+    if args.assign:
+        assign(store)
+    else:
+        recluster(store, args.clusters, args.seed)
+
+
+if __name__ == "__main__":
+    main(parse_args(sys.argv[1:]))
@@ -0,0 +1,273 @@
+"""
+Cost- and latency-aware model routing for the COMPLETE prompts.
+
+The resolution and service rating prompts all went to mistral-large2, so a two-line "the catheter is uncomfortable"
+call cost as much as a 20-minute escalation. The router picks the model per transcript from:
+
+- its length in tokens (see transcript_chunker.py)
+- the keyword fast path status (see device_fastpath.py); a transcript the fast path could not classify is treated as
+  harder and starts one model higher
+- the configured quality tier (economy, standard or premium)
+
+Every response is validated against the structured format the prompt asks for ("Resolved: reason", "7: reason").
+A response from a smaller model that fails validation is retried once on the large model. The router records the
+calls, latency and tokens per model.
+
+StubComplete stands in for SNOWFLAKE.CORTEX.COMPLETE so the routing policy can be benchmarked offline: it returns
+deterministic responses with simulated latency, token counts and per-model format failure rates.
+
+In Snowflake the module is the handler of the ROUTE_COMPLETE_MODEL UDF used by the complete_responses dynamic table
+(see Analytics_Setup/Cortex_Analysis.sql).
+
+Usage:
+    python model_router.py <json file or directory> [...]
+"""
+
+import hashlib
+import re
+import sys
+import time
+from collections import defaultdict
+from statistics import median
+
+from device_fastpath import MATCHED, get_matcher
+from transcript_chunker import TOKEN_BUDGETS, estimate_tokens, fit_to_budget
+from transcript_io import read_transcripts
+
+SMALL_MODEL = "llama3.1-8b"
+MEDIUM_MODEL = "llama3.1-70b"
+LARGE_MODEL = "mistral-large2"
+MODEL_LADDER = [SMALL_MODEL, MEDIUM_MODEL, LARGE_MODEL]
+
+# Approximate credits per million tokens from the Snowflake service consumption table; check the current rates
+CREDITS_PER_MILLION_TOKENS = {
+    SMALL_MODEL: 0.19,
+    MEDIUM_MODEL: 1.21,
+    LARGE_MODEL: 1.95,
+}
+
+# The position on MODEL_LADDER a short, keyword-classified transcript starts at, and the token length above which
+# a transcript starts one model higher
+QUALITY_TIERS = {
+    "economy": {"base_level": 0, "long_tokens": 1500},
+    "standard": {"base_level": 0, "long_tokens": 600},
+    "premium": {"base_level": 2, "long_tokens": 0},
+}
+DEFAULT_QUALITY_TIER = "standard"
+
+RESOLUTION = "resolution"
+SERVICE_RATING = "service_rating"
+
+# Keep the prompts and patterns in sync with the complete_responses dynamic table in Analytics_Setup/Cortex_Analysis.sql
+RESOLUTION_SYSTEM_PROMPT = (
+    "You are a customer service quality analyst. "
+    "Analyze customer service transcripts and determine if the customer's issue was resolved. "
+    'Respond with exactly one word ("Resolved", "Unresolved", or "Partial") followed by a colon and 10 words or '
+    "less explaining why."
+)
+SERVICE_RATING_PROMPT = (
+    "Rate the customer service experience from 0 to 10, with 0 being very poor support without resolution "
+    "and 10 being highly supportive and complete resolution of the issue and a completely happy customer. "
+    "Return the results with a single integer for the rating followed by a colon and then a reason for the rating. "
+    "The reason should be 25 words or less."
+)
+
+RESPONSE_PATTERNS = {
+    RESOLUTION: re.compile(r"^\s*(Resolved|Unresolved|Partial)\s*:.+", re.DOTALL),
+    SERVICE_RATING: re.compile(r"^\s*(10|[0-9])\s*:.+", re.DOTALL),
+}
+
+
+def route(transcript_tokens, fastpath_status=None, quality_tier=DEFAULT_QUALITY_TIER):
+    """Return the model to start with for one prompt."""
+    tier = QUALITY_TIERS[quality_tier]
+    level = tier["base_level"]
+    if transcript_tokens > tier["long_tokens"]:
+        level += 1
+    if fastpath_status != MATCHED:
+        level += 1
+    return MODEL_LADDER[min(level, len(MODEL_LADDER) - 1)]
+
+
+def build_messages(prompt_type, transcript):
+    """Return the COMPLETE messages for a prompt type."""
+    if prompt_type == RESOLUTION:
+        return [
+            {"role": "system", "content": RESOLUTION_SYSTEM_PROMPT},
+            {"role": "user", "content": transcript},
+        ]
+    return [{"role": "user", "content": SERVICE_RATING_PROMPT + transcript}]
+
+
+def is_valid_response(prompt_type, text):
+    """Check that a response has the structured format the prompt asks for."""
+    return bool(text) and bool(RESPONSE_PATTERNS[prompt_type].match(text))
+
+
+class ModelRouter:
+    """Routes prompts to models, escalates invalid responses and records per-model statistics.
+
+    complete(model, messages) must return a dict with text, prompt_tokens and completion_tokens, and may return
+    latency_ms (otherwise the wall-clock time of the call is recorded).
+    """
+
+    def __init__(self, complete, quality_tier=DEFAULT_QUALITY_TIER):
+        self.complete = complete
+        self.quality_tier = quality_tier
+        self.stats = defaultdict(lambda: {"calls": 0, "valid": 0, "latency_ms": [], "prompt_tokens": 0, "completion_tokens": 0})
+        self.escalations = 0
+
+    def call(self, model, prompt_type, messages):
+        start = time.perf_counter()
+        response = self.complete(model, messages)
+        latency_ms = response.get("latency_ms", (time.perf_counter() - start) * 1000)
+        valid = is_valid_response(prompt_type, response["text"])
+
+        stats = self.stats[model]
+        stats["calls"] += 1
+        stats["valid"] += int(valid)
+        stats["latency_ms"].append(latency_ms)
+        stats["prompt_tokens"] += response["prompt_tokens"]
+        stats["completion_tokens"] += response["completion_tokens"]
+        return response["text"], valid
+
+    def run(self, prompt_type, transcript, fastpath_status=None):
+        """Answer one prompt; returns a dict with the routed and final model, the response and whether it escalated."""
+        messages = build_messages(prompt_type, transcript)
+        routed_model = route(estimate_tokens(transcript), fastpath_status, self.quality_tier)
+
+        text, valid = self.call(routed_model, prompt_type, messages)
+        escalated = False
+        if not valid and routed_model != LARGE_MODEL:
+            self.escalations += 1
+            escalated = True
+            text, valid = self.call(LARGE_MODEL, prompt_type, messages)
+
+        return {
+            "prompt_type": prompt_type,
+            "routed_model": routed_model,
+            "model": LARGE_MODEL if escalated else routed_model,
+            "escalated": escalated,
+            "valid": valid,
+            "text": text,
+        }
+
+    def report(self):
+        """Return one row per model with calls, validity, latency, tokens and credits."""
+        rows = []
+        for model in MODEL_LADDER:
+            stats = self.stats.get(model)
+            if not stats or not stats["calls"]:
+                continue
+            latencies = sorted(stats["latency_ms"])
+            tokens = stats["prompt_tokens"] + stats["completion_tokens"]
+            rows.append({
+                "model": model,
+                "calls": stats["calls"],
+                "valid_pct": round(100.0 * stats["valid"] / stats["calls"], 1),
+                "latency_ms_p50": round(median(latencies)),
+                "latency_ms_p95": round(latencies[int(0.95 * (len(latencies) - 1))]),
+                "prompt_tokens": stats["prompt_tokens"],
+                "completion_tokens": stats["completion_tokens"],
+                "credits": tokens * CREDITS_PER_MILLION_TOKENS[model] / 1_000_000,
+            })
+        return rows
+
+
+class StubComplete:
+    """Deterministic offline stand-in for COMPLETE with simulated latency, tokens and format failures."""
+
+    # Fixed latency per call, latency per prompt token, and the share of responses that break the format
+    PROFILES = {
+        SMALL_MODEL: {"base_ms": 250, "ms_per_token": 0.15, "failure_rate": 0.12},
+        MEDIUM_MODEL: {"base_ms": 600, "ms_per_token": 0.5, "failure_rate": 0.04},
+        LARGE_MODEL: {"base_ms": 900, "ms_per_token": 0.8, "failure_rate": 0.01},
+    }
+
+    def __init__(self, seed=0):
+        self.seed = seed
+
+    def _fraction(self, *parts):
+        """A stable pseudo-random number in [0, 1) for the given inputs."""
+        digest = hashlib.sha256("|".join([str(self.seed)] + [str(part) for part in parts]).encode("utf-8")).hexdigest()
+        return int(digest[:8], 16) / 0x100000000
+
+    def __call__(self, model, messages):
+        profile = self.PROFILES[model]
+        prompt = "\n".join(message["content"] for message in messages)
+        transcript = messages[-1]["content"].lower()
+        prompt_tokens = estimate_tokens(prompt)
+
+        if messages[0]["role"] == "system":
+            if "thank you for your help" in transcript or "that fixed it" in transcript or "working now" in transcript:
+                text = "Resolved: Agent fixed the device issue during the call."
+            elif "escalate" in transcript or "replacement" in transcript:
+                text = "Partial: Replacement or follow-up arranged, not yet fixed."
+            else:
+                text = "Unresolved: Customer issue still open at end of call."
+        else:
+            rating = 4 + int(self._fraction("rating", transcript) * 6)
+            text = f"{rating}: Agent was courteous and followed up on the customer's device issue."
+
+        # Some responses ignore the requested format
+        if self._fraction(model, prompt) < profile["failure_rate"]:
+            text = "Based on the transcript, " + text.split(":", 1)[1].strip().lower()
+
+        jitter = 0.8 + 0.4 * self._fraction("latency", model, prompt)
+        return {
+            "text": text,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": estimate_tokens(text),
+            "latency_ms": (profile["base_ms"] + profile["ms_per_token"] * prompt_tokens) * jitter,
+        }
+
+
+def udf_route(transcript, fastpath_status=None, quality_tier=None):
+    """Handler of the ROUTE_COMPLETE_MODEL UDF."""
+    return route(estimate_tokens(transcript or ""), fastpath_status, quality_tier or DEFAULT_QUALITY_TIER)
+
+
+def benchmark(records, quality_tier, complete):
+    """Run both prompts over all records with one routing policy; returns the router."""
+    matcher = get_matcher()
+    router = ModelRouter(complete, quality_tier)
+    for record in records:
+        names = (record.get("agent_name"), record.get("customer_name"))
+        status = matcher.classify(record.get("transcript"), names)["status"]
+        transcript = fit_to_budget(record.get("transcript"), names[0], names[1], TOKEN_BUDGETS["complete"])
+        for prompt_type in (RESOLUTION, SERVICE_RATING):
+            router.run(prompt_type, transcript, status)
+    return router
+
+
+def main(paths):
+    records = read_transcripts(paths)
+    print(f"Transcripts: {len(records)} ({2 * len(records)} prompts)")
+
+    complete = StubComplete()
+    baseline_credits = None
+    for quality_tier in ("premium", "standard", "economy"):
+        router = benchmark(records, quality_tier, complete)
+        rows = router.report()
+        credits = sum(row["credits"] for row in rows)
+        if baseline_credits is None:
+            # The premium tier sends every prompt to the large model, as before the router
+            baseline_credits = credits
+
+        print()
+        print(f"Quality tier: {quality_tier} ({router.escalations} escalations)")
+        for row in rows:
+            print(
+                f"  {row['model']:15s} calls {row['calls']:5d}  valid {row['valid_pct']:5.1f}%  "
+                f"p50 {row['latency_ms_p50']:5d} ms  p95 {row['latency_ms_p95']:5d} ms  "
+                f"tokens {row['prompt_tokens'] + row['completion_tokens']:7d}"
+            )
+        saved = 100.0 * (1 - credits / baseline_credits) if baseline_credits else 0.0
+        print(f"  credits {credits:.5f} ({saved:.1f}% less than all {LARGE_MODEL})")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    main(sys.argv[1:])
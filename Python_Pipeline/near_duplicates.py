@@ -0,0 +1,235 @@
+"""
+Near-duplicate transcript detection with MinHash and locality-sensitive hashing (LSH).
+
+The synthetic generator and real call flows produce many near-identical transcripts (templated calls, repeat calls
+about the same device issue), and each one still gets a full set of Cortex calls. This module keeps an incremental
+index of MinHash signatures over the normalized transcript text:
+
+- normalization keeps only the spoken text of each turn (see turn_parser.py), replaces the agent and customer names
+  with placeholders, lower-cases it and drops punctuation, so two calls that differ only in names and timestamps match
+- each transcript is reduced to word 3-gram shingles and a signature of num_perm MinHash values
+- the signature is split into bands; transcripts that share a band are candidates, and a candidate counts when the
+  estimated Jaccard similarity is at least review_threshold
+
+A transcript whose similarity to its cluster representative (the first transcript of the cluster) is at least
+reuse_threshold can reuse the representative's enrichment results; one between the two thresholds is flagged for
+review and enriched as usual. The index is saved as JSON, so new files can be added as they land.
+
+Usage:
+    python near_duplicates.py <index file> <json file or directory> [...]
+"""
+
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+from collections import Counter, defaultdict
+
+from transcript_io import read_transcripts
+from turn_parser import parse_turns
+
+NUM_PERM = 128
+SHINGLE_WORDS = 3
+REVIEW_THRESHOLD = 0.8
+REUSE_THRESHOLD = 0.9
+
+# Cortex calls per transcript in TRANSCRIPT_ANALYSIS_RESULTS_FINAL: SUMMARIZE, SENTIMENT, EXTRACT_ANSWER, CLASSIFY_TEXT
+# and the two COMPLETE prompts
+CORTEX_CALLS_PER_TRANSCRIPT = 6
+
+NEW = "new"
+REUSE = "reuse"
+REVIEW = "review"
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(transcript, agent_name=None, customer_name=None):
+    """Return the spoken text of a transcript without names, timestamps, case or punctuation."""
+    turns = parse_turns(transcript, agent_name, customer_name)
+    text = "\n".join(turn["turn_text"] for turn in turns) if turns else (transcript or "")
+    text = text.lower()
+    for name, placeholder in ((agent_name, " agentname "), (customer_name, " customername ")):
+        for part in sorted((name or "").lower().split(), key=len, reverse=True):
+            text = re.sub(r"\b%s\b" % re.escape(part), placeholder, text)
+    return NON_WORD.sub(" ", text).strip()
+
+
+def shingles(text, size=SHINGLE_WORDS):
+    """Return the set of 64-bit hashes of the word n-grams of a normalized text."""
+    words = text.split()
+    if len(words) < size:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+    return {int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "big") for gram in grams}
+
+
+def optimal_bands(threshold, num_perm):
+    """Pick the bands and rows per band that minimize the false positive and false negative probability mass."""
+
+    def area(function, low, high, steps=100):
+        width = (high - low) / steps
+        return sum(function(low + (i + 0.5) * width) for i in range(steps)) * width
+
+    best = None
+    for bands in range(1, num_perm + 1):
+        for rows in range(1, num_perm // bands + 1):
+            false_positive = area(lambda s: 1 - (1 - s ** rows) ** bands, 0.0, threshold)
+            false_negative = area(lambda s: (1 - s ** rows) ** bands, threshold, 1.0)
+            error = false_positive + false_negative
+            if best is None or error < best[0]:
+                best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class MinHasher:
+    """MinHash signatures with num_perm universal hash functions."""
+
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        generator = random.Random(seed)
+        self.num_perm = num_perm
+        self.permutations = [
+            (generator.randrange(1, MERSENNE_PRIME), generator.randrange(0, MERSENNE_PRIME)) for _ in range(num_perm)
+        ]
+
+    def signature(self, hashes):
+        if not hashes:
+            return [MAX_HASH] * self.num_perm
+        return [min(((a * h + b) % MERSENNE_PRIME) & MAX_HASH for h in hashes) for a, b in self.permutations]
+
+
+def similarity(signature_a, signature_b):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(a == b for a, b in zip(signature_a, signature_b)) / len(signature_a)
+
+
+class NearDuplicateIndex:
+    """Incremental MinHash LSH index that assigns each transcript to a cluster representative."""
+
+    def __init__(self, review_threshold=REVIEW_THRESHOLD, reuse_threshold=REUSE_THRESHOLD, num_perm=NUM_PERM, seed=1):
+        self.review_threshold = review_threshold
+        self.reuse_threshold = reuse_threshold
+        self.seed = seed
+        self.hasher = MinHasher(num_perm, seed)
+        self.bands, self.rows = optimal_bands(review_threshold, num_perm)
+        self.buckets = [defaultdict(list) for _ in range(self.bands)]
+        self.signatures = {}
+        self.representatives = {}
+
+    def __contains__(self, key):
+        return key in self.signatures
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def signature(self, transcript, agent_name=None, customer_name=None):
+        return self.hasher.signature(shingles(normalize(transcript, agent_name, customer_name)))
+
+    def band_keys(self, signature):
+        return [tuple(signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+    def query(self, signature):
+        """Return (representative, similarity to it) of the closest indexed transcript, or (None, 0.0)."""
+        candidates = set()
+        for band, band_key in enumerate(self.band_keys(signature)):
+            candidates.update(self.buckets[band].get(band_key, ()))
+
+        best_key, best_similarity = None, 0.0
+        for candidate in candidates:
+            candidate_similarity = similarity(signature, self.signatures[candidate])
+            if candidate_similarity > best_similarity:
+                best_key, best_similarity = candidate, candidate_similarity
+        if best_key is None or best_similarity < self.review_threshold:
+            return None, 0.0
+
+        representative = self.representatives[best_key]
+        return representative, similarity(signature, self.signatures[representative])
+
+    def add(self, key, transcript, agent_name=None, customer_name=None):
+        """Index a transcript; returns a dict with action (new, reuse or review), representative and similarity."""
+        if key in self.signatures:
+            representative = self.representatives[key]
+            return {"action": NEW if representative == key else REUSE, "representative": representative, "similarity": 1.0}
+
+        signature = self.signature(transcript, agent_name, customer_name)
+        representative, representative_similarity = self.query(signature)
+        if representative is None:
+            action, representative = NEW, key
+        elif representative_similarity >= self.reuse_threshold:
+            action = REUSE
+        else:
+            # Close to the cluster but not close enough to its representative to copy its results
+            action = REVIEW
+
+        self._insert(key, signature, representative if action == REUSE else key)
+        return {"action": action, "representative": representative, "similarity": round(representative_similarity, 4)}
+
+    def _insert(self, key, signature, representative):
+        self.signatures[key] = signature
+        self.representatives[key] = representative
+        for band, band_key in enumerate(self.band_keys(signature)):
+            self.buckets[band][band_key].append(key)
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "review_threshold": self.review_threshold,
+                "reuse_threshold": self.reuse_threshold,
+                "num_perm": self.hasher.num_perm,
+                "seed": self.seed,
+                "entries": [[key, self.representatives[key], signature] for key, signature in self.signatures.items()],
+            }, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(data["review_threshold"], data["reuse_threshold"], data["num_perm"], data["seed"])
+        for key, representative, signature in data["entries"]:
+            index._insert(key, signature, representative)
+        return index
+
+
+def main(index_path, paths):
+    index = NearDuplicateIndex.load(index_path) if os.path.exists(index_path) else NearDuplicateIndex()
+    print(f"Index: {len(index)} transcripts, {index.bands} bands of {index.rows} rows")
+
+    actions = Counter()
+    reviews = []
+    for record in read_transcripts(paths):
+        key = record.get("conversation_id")
+        if key is None:
+            continue
+        if key in index:
+            actions["already indexed"] += 1
+            continue
+        result = index.add(key, record.get("transcript"), record.get("agent_name"), record.get("customer_name"))
+        actions[result["action"]] += 1
+        if result["action"] == REVIEW:
+            reviews.append((key, result["representative"], result["similarity"]))
+    index.save(index_path)
+
+    added = actions[NEW] + actions[REUSE] + actions[REVIEW]
+    hit_rate = 100.0 * actions[REUSE] / added if added else 0.0
+    print(f"Added {added} transcripts ({actions['already indexed']} already indexed)")
+    print(f"  new clusters:          {actions[NEW]}")
+    print(f"  reuse representative:  {actions[REUSE]}")
+    print(f"  flagged for review:    {actions[REVIEW]}")
+    print(f"Hit rate: {hit_rate:.1f}%, Cortex calls saved: {actions[REUSE] * CORTEX_CALLS_PER_TRANSCRIPT}")
+
+    cluster_sizes = Counter(index.representatives.values())
+    print(f"Clusters in index: {len(cluster_sizes)}, largest: {cluster_sizes.most_common(5)}")
+    for key, representative, score in reviews[:10]:
+        print(f"  review {key}: similarity {score:.2f} to {representative}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    main(sys.argv[1], sys.argv[2:])
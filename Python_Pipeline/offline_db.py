@@ -0,0 +1,303 @@
+"""
+Offline mode: a local DuckDB database with the tables of the Snowflake pipeline.
+
+The database holds RAW_TRANSCRIPTS (merged on conversation_id, as MERGE_STAGED_TRANSCRIPTS does in Snowflake), the
+parsed_transcripts view over it, the TRANSCRIPT_COMPLETE_RESULTS table written by enrichment_worker.py, the
+INGEST_MANIFEST of the files loaded by ingestion_service.py and the ISSUE_CLUSTERS and TRANSCRIPT_ISSUE_CLUSTERS tables
+written by issue_clusters.py. It lets the pipeline run and be benchmarked without a
+Snowflake account. Requires the duckdb package.
+
+Usage:
+    python offline_db.py <database file> <json file or directory> [...]
+"""
+
+import sys
+import threading
+
+import duckdb
+
+from transcript_io import read_transcripts
+
+TRANSCRIPT_COLUMNS = ["source", "conversation_id", "start_time", "end_time", "agent_name", "customer_name", "transcript"]
+
+MANIFEST_COLUMNS = ["file_name", "md5", "size", "rows_loaded", "batch_id", "error"]
+
+ISSUE_CLUSTER_COLUMNS = ["issue_cluster", "label", "examples", "centroid"]
+
+RESULT_COLUMNS = [
+    "conversation_id",
+    "prompt_type",
+    "routed_model",
+    "model",
+    "escalated",
+    "response_text",
+    "is_valid",
+    "prompt_tokens",
+    "completion_tokens",
+    "latency_ms",
+    "reused_from",
+]
+
+
+class OfflineDatabase:
+    """DuckDB stand-in for the MED_DEVICE_TRANSCRIPTS.ANALYTICS schema; safe to call from several threads."""
+
+    def __init__(self, path=":memory:"):
+        self.connection = duckdb.connect(path)
+        # A DuckDB connection must not be used by two threads at once
+        self.lock = threading.Lock()
+        self.create_tables()
+
+    def execute(self, sql, parameters=None):
+        with self.lock:
+            return self.connection.execute(sql, parameters or []).fetchall()
+
+    def create_tables(self):
+        self.execute("""
+            CREATE TABLE IF NOT EXISTS raw_transcripts (
+                source VARCHAR,
+                conversation_id BIGINT PRIMARY KEY,
+                start_time TIMESTAMP,
+                end_time TIMESTAMP,
+                agent_name VARCHAR,
+                customer_name VARCHAR,
+                transcript VARCHAR,
+                file_load_time TIMESTAMP DEFAULT current_timestamp
+            )
+        """)
+        self.execute("""
+            CREATE OR REPLACE VIEW parsed_transcripts AS
+            SELECT source, conversation_id, start_time, end_time, agent_name, customer_name, transcript
+            FROM raw_transcripts
+        """)
+        self.execute("""
+            CREATE TABLE IF NOT EXISTS transcript_complete_results (
+                conversation_id BIGINT,
+                prompt_type VARCHAR,
+                routed_model VARCHAR,
+                model VARCHAR,
+                escalated BOOLEAN,
+                response_text VARCHAR,
+                is_valid BOOLEAN,
+                prompt_tokens INTEGER,
+                completion_tokens INTEGER,
+                latency_ms DOUBLE,
+                reused_from BIGINT,
+                enriched_at TIMESTAMP DEFAULT current_timestamp,
+                PRIMARY KEY (conversation_id, prompt_type)
+            )
+        """)
+        self.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_manifest (
+                file_name VARCHAR,
+                md5 VARCHAR,
+                size BIGINT,
+                rows_loaded INTEGER,
+                batch_id VARCHAR,
+                loaded_at TIMESTAMP DEFAULT current_timestamp,
+                error VARCHAR,
+                PRIMARY KEY (file_name, md5)
+            )
+        """)
+        # Files that could not be loaded are recorded with the error; added after the table was first created
+        self.execute("ALTER TABLE ingest_manifest ADD COLUMN IF NOT EXISTS error VARCHAR")
+        self.execute("""
+            CREATE TABLE IF NOT EXISTS issue_clusters (
+                issue_cluster INTEGER PRIMARY KEY,
+                label VARCHAR,
+                examples VARCHAR[],
+                centroid FLOAT[],
+                clustered_at TIMESTAMP DEFAULT current_timestamp
+            )
+        """)
+        self.execute("""
+            CREATE TABLE IF NOT EXISTS transcript_issue_clusters (
+                conversation_id BIGINT PRIMARY KEY,
+                issue_cluster INTEGER,
+                similarity DOUBLE,
+                assigned_at TIMESTAMP DEFAULT current_timestamp
+            )
+        """)
+
+    def load_transcripts(self, records, source="NEW", manifest=None):
+        """Merge transcript records into raw_transcripts on conversation_id; returns the number of records.
+
+        manifest entries (dicts with MANIFEST_COLUMNS) are added to ingest_manifest in the same transaction, so a
+        file is recorded as loaded exactly when its records are."""
+        rows = []
+        for record in records:
+            if record.get("conversation_id") is None:
+                continue
+            rows.append([
+                record.get("source", source),
+                int(record["conversation_id"]),
+                record.get("start_time"),
+                record.get("end_time"),
+                record.get("agent_name"),
+                record.get("customer_name"),
+                record.get("transcript"),
+            ])
+        if not rows and not manifest:
+            return 0
+
+        with self.lock:
+            self.connection.execute("BEGIN TRANSACTION")
+            try:
+                self._merge_transcripts(rows)
+                if manifest:
+                    self.connection.executemany(
+                        f"INSERT OR REPLACE INTO ingest_manifest ({', '.join(MANIFEST_COLUMNS)}) VALUES ({', '.join('?' for _ in MANIFEST_COLUMNS)})",
+                        [[entry.get(column) for column in MANIFEST_COLUMNS] for entry in manifest],
+                    )
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def _merge_transcripts(self, rows):
+        if not rows:
+            return
+        self.connection.execute("CREATE OR REPLACE TEMP TABLE staged_transcripts AS SELECT * EXCLUDE (file_load_time) FROM raw_transcripts LIMIT 0")
+        self.connection.executemany("INSERT INTO staged_transcripts VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self.connection.execute("""
+            MERGE INTO raw_transcripts t
+            USING (
+                SELECT * FROM staged_transcripts
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY conversation_id ORDER BY start_time DESC) = 1
+            ) s
+            ON t.conversation_id = s.conversation_id
+            WHEN MATCHED THEN UPDATE SET
+                source = s.source,
+                start_time = s.start_time,
+                end_time = s.end_time,
+                agent_name = s.agent_name,
+                customer_name = s.customer_name,
+                transcript = s.transcript,
+                file_load_time = current_timestamp
+            WHEN NOT MATCHED THEN INSERT (source, conversation_id, start_time, end_time, agent_name, customer_name, transcript)
+                VALUES (s.source, s.conversation_id, s.start_time, s.end_time, s.agent_name, s.customer_name, s.transcript)
+        """)
+        self.connection.execute("DROP TABLE staged_transcripts")
+
+    def fetch_pending(self, limit=1000, after_id=None, include_enriched=False, loaded_since=None):
+        """Return up to limit transcripts without enrichment results (or all, to reprocess them), in conversation_id
+        order, as dicts; with loaded_since, only those loaded or updated at or after it."""
+        rows = self.execute(f"""
+            SELECT {", ".join("p." + column for column in TRANSCRIPT_COLUMNS)}
+            FROM parsed_transcripts p
+            WHERE (? OR NOT EXISTS (
+                SELECT 1 FROM transcript_complete_results r WHERE r.conversation_id = p.conversation_id
+            ))
+            AND (? IS NULL OR p.conversation_id IN (
+                SELECT conversation_id FROM raw_transcripts WHERE file_load_time >= ?
+            ))
+            AND p.conversation_id > ?
+            ORDER BY p.conversation_id
+            LIMIT ?
+        """, [include_enriched, loaded_since, loaded_since, after_id if after_id is not None else -1, limit])
+        return [dict(zip(TRANSCRIPT_COLUMNS, row)) for row in rows]
+
+    def load_watermark(self):
+        """Return the latest load time and the row count of raw_transcripts; they change whenever rows are loaded."""
+        return self.execute("SELECT MAX(file_load_time), COUNT(*) FROM raw_transcripts")[0]
+
+    def fetch_results(self, conversation_id):
+        """Return the enrichment results of one transcript as dicts."""
+        rows = self.execute(
+            f"SELECT {', '.join(RESULT_COLUMNS)} FROM transcript_complete_results WHERE conversation_id = ?",
+            [conversation_id],
+        )
+        return [dict(zip(RESULT_COLUMNS, row)) for row in rows]
+
+    def merge_results(self, results):
+        """Bulk MERGE enrichment results (dicts with RESULT_COLUMNS) into transcript_complete_results."""
+        if not results:
+            return 0
+        rows = [[result.get(column) for column in RESULT_COLUMNS] for result in results]
+        with self.lock:
+            self.connection.execute("CREATE OR REPLACE TEMP TABLE staged_results AS SELECT * EXCLUDE (enriched_at) FROM transcript_complete_results LIMIT 0")
+            self.connection.executemany(
+                f"INSERT INTO staged_results VALUES ({', '.join('?' for _ in RESULT_COLUMNS)})", rows
+            )
+            self.connection.execute(f"""
+                MERGE INTO transcript_complete_results t
+                USING staged_results s
+                ON t.conversation_id = s.conversation_id AND t.prompt_type = s.prompt_type
+                WHEN MATCHED THEN UPDATE SET
+                    {", ".join(f"{column} = s.{column}" for column in RESULT_COLUMNS[2:])},
+                    enriched_at = current_timestamp
+                WHEN NOT MATCHED THEN INSERT ({", ".join(RESULT_COLUMNS)})
+                    VALUES ({", ".join("s." + column for column in RESULT_COLUMNS)})
+            """)
+            self.connection.execute("DROP TABLE staged_results")
+        return len(rows)
+
+    def fetch_manifest(self):
+        """Return the (file_name, md5) pairs of the files in ingest_manifest."""
+        return {(row[0], row[1]) for row in self.execute("SELECT file_name, md5 FROM ingest_manifest")}
+
+    def fetch_issue_clusters(self):
+        """Return the issue clusters as dicts with ISSUE_CLUSTER_COLUMNS, in cluster order."""
+        rows = self.execute(f"SELECT {', '.join(ISSUE_CLUSTER_COLUMNS)} FROM issue_clusters ORDER BY issue_cluster")
+        return [dict(zip(ISSUE_CLUSTER_COLUMNS, row)) for row in rows]
+
+    def replace_issue_clusters(self, clusters, assignments):
+        """Replace the issue clusters (dicts with ISSUE_CLUSTER_COLUMNS) and all (conversation_id, issue_cluster,
+        similarity) assignments in one transaction."""
+        with self.lock:
+            self.connection.execute("BEGIN TRANSACTION")
+            try:
+                self.connection.execute("DELETE FROM issue_clusters")
+                self.connection.execute("DELETE FROM transcript_issue_clusters")
+                if clusters:
+                    self.connection.executemany(
+                        f"INSERT INTO issue_clusters ({', '.join(ISSUE_CLUSTER_COLUMNS)}) VALUES ({', '.join('?' for _ in ISSUE_CLUSTER_COLUMNS)})",
+                        [[cluster[column] for column in ISSUE_CLUSTER_COLUMNS] for cluster in clusters],
+                    )
+                if assignments:
+                    self.connection.executemany(
+                        "INSERT INTO transcript_issue_clusters (conversation_id, issue_cluster, similarity) VALUES (?, ?, ?)",
+                        assignments,
+                    )
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def add_issue_assignments(self, assignments):
+        """Add (conversation_id, issue_cluster, similarity) assignments of calls without a cluster."""
+        if not assignments:
+            return 0
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO transcript_issue_clusters (conversation_id, issue_cluster, similarity) VALUES (?, ?, ?)",
+                assignments,
+            )
+        return len(assignments)
+
+    def register_cortex(self, stub):
+        """Add the Cortex functions of a cortex_stub.CortexStub to the database."""
+        with self.lock:
+            stub.register(self.connection)
+
+    def counts(self):
+        """Return the number of transcripts and of enriched transcripts."""
+        transcripts = self.execute("SELECT COUNT(*) FROM parsed_transcripts")[0][0]
+        enriched = self.execute("SELECT COUNT(DISTINCT conversation_id) FROM transcript_complete_results")[0][0]
+        return {"transcripts": transcripts, "enriched": enriched}
+
+
+def main(database_path, paths):
+    db = OfflineDatabase(database_path)
+    loaded = db.load_transcripts(read_transcripts(paths))
+    counts = db.counts()
+    print(f"Loaded {loaded} records into {database_path}")
+    print(f"Transcripts: {counts['transcripts']}, enriched: {counts['enriched']}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    main(sys.argv[1], sys.argv[2:])
@@ -0,0 +1,179 @@
+"""
+Streaming ingestion of transcript JSON dumps into date-partitioned parquet.
+
+Reads Initial_Demo/customer_support_calls.json (ID/Agent/Customer/Start_Time/Transcript keys) and the staged
+conversations_*.json exports (conversation_id/agent_name/start_time/transcript keys) record by record with
+transcript_io.iter_transcript_file, normalizes both to the parsed_transcripts columns and writes them to
+<output directory>/start_date=YYYY-MM-DD/ files. Records are buffered up to CHUNK_ROWS rows or CHUNK_CHARS characters
+of transcript text and each buffer is written as one row group per date, so memory stays flat however large the input
+is. Files that are not conversations_*.json exports get the INITIAL source. Requires pyarrow.
+
+The output can be read by DuckDB (read_parquet('<output directory>/**/*.parquet', hive_partitioning = true)) or
+loaded into Snowflake with COPY INTO ... MATCH_BY_COLUMN_NAME. Conversation ids are not deduplicated here; as with the
+JSON files, the MERGE on load keeps the latest record of each conversation.
+
+Usage:
+    python parquet_ingest.py <output directory> <json file or directory> [...]
+"""
+
+import os
+import resource
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from transcript_io import iter_transcript_file, list_transcript_files
+
+CHUNK_ROWS = 50_000
+CHUNK_CHARS = 64 * 1024 * 1024
+# Partition files kept open at once; the least recently written one is closed beyond it
+MAX_OPEN_FILES = 64
+
+SCHEMA = pa.schema([
+    ("source", pa.string()),
+    ("conversation_id", pa.int64()),
+    ("start_time", pa.timestamp("us")),
+    ("end_time", pa.timestamp("us")),
+    ("agent_name", pa.string()),
+    ("customer_name", pa.string()),
+    ("transcript", pa.string()),
+])
+COLUMNS = SCHEMA.names
+
+
+def parse_timestamp(value):
+    """Return a naive UTC datetime for an ISO 8601 or Snowflake timestamp string (None when missing or invalid)."""
+    if not value:
+        return None
+    try:
+        timestamp = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if timestamp.tzinfo:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+def file_source(path):
+    """INITIAL or NEW, as the stage a file would be loaded from."""
+    return "NEW" if os.path.basename(path).startswith("conversations_") else "INITIAL"
+
+
+def to_row(record, source):
+    """Return the parsed_transcripts values of a normalized record, or None without a valid conversation id."""
+    try:
+        conversation_id = int(record.get("conversation_id"))
+    except (TypeError, ValueError):
+        return None
+    return [
+        record.get("source") or source,
+        conversation_id,
+        parse_timestamp(record.get("start_time")),
+        parse_timestamp(record.get("end_time")),
+        record.get("agent_name"),
+        record.get("customer_name"),
+        record.get("transcript"),
+    ]
+
+
+class PartitionedWriter:
+    """Writes rows to one parquet file per start_time date, one row group per flushed chunk."""
+
+    def __init__(self, output_dir, max_open_files=MAX_OPEN_FILES):
+        self.output_dir = output_dir
+        self.max_open_files = max_open_files
+        self.run_id = uuid.uuid4().hex[:8]
+        self.writers = {}
+        self.file_counts = {}
+        self.stats = {"rows": 0, "row_groups": 0, "files": 0}
+
+    def writer(self, date):
+        if date in self.writers:
+            # Move to the end of the dict, which is in least recently written order
+            self.writers[date] = self.writers.pop(date)
+            return self.writers[date]
+        if len(self.writers) >= self.max_open_files:
+            oldest = next(iter(self.writers))
+            self.writers.pop(oldest).close()
+
+        directory = os.path.join(self.output_dir, f"start_date={date or '__NULL__'}")
+        os.makedirs(directory, exist_ok=True)
+        number = self.file_counts.get(date, 0)
+        self.file_counts[date] = number + 1
+        path = os.path.join(directory, f"part-{self.run_id}-{number:05d}.parquet")
+        self.writers[date] = pq.ParquetWriter(path, SCHEMA, compression="zstd")
+        self.stats["files"] += 1
+        return self.writers[date]
+
+    def write(self, rows):
+        partitions = {}
+        for row in rows:
+            date = row[2].date().isoformat() if row[2] else None
+            partitions.setdefault(date, []).append(row)
+        for date, partition_rows in partitions.items():
+            columns = list(zip(*partition_rows))
+            table = pa.table({name: pa.array(column, type=SCHEMA.field(name).type) for name, column in zip(COLUMNS, columns)})
+            self.writer(date).write_table(table)
+            self.stats["row_groups"] += 1
+        self.stats["rows"] += len(rows)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+
+def ingest(output_dir, paths, chunk_rows=CHUNK_ROWS, chunk_chars=CHUNK_CHARS):
+    """Stream the transcript files into date-partitioned parquet; returns the run statistics."""
+    if isinstance(paths, str):
+        paths = [paths]
+    writer = PartitionedWriter(output_dir)
+    stats = {"files_read": 0, "bytes_read": 0, "records": 0, "skipped": 0}
+    rows, chars = [], 0
+    try:
+        for path in paths:
+            for file_path in list_transcript_files(path):
+                stats["files_read"] += 1
+                stats["bytes_read"] += os.path.getsize(file_path)
+                source = file_source(file_path)
+                for record in iter_transcript_file(file_path):
+                    row = to_row(record, source)
+                    if row is None:
+                        stats["skipped"] += 1
+                        continue
+                    rows.append(row)
+                    chars += len(row[6] or "")
+                    stats["records"] += 1
+                    if len(rows) >= chunk_rows or chars >= chunk_chars:
+                        writer.write(rows)
+                        rows, chars = [], 0
+        if rows:
+            writer.write(rows)
+    finally:
+        writer.close()
+    stats.update(writer.stats)
+    stats["partitions"] = len(writer.file_counts)
+    return stats
+
+
+def main(output_dir, paths):
+    start = time.monotonic()
+    stats = ingest(output_dir, paths)
+    elapsed = time.monotonic() - start
+    # ru_maxrss is in kilobytes on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    print(f"Read {stats['records']} records from {stats['files_read']} files ({stats['bytes_read'] / 1e6:.1f} MB), skipped {stats['skipped']} without a conversation id")
+    print(f"Wrote {stats['partitions']} date partitions, {stats['files']} files, {stats['row_groups']} row groups to {output_dir}")
+    print(f"Elapsed: {elapsed:.2f} s ({stats['bytes_read'] / 1e6 / elapsed if elapsed else 0:.1f} MB/s), peak memory: {peak_mb:.0f} MB")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    main(sys.argv[1], sys.argv[2:])
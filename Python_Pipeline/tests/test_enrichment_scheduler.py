@@ -0,0 +1,78 @@
+import asyncio
+
+from enrichment_scheduler import EnrichmentScheduler
+from offline_db import OfflineDatabase
+
+TRANSCRIPT = "Agent: Thank you for calling. Customer: My glucose meter shows an error. Agent: Let me replace it."
+
+
+class FakeClient:
+    """Answers every prompt; raises an error for the transcripts that contain fail_on."""
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+
+    async def complete(self, model, messages, max_tokens=60):
+        await asyncio.sleep(0)
+        if self.fail_on and self.fail_on in str(messages):
+            raise ValueError("malformed response")
+        return {"text": "Resolved: replaced the meter", "prompt_tokens": 10, "completion_tokens": 5, "latency_ms": 1.0}
+
+
+def load(db, ids):
+    db.load_transcripts([
+        {"conversation_id": i, "start_time": "2025-01-01 10:00:00", "agent_name": "Agent", "customer_name": "Customer",
+         "transcript": f"{TRANSCRIPT} Call {i}."}
+        for i in ids
+    ])
+
+
+def make_scheduler(db, client, **options):
+    return EnrichmentScheduler(
+        db, client, fresh_concurrency=2, backfill_concurrency=1, now="2025-01-01 12:00:00", poll_seconds=0.01,
+        report_seconds=60, batch_size=1, flush_seconds=0.05, **options,
+    )
+
+
+def test_polls_read_only_new_loads():
+    db = OfflineDatabase()
+    load(db, range(5))
+    fetches = []
+    fetch_pending = db.fetch_pending
+
+    def counting_fetch(*args):
+        fetches.append(args)
+        return fetch_pending(*args)
+
+    db.fetch_pending = counting_fetch
+    scheduler = make_scheduler(db, FakeClient())
+
+    async def polls():
+        first = await scheduler.poll()
+        fetches.clear()
+        idle = await scheduler.poll()
+        idle_fetches = len(fetches)
+        load(db, [5])
+        return first, idle, idle_fetches, await scheduler.poll()
+
+    first, idle, idle_fetches, after_load = asyncio.run(polls())
+    assert (first, idle, after_load) == (5, 0, 1)
+    # An idle poll only reads the load watermark, and the next one is limited to the new loads
+    assert idle_fetches == 0
+    assert fetches[-1][3] is not None
+
+
+def test_failed_transcript_is_requeued_then_dead_lettered():
+    db = OfflineDatabase()
+    load(db, range(4))
+    scheduler = make_scheduler(db, FakeClient(fail_on="Call 3."), requeue_seconds=0, max_requeues=2)
+
+    asyncio.run(asyncio.wait_for(scheduler.run(), timeout=10))
+
+    lane = scheduler.lanes["fresh"]
+    assert lane.stats["enriched"] == 3
+    assert lane.stats["failed"] == 3
+    assert lane.stats["requeued"] == 2
+    assert lane.stats["dead_lettered"] == 1
+    assert 3 not in scheduler.scheduled
+    assert {row[0] for row in db.execute("SELECT conversation_id FROM transcript_complete_results")} == {0, 1, 2}
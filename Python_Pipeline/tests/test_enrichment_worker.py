@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from enrichment_worker import EnrichmentWorker
+
+TRANSCRIPT = "Agent: Thank you for calling. Customer: My glucose meter shows an error. Agent: Let me replace it."
+
+
+class FakeDatabase:
+    def __init__(self, count, fail_merge=False, fail_fetch=False):
+        self.records = [
+            {"conversation_id": i, "agent_name": "Agent", "customer_name": "Customer", "transcript": f"{TRANSCRIPT} Call {i}."}
+            for i in range(count)
+        ]
+        self.fail_merge = fail_merge
+        self.fail_fetch = fail_fetch
+        self.merged = []
+
+    def fetch_pending(self, limit=1000, after_id=None, include_enriched=False):
+        if self.fail_fetch:
+            raise RuntimeError("fetch failed")
+        start = -1 if after_id is None else after_id
+        return [record for record in self.records if record["conversation_id"] > start][:limit]
+
+    def fetch_results(self, conversation_id):
+        return [result for result in self.merged if result["conversation_id"] == conversation_id]
+
+    def merge_results(self, results):
+        if self.fail_merge:
+            raise RuntimeError("merge failed")
+        self.merged.extend(results)
+        return len(results)
+
+
+class FakeClient:
+    """Answers every prompt; raises an unexpected error for the transcripts that contain fail_on."""
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+
+    async def complete(self, model, messages, max_tokens=60):
+        await asyncio.sleep(0)
+        if self.fail_on and self.fail_on in str(messages):
+            raise ValueError("malformed response")
+        return {"text": "Resolved: replaced the meter", "prompt_tokens": 10, "completion_tokens": 5, "latency_ms": 1.0}
+
+
+def run_worker(db, client):
+    worker = EnrichmentWorker(db, client, concurrency=2, queue_size=2, batch_size=1, flush_seconds=0.05, page_size=5)
+    return worker, asyncio.run(asyncio.wait_for(worker.run(), timeout=10))
+
+
+def test_all_records_enriched_and_consumers_shut_down():
+    db = FakeDatabase(12)
+    worker, stats = run_worker(db, FakeClient())
+    assert stats["enriched"] == 12
+    assert stats["failed"] == 0
+    assert stats["rows_written"] == len(db.merged) == 24
+    assert worker.work_queue.empty()
+
+
+def test_unexpected_record_error_is_counted_and_the_run_continues():
+    db = FakeDatabase(12)
+    worker, stats = run_worker(db, FakeClient(fail_on="Call 7."))
+    assert stats["failed"] == 1
+    assert stats["enriched"] == 11
+    assert 7 not in {result["conversation_id"] for result in db.merged}
+
+
+def test_writer_error_is_raised_instead_of_blocking():
+    with pytest.raises(ExceptionGroup) as raised:
+        run_worker(FakeDatabase(40, fail_merge=True), FakeClient())
+    assert raised.group_contains(RuntimeError, match="merge failed")
+
+
+def test_producer_error_is_raised_instead_of_blocking():
+    with pytest.raises(ExceptionGroup) as raised:
+        run_worker(FakeDatabase(5, fail_fetch=True), FakeClient())
+    assert raised.group_contains(RuntimeError, match="fetch failed")
@@ -0,0 +1,78 @@
+import json
+
+from ingestion_service import IngestionService, LocalStage
+from offline_db import OfflineDatabase
+
+
+def write_records(path, ids):
+    records = [
+        {"conversation_id": i, "start_time": "2025-01-01 10:00:00", "end_time": "2025-01-01 10:05:00",
+         "agent_name": "Agent", "customer_name": "Customer", "transcript": f"Agent: Hello. Customer: Call {i}."}
+        for i in ids
+    ]
+    path.write_text(json.dumps(records))
+
+
+def make_service(directory, db):
+    return IngestionService(LocalStage(str(directory), db, settle_seconds=0), batch_files=10, batch_seconds=0, poll_seconds=0)
+
+
+def test_bad_file_is_quarantined_and_the_batch_loads(tmp_path):
+    write_records(tmp_path / "a.json", [1, 2])
+    (tmp_path / "b.json").write_text('[{"conversation_id": 3, "transcript": "cut off')
+    write_records(tmp_path / "c.json", [4])
+    db = OfflineDatabase(str(tmp_path / "transcripts.duckdb"))
+
+    report = make_service(tmp_path, db).run(once=True)
+
+    assert report["files"] == 2
+    assert report["rows"] == 3
+    assert report["failed_files"] == 1
+    assert report["pending"] == 0
+    assert [row[0] for row in db.execute("SELECT conversation_id FROM raw_transcripts ORDER BY 1")] == [1, 2, 4]
+    errors = dict(db.execute("SELECT file_name, error FROM ingest_manifest"))
+    assert errors["a.json"] is None and errors["c.json"] is None
+    assert errors["b.json"]
+
+
+def test_quarantined_file_is_not_retried_after_a_restart(tmp_path):
+    (tmp_path / "bad.json").write_text("{not json")
+    db = OfflineDatabase(str(tmp_path / "transcripts.duckdb"))
+    assert make_service(tmp_path, db).run(once=True)["failed_files"] == 1
+
+    restarted = make_service(tmp_path, db)
+    assert restarted.poll() == 0
+
+    # New content under the same name is a new file and is loaded
+    write_records(tmp_path / "bad.json", [7])
+    assert restarted.poll() == 1
+    assert restarted.run(once=True)["rows"] == 1
+
+
+def test_transient_error_is_retried_not_quarantined(tmp_path):
+    write_records(tmp_path / "a.json", [1, 2])
+    db = OfflineDatabase(str(tmp_path / "transcripts.duckdb"))
+    stage = LocalStage(str(tmp_path), db, settle_seconds=0)
+    load = stage.load
+    failures = [ConnectionError("connection reset")]
+
+    def flaky_load(files, batch_id):
+        if failures:
+            raise failures.pop()
+        return load(files, batch_id)
+
+    stage.load = flaky_load
+    service = IngestionService(stage, batch_files=10, batch_seconds=0, poll_seconds=0, retry_seconds=0)
+    service.poll()
+
+    service.load_batch()
+    assert service.stats["retries"] == 1
+    assert service.stats["failed_files"] == 0
+    assert len(service.pending) == 1
+    assert db.execute("SELECT COUNT(*) FROM ingest_manifest") == [(0,)]
+
+    service.load_batch()
+    assert service.stats["files"] == 1
+    assert service.stats["rows"] == 2
+    assert not service.pending
+    assert dict(db.execute("SELECT file_name, error FROM ingest_manifest")) == {"a.json": None}
@@ -0,0 +1,43 @@
+import gzip
+import io
+import json
+
+import pytest
+
+from transcript_io import iter_json_records, iter_transcript_file
+
+RECORDS = [
+    {"conversation_id": i, "agent_name": "Agent", "transcript": f"Agent: Hello. Customer: My meter {i} shows E{i}, [help]."}
+    for i in range(20)
+]
+
+
+def parse(text, chunk_chars=16):
+    return list(iter_json_records(io.StringIO(text), chunk_chars=chunk_chars))
+
+
+def test_array_spanning_many_chunks():
+    assert parse(json.dumps(RECORDS, indent=2)) == RECORDS
+
+
+def test_one_object_per_line():
+    assert parse("\n".join(json.dumps(record) for record in RECORDS) + "\n") == RECORDS
+
+
+def test_empty_array_and_empty_file():
+    assert parse("  [ ]\n") == []
+    assert parse("") == []
+
+
+def test_truncated_object_raises():
+    text = json.dumps(RECORDS)
+    with pytest.raises(ValueError):
+        parse(text[: len(text) // 2])
+
+
+def test_gzip_file_with_initial_demo_keys(tmp_path):
+    path = tmp_path / "calls.json.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump([{"ID": 1, "Agent": "Agent", "Transcript": "Agent: Hello."}], f)
+
+    assert list(iter_transcript_file(str(path))) == [{"conversation_id": 1, "agent_name": "Agent", "transcript": "Agent: Hello."}]
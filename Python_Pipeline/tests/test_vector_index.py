@@ -0,0 +1,56 @@
+import numpy as np
+
+from vector_index import VectorIndex, normalize, synthetic_vectors
+
+DIM = 32
+
+
+def exact_top_k(ids, vectors, query, k):
+    scores = vectors @ normalize(query)
+    return set(ids[np.argsort(-scores)[:k]].tolist())
+
+
+def test_trained_index_recall_against_brute_force():
+    index = VectorIndex(DIM, dtype=np.float32)
+    all_ids, all_vectors = [], []
+    # Added in chunks, so the index trains itself once it outgrows a single list
+    for ids, vectors in synthetic_vectors(20_000, DIM, topics=200, chunk_size=5_000):
+        index.add(ids, vectors)
+        all_ids.append(ids)
+        all_vectors.append(vectors)
+    ids, vectors = np.concatenate(all_ids), np.concatenate(all_vectors)
+    assert len(index) == 20_000
+    assert len(index.lists) > 1
+
+    queries = next(synthetic_vectors(100, DIM, topics=200, first_chunk=10))[1]
+    recall = np.mean([
+        len({i for i, _ in index.search(query, 10)} & exact_top_k(ids, vectors, query, 10)) / 10
+        for query in queries
+    ])
+    assert recall >= 0.9
+
+
+def test_search_excludes_the_query_call():
+    ids, vectors = next(synthetic_vectors(500, DIM, topics=20))
+    index = VectorIndex(DIM)
+    index.add(ids, vectors)
+
+    matches = index.search(index.vector(7), 5, exclude=7)
+
+    assert len(matches) == 5
+    assert 7 not in [match_id for match_id, _ in matches]
+    scores = [score for _, score in matches]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_add_replaces_an_existing_id():
+    ids, vectors = next(synthetic_vectors(100, DIM, topics=10))
+    index = VectorIndex(DIM, dtype=np.float32)
+    index.add(ids, vectors)
+
+    index.add([3], vectors[50:51])
+
+    assert len(index) == 100
+    assert np.allclose(index.vector(3), vectors[50], atol=1e-6)
+    assert index.search(vectors[50], 2)[0][1] > 0.999
+    assert {match_id for match_id, _ in index.search(vectors[50], 2)} == {3, 50}
@@ -0,0 +1,226 @@
+"""
+Token-aware chunking of long transcripts.
+
+TRANSCRIPT is up to VARCHAR(20000), and every Cortex function used to get the full text. The longest calls dominated
+latency and cost, and could exceed the context window of EXTRACT_ANSWER (2,048 tokens) and SENTIMENT (512 tokens),
+which truncate silently. This module:
+
+- estimates the tokens of a transcript locally (about 4 characters per token; SNOWFLAKE.CORTEX.COUNT_TOKENS gives
+  the exact count inside Snowflake)
+- splits long transcripts into chunks on speaker-turn boundaries (see turn_parser.py), so the chunks can be summarized
+  in parallel and the chunk summaries reduced into one summary
+- caps the prompt of each function at a token budget by keeping the opening and closing turns of the call, where the
+  issue is stated and resolved
+
+In Snowflake the module is the handler of the TRANSCRIPT_CHUNKS and FIT_TRANSCRIPT_TO_BUDGET UDFs used by the
+transcript_summaries and TRANSCRIPT_ANALYSIS_RESULTS_FINAL dynamic tables (see Analytics_Setup/Cortex_Analysis.sql).
+
+Usage:
+    python transcript_chunker.py <json file or directory> [...]
+"""
+
+import math
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from transcript_io import read_transcripts
+from turn_parser import parse_turns, turns_text
+
+CHARS_PER_TOKEN = 4
+
+# Prompt budgets in tokens; keep these in sync with the constants in Analytics_Setup/Cortex_Analysis.sql
+TOKEN_BUDGETS = {
+    "summarize": 2000,        # longer transcripts are summarized in chunks and reduced
+    "summarize_chunk": 1000,  # size of each chunk in the map step
+    "extract_answer": 1800,   # context window of 2,048 tokens including the question
+    "sentiment": 500,         # context window of 512 tokens
+    "complete": 3000,         # resolution and service rating prompts
+}
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text):
+    """Approximate the number of tokens of a text without calling a tokenizer."""
+    return int(math.ceil(len(text or "") / CHARS_PER_TOKEN))
+
+
+def split_text(text, max_tokens):
+    """Split a text that is too long for one chunk on sentence boundaries, and on words as a last resort."""
+    pieces = []
+    current = ""
+    for sentence in SENTENCE_END.split(text):
+        # A single sentence over the budget is split into runs of words
+        while estimate_tokens(sentence) > max_tokens:
+            words = sentence.split()
+            head = []
+            while words and estimate_tokens(" ".join(head + words[:1])) <= max_tokens:
+                head.append(words.pop(0))
+            if not head:
+                head.append(words.pop(0))
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(" ".join(head))
+            sentence = " ".join(words)
+
+        candidate = (current + " " + sentence).strip()
+        if current and estimate_tokens(candidate) > max_tokens:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def turn_lines(turns):
+    """Return one 'Speaker: text' line per turn."""
+    return [turns_text([turn]) for turn in turns]
+
+
+def chunk_transcript(transcript, agent_name=None, customer_name=None, max_tokens=None):
+    """Split a transcript into chunks of at most max_tokens on speaker-turn boundaries.
+
+    Returns a list of dicts with chunk_no, turn_start, turn_end, tokens and text. Transcripts without recognized
+    speakers are split on sentence boundaries instead.
+    """
+    max_tokens = max_tokens or TOKEN_BUDGETS["summarize_chunk"]
+    turns = parse_turns(transcript, agent_name, customer_name)
+
+    if turns:
+        units = [(turn["turn_no"], line) for turn, line in zip(turns, turn_lines(turns))]
+    else:
+        units = [(None, piece) for piece in split_text(" ".join((transcript or "").split()), max_tokens)]
+
+    chunks = []
+    lines = []
+    first_turn = last_turn = None
+
+    def close_chunk():
+        text = "\n".join(lines)
+        chunks.append({
+            "chunk_no": len(chunks) + 1,
+            "turn_start": first_turn,
+            "turn_end": last_turn,
+            "tokens": estimate_tokens(text),
+            "text": text,
+        })
+
+    for turn_no, line in units:
+        # A single turn over the budget becomes several chunks of its own
+        parts = split_text(line, max_tokens) if estimate_tokens(line) > max_tokens else [line]
+        for part in parts:
+            if lines and estimate_tokens("\n".join(lines + [part])) > max_tokens:
+                close_chunk()
+                lines = []
+                first_turn = None
+            if first_turn is None:
+                first_turn = turn_no
+            last_turn = turn_no
+            lines.append(part)
+
+    if lines:
+        close_chunk()
+    return chunks
+
+
+def fit_to_budget(transcript, agent_name=None, customer_name=None, max_tokens=None):
+    """Return the transcript unchanged when it fits max_tokens, otherwise its opening and closing turns.
+
+    Turns are taken alternately from the start and the end of the call until the budget is used, and the turns
+    left out are replaced by a single marker line.
+    """
+    transcript = transcript or ""
+    max_tokens = max_tokens or TOKEN_BUDGETS["complete"]
+    if estimate_tokens(transcript) <= max_tokens:
+        return transcript
+
+    turns = parse_turns(transcript, agent_name, customer_name)
+    lines = turn_lines(turns) if turns else split_text(" ".join(transcript.split()), max_tokens // 4)
+
+    head, tail = [], []
+    used = estimate_tokens("[... 000 turns omitted ...]")
+    low, high = 0, len(lines) - 1
+    take_head = True
+    while low <= high:
+        line = lines[low] if take_head else lines[high]
+        cost = estimate_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        used += cost
+        if take_head:
+            head.append(line)
+            low += 1
+        else:
+            tail.insert(0, line)
+            high -= 1
+        take_head = not take_head
+
+    omitted = high - low + 1
+    if not head and not tail:
+        # Not even one turn fits: cut the first turn at the budget
+        return lines[0][:max_tokens * CHARS_PER_TOKEN]
+    return "\n".join(head + [f"[... {omitted} turns omitted ...]"] + tail) if omitted else "\n".join(head + tail)
+
+
+def map_reduce_summary(transcript, summarize, agent_name=None, customer_name=None, max_workers=4):
+    """Summarize a transcript with a summarize(text) callable, in chunks when it is over the summarize budget.
+
+    The chunk summaries are produced in parallel and summarized again into one summary.
+    """
+    if estimate_tokens(transcript) <= TOKEN_BUDGETS["summarize"]:
+        return summarize(transcript)
+
+    chunks = chunk_transcript(transcript, agent_name, customer_name, TOKEN_BUDGETS["summarize_chunk"])
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        chunk_summaries = list(executor.map(summarize, [chunk["text"] for chunk in chunks]))
+    return summarize("\n".join(chunk_summaries))
+
+
+def udf_chunks(transcript, agent_name=None, customer_name=None, max_tokens=None):
+    """Handler of the TRANSCRIPT_CHUNKS UDF; returns an ARRAY of chunk objects."""
+    return chunk_transcript(transcript, agent_name, customer_name, max_tokens)
+
+
+def udf_fit(transcript, agent_name=None, customer_name=None, max_tokens=None):
+    """Handler of the FIT_TRANSCRIPT_TO_BUDGET UDF."""
+    return fit_to_budget(transcript, agent_name, customer_name, max_tokens)
+
+
+def main(paths):
+    records = read_transcripts(paths)
+    if not records:
+        print("No transcripts found")
+        return
+
+    tokens = sorted(estimate_tokens(record.get("transcript")) for record in records)
+    print(f"Transcripts:     {len(records)}")
+    print(f"Est. tokens:     min {tokens[0]}, median {tokens[len(tokens) // 2]}, max {tokens[-1]}")
+
+    long_records = [record for record in records if estimate_tokens(record.get("transcript")) > TOKEN_BUDGETS["summarize"]]
+    chunk_count = sum(
+        len(chunk_transcript(record.get("transcript"), record.get("agent_name"), record.get("customer_name")))
+        for record in long_records
+    )
+    print(f"Map-reduce summaries: {len(long_records)} transcripts in {chunk_count} chunks")
+
+    # Prompt tokens with and without the per-function budgets
+    for function in ("extract_answer", "sentiment", "complete"):
+        budget = TOKEN_BUDGETS[function]
+        full = sum(tokens)
+        capped = sum(
+            estimate_tokens(fit_to_budget(record.get("transcript"), record.get("agent_name"), record.get("customer_name"), budget))
+            for record in records
+        )
+        over = sum(1 for count in tokens if count > budget)
+        print(f"{function:15s} budget {budget}: {over} transcripts capped, {full} -> {capped} prompt tokens")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    main(sys.argv[1:])
@@ -0,0 +1,121 @@
+"""
+Helpers for reading transcripts and the device catalog outside of Snowflake.
+
+Transcripts can come from the JSON files exported to the CALL_DATA_INITIAL / CALL_DATA_NEW stages
+(downloaded with GET, usually gzip compressed) or from the Initial_Demo customer_support_calls.json file.
+Both layouts are normalized to the same lower-case keys used by the RAW_TRANSCRIPTS table. The files are parsed
+incrementally (iter_transcripts), so a multi-GB dump never has to fit in memory.
+"""
+
+import csv
+import gzip
+import json
+import os
+
+READ_CHUNK_CHARS = 1 << 20
+JSON_SEPARATORS = " \t\r\n,"
+
+PIPELINE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CATALOG_PATH = os.path.join(PIPELINE_DIR, "home_medical_devices.csv")
+
+# Initial_Demo/customer_support_calls.json uses different key names than the stage exports
+INITIAL_DEMO_KEYS = {
+    "ID": "conversation_id",
+    "Start_Time": "start_time",
+    "End_Time": "end_time",
+    "Agent": "agent_name",
+    "Customer": "customer_name",
+    "Transcript": "transcript",
+}
+
+
+def open_text(path):
+    """Open a plain or gzip compressed text file."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def normalize_record(record):
+    """Return a record with the RAW_TRANSCRIPTS column names (lower case)."""
+    normalized = {}
+    for key, value in record.items():
+        normalized[INITIAL_DEMO_KEYS.get(key, key.lower())] = value
+    return normalized
+
+
+def iter_json_records(f, chunk_chars=READ_CHUNK_CHARS):
+    """Yield the objects of a JSON array or of one-object-per-line JSON from a text stream, reading it in chunks."""
+    decoder = json.JSONDecoder()
+    buffer = f.read(chunk_chars).lstrip()
+    if buffer.startswith("["):
+        buffer = buffer[1:]
+    position = 0
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in JSON_SEPARATORS:
+            position += 1
+        if position < len(buffer) and buffer[position] == "]":
+            return
+        try:
+            if position == len(buffer):
+                raise ValueError("empty buffer")
+            record, end = decoder.raw_decode(buffer, position)
+        except ValueError:
+            # The object continues past the buffer: keep the unread part and read the next chunk
+            if eof:
+                if position < len(buffer):
+                    raise
+                return
+            chunk = f.read(max(chunk_chars, len(buffer) - position))
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield record
+        position = end
+
+
+def iter_transcript_file(path):
+    """Yield the normalized transcript records of one JSON file (an array or one object per line)."""
+    with open_text(path) as f:
+        for record in iter_json_records(f):
+            yield normalize_record(record)
+
+
+def read_transcript_file(path):
+    """Read all transcript records from one JSON file (an array or one object per line)."""
+    return list(iter_transcript_file(path))
+
+
+def list_transcript_files(path):
+    """Return the JSON files in a directory (or the path itself when it is a file), sorted by name."""
+    if os.path.isfile(path):
+        return [path]
+
+    files = []
+    for name in sorted(os.listdir(path)):
+        if name.endswith((".json", ".json.gz", ".ndjson", ".ndjson.gz")):
+            files.append(os.path.join(path, name))
+    return files
+
+
+def iter_transcripts(paths):
+    """Yield the transcript records of a list of files and/or directories, one record at a time."""
+    if isinstance(paths, str):
+        paths = [paths]
+
+    for path in paths:
+        for file_path in list_transcript_files(path):
+            yield from iter_transcript_file(file_path)
+
+
+def read_transcripts(paths):
+    """Read the transcript records from a list of files and/or directories."""
+    return list(iter_transcripts(paths))
+
+
+def read_device_catalog(path=None):
+    """Read the HOME_MEDICAL_DEVICES catalog as a list of dicts with upper-case column names."""
+    with open(path or DEFAULT_CATALOG_PATH, "r", encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
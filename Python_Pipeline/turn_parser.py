@@ -0,0 +1,224 @@
+"""
+Speaker-turn parser for support call transcripts.
+
+Transcripts are plain text with one speaker turn per line, prefixed with the speaker and, for the generated
+transcripts, a timestamp. The layouts seen in practice include:
+
+    Agent: Hello, how can I assist you today?
+    [00:15] Customer: My CPAP machine is leaking.
+    00:00:42 - Agent (Sarah Johnson): Let me check that for you.
+    **Richard Walker [10:02 AM]:** Thanks.
+
+Every line is matched once by a single compiled pattern; lines without a recognized speaker are appended to the
+previous turn. Each transcript becomes a list of turns (turn_no, speaker, speaker_label, char_offset, offset_seconds,
+turn_text) from which conversation features are computed without any LLM call.
+
+In Snowflake the module is the handler of the TRANSCRIPT_TURNS UDF, whose array of turns is flattened into the
+transcript_turns dynamic table (see Analytics_Setup/Create_Dynamic_Tables.sql).
+
+Usage:
+    python turn_parser.py <json file or directory> [...]
+"""
+
+import re
+import sys
+from statistics import mean
+
+from transcript_io import read_transcripts
+
+AGENT = "AGENT"
+CUSTOMER = "CUSTOMER"
+
+TIMESTAMP = r"\d{1,2}:\d{2}(?::\d{2})?(?:\s*[AaPp]\.?[Mm]\.?)?"
+
+# Optional leading timestamp, then a speaker label of up to 60 characters (which may carry its own timestamp, so a
+# colon between two digits neither ends the label nor starts the text), then a colon and the spoken text
+TURN_LINE = re.compile(
+    r"^[ \t*_>-]*"
+    r"(?:[\[(]?(?P<lead_ts>" + TIMESTAMP + r")[\])]?[ \t]*[-–—|]?[ \t]*)?"
+    r"[*_]*(?P<label>[A-Za-z](?:[^:\n]|(?<=\d):(?=\d)){0,60}?)[*_]*[ \t]*(?!(?<=\d):\d):[*_]*[ \t]*"
+    r"(?P<text>.*)$",
+    re.MULTILINE,
+)
+LABEL_TIMESTAMP = re.compile(r"[\[(]?(" + TIMESTAMP + r")[\])]?")
+
+
+def timestamp_seconds(value):
+    """Convert a transcript timestamp to seconds; clock times with AM/PM become seconds since midnight."""
+    if not value:
+        return None
+    clock = re.search(r"([AaPp])\.?[Mm]", value)
+    parts = [int(part) for part in re.findall(r"\d+", value)]
+    if clock:
+        hours, minutes = parts[0] % 12, parts[1]
+        if clock.group(1).lower() == "p":
+            hours += 12
+        return hours * 3600 + minutes * 60 + (parts[2] if len(parts) > 2 else 0)
+    if len(parts) == 3:
+        return parts[0] * 3600 + parts[1] * 60 + parts[2]
+    return parts[0] * 60 + parts[1]
+
+
+def name_terms(name):
+    """Return the lower-case full name and its individual parts."""
+    name = (name or "").strip().lower()
+    if not name:
+        return set()
+    return {name} | set(name.split())
+
+
+def resolve_speaker(label, agent_terms, customer_terms):
+    """Map a speaker label to AGENT or CUSTOMER, or None when the label is not a speaker."""
+    label = label.lower()
+    words = set(re.findall(r"[a-z']+", label))
+    if "agent" in words or "representative" in words or "rep" in words or "support" in words:
+        return AGENT
+    if "customer" in words or "caller" in words or "patient" in words:
+        return CUSTOMER
+    if label in agent_terms or words & agent_terms:
+        return AGENT
+    if label in customer_terms or words & customer_terms:
+        return CUSTOMER
+    return None
+
+
+def parse_turns(transcript, agent_name=None, customer_name=None):
+    """Split a transcript into a list of turn dicts."""
+    transcript = transcript or ""
+    agent_terms = name_terms(agent_name)
+    customer_terms = name_terms(customer_name)
+
+    turns = []
+    first_seconds = None
+    previous_seconds = None
+
+    for match in TURN_LINE.finditer(transcript):
+        label = match.group("label").strip()
+        speaker = resolve_speaker(label, agent_terms, customer_terms)
+        if speaker is None:
+            continue
+
+        timestamp = match.group("lead_ts")
+        label_timestamp = LABEL_TIMESTAMP.search(label)
+        if not timestamp and label_timestamp:
+            timestamp = label_timestamp.group(1)
+        if label_timestamp:
+            label = (label[:label_timestamp.start()] + label[label_timestamp.end():]).strip(" -")
+
+        seconds = timestamp_seconds(timestamp)
+        offset_seconds = None
+        if seconds is not None:
+            if first_seconds is None:
+                first_seconds = seconds
+            # A timestamp that goes backwards is not a reliable offset
+            if previous_seconds is None or seconds >= previous_seconds:
+                offset_seconds = seconds - first_seconds
+                previous_seconds = seconds
+
+        turns.append({
+            "turn_no": len(turns) + 1,
+            "speaker": speaker,
+            "speaker_label": label,
+            "char_offset": match.start(),
+            "offset_seconds": offset_seconds,
+            "turn_text": match.group("text").strip(),
+            "_end": match.end(),
+        })
+
+    # Lines without a recognized speaker belong to the turn above them
+    for index, turn in enumerate(turns):
+        next_start = turns[index + 1]["char_offset"] if index + 1 < len(turns) else len(transcript)
+        continuation = transcript[turn.pop("_end"):next_start].strip()
+        if continuation:
+            turn["turn_text"] = (turn["turn_text"] + " " + " ".join(continuation.split())).strip()
+
+    return turns
+
+
+def parse_batch(records):
+    """Parse many transcripts into one columnar turn table (a dict of equal-length lists)."""
+    table = {
+        "conversation_id": [],
+        "turn_no": [],
+        "speaker": [],
+        "speaker_label": [],
+        "char_offset": [],
+        "offset_seconds": [],
+        "turn_text": [],
+    }
+    for record in records:
+        for turn in parse_turns(record.get("transcript"), record.get("agent_name"), record.get("customer_name")):
+            table["conversation_id"].append(record.get("conversation_id"))
+            for column in ("turn_no", "speaker", "speaker_label", "char_offset", "offset_seconds", "turn_text"):
+                table[column].append(turn[column])
+    return table
+
+
+def conversation_features(turns):
+    """Compute turn counts, talk ratio, customer-last-word and response gaps for one conversation."""
+    agent_words = sum(len(turn["turn_text"].split()) for turn in turns if turn["speaker"] == AGENT)
+    customer_words = sum(len(turn["turn_text"].split()) for turn in turns if turn["speaker"] == CUSTOMER)
+
+    # Seconds between a customer turn and the agent turn that answers it
+    gaps = []
+    for current, following in zip(turns, turns[1:]):
+        if current["speaker"] == CUSTOMER and following["speaker"] == AGENT:
+            if current["offset_seconds"] is not None and following["offset_seconds"] is not None:
+                gaps.append(following["offset_seconds"] - current["offset_seconds"])
+
+    return {
+        "turn_count": len(turns),
+        "agent_turns": sum(1 for turn in turns if turn["speaker"] == AGENT),
+        "customer_turns": sum(1 for turn in turns if turn["speaker"] == CUSTOMER),
+        "agent_words": agent_words,
+        "customer_words": customer_words,
+        "agent_talk_ratio": round(agent_words / (agent_words + customer_words), 3) if agent_words + customer_words else None,
+        "customer_last_word": turns[-1]["speaker"] == CUSTOMER if turns else None,
+        "has_timestamps": any(turn["offset_seconds"] is not None for turn in turns),
+        "avg_response_gap_seconds": round(mean(gaps), 1) if gaps else None,
+        "max_response_gap_seconds": max(gaps) if gaps else None,
+    }
+
+
+def turns_text(turns, speakers=(AGENT, CUSTOMER)):
+    """Rebuild a compact transcript from the turns of the given speakers (drops timestamps and formatting)."""
+    return "\n".join(
+        f"{turn['speaker'].title()}: {turn['turn_text']}" for turn in turns if turn["speaker"] in speakers
+    )
+
+
+def udf_turns(transcript, agent_name=None, customer_name=None):
+    """Handler of the TRANSCRIPT_TURNS UDF; returns an ARRAY of turn objects."""
+    return parse_turns(transcript, agent_name, customer_name)
+
+
+def main(paths):
+    records = read_transcripts(paths)
+    table = parse_batch(records)
+    print(f"Transcripts: {len(records)}")
+    print(f"Turns:       {len(table['turn_no'])}")
+
+    features = [
+        conversation_features(parse_turns(record.get("transcript"), record.get("agent_name"), record.get("customer_name")))
+        for record in records
+    ]
+    parsed = [feature for feature in features if feature["turn_count"]]
+    if not parsed:
+        return
+
+    print(f"Parsed:      {len(parsed)} transcripts with at least one turn")
+    print(f"Avg turns:   {mean(feature['turn_count'] for feature in parsed):.1f}")
+    ratios = [feature["agent_talk_ratio"] for feature in parsed if feature["agent_talk_ratio"] is not None]
+    if ratios:
+        print(f"Avg agent talk ratio: {mean(ratios):.2f}")
+    print(f"Customer has the last word: {sum(1 for feature in parsed if feature['customer_last_word'])}")
+    gaps = [feature["avg_response_gap_seconds"] for feature in parsed if feature["avg_response_gap_seconds"] is not None]
+    if gaps:
+        print(f"Avg response gap: {mean(gaps):.1f} seconds")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    main(sys.argv[1:])
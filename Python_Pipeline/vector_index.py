@@ -0,0 +1,345 @@
+"""
+Approximate nearest-neighbour search over transcript embeddings with numpy, for the "similar calls" panel.
+
+VectorIndex is an inverted-file (IVF) index of unit-length vectors:
+
+- the vectors are partitioned into lists by mini-batch k-means (minibatch_kmeans); each vector is stored in the list
+  of its nearest centroid
+- a query scores the centroids, then only the vectors of the n_probe nearest lists, with one matrix-vector product per
+  list, so a lookup reads a few thousand vectors instead of all of them
+- similarity is the cosine similarity (the dot product of unit vectors), as VECTOR_COSINE_SIMILARITY in Snowflake
+- vectors are stored as float16 by default, which halves the memory (1M 768-dimension vectors take 1.5 GB) and moves
+  the scores by less than 0.001
+
+add() inserts vectors into the lists of their nearest centroids without retraining; a conversation id that is already
+in the index is replaced. Until it holds MIN_TRAIN vectors the index is a single list searched exhaustively. It is
+(re)trained when it grows past MIN_TRAIN and past RETRAIN_FACTOR times the size its lists were sized for (sqrt(n)
+lists for n vectors), so inserts stay cheap while the lists stay short. The index is saved with numpy.savez.
+
+Building an index embeds the transcripts with cortex_stub.CortexStub.embed_text_768 (a deterministic hashed bag of
+words, not a semantic model), saves it and prints the most similar calls of a few transcripts. The benchmark builds an
+index of synthetic clustered vectors and reports the build time, the p50/p95 top-k lookup latency and the recall
+against an exact search. Requires numpy.
+
+Usage:
+    python vector_index.py <index file> <json file or directory> [...]
+    python vector_index.py --benchmark [number of vectors] [dimensions]
+"""
+
+import resource
+import sys
+import time
+
+import numpy as np
+
+EMBEDDING_DIM = 768
+TOP_K = 10
+# Lists scored per query; more lists raise the recall and the latency
+N_PROBE = 16
+MIN_TRAIN = 10_000
+RETRAIN_FACTOR = 4
+# Vectors per k-means mini-batch, and training sample per list
+BATCH_SIZE = 4096
+SAMPLE_PER_LIST = 64
+
+
+def normalize(vectors):
+    """Return float32 unit-length rows (zero rows stay zero)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def default_lists(n):
+    """Number of lists for n vectors: about sqrt(n), so lists and centroids cost the same to score."""
+    return max(1, int(round(n ** 0.5)))
+
+
+def nearest_centroids(vectors, centroids, chunk_size=16384):
+    """Return the index of the nearest centroid of each unit vector and its cosine similarity."""
+    nearest = np.empty(len(vectors), dtype=np.int64)
+    scores = np.empty(len(vectors), dtype=np.float32)
+    for start in range(0, len(vectors), chunk_size):
+        similarity = np.asarray(vectors[start:start + chunk_size], dtype=np.float32) @ centroids.T
+        nearest[start:start + chunk_size] = similarity.argmax(axis=1)
+        scores[start:start + chunk_size] = similarity[np.arange(len(similarity)), nearest[start:start + chunk_size]]
+    return nearest, scores
+
+
+def minibatch_kmeans(vectors, k, batch_size=BATCH_SIZE, iterations=100, seed=0):
+    """Spherical mini-batch k-means (Sculley, 2010) over unit vectors; returns k unit-length centroids.
+
+    Each iteration assigns a random batch to the nearest centroids and moves each centroid towards the mean of its
+    batch vectors with a learning rate of (batch vectors / all vectors assigned so far), so centroids settle as they
+    accumulate vectors."""
+    vectors = np.asarray(vectors)
+    rng = np.random.default_rng(seed)
+    k = min(k, len(vectors))
+    centroids = normalize(vectors[rng.choice(len(vectors), k, replace=False)])
+    counts = np.zeros(k)
+    for _ in range(iterations):
+        batch = normalize(vectors[rng.integers(0, len(vectors), min(batch_size, len(vectors)))])
+        nearest = (batch @ centroids.T).argmax(axis=1)
+        order = np.argsort(nearest, kind="stable")
+        hit, starts, batch_counts = np.unique(nearest[order], return_index=True, return_counts=True)
+        means = np.add.reduceat(batch[order], starts, axis=0) / batch_counts[:, None]
+        counts[hit] += batch_counts
+        rate = (batch_counts / counts[hit])[:, None]
+        centroids[hit] = normalize(centroids[hit] + rate * (means - centroids[hit]))
+    return centroids
+
+
+class VectorList:
+    """The ids and vectors of one inverted list, in arrays that grow by half when full."""
+
+    def __init__(self, dim, dtype, capacity=0):
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.vectors = np.empty((capacity, dim), dtype=dtype)
+        self.count = 0
+
+    def extend(self, ids, vectors):
+        """Append rows; returns the position of the first one."""
+        start = self.count
+        needed = start + len(ids)
+        if needed > len(self.ids):
+            capacity = max(needed, int(len(self.ids) * 1.5), 16)
+            grown_ids = np.empty(capacity, dtype=self.ids.dtype)
+            grown_vectors = np.empty((capacity, self.vectors.shape[1]), dtype=self.vectors.dtype)
+            grown_ids[:start] = self.ids[:start]
+            grown_vectors[:start] = self.vectors[:start]
+            self.ids, self.vectors = grown_ids, grown_vectors
+        self.ids[start:needed] = ids
+        self.vectors[start:needed] = vectors
+        self.count = needed
+        return start
+
+
+class VectorIndex:
+    """Inverted-file index of unit-length vectors keyed by conversation id, with incremental inserts."""
+
+    def __init__(self, dim=EMBEDDING_DIM, n_probe=N_PROBE, dtype=np.float16):
+        self.dim = dim
+        self.n_probe = n_probe
+        self.dtype = np.dtype(dtype)
+        self.centroids = np.zeros((1, dim), dtype=np.float32)
+        self.lists = [VectorList(dim, self.dtype)]
+        # conversation id -> (list number, position in the list)
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, conversation_id):
+        return int(conversation_id) in self.positions
+
+    def vectors(self):
+        """Return all ids and vectors (float32) in list order."""
+        ids = np.concatenate([vector_list.ids[:vector_list.count] for vector_list in self.lists])
+        vectors = np.concatenate([vector_list.vectors[:vector_list.count] for vector_list in self.lists])
+        return ids, vectors.astype(np.float32)
+
+    def vector(self, conversation_id):
+        """Return the stored vector of a conversation (float32), or None."""
+        position = self.positions.get(int(conversation_id))
+        if position is None:
+            return None
+        list_no, row = position
+        return self.lists[list_no].vectors[row].astype(np.float32)
+
+    def train(self, sample=None, n_lists=None, seed=0):
+        """Partition the index into n_lists lists (default sqrt of its size) with k-means over sample (default a
+        sample of the index) and move the stored vectors into the new lists."""
+        ids, vectors = self.vectors()
+        if sample is None:
+            n_lists = n_lists or default_lists(len(ids))
+            rng = np.random.default_rng(seed)
+            sample = vectors[rng.choice(len(vectors), min(len(vectors), n_lists * SAMPLE_PER_LIST), replace=False)]
+        n_lists = n_lists or default_lists(max(len(ids), len(sample)))
+        self.centroids = minibatch_kmeans(normalize(sample), n_lists, seed=seed)
+        self.lists = [VectorList(self.dim, self.dtype) for _ in range(len(self.centroids))]
+        self.positions = {}
+        if len(ids):
+            self._insert(ids, vectors)
+
+    def add(self, ids, vectors):
+        """Insert or replace vectors; returns the number added. Trains the index when it has outgrown its lists."""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        vectors = normalize(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim))
+        if not len(ids):
+            return 0
+        # Keep the last vector of an id repeated within the batch
+        _, last = np.unique(ids[::-1], return_index=True)
+        keep = np.sort(len(ids) - 1 - last)
+        ids, vectors = ids[keep], vectors[keep]
+        for conversation_id in ids.tolist():
+            if conversation_id in self.positions:
+                self.remove(conversation_id)
+        self._insert(ids, vectors)
+
+        if len(self) >= MIN_TRAIN and len(self) > RETRAIN_FACTOR * len(self.lists) ** 2:
+            self.train()
+        return len(ids)
+
+    def _insert(self, ids, vectors):
+        if len(self.lists) > 1:
+            nearest, _ = nearest_centroids(vectors, self.centroids)
+        else:
+            nearest = np.zeros(len(ids), dtype=np.int64)
+        order = np.argsort(nearest, kind="stable")
+        list_numbers, starts = np.unique(nearest[order], return_index=True)
+        for list_no, rows in zip(list_numbers.tolist(), np.split(order, starts[1:])):
+            start = self.lists[list_no].extend(ids[rows], vectors[rows])
+            for offset, conversation_id in enumerate(ids[rows].tolist()):
+                self.positions[conversation_id] = (list_no, start + offset)
+
+    def remove(self, conversation_id):
+        """Remove a vector; the last row of its list takes its place."""
+        list_no, row = self.positions.pop(int(conversation_id))
+        vector_list = self.lists[list_no]
+        last = vector_list.count - 1
+        if row != last:
+            vector_list.ids[row] = vector_list.ids[last]
+            vector_list.vectors[row] = vector_list.vectors[last]
+            self.positions[int(vector_list.ids[row])] = (list_no, row)
+        vector_list.count = last
+
+    def search(self, query, k=TOP_K, n_probe=None, exclude=None):
+        """Return up to k (conversation id, cosine similarity) pairs, most similar first, leaving out exclude."""
+        query = normalize(np.asarray(query, dtype=np.float32).reshape(-1))
+        n_probe = min(n_probe or self.n_probe, len(self.lists))
+        if n_probe < len(self.lists):
+            probe = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+        else:
+            probe = range(len(self.lists))
+
+        candidate_ids, candidate_scores = [], []
+        for list_no in probe:
+            vector_list = self.lists[list_no]
+            if vector_list.count:
+                candidate_ids.append(vector_list.ids[:vector_list.count])
+                candidate_scores.append(vector_list.vectors[:vector_list.count] @ query)
+        if not candidate_ids:
+            return []
+        ids = np.concatenate(candidate_ids)
+        scores = np.concatenate(candidate_scores).astype(np.float32)
+        if exclude is not None:
+            scores[ids == int(exclude)] = -np.inf
+
+        k = min(k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top if scores[i] > -np.inf]
+
+    def save(self, path):
+        ids, vectors = self.vectors()
+        # Through a file object, so numpy does not add .npz to the path
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                ids=ids,
+                vectors=vectors.astype(self.dtype),
+                sizes=np.array([vector_list.count for vector_list in self.lists]),
+                n_probe=self.n_probe,
+            )
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        vectors = data["vectors"]
+        index = cls(dim=vectors.shape[1], n_probe=int(data["n_probe"]), dtype=vectors.dtype)
+        index.centroids = data["centroids"]
+        index.lists = []
+        ids = data["ids"]
+        start = 0
+        for list_no, size in enumerate(data["sizes"].tolist()):
+            vector_list = VectorList(index.dim, index.dtype)
+            vector_list.extend(ids[start:start + size], vectors[start:start + size])
+            for offset, conversation_id in enumerate(ids[start:start + size].tolist()):
+                index.positions[conversation_id] = (list_no, offset)
+            index.lists.append(vector_list)
+            start += size
+        return index
+
+
+def synthetic_vectors(n, dim, topics=2000, chunk_size=50_000, seed=0, first_chunk=0):
+    """Yield (ids, vectors) chunks of unit vectors around random topic directions, at a cosine similarity of about
+    0.8 to their topic; the same seed and chunk numbers yield the same chunks."""
+    centers = normalize(np.random.default_rng(seed).standard_normal((topics, dim)))
+    for chunk_no, start in enumerate(range(0, n, chunk_size), first_chunk):
+        rng = np.random.default_rng([seed, chunk_no])
+        size = min(chunk_size, n - start)
+        noise = rng.standard_normal((size, dim), dtype=np.float32) * (0.75 / dim ** 0.5)
+        yield np.arange(start, start + size), normalize(centers[rng.integers(0, topics, size)] + noise)
+
+
+def benchmark(n, dim, queries=200, k=TOP_K):
+    index = VectorIndex(dim)
+    start = time.perf_counter()
+    for ids, vectors in synthetic_vectors(n, dim):
+        if not len(index):
+            # Size the lists for the full index up front, as a retrain would
+            index.train(vectors, n_lists=default_lists(n))
+        index.add(ids, vectors)
+    build_seconds = time.perf_counter() - start
+
+    # New calls about the same topics as the indexed ones
+    query_vectors = next(synthetic_vectors(queries, dim, first_chunk=n))[1]
+    latencies, results = [], []
+    for query in query_vectors:
+        start = time.perf_counter()
+        results.append(index.search(query, k))
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    # Exact top-k by scoring every vector against every query, one chunk at a time
+    best_ids = np.full((queries, k), -1)
+    best_scores = np.full((queries, k), -np.inf, dtype=np.float32)
+    for ids, vectors in synthetic_vectors(n, dim):
+        scores = np.concatenate([best_scores, query_vectors @ vectors.T], axis=1)
+        all_ids = np.concatenate([best_ids, np.broadcast_to(ids, (queries, len(ids)))], axis=1)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_ids = np.take_along_axis(all_ids, top, axis=1)
+    recall = np.mean([len({i for i, _ in found} & set(exact.tolist())) / k for found, exact in zip(results, best_ids)])
+
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Indexed {len(index)} vectors of {dim} dimensions in {len(index.lists)} lists in {build_seconds:.1f} s ({n / build_seconds:,.0f} vectors/s)")
+    print(f"Top-{k} lookups probing {index.n_probe} lists: p50 {latencies[len(latencies) // 2]:.2f} ms, p95 {latencies[int(0.95 * (len(latencies) - 1))]:.2f} ms, max {latencies[-1]:.2f} ms")
+    print(f"Recall@{k} against an exact search over {queries} queries: {recall:.3f}")
+    print(f"Peak memory: {peak_mb:.0f} MB")
+
+
+def main(index_path, paths):
+    from cortex_stub import CortexStub
+    from transcript_io import read_transcripts
+
+    records = {int(record["conversation_id"]): record for record in read_transcripts(paths) if record.get("conversation_id") is not None}
+    stub = CortexStub(realtime=False)
+    ids = list(records)
+    vectors = np.array([stub.embed_text_768("snowflake-arctic-embed-m-v1.5", records[i].get("transcript")) for i in ids], dtype=np.float32)
+
+    try:
+        index = VectorIndex.load(index_path)
+    except FileNotFoundError:
+        index = VectorIndex()
+    new = [n for n, conversation_id in enumerate(ids) if conversation_id not in index]
+    index.add(np.array(ids)[new], vectors[new])
+    index.save(index_path)
+    print(f"Added {len(new)} transcripts to {index_path}; {len(index)} vectors in {len(index.lists)} lists")
+
+    for conversation_id in ids[:3]:
+        print()
+        print(f"  {conversation_id}: {(records[conversation_id].get('transcript') or '').splitlines()[1:2]}")
+        for similar_id, score in index.search(index.vector(conversation_id), 3, exclude=conversation_id):
+            print(f"    {score:.3f}  {similar_id}: {(records[similar_id].get('transcript') or '').splitlines()[1:2]}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "--benchmark":
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 1_000_000, int(sys.argv[3]) if len(sys.argv) > 3 else EMBEDDING_DIM)
+    elif len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    else:
+        main(sys.argv[1], sys.argv[2:])
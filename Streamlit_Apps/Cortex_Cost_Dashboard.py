@@ -0,0 +1,244 @@
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+from snowflake.snowpark.context import get_active_session
+
+# Set page config - must be the first Streamlit command
+st.set_page_config(
+    page_title="Cortex Cost Dashboard",
+    page_icon="💰",
+    layout="wide",
+    initial_sidebar_state="expanded"
+)
+
+# Page title and description
+st.title("Cortex Cost Dashboard")
+st.markdown("Cortex tokens and estimated credits of the transcript enrichment per transcript, agent and refresh")
+
+# Initialize Snowflake session
+try:
+    session = get_active_session()
+except Exception as e:
+    st.error(f"Failed to connect to Snowflake: {e}")
+    st.stop()
+
+# Function to load the token accounting rows recorded by SYNC_TRANSCRIPT_ANALYSIS_RESULTS_TBL
+@st.cache_data(ttl=600)
+def load_token_costs():
+    try:
+        df = session.sql("""
+            SELECT *
+            FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.CORTEX_TOKEN_COSTS
+        """).to_pandas()
+    except Exception as e:
+        st.error(f"Error loading CORTEX_TOKEN_COSTS: {e}")
+        st.info("Run Analytics_Setup/Cortex_Analysis.sql to create the token accounting table.")
+        return pd.DataFrame()
+
+    df.columns = [col.lower() for col in df.columns]
+    df['recorded_at'] = pd.to_datetime(df['recorded_at'])
+    df['start_time'] = pd.to_datetime(df['start_time'])
+    df['model'] = df['model'].fillna('-')
+    df['function_model'] = df.apply(
+        lambda row: row['function_name'] if row['model'] == '-' else f"{row['function_name']} ({row['model']})",
+        axis=1
+    )
+    df['estimated_credits'] = pd.to_numeric(df['estimated_credits'], errors='coerce').fillna(0)
+    return df
+
+# Function to load the billed Cortex credits of the dynamic table refreshes (requires access to ACCOUNT_USAGE)
+@st.cache_data(ttl=600)
+def load_refresh_credits():
+    try:
+        df = session.sql("""
+            SELECT
+                q.QUERY_ID,
+                q.START_TIME,
+                c.FUNCTION_NAME,
+                c.MODEL_NAME,
+                SUM(c.TOKENS) AS TOKENS,
+                SUM(c.TOKEN_CREDITS) AS TOKEN_CREDITS
+            FROM SNOWFLAKE.ACCOUNT_USAGE.CORTEX_FUNCTIONS_QUERY_USAGE_HISTORY c
+            JOIN SNOWFLAKE.ACCOUNT_USAGE.QUERY_HISTORY q ON q.QUERY_ID = c.QUERY_ID
+            WHERE q.DATABASE_NAME = 'MED_DEVICE_TRANSCRIPTS'
+                AND q.QUERY_TYPE = 'REFRESH_DYNAMIC_TABLE'
+                AND q.START_TIME >= DATEADD('day', -30, CURRENT_TIMESTAMP())
+            GROUP BY 1, 2, 3, 4
+        """).to_pandas()
+    except Exception:
+        return pd.DataFrame()
+
+    df.columns = [col.lower() for col in df.columns]
+    df['start_time'] = pd.to_datetime(df['start_time'])
+    return df
+
+df = load_token_costs()
+
+if df.empty:
+    st.warning("No token usage has been recorded yet.")
+    st.stop()
+
+# Sidebar filters
+st.sidebar.header("Filters")
+min_date = df['recorded_at'].min().date()
+max_date = df['recorded_at'].max().date()
+date_range = st.sidebar.date_input(
+    "Recorded Date Range",
+    value=(min_date, max_date),
+    min_value=min_date,
+    max_value=max_date
+)
+functions = st.sidebar.multiselect(
+    "Functions",
+    options=sorted(df['function_name'].unique()),
+    default=sorted(df['function_name'].unique())
+)
+
+df_filtered = df[df['function_name'].isin(functions)]
+if isinstance(date_range, tuple) and len(date_range) == 2:
+    df_filtered = df_filtered[
+        (df_filtered['recorded_at'].dt.date >= date_range[0]) &
+        (df_filtered['recorded_at'].dt.date <= date_range[1])
+    ]
+
+if df_filtered.empty:
+    st.warning("No token usage with the current filters. Please adjust your filters.")
+    st.stop()
+
+st.caption(
+    "Estimated credits are token counts multiplied by the rates in CORTEX_TOKEN_RATES. "
+    "COMPLETE tokens are reported by COMPLETE itself; the other functions are counted with COUNT_TOKENS."
+)
+
+tab1, tab2, tab3 = st.tabs(["Per Transcript", "Per Agent", "Per Refresh"])
+
+# Tab 1: cost per transcript and function
+with tab1:
+    per_transcript = df_filtered.groupby('conversation_id').agg({
+        'estimated_credits': 'sum',
+        'total_tokens': 'sum'
+    }).reset_index()
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Transcripts", f"{len(per_transcript):,}")
+    col2.metric("Estimated Credits", f"{df_filtered['estimated_credits'].sum():.4f}")
+    col3.metric("Credits per Transcript", f"{per_transcript['estimated_credits'].mean():.6f}")
+    col4.metric("Tokens per Transcript", f"{per_transcript['total_tokens'].mean():,.0f}")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Credits by Function and Model")
+        by_function = df_filtered.groupby('function_model').agg({
+            'estimated_credits': 'sum',
+            'input_tokens': 'sum',
+            'output_tokens': 'sum'
+        }).reset_index().sort_values('estimated_credits')
+        fig = px.bar(
+            by_function,
+            x='estimated_credits',
+            y='function_model',
+            orientation='h',
+            labels={'estimated_credits': 'Estimated Credits', 'function_model': 'Function'},
+            height=max(350, len(by_function) * 40)
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+    with col2:
+        st.subheader("Credits per Transcript")
+        fig = px.histogram(
+            per_transcript,
+            x='estimated_credits',
+            nbins=30,
+            labels={'estimated_credits': 'Estimated Credits per Transcript'}
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+    with st.expander("See Most Expensive Transcripts"):
+        st.dataframe(
+            per_transcript.sort_values('estimated_credits', ascending=False).head(20),
+            use_container_width=True
+        )
+
+# Tab 2: cost per agent
+with tab2:
+    st.subheader("Credits per Transcript by Agent")
+    per_agent = df_filtered.dropna(subset=['agent_name']).groupby('agent_name').agg({
+        'conversation_id': 'nunique',
+        'estimated_credits': 'sum',
+        'total_tokens': 'sum'
+    }).reset_index()
+    per_agent['credits_per_transcript'] = per_agent['estimated_credits'] / per_agent['conversation_id']
+    per_agent.rename(columns={
+        'agent_name': 'Agent',
+        'conversation_id': 'Transcripts',
+        'estimated_credits': 'Estimated Credits',
+        'total_tokens': 'Tokens',
+        'credits_per_transcript': 'Credits per Transcript'
+    }, inplace=True)
+
+    fig = px.bar(
+        per_agent.sort_values('Credits per Transcript'),
+        x='Credits per Transcript',
+        y='Agent',
+        orientation='h',
+        color='Transcripts',
+        color_continuous_scale='Blues',
+        height=max(350, len(per_agent) * 30)
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    with st.expander("See Agent Cost Table"):
+        st.dataframe(per_agent, use_container_width=True)
+
+# Tab 3: cost per refresh and trends
+with tab3:
+    st.subheader("Credits per Refresh")
+    st.markdown("Each sync of the search base table records the conversations enriched by the refreshes since the previous sync.")
+    per_refresh = df_filtered.groupby('recorded_at').agg({
+        'conversation_id': 'nunique',
+        'estimated_credits': 'sum'
+    }).reset_index()
+    per_refresh['credits_per_transcript'] = per_refresh['estimated_credits'] / per_refresh['conversation_id']
+    fig = px.line(
+        per_refresh,
+        x='recorded_at',
+        y='estimated_credits',
+        markers=True,
+        hover_data=['conversation_id', 'credits_per_transcript'],
+        labels={'recorded_at': 'Refresh', 'estimated_credits': 'Estimated Credits', 'conversation_id': 'Transcripts'}
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.subheader("Daily Credits per Transcript by Function")
+    daily = df_filtered.assign(day=df_filtered['recorded_at'].dt.floor('D'))
+    daily_transcripts = daily.groupby('day')['conversation_id'].nunique().rename('transcripts')
+    daily_by_function = daily.groupby(['day', 'function_model'])['estimated_credits'].sum().reset_index()
+    daily_by_function = daily_by_function.merge(daily_transcripts, left_on='day', right_index=True)
+    daily_by_function['credits_per_transcript'] = daily_by_function['estimated_credits'] / daily_by_function['transcripts']
+    fig = px.line(
+        daily_by_function,
+        x='day',
+        y='credits_per_transcript',
+        color='function_model',
+        markers=True,
+        labels={'day': 'Day', 'credits_per_transcript': 'Credits per Transcript', 'function_model': 'Function'}
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    # Billed credits from ACCOUNT_USAGE, to check the estimates
+    with st.expander("Billed Cortex Credits of Dynamic Table Refreshes (ACCOUNT_USAGE, last 30 days)"):
+        refresh_credits = load_refresh_credits()
+        if refresh_credits.empty:
+            st.info("ACCOUNT_USAGE is not accessible with the current role, or there are no refreshes yet.")
+        else:
+            billed = refresh_credits.assign(day=refresh_credits['start_time'].dt.floor('D'))
+            billed = billed.groupby(['day', 'function_name'])['token_credits'].sum().reset_index()
+            fig = px.line(
+                billed,
+                x='day',
+                y='token_credits',
+                color='function_name',
+                markers=True,
+                labels={'day': 'Day', 'token_credits': 'Billed Credits', 'function_name': 'Function'}
+            )
+            st.plotly_chart(fig, use_container_width=True)
@@ -1,9 +1,20 @@
+import threading
+import time
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
 from datetime import datetime, timedelta
 from snowflake.snowpark.context import get_active_session
 from statistics import mean, median, mode
+from shared_frames import caller_frame, read_only_frame
+
+# vector_index.py (from Python_Pipeline) is uploaded next to the app for the "Similar Calls" panel, which is hidden
+# when the file is missing
+try:
+    from vector_index import VectorIndex
+except ImportError:
+    VectorIndex = None
 
 # Set page config - must be the first Streamlit command
 st.set_page_config(
@@ -35,94 +46,302 @@ with st.sidebar.expander("Connectivity Status"):
         st.error(f"Failed to connect to Snowflake: {e}")
         st.stop()
 
-# Function to load data with error handling
+# Lazy enrichment mode (Analytics_Setup/Lazy_Enrichment.sql): read TRANSCRIPT_ANALYSIS_RESULTS_LAZY, whose summary,
+# resolution and rating are computed when a record is first opened in the Record Viewer
+LAZY_ENRICHMENT = False
+RESULTS_TABLE = "TRANSCRIPT_ANALYSIS_RESULTS_LAZY" if LAZY_ENRICHMENT else "TRANSCRIPT_ANALYSIS_RESULTS_FINAL"
+
+# Number of days shown by default; the results tables are clustered on the call date, so a short range only scans
+# the micro-partitions of those days
+DEFAULT_DAYS = 7
+
+# Function to get the first and last call date, so the date picker can be shown before the data is loaded
 @st.cache_data(ttl=600)
-def load_data():
+def load_date_bounds():
     try:
-        # Try different database specifications in case the fully qualified name is needed
-        queries = [
-            # Option 1: Unqualified table name (relies on current session context)
-            """
-            SELECT * 
-            FROM TRANSCRIPT_ANALYSIS_RESULTS_FINAL 
-            ORDER BY START_TIME DESC
-            """,
-            
-            # Option 2: With database and schema qualification - adjust if needed
-            """
-            SELECT * 
-            FROM MED_DEVICE_TRANSCRIPTS.PUBLIC.TRANSCRIPT_ANALYSIS_RESULTS_FINAL 
-            ORDER BY START_TIME DESC
-            """,
-            
-            # Option 3: Using quoted identifiers
-            """
-            SELECT *
-            FROM "TRANSCRIPT_ANALYSIS_RESULTS_FINAL"
-            ORDER BY "START_TIME" DESC
-            """
-        ]
-        
-        # Try each query until one works
-        df = pd.DataFrame()
-        last_error = None
-        
-        for i, query in enumerate(queries):
-            try:
-                st.sidebar.expander(f"SQL Query Option {i+1}").write(query)
-                df = session.sql(query).to_pandas()
-                if not df.empty:
-                    st.sidebar.success(f"Query option {i+1} succeeded!")
-                    break
-            except Exception as e:
-                last_error = str(e)
-                continue
+        bounds = session.sql(f"SELECT MIN(START_TIME)::DATE, MAX(START_TIME)::DATE FROM {RESULTS_TABLE}").collect()
+        if bounds and bounds[0][0] is not None:
+            return bounds[0][0], bounds[0][1]
+    except Exception:
+        pass
+    return None, None
+
+# Calculate the service index for each record
+def calculate_service_index(row):
+    try:
+        # Resolution component (60%)
+        resolution_score = 0
+        if row.get('resolution') == 'Resolved':
+            resolution_score = 10
+        elif row.get('resolution') == 'Partial':
+            resolution_score = 5
         
-        if df.empty and last_error:
-            st.warning(f"All queries failed. Last error: {last_error}")
+        # Service rating component (40%)
+        service_rating = row.get('service_rating_numeric', 0) 
+        if pd.isna(service_rating):
+            service_rating = 0
             
-            # Try to list tables to help debugging
-            try:
-                tables = session.sql("SHOW TABLES").collect()
-                st.sidebar.expander("Available Tables").write(pd.DataFrame(tables))
-            except:
-                st.sidebar.warning("Could not list available tables")
-                
-            return pd.DataFrame()
-        
-        # Debug information
-        if df.empty:
-            st.warning("No data was returned from the query.")
-            return pd.DataFrame()
-        
-        # Ensure column names are lowercase for consistent access
-        df.columns = [col.lower() for col in df.columns]
-        
-        # Convert date columns to datetime
-        if 'start_time' in df.columns:
-            df['start_time'] = pd.to_datetime(df['start_time'])
-        if 'end_time' in df.columns:
-            df['end_time'] = pd.to_datetime(df['end_time'])
-        
-        # Calculate duration in minutes
-        if 'start_time' in df.columns and 'end_time' in df.columns:
-            df['duration_minutes'] = (df['end_time'] - df['start_time']).dt.total_seconds() / 60
+        # Combine scores with weights
+        service_index = (0.2 * resolution_score) + (0.8 * service_rating)
+        return round(service_index, 1)
+    except:
+        return 0
+
+# Function to load data
+# With a date range, the filter is pushed down as a START_TIME BETWEEN predicate instead of being applied in pandas.
+# st.cache_data would pickle the frame and unpickle a new copy of it (transcripts included) on every rerun; the frame
+# is cached as a shared, read-only resource instead (see shared_frames.py), and load_data hands each rerun a shallow
+# copy of it, so a rerun gets it without copying the data
+# Errors are raised rather than returned as an empty frame, so a failed query is not cached for every session
+@st.cache_resource(ttl=600, max_entries=8)
+def load_shared_data(start_date=None, end_date=None):
+    date_filter = ""
+    params = None
+    if start_date is not None and end_date is not None:
+        date_filter = "WHERE START_TIME BETWEEN ? AND ?"
+        # BETWEEN is inclusive, so the range ends at the last microsecond of end_date
+        params = [
+            datetime.combine(start_date, datetime.min.time()),
+            datetime.combine(end_date, datetime.min.time()) + timedelta(days=1) - timedelta(microseconds=1),
+        ]
+    
+    # Try different database specifications in case the fully qualified name is needed
+    queries = [
+        # Option 1: Unqualified table name (relies on current session context)
+        f"""
+        SELECT * 
+        FROM {RESULTS_TABLE} 
+        {date_filter}
+        ORDER BY START_TIME DESC
+        """,
         
-        # Convert service_rating to numeric
-        if 'service_rating' in df.columns:
-            df['service_rating_numeric'] = pd.to_numeric(df['service_rating'], errors='coerce')
+        # Option 2: With database and schema qualification - adjust if needed
+        f"""
+        SELECT * 
+        FROM MED_DEVICE_TRANSCRIPTS.PUBLIC.{RESULTS_TABLE} 
+        {date_filter}
+        ORDER BY START_TIME DESC
+        """,
         
-        return df
+        # Option 3: Using quoted identifiers
+        f"""
+        SELECT *
+        FROM "{RESULTS_TABLE}"
+        {date_filter.replace("START_TIME", '"START_TIME"')}
+        ORDER BY "START_TIME" DESC
+        """
+    ]
+    
+    # Try each query until one works
+    df = pd.DataFrame()
+    last_error = None
+    succeeded = False
+    
+    for i, query in enumerate(queries):
+        try:
+            st.sidebar.expander(f"SQL Query Option {i+1}").write(query)
+            df = session.sql(query, params=params).to_pandas()
+            succeeded = True
+            if not df.empty:
+                st.sidebar.success(f"Query option {i+1} succeeded!")
+                break
+        except Exception as e:
+            last_error = str(e)
+            continue
+    
+    if not succeeded:
+        raise RuntimeError(f"All queries failed. Last error: {last_error}")
+    
+    # An empty result of a successful query is cached like any other result
+    if df.empty:
+        return pd.DataFrame()
+    
+    # Ensure column names are lowercase for consistent access
+    df.columns = [col.lower() for col in df.columns]
     
+    # Convert date columns to datetime
+    if 'start_time' in df.columns:
+        df['start_time'] = pd.to_datetime(df['start_time'])
+    if 'end_time' in df.columns:
+        df['end_time'] = pd.to_datetime(df['end_time'])
+    
+    # Calculate duration in minutes
+    if 'start_time' in df.columns and 'end_time' in df.columns:
+        df['duration_minutes'] = (df['end_time'] - df['start_time']).dt.total_seconds() / 60
+    
+    # Convert service_rating to numeric
+    if 'service_rating' in df.columns:
+        df['service_rating_numeric'] = pd.to_numeric(df['service_rating'], errors='coerce')
+    
+    # The service index only depends on the record, so it is computed once here rather than on every rerun
+    if 'resolution' in df.columns:
+        df['service_index'] = df.apply(calculate_service_index, axis=1)
+    
+    return read_only_frame(df)
+
+# Function to load data with error handling; a failure is reported here and retried on the next rerun
+def load_data(start_date=None, end_date=None):
+    try:
+        df = caller_frame(load_shared_data(start_date, end_date))
     except Exception as e:
         st.error(f"Error loading data: {e}")
         import traceback
         st.code(traceback.format_exc())
-        # Return empty DataFrame with expected columns
+        
+        # Try to list tables to help debugging
+        try:
+            tables = session.sql("SHOW TABLES").collect()
+            st.sidebar.expander("Available Tables").write(pd.DataFrame(tables))
+        except:
+            st.sidebar.warning("Could not list available tables")
         return pd.DataFrame()
+    
+    if df.empty:
+        st.warning("No data was returned from the query.")
+    return df
+
+# Function to load the conversation features computed from the speaker turns (no LLM calls)
+@st.cache_data(ttl=600)
+def load_conversation_features():
+    try:
+        features = session.sql("""
+            SELECT *
+            FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.CONVERSATION_FEATURES
+        """).to_pandas()
+        features.columns = [col.lower() for col in features.columns]
+        return features
+    except Exception:
+        # The table is created by Create_Dynamic_Tables.sql; the dashboard works without it
+        return pd.DataFrame()
+
+# Function to load the issue cluster label of each call (Issue_Clusters.sql), so top issues are a plain group by
+@st.cache_data(ttl=600)
+def load_issue_labels():
+    try:
+        issues = session.sql("""
+            SELECT conversation_id, issue_label
+            FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ISSUES
+        """).to_pandas()
+        issues.columns = [col.lower() for col in issues.columns]
+        return issues
+    except Exception:
+        # The clusters are written by Python_Pipeline/issue_clusters.py; the dashboard works without them
+        return pd.DataFrame()
+
+# Function to load the rolling agent and device category summaries (Rolling_Summaries.sql), kept up to date by a task
+@st.cache_data(ttl=600)
+def load_rolling_summaries():
+    try:
+        summaries = session.sql("""
+            SELECT summary_type, summary_key, window_days, summary, calls_summarized, first_call_time, last_call_time, updated_at
+            FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.ROLLING_SUMMARIES
+        """).to_pandas()
+        summaries.columns = [col.lower() for col in summaries.columns]
+        return summaries
+    except Exception:
+        # The summaries are created by Rolling_Summaries.sql; the dashboard works without them
+        return pd.DataFrame()
+
+# Function to compute (or read from the cache) the expensive fields of one record in the lazy enrichment mode
+def enrich_on_read(conversation_id):
+    session.sql(
+        "CALL MED_DEVICE_TRANSCRIPTS.ANALYTICS.ENRICH_ON_READ(ARRAY_CONSTRUCT(?), 'VIEW')",
+        params=[int(conversation_id)]
+    ).collect()
+    fields = session.sql(f"""
+        SELECT transcript_summary, resolution, resolution_reason, service_rating, service_rating_reason
+        FROM MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_ANALYSIS_RESULTS_LAZY
+        WHERE conversation_id = {int(conversation_id)}
+    """).to_pandas()
+    fields.columns = [col.lower() for col in fields.columns]
+    return fields.iloc[0].to_dict() if not fields.empty else {}
+
+# Function to return a copy of a record with the fields computed on view
+def with_lazy_fields(record, fields):
+    record = record.copy()
+    for field, value in fields.items():
+        record[field] = value
+    record['service_rating_numeric'] = pd.to_numeric(record.get('service_rating'), errors='coerce')
+    return record
+
+# "Similar calls" in the Record Viewer: the transcript embeddings written by the sync procedure (TRANSCRIPT_EMBEDDINGS,
+# see Cortex_Analysis.sql) are searched with VectorIndex from Python_Pipeline/vector_index.py, an in-memory inverted-file
+# index over mini-batch k-means lists, stored as float16, with top-10 lookups of about 20 ms at 1M vectors
+EMBEDDINGS_TABLE = "MED_DEVICE_TRANSCRIPTS.ANALYTICS.TRANSCRIPT_EMBEDDINGS"
+SIMILAR_CALLS = 5
+# Seconds between checks for new embeddings
+SIMILARITY_REFRESH_SECONDS = 60
+
+# One index per app process, shared by all sessions and reruns; load_similarity_index only adds the embeddings
+# written since the last check (EMBEDDED_AT), so the full table is read once
+@st.cache_resource
+def similarity_index_state():
+    return {"index": VectorIndex(), "loaded_until": None, "checked_at": 0.0, "lock": threading.Lock()}
+
+def load_similarity_index():
+    state = similarity_index_state()
+    with state["lock"]:
+        if time.monotonic() - state["checked_at"] >= SIMILARITY_REFRESH_SECONDS:
+            try:
+                where, params = "", None
+                if state["loaded_until"] is not None:
+                    where, params = "WHERE EMBEDDED_AT > ?", [state["loaded_until"]]
+                # The VECTOR column is read in Arrow batches, one array per row, rather than as JSON text
+                batches = session.sql(
+                    f"SELECT CONVERSATION_ID, EMBEDDING, EMBEDDED_AT FROM {EMBEDDINGS_TABLE} {where} ORDER BY EMBEDDED_AT",
+                    params=params
+                ).to_pandas_batches()
+                for batch in batches:
+                    if batch.empty:
+                        continue
+                    vectors = np.stack(batch["EMBEDDING"].to_numpy()).astype(np.float32)
+                    state["index"].add(batch["CONVERSATION_ID"].to_numpy(), vectors)
+                    state["loaded_until"] = batch["EMBEDDED_AT"].max()
+            except Exception:
+                # The table is created by Cortex_Analysis.sql; the Record Viewer works without it
+                pass
+            state["checked_at"] = time.monotonic()
+    return state
+
+# Function to find the calls most similar to one call, with their details
+def find_similar_calls(conversation_id, k=SIMILAR_CALLS):
+    state = load_similarity_index()
+    with state["lock"]:
+        query = state["index"].vector(conversation_id)
+        if query is None:
+            return None
+        matches = state["index"].search(query, k, exclude=conversation_id)
+    if not matches:
+        return pd.DataFrame()
+    details = session.sql(f"""
+        SELECT conversation_id, start_time, agent_name, device_category, resolution, main_issue_answer
+        FROM {RESULTS_TABLE}
+        WHERE conversation_id IN ({", ".join(str(match_id) for match_id, _ in matches)})
+    """).to_pandas()
+    details.columns = [col.lower() for col in details.columns]
+    similarity = pd.DataFrame(matches, columns=["conversation_id", "similarity"])
+    # Calls removed since they were embedded have no details and are left out
+    return similarity.merge(details, on="conversation_id").round({"similarity": 3})
+
+# Date range filter, pushed down into the query that loads the data
+st.sidebar.header("Date Range")
+min_date, max_date = load_date_bounds()
+start_date, end_date = None, None
+if min_date is not None:
+    date_range = st.sidebar.date_input(
+        "Date Range",
+        value=(max(min_date, max_date - timedelta(days=DEFAULT_DAYS - 1)), max_date),
+        min_value=min_date,
+        max_value=max_date
+    )
+    # While only the first date of a new range is picked, load that day rather than the whole table
+    if len(date_range) == 2:
+        start_date, end_date = date_range
+    elif len(date_range) == 1:
+        start_date = end_date = date_range[0]
 
 # Load the data
-df = load_data()
+df = load_data(start_date, end_date)
 
 # Add a debug expander to show available columns and data sample
 with st.sidebar.expander("Debug Info"):
@@ -135,41 +354,39 @@ with st.sidebar.expander("Debug Info"):
 
 # Add button to run pipeline stored procedure
 st.sidebar.header("Pipeline Control")
+pipeline_completed = False
 if st.sidebar.button("Run Transcript Pipeline"):
     try:
         with st.sidebar.status("Running transcript pipeline..."):
             # Execute the stored procedure
             result = session.sql("CALL MED_DEVICE_TRANSCRIPTS.ANALYTICS.RUN_NEW_TRANSCRIPT_PIPELINE()").collect()
-            st.sidebar.success("Pipeline completed successfully!")
-            st.sidebar.info("Refresh the page to see new data.")
+            pipeline_message = result[0][0] if result else ""
+        # The procedure reports its own errors in the returned message
+        if pipeline_message.startswith("Error"):
+            st.sidebar.error(pipeline_message)
+        else:
+            st.session_state['pipeline_message'] = pipeline_message
+            pipeline_completed = True
     except Exception as e:
         st.sidebar.error(f"Failed to run pipeline: {e}")
 
+# The procedure loads the new files and refreshes the analysis table before it returns,
+# so clear the cached data and rerun to show the new transcripts right away
+if pipeline_completed:
+    load_date_bounds.clear()
+    load_shared_data.clear()
+    load_issue_labels.clear()
+    st.rerun()
+
+if 'pipeline_message' in st.session_state:
+    st.sidebar.success("Pipeline completed successfully!")
+    st.sidebar.info(st.session_state.pop('pipeline_message'))
+
 # Sidebar filters
 st.sidebar.header("Filters")
 
-# Date range filter
-if 'start_time' in df.columns and not df.empty:
-    min_date = df['start_time'].min().date()
-    max_date = df['start_time'].max().date()
-    
-    default_start = min_date
-   
-    date_range = st.sidebar.date_input(
-        "Date Range",
-        value=(default_start, max_date),
-        min_value=min_date,
-        max_value=max_date
-    )
-    
-    if len(date_range) == 2:
-        start_date, end_date = date_range
-        df_filtered = df[(df['start_time'].dt.date >= start_date) & 
-                          (df['start_time'].dt.date <= end_date)]
-    else:
-        df_filtered = df
-else:
-    df_filtered = df
+# The date range is applied by load_data
+df_filtered = df
 
 
 # Agent filter
@@ -222,31 +439,6 @@ if 'service_rating_numeric' in df.columns and not df.empty:
     ]
 
 
-# Calculate the service index for each record
-def calculate_service_index(row):
-    try:
-        # Resolution component (60%)
-        resolution_score = 0
-        if row.get('resolution') == 'Resolved':
-            resolution_score = 10
-        elif row.get('resolution') == 'Partial':
-            resolution_score = 5
-        
-        # Service rating component (40%)
-        service_rating = row.get('service_rating_numeric', 0) 
-        if pd.isna(service_rating):
-            service_rating = 0
-            
-        # Combine scores with weights
-        service_index = (0.2 * resolution_score) + (0.8 * service_rating)
-        return round(service_index, 1)
-    except:
-        return 0
-
-# Apply service index calculation
-if not df_filtered.empty and 'resolution' in df_filtered.columns:
-    df_filtered['service_index'] = df_filtered.apply(calculate_service_index, axis=1)
-
 # Create tabs for different views
 tab1, tab2, tab3 = st.tabs(["Overview", "Agent Metrics", "Record Viewer"])
 
@@ -426,6 +618,27 @@ else:
             else:
                 st.warning("Resolution information is not available.")
         
+        # Top issues, from the precomputed clusters of the main issues
+        issue_labels = load_issue_labels()
+        if not issue_labels.empty:
+            st.subheader("Top Issues")
+            issue_df = df_filtered[['conversation_id']].merge(issue_labels, on='conversation_id', how='inner')
+            if not issue_df.empty:
+                issue_counts = issue_df.groupby('issue_label').size().reset_index(name='Count')
+                issue_counts = issue_counts.sort_values('Count', ascending=False).head(15)
+                fig = px.bar(
+                    issue_counts.sort_values('Count'),
+                    x='Count',
+                    y='issue_label',
+                    orientation='h',
+                    labels={'issue_label': 'Issue', 'Count': 'Number of Calls'},
+                    height=max(300, len(issue_counts) * 30)
+                )
+                fig.update_layout(margin=dict(t=0, b=0, l=0, r=0))
+                st.plotly_chart(fig, use_container_width=True)
+            else:
+                st.info("None of the selected calls has an issue cluster yet.")
+
         # Service rating statistics
         st.subheader("Service Rating Statistics")
         
@@ -535,6 +748,36 @@ else:
                 use_container_width=True
             )
 
+            # Rolling summaries of the agents and device categories in the filtered data, read from the summary table
+            rolling_summaries = load_rolling_summaries()
+            if not rolling_summaries.empty:
+                st.subheader("Agent Summaries")
+                window_days = int(rolling_summaries['window_days'].max())
+                st.caption(f"How each agent has done over the last {window_days} days of calls, folded in by the hourly summary task.")
+                for summary_type, key_column, key_label in [('AGENT', 'agent_name', 'Agent'), ('DEVICE', 'device_category', 'Device Category')]:
+                    if key_column not in df_filtered.columns:
+                        continue
+                    type_summaries = rolling_summaries[
+                        (rolling_summaries['summary_type'] == summary_type)
+                        & rolling_summaries['summary_key'].isin(df_filtered[key_column].dropna().unique())
+                    ]
+                    if type_summaries.empty:
+                        continue
+                    type_summaries = type_summaries.sort_values('calls_summarized', ascending=False)[
+                        ['summary_key', 'summary', 'calls_summarized', 'last_call_time', 'updated_at']
+                    ].rename(columns={
+                        'summary_key': key_label,
+                        'summary': 'Summary',
+                        'calls_summarized': 'Calls Summarized',
+                        'last_call_time': 'Latest Call',
+                        'updated_at': 'Updated'
+                    })
+                    if summary_type == 'AGENT':
+                        st.dataframe(type_summaries, use_container_width=True, hide_index=True)
+                    else:
+                        with st.expander("See Device Category Summaries"):
+                            st.dataframe(type_summaries, use_container_width=True, hide_index=True)
+
             col1, col2 = st.columns(2)
             with col1:
                 # Calculate and display resolution percentages by agent
@@ -795,6 +1038,58 @@ else:
             else:
                 st.warning("Agent information is not available in the filtered data.")
 
+            # Conversation flow by agent, from the speaker turns of each transcript
+            conversation_features = load_conversation_features()
+            if not conversation_features.empty:
+                st.subheader("Conversation Flow by Agent")
+
+                flow_df = df_filtered[['conversation_id', 'agent_name']].merge(
+                    conversation_features,
+                    on='conversation_id',
+                    how='inner'
+                )
+
+                if not flow_df.empty:
+                    flow_df['customer_last_word'] = flow_df['customer_last_word'].astype(float)
+                    flow_by_agent = flow_df.groupby('agent_name').agg({
+                        'turn_count': 'mean',
+                        'agent_talk_ratio': 'mean',
+                        'customer_last_word': 'mean',
+                        'avg_response_gap_seconds': 'mean'
+                    }).reset_index()
+                    flow_by_agent['agent_talk_ratio'] = flow_by_agent['agent_talk_ratio'] * 100
+                    flow_by_agent['customer_last_word'] = flow_by_agent['customer_last_word'] * 100
+                    flow_by_agent.rename(columns={
+                        'agent_name': 'Agent',
+                        'turn_count': 'Avg Turns',
+                        'agent_talk_ratio': 'Agent Talk Share (%)',
+                        'customer_last_word': 'Customer Last Word (%)',
+                        'avg_response_gap_seconds': 'Avg Response Gap (sec)'
+                    }, inplace=True)
+
+                    with st.expander("See Conversation Flow Table"):
+                        st.dataframe(
+                            flow_by_agent.style.format({
+                                'Avg Turns': '{:.1f}',
+                                'Agent Talk Share (%)': '{:.1f}',
+                                'Customer Last Word (%)': '{:.1f}',
+                                'Avg Response Gap (sec)': '{:.1f}',
+                            }, na_rep='-'),
+                            use_container_width=True
+                        )
+
+                    fig = px.bar(
+                        flow_by_agent.sort_values('Agent Talk Share (%)'),
+                        x='Agent Talk Share (%)',
+                        y='Agent',
+                        orientation='h',
+                        color='Avg Turns',
+                        color_continuous_scale='Blues',
+                        height=max(350, len(flow_by_agent) * 30)
+                    )
+                    fig.update_layout(xaxis_range=[0, 100])
+                    st.plotly_chart(fig, use_container_width=True)
+
              
     
     # Tab 3: Record Viewer
@@ -837,12 +1132,32 @@ else:
                     records_to_display = date_filtered_records
                 
                 # Display records for selected date range
+                # Expensive fields computed on view in the lazy enrichment mode, kept for the rest of the session
+                lazy_fields = st.session_state.setdefault('lazy_fields', {})
+                
                 for idx, record in records_to_display.iterrows():
-                    with st.expander(f"{record.get('conversation_id', 'N/A')} - {record.get('start_time', 'N/A').strftime('%Y-%m-%d %H:%M') if pd.notna(record.get('start_time')) else 'N/A'} - {record.get('agent_name', 'N/A')} - {record.get('device_category', 'N/A')} - {record.get('resolution', 'N/A')} - {record.get('service_rating', 'N/A')} - {record.get('sentiment_category', 'N/A')}"):
+                    # The label of an enriched record changes with its resolution and rating, so it is opened
+                    # explicitly to stay expanded on later reruns
+                    enriched_on_view = LAZY_ENRICHMENT and record.get('conversation_id') in lazy_fields
+                    if enriched_on_view:
+                        record = with_lazy_fields(record, lazy_fields[record['conversation_id']])
+                    with st.expander(f"{record.get('conversation_id', 'N/A')} - {record.get('start_time', 'N/A').strftime('%Y-%m-%d %H:%M') if pd.notna(record.get('start_time')) else 'N/A'} - {record.get('agent_name', 'N/A')} - {record.get('device_category', 'N/A')} - {record.get('resolution', 'N/A')} - {record.get('service_rating', 'N/A')} - {record.get('sentiment_category', 'N/A')}", expanded=enriched_on_view):
                         # Display summary above the columns
                         st.markdown("### Summary")
+                        if LAZY_ENRICHMENT and pd.isna(record.get('transcript_summary')):
+                            pending = st.empty()
+                            with pending.container():
+                                st.write("The summary, resolution and rating of this record have not been generated yet.")
+                                generate = st.button("Generate summary and reasons", key=f"enrich_{idx}")
+                            if generate:
+                                with st.spinner("Running Cortex..."):
+                                    lazy_fields[record['conversation_id']] = enrich_on_read(record['conversation_id'])
+                                # Show the new fields in place: st.rerun() would collapse the expander just opened
+                                record = with_lazy_fields(record, lazy_fields[record['conversation_id']])
+                                pending.empty()
                         if 'transcript_summary' in record:
-                            st.write(record['transcript_summary'])
+                            if not (LAZY_ENRICHMENT and pd.isna(record.get('transcript_summary'))):
+                                st.write(record['transcript_summary'])
                         else:
                             st.write("Summary not available")
                         
@@ -902,6 +1217,18 @@ else:
                                 st.text_area("", record.get('service_rating_reason', ''), height=75, key=f"rating_reason_{idx}")
                             else:
                                 st.write("Rating reason not available")
+
+                        # Similar calls from the embedding index, only searched when asked for
+                        if VectorIndex is not None:
+                            st.markdown("### Similar Calls")
+                            if st.checkbox("Find similar calls", key=f"similar_{idx}"):
+                                similar_calls = find_similar_calls(record['conversation_id'])
+                                if similar_calls is None:
+                                    st.write("This call has not been embedded yet")
+                                elif similar_calls.empty:
+                                    st.write("No similar calls found")
+                                else:
+                                    st.dataframe(similar_calls, use_container_width=True, hide_index=True)
             else:
                 st.warning("Please select a valid date range.")
         else:
@@ -0,0 +1,111 @@
+"""
+Measure the cache hit latency of the dashboards' load_data(): st.cache_data vs a shared, read-only st.cache_resource.
+
+On a cache hit st.cache_data unpickles a new copy of the stored DataFrame, so every rerun pays for deserializing the
+whole frame, transcripts included. st.cache_resource returns the stored object itself, which the dashboards make
+read-only with read_only_frame (shared_frames.py) and hand out as a shallow copy. This script times both on a
+synthetic frame shaped like TRANSCRIPT_ANALYSIS_RESULTS_FINAL, without Streamlit or a Snowflake account: the hit of
+st.cache_data is timed as the pickle.loads it does, the hit of st.cache_resource as a dictionary lookup.
+
+Usage:
+    python cache_benchmark.py [rows] [hits]
+"""
+
+import pickle
+import random
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from shared_frames import caller_frame, read_only_frame
+
+WORDS = ("glucose meter reading battery pump cpap mask oxygen concentrator nebulizer wheelchair replace shipping "
+         "warranty error screen alarm filter tubing refund calibrate sensor strip order account insurance").split()
+AGENTS = [f"Agent {i}" for i in range(25)]
+DEVICES = ["Glucose Meter", "CPAP Machine", "Oxygen Concentrator", "Nebulizer", "Mobility Aid", "Blood Pressure Monitor"]
+RESOLUTIONS = ["Resolved", "Partial", "Unresolved"]
+
+
+def text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def synthetic_results(rows, seed=0):
+    """Return a DataFrame with the columns of the results table, with object string columns as Snowpark returns them."""
+    rng = random.Random(seed)
+    start = pd.Timestamp("2025-01-01") + pd.to_timedelta(np.sort(np.random.default_rng(seed).integers(0, 90 * 86400, rows)), unit="s")
+    df = pd.DataFrame({
+        "conversation_id": np.arange(rows),
+        "start_time": start,
+        "end_time": start + pd.to_timedelta(np.random.default_rng(seed + 1).integers(120, 1800, rows), unit="s"),
+        "agent_name": [rng.choice(AGENTS) for _ in range(rows)],
+        "customer_name": [f"Customer {rng.randrange(rows)}" for _ in range(rows)],
+        # About 3,000 characters, a typical support call
+        "transcript": [text(rng, 450) for _ in range(rows)],
+        "transcript_summary": [text(rng, 50) for _ in range(rows)],
+        "sentiment_score": np.random.default_rng(seed + 2).uniform(-1, 1, rows),
+        "device_category": [rng.choice(DEVICES) for _ in range(rows)],
+        "main_issue_answer": [text(rng, 12) for _ in range(rows)],
+        "resolution": [rng.choice(RESOLUTIONS) for _ in range(rows)],
+        "resolution_reason": [text(rng, 30) for _ in range(rows)],
+        "service_rating_numeric": np.random.default_rng(seed + 3).integers(0, 11, rows).astype(float),
+        "service_rating_reason": [text(rng, 30) for _ in range(rows)],
+    })
+    for column in df.columns:
+        if df[column].dtype != object and not isinstance(df[column].dtype, np.dtype):
+            df[column] = df[column].astype(object)
+    return df
+
+
+def timed(function, repeat):
+    """Return the sorted latencies of repeat calls of function, in ms."""
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return sorted(latencies)
+
+
+def main(rows=100_000, hits=5):
+    df = synthetic_results(rows)
+    frame_mb = df.memory_usage(deep=True).sum() / 1e6
+    print(f"{rows} rows, {frame_mb:.0f} MB in memory (pandas {pd.__version__})")
+
+    # st.cache_data: the value is pickled on the miss and unpickled on every hit
+    started = time.perf_counter()
+    stored = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+    write_ms = (time.perf_counter() - started) * 1000
+    data_hits = timed(lambda: pickle.loads(stored), hits)
+    print(f"st.cache_data:     write {write_ms:8.1f} ms, {len(stored) / 1e6:.0f} MB pickled; "
+          f"hit p50 {data_hits[len(data_hits) // 2]:8.1f} ms, max {data_hits[-1]:8.1f} ms")
+    del stored
+
+    # st.cache_resource: the read-only frame is built once on the miss; every hit returns a shallow copy of it
+    started = time.perf_counter()
+    resources = {"load_data": read_only_frame(df)}
+    write_ms = (time.perf_counter() - started) * 1000
+    resource_hits = timed(lambda: caller_frame(resources["load_data"]), hits)
+    print(f"st.cache_resource: write {write_ms:8.1f} ms, shared; "
+          f"hit p50 {resource_hits[len(resource_hits) // 2]:8.4f} ms, max {resource_hits[-1]:8.4f} ms")
+
+    try:
+        resources["load_data"].iloc[0, resources["load_data"].columns.get_loc("sentiment_score")] = 0.0
+        print("read-only check: FAILED, the shared frame was changed in place")
+    except ValueError:
+        print("read-only check: writing into the shared frame raises ValueError")
+
+    copy = caller_frame(resources["load_data"])
+    copy["sentiment_label"] = np.where(copy["sentiment_score"] > 0, "Positive", "Negative")
+    copy.drop(columns=["transcript"], inplace=True)
+    unchanged = "sentiment_label" not in resources["load_data"] and "transcript" in resources["load_data"]
+    print(f"shallow copy check: adding and dropping columns of a caller's copy {'leaves' if unchanged else 'CHANGES'} the shared frame")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 3 or any(not arg.isdigit() for arg in sys.argv[1:]):
+        print(__doc__)
+        sys.exit(1)
+    main(*[int(arg) for arg in sys.argv[1:]])
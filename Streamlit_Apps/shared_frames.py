@@ -0,0 +1,35 @@
+"""
+Helpers for the DataFrames the dashboards cache with st.cache_resource and share between reruns and sessions.
+
+st.cache_resource returns the cached object itself rather than a copy, so one frame is shared by every rerun and
+session of the app:
+
+- read_only_frame backs each numpy column with a non-writeable array (extension columns, like Arrow strings, are
+  immutable already), so writing values into the shared frame raises an error instead of changing it for everyone
+- caller_frame returns a shallow copy for one caller: it shares the column data, but adding, replacing or dropping a
+  column only changes the copy. Each load_data() returns caller_frame(cached frame), which costs no copy of the data
+
+Upload this file next to the app (Med_Device_Transcripts_Overview.py or transcript_analysis_basic.py) when creating
+it in Streamlit in Snowflake.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def read_only_frame(df):
+    """Return a frame with the columns of df, each numpy column backed by a non-writeable array."""
+    columns = {}
+    for col in df.columns:
+        if isinstance(df[col].dtype, np.dtype):
+            values = df[col].to_numpy()
+            values.flags.writeable = False
+            columns[col] = values
+        else:
+            columns[col] = df[col]
+    return pd.DataFrame(columns, index=df.index, copy=False)
+
+
+def caller_frame(df):
+    """Return a shallow copy of a shared frame, whose columns one caller can add or drop."""
+    return df.copy(deep=False)
@@ -9,6 +9,7 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 from datetime import datetime, timedelta
+from shared_frames import caller_frame, read_only_frame
 
 # Set page configuration - MUST be the first Streamlit command
 st.set_page_config(
@@ -56,64 +57,67 @@ def get_table_columns():
         return []
 
 # Function to load data
-@st.cache_data(ttl=300)
-def load_data():
-    try:
-        # Get available columns
-        available_columns = get_table_columns()
-        
-        # Build a safe query with proper quoting
-        if available_columns:
-            # Use double quotes for all column names
-            quoted_columns = [f'"{col}"' for col in available_columns]
-            columns_str = ", ".join(quoted_columns)
-            
-            query = f"""
-            SELECT {columns_str}
-            FROM "TRANSCRIPT_ANALYSIS_RESULTS_FINAL"
-            ORDER BY "START_TIME" DESC
-            """
-        else:
-            # Fallback to SELECT * if we couldn't determine columns
-            query = """
-            SELECT * 
-            FROM "TRANSCRIPT_ANALYSIS_RESULTS_FINAL"
-            """
-        
-        # Show the query in debug
-        with st.sidebar.expander("SQL Query", expanded=False):
-            st.code(query)
-            
-        # Execute the query    
-        df = session.sql(query).to_pandas()
-        
-        # Convert column names to lowercase for easier handling
-        df.columns = [col.lower() for col in df.columns]
+# Cached as a shared, read-only resource (see shared_frames.py): st.cache_data would unpickle a new copy of the whole
+# frame on every rerun. Each rerun gets a shallow copy, whose columns it can add or drop
+# Errors are raised rather than returned as an empty frame, so a failed query is not cached for every session
+@st.cache_resource(ttl=300)
+def load_shared_data():
+    # Get available columns
+    available_columns = get_table_columns()
+    
+    # Build a safe query with proper quoting
+    if available_columns:
+        # Use double quotes for all column names
+        quoted_columns = [f'"{col}"' for col in available_columns]
+        columns_str = ", ".join(quoted_columns)
         
-        # Debug: Show available columns
-        with st.sidebar.expander("Available Columns", expanded=False):
-            st.write(", ".join(df.columns.tolist()))
+        query = f"""
+        SELECT {columns_str}
+        FROM "TRANSCRIPT_ANALYSIS_RESULTS_FINAL"
+        ORDER BY "START_TIME" DESC
+        """
+    else:
+        # Fallback to SELECT * if we couldn't determine columns
+        query = """
+        SELECT * 
+        FROM "TRANSCRIPT_ANALYSIS_RESULTS_FINAL"
+        """
+    
+    # Show the query in debug
+    with st.sidebar.expander("SQL Query", expanded=False):
+        st.code(query)
         
-        # Convert date columns
-        if 'start_time' in df.columns:
-            df['start_time'] = pd.to_datetime(df['start_time'], errors='coerce')
+    # Execute the query    
+    df = session.sql(query).to_pandas()
+    
+    # Convert column names to lowercase for easier handling
+    df.columns = [col.lower() for col in df.columns]
+    
+    # Debug: Show available columns
+    with st.sidebar.expander("Available Columns", expanded=False):
+        st.write(", ".join(df.columns.tolist()))
+    
+    # Convert date columns
+    if 'start_time' in df.columns:
+        df['start_time'] = pd.to_datetime(df['start_time'], errors='coerce')
+    
+    # Convert numeric columns
+    if 'service_rating' in df.columns:
+        df['service_rating'] = pd.to_numeric(df['service_rating'], errors='coerce')
+    if 'sentiment_score' in df.columns:
+        df['sentiment_score'] = pd.to_numeric(df['sentiment_score'], errors='coerce')
         
-        # Convert numeric columns
-        if 'service_rating' in df.columns:
-            df['service_rating'] = pd.to_numeric(df['service_rating'], errors='coerce')
-        if 'sentiment_score' in df.columns:
-            df['sentiment_score'] = pd.to_numeric(df['sentiment_score'], errors='coerce')
-            
-        return df
-    except Exception as e:
-        st.sidebar.error(f"Error loading data: {e}")
-        # Return an empty DataFrame with expected columns
-        expected_columns = ['conversation_id', 'source', 'start_time', 'service_rating', 
-                           'sentiment_score', 'device_category', 'resolution']
-        return pd.DataFrame(columns=expected_columns)
+    return read_only_frame(df)
 
-# Load data
-df = load_data()
+# Load data; a failure is reported here and retried on the next rerun
+try:
+    df = caller_frame(load_shared_data())
+except Exception as e:
+    st.sidebar.error(f"Error loading data: {e}")
+    # Fall back to an empty DataFrame with expected columns
+    expected_columns = ['conversation_id', 'source', 'start_time', 'service_rating', 
+                       'sentiment_score', 'device_category', 'resolution']
+    df = pd.DataFrame(columns=expected_columns)
 
 # Check if data is available
 if df.empty:
@@ -222,8 +226,7 @@ with tab1:
         st.subheader("Conversations Over Time")
         
         # Group by date
-        df_filtered['date'] = df_filtered['start_time'].dt.date
-        daily_counts = df_filtered.groupby('date').size().reset_index()
+        daily_counts = df_filtered.groupby(df_filtered['start_time'].dt.date).size().reset_index()
         daily_counts.columns = ['Date', 'Count']
         
         fig = px.line(
@@ -255,14 +258,14 @@ with tab2:
         st.plotly_chart(fig, use_container_width=True)
         
         # Create sentiment categories for analysis
-        df_filtered['sentiment_category'] = pd.cut(
+        sentiment_category = pd.cut(
             df_filtered['sentiment_score'],
             bins=[-1, -0.33, 0.33, 1],
             labels=['Negative', 'Neutral', 'Positive']
         )
         
         # Sentiment by category
-        sentiment_counts = df_filtered['sentiment_category'].value_counts().reset_index()
+        sentiment_counts = sentiment_category.value_counts().reset_index()
         sentiment_counts.columns = ['Category', 'Count']
         
         fig = px.pie(